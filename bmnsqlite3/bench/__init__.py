@@ -0,0 +1,259 @@
+"""
+Benchmark of VFS wrappers:
+
+    python -m bmnsqlite3.bench [--rows 20000] [--repeat 3] [--config full] [--workload backup] ...
+
+Every workload runs against every configuration in a new temporary directory
+and the report is printed as JSON. Configurations:
+
+- 'sqlite3' - standard library module
+- 'bmnsqlite3' - this module without wrapper
+- 'null' - native codec passing pages as is, no python callbacks
+- 'partial' - partial wrapper passing pages as is
+- 'full' - full wrapper doing file I/O in python and passing data as is
+- 'xor' - full wrapper XORing main DB
+- 'aes' - full wrapper encrypting main DB with AES CTR
+- 'fernet' - full wrapper encrypting main DB sectors with Fernet
+
+'aes' and 'fernet' need 'cryptography' package, they're reported as skipped
+without it. Workloads: 'bulk_insert', 'point_lookups', 'range_scans',
+'update_heavy', 'vacuum' and 'backup'. 'bulk_insert' fills the DB used by
+the others, so it always runs first. Each workload opens its own connection
+with small page cache to reach the VFS. With '--repeat' every workload is
+run on new DB several times and the fastest run is reported.
+
+For every workload the report has 'ops' ( rows or statements ), 'seconds',
+'ops_per_sec' and 'mb_per_sec' of row data or of the DB for 'vacuum' and
+'backup'. Wrapped configurations also have 'calls' of VFS callbacks and
+'bytes_read' and 'bytes_written' by the VFS ( see vfs_stats ).
+'overhead' of the report is the fixed cost of one callback by its parts
+( see callback_overhead ), the difference of 'null' and 'partial' is the
+cost of python callbacks.
+"""
+import os
+import platform
+import random
+import shutil
+import sqlite3
+import tempfile
+import time
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+import bmnsqlite3
+from bmnsqlite3.bench import wrappers
+from bmnsqlite3.vfs import NullVfsWrapper
+
+VFS_NAME = "bmn_bench"
+NATIVE_VFS_NAME = "win32" if "nt" == os.name else "unix"
+
+CONFIGS = {
+    "sqlite3": None,
+    "bmnsqlite3": None,
+    "null": NullVfsWrapper,
+    "partial": wrappers.PassThroughPartialWrapper,
+    "full": wrappers.PassThroughWrapper,
+    "xor": wrappers.XorWrapper,
+    "aes": wrappers.AesCtrWrapper,
+    "fernet": wrappers.FernetWrapper,
+}
+CRYPTO_CONFIGS = ("aes", "fernet")
+
+WORKLOADS = ("bulk_insert", "point_lookups", "range_scans", "update_heavy",
+             "vacuum", "backup")
+
+
+class Bench:
+    """
+    Workloads of one configuration. Every workload returns count of
+    operations and bytes of data
+    """
+
+    def __init__(self, connect: Callable[[str], Any], directory: str, rows: int,
+                 payload: int, cache_pages: int, synchronous: str) -> None:
+        self.connect = connect
+        self.path = os.path.join(directory, "bench.db")
+        self.directory = directory
+        self.rows = rows
+        self.payload = payload
+        self.cache_pages = cache_pages
+        self.synchronous = synchronous
+        self.random = random.Random(0)
+
+    def open(self, path: Optional[str] = None) -> Any:
+        con = self.connect(path or self.path)
+        con.execute("PRAGMA cache_size = %d" % self.cache_pages)
+        con.execute("PRAGMA synchronous = %s" % self.synchronous)
+        # anonymous temporary files aren't opened by wrappers
+        con.execute("PRAGMA temp_store = MEMORY")
+        return con
+
+    def keys(self, count: int) -> List[int]:
+        return [self.random.randint(1, self.rows) for _ in range(count)]
+
+    def bulk_insert(self, con: Any) -> Tuple[int, int]:
+        con.execute("PRAGMA page_size = 4096")
+        con.execute("CREATE TABLE t (id INTEGER PRIMARY KEY, k INTEGER, v BLOB)")
+        con.execute("CREATE INDEX t_k ON t (k)")
+        value = os.urandom(self.payload)
+        with con:
+            con.executemany("INSERT INTO t VALUES (?, ?, ?)",
+                            ((i, i * 7 % self.rows, value) for i in range(1, self.rows + 1)))
+        return self.rows, self.rows * self.payload
+
+    def point_lookups(self, con: Any) -> Tuple[int, int]:
+        count = 0
+        for key in self.keys(self.rows):
+            count += len(con.execute("SELECT v FROM t WHERE id = ?", (key,)).fetchone()[0])
+        return self.rows, count
+
+    def range_scans(self, con: Any) -> Tuple[int, int]:
+        scans = max(1, self.rows // 100)
+        count = 0
+        for key in self.keys(scans):
+            for row in con.execute("SELECT v FROM t WHERE k BETWEEN ? AND ?", (key, key + 100)):
+                count += len(row[0])
+        return scans, count
+
+    def update_heavy(self, con: Any) -> Tuple[int, int]:
+        # transactions of 10 updates
+        count = max(10, self.rows // 10)
+        value = os.urandom(self.payload)
+        keys = self.keys(count)
+        for i in range(0, count, 10):
+            with con:
+                con.executemany("UPDATE t SET v = ? WHERE id = ?",
+                                ((value, key) for key in keys[i:i + 10]))
+        return count, count * self.payload
+
+    def vacuum(self, con: Any) -> Tuple[int, int]:
+        con.execute("VACUUM")
+        return 1, self.db_size(con)
+
+    def backup(self, con: Any) -> Tuple[int, int]:
+        target = self.open(os.path.join(self.directory, "backup.db"))
+        try:
+            con.backup(target)
+        finally:
+            target.close()
+        return 1, self.db_size(con)
+
+    @staticmethod
+    def db_size(con: Any) -> int:
+        pages = con.execute("PRAGMA page_count").fetchone()[0]
+        return pages * con.execute("PRAGMA page_size").fetchone()[0]
+
+
+def _counters(vfs_name: Optional[str]) -> Optional[Dict[str, Any]]:
+    if vfs_name is None:
+        return None
+    return bmnsqlite3.vfs_stats(vfs_name)
+
+
+def _difference(before: Optional[Dict[str, Any]],
+                after: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    if before is None or after is None:
+        return {}
+    calls = {op: count - before["calls"].get(op, 0) for op, count in after["calls"].items()}
+    return {
+        "calls": {op: count for op, count in calls.items() if count},
+        "bytes_read": after["bytes_read"] - before["bytes_read"],
+        "bytes_written": after["bytes_written"] - before["bytes_written"],
+    }
+
+
+def _run_once(connect: Callable[[str], Any], vfs_name: Optional[str], workloads: List[str],
+              directory: Optional[str], **kwargs) -> Dict[str, Any]:
+    temp = tempfile.mkdtemp(prefix="bmnbench", dir=directory)
+    try:
+        bench = Bench(connect, temp, **kwargs)
+        result = {}
+        for workload in ["bulk_insert"] + [w for w in workloads if "bulk_insert" != w]:
+            con = bench.open()
+            try:
+                before = _counters(vfs_name)
+                start = time.perf_counter()
+                ops, size = getattr(bench, workload)(con)
+                seconds = time.perf_counter() - start
+                after = _counters(vfs_name)
+            finally:
+                con.close()
+            if workload not in workloads:
+                continue
+            result[workload] = {
+                "ops": ops,
+                "seconds": seconds,
+                "ops_per_sec": ops / seconds if seconds else None,
+                "mb_per_sec": size / seconds / 1e6 if seconds else None,
+                **_difference(before, after),
+            }
+        return result
+    finally:
+        shutil.rmtree(temp, ignore_errors=True)
+
+
+def run_config(name: str, workloads: List[str], rows: int = 20000, payload: int = 100,
+               cache_pages: int = 64, synchronous: str = "OFF", repeat: int = 1,
+               directory: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Runs workloads against the configuration 'repeat' times on new DB,
+    the fastest run of every workload is reported.
+
+    Returns:
+        dict: results by workload name or 'skipped' with the reason
+    """
+    if name in CRYPTO_CONFIGS and wrappers.fernet is None:
+        return {"skipped": "cryptography isn't installed"}
+    vfs_name = None
+    if "sqlite3" == name:
+        connect = sqlite3.connect
+    elif CONFIGS[name] is None:
+        # a wrapper can be the default VFS of the process
+        def connect(path: str) -> Any:
+            return bmnsqlite3.connect(path, vfs=NATIVE_VFS_NAME)
+    else:
+        vfs_name = VFS_NAME
+        bmnsqlite3.vfs_register(CONFIGS[name](), make_default=False, name=vfs_name)
+
+        def connect(path: str) -> Any:
+            return bmnsqlite3.connect(path, vfs=vfs_name)
+
+    try:
+        result = {}
+        for _ in range(max(1, repeat)):
+            once = _run_once(connect, vfs_name, workloads, directory, rows=rows,
+                             payload=payload, cache_pages=cache_pages, synchronous=synchronous)
+            for workload, value in once.items():
+                if workload not in result or value["seconds"] < result[workload]["seconds"]:
+                    result[workload] = value
+        return result
+    finally:
+        if vfs_name is not None:
+            bmnsqlite3.vfs_register(None, name=vfs_name)
+
+
+def run(configs: Optional[List[str]] = None, workloads: Optional[List[str]] = None,
+        **kwargs) -> Dict[str, Any]:
+    """
+    Runs workloads against configurations, all of them if None.
+    Keyword arguments are passed to run_config.
+
+    Returns:
+        dict: the report
+    """
+    configs = list(configs or CONFIGS)
+    workloads = list(workloads or WORKLOADS)
+    for name in configs:
+        if name not in CONFIGS:
+            raise ValueError("unknown configuration %r" % name)
+    for workload in workloads:
+        if workload not in WORKLOADS:
+            raise ValueError("unknown workload %r" % workload)
+    return {
+        "bmnsqlite3": bmnsqlite3.version,
+        "sqlite": bmnsqlite3.sqlite_version,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "parameters": dict(kwargs),
+        "overhead": bmnsqlite3.callback_overhead(wrappers.NoopWrapper()),
+        "results": {name: run_config(name, workloads, **kwargs) for name in configs},
+    }
@@ -0,0 +1,48 @@
+import argparse
+import json
+import sys
+
+from bmnsqlite3 import bench
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        prog="python -m bmnsqlite3.bench",
+        description="Compares VFS wrappers, prints JSON report")
+    parser.add_argument("--config", action="append", choices=list(bench.CONFIGS),
+                        help="configuration to run, all of them by default")
+    parser.add_argument("--workload", action="append", choices=list(bench.WORKLOADS),
+                        help="workload to run, all of them by default")
+    parser.add_argument("--rows", type=int, default=20000, help="rows of the table")
+    parser.add_argument("--payload", type=int, default=100, help="bytes of row value")
+    parser.add_argument("--cache-pages", type=int, default=64,
+                        help="PRAGMA cache_size of connections")
+    parser.add_argument("--synchronous", default="OFF",
+                        choices=("OFF", "NORMAL", "FULL", "EXTRA"),
+                        help="PRAGMA synchronous of connections")
+    parser.add_argument("--repeat", type=int, default=1,
+                        help="runs of every workload, the fastest one is reported")
+    parser.add_argument("--directory", help="parent of temporary directories")
+    parser.add_argument("--output", help="file for the report instead of stdout")
+    args = parser.parse_args()
+
+    report = bench.run(
+        args.config,
+        args.workload,
+        rows=args.rows,
+        payload=args.payload,
+        cache_pages=args.cache_pages,
+        synchronous=args.synchronous,
+        repeat=args.repeat,
+        directory=args.directory)
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as output:
+            output.write(text + "\n")
+    else:
+        print(text)
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
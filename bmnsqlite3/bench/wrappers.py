@@ -0,0 +1,206 @@
+import os
+import struct
+from typing import Any, Callable, Optional, Union
+
+from bmnsqlite3 import vfs
+
+try:
+    from cryptography import fernet
+    from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+except ImportError:
+    fernet = None
+
+SQLITE_OPEN_READONLY = 0x00000001
+SQLITE_OPEN_READWRITE = 0x00000002
+SQLITE_OPEN_CREATE = 0x00000004
+SQLITE_OPEN_EXCLUSIVE = 0x00000010
+SQLITE_OPEN_MAIN_DB = 0x00000100
+
+
+class PassThroughPartialWrapper(vfs.IPartialVfsWrapper):
+    """
+    Partial wrapper passing pages as is, files are handled by sqlite
+    """
+
+    def encode(self, file_flags: int, callback: Callable[[bytes, int], int],
+               data: bytes, offset: int) -> None:
+        callback(data, offset)
+
+    def decode(self, file_flags: int,
+               callback: Callable[[int, int], Union[bytes, bool]], length: int,
+               offset: int) -> Union[bytes, bool]:
+        return callback(length, offset)
+
+
+class NoopWrapper:
+    """
+    'write' doing nothing, the floor of callback_overhead
+    """
+
+    def write(self, fh: Any, data: bytes, offset: int) -> None:
+        pass
+
+
+class BenchFile:
+    """
+    Unbuffered file of full wrappers, 'encode' is set for main DB only
+    """
+
+    def __init__(self, path: str, flags: int) -> None:
+        mode = os.O_RDWR if flags & SQLITE_OPEN_READWRITE else os.O_RDONLY
+        if flags & SQLITE_OPEN_CREATE:
+            mode |= os.O_CREAT
+        if flags & SQLITE_OPEN_EXCLUSIVE:
+            mode |= os.O_EXCL
+        self.fd = os.open(path, mode | getattr(os, "O_BINARY", 0), 0o644)
+        self.encode = 0 != flags & SQLITE_OPEN_MAIN_DB
+
+
+class PassThroughWrapper(vfs.IFullVfsWrapper):
+    """
+    Full wrapper doing file I/O in python and passing data as is.
+    Children transform data of main DB by 'transform' ( the same length )
+    """
+
+    def open(self, path: str, flags: int) -> Any:
+        return BenchFile(path, flags)
+
+    def close(self, fh: Any) -> None:
+        os.close(fh.fd)
+
+    def write(self, fh: Any, data: bytes, offset: int) -> None:
+        if fh.encode:
+            data = self.transform(data, offset)
+        os.lseek(fh.fd, offset, os.SEEK_SET)
+        os.write(fh.fd, data)
+
+    def read(self, fh: Any, length: int, offset: int) -> Union[bytes, bool]:
+        os.lseek(fh.fd, offset, os.SEEK_SET)
+        data = os.read(fh.fd, length)
+        if len(data) < length:
+            return False
+        if fh.encode:
+            return self.transform(data, offset)
+        return data
+
+    def truncate(self, fh: Any, size: int) -> None:
+        os.ftruncate(fh.fd, size)
+
+    def file_size(self, fh: Any) -> int:
+        return os.fstat(fh.fd).st_size
+
+    def sync(self, fh: Any, flags: int) -> None:
+        os.fsync(fh.fd)
+
+    def transform(self, data: bytes, offset: int) -> bytes:
+        return data
+
+
+class XorWrapper(PassThroughWrapper):
+    """
+    XOR with key stream depending on the offset only
+    """
+    KEY = os.urandom(4096)
+
+    def transform(self, data: bytes, offset: int) -> bytes:
+        length = len(data)
+        start = offset % len(self.KEY)
+        key = self.KEY[start:]
+        while len(key) < length:
+            key += self.KEY
+        value = int.from_bytes(data, "little") ^ int.from_bytes(key[:length], "little")
+        return value.to_bytes(length, "little")
+
+
+class AesCtrWrapper(PassThroughWrapper):
+    """
+    AES CTR with counter of the offset, so any range is encrypted in place
+    """
+
+    def __init__(self, key: Optional[bytes] = None) -> None:
+        super().__init__()
+        self.__algo = algorithms.AES(key or os.urandom(32))
+
+    def transform(self, data: bytes, offset: int) -> bytes:
+        skip = offset % 16
+        counter = (offset // 16).to_bytes(16, "big")
+        cipher = Cipher(self.__algo, modes.CTR(counter)).encryptor()
+        return cipher.update(bytes(skip) + bytes(data))[skip:]
+
+
+class FernetWrapper(PassThroughWrapper):
+    """
+    Fernet ( AES CBC + HMAC ) of main DB sectors. Every sector is kept with
+    its length in the slot of fixed size, partial sectors are rewritten
+    """
+    SECTOR_SIZE = 4096
+    # token of 2 + 4096 bytes in base64
+    SLOT_SIZE = 5560
+
+    def __init__(self, key: Optional[bytes] = None) -> None:
+        super().__init__()
+        self.__f = fernet.Fernet(key or fernet.Fernet.generate_key())
+
+    def sector_size(self, fh: Any) -> Optional[float]:
+        return self.SECTOR_SIZE
+
+    def _read_sector(self, fh: Any, index: int) -> bytes:
+        os.lseek(fh.fd, index * self.SLOT_SIZE, os.SEEK_SET)
+        token = os.read(fh.fd, self.SLOT_SIZE)
+        if len(token) < self.SLOT_SIZE:
+            return b""
+        data = self.__f.decrypt(token)
+        return data[2:2 + struct.unpack(">H", data[:2])[0]]
+
+    def _write_sector(self, fh: Any, index: int, data: bytes) -> None:
+        token = self.__f.encrypt(struct.pack(">H", len(data)) + data.ljust(self.SECTOR_SIZE, b"\0"))
+        assert len(token) == self.SLOT_SIZE
+        os.lseek(fh.fd, index * self.SLOT_SIZE, os.SEEK_SET)
+        os.write(fh.fd, token)
+
+    def write(self, fh: Any, data: bytes, offset: int) -> None:
+        if not fh.encode:
+            return super().write(fh, data, offset)
+        data = bytes(data)
+        end = offset + len(data)
+        while offset < end:
+            index, start = divmod(offset, self.SECTOR_SIZE)
+            length = min(self.SECTOR_SIZE - start, end - offset)
+            chunk = data[:length]
+            if start or length < self.SECTOR_SIZE:
+                old = self._read_sector(fh, index)
+                chunk = old[:start].ljust(start, b"\0") + chunk + old[start + length:]
+            self._write_sector(fh, index, chunk)
+            data = data[length:]
+            offset += length
+
+    def read(self, fh: Any, length: int, offset: int) -> Union[bytes, bool]:
+        if not fh.encode:
+            return super().read(fh, length, offset)
+        result = b""
+        index, start = divmod(offset, self.SECTOR_SIZE)
+        while len(result) < length:
+            sector = self._read_sector(fh, index)
+            if len(sector) <= start:
+                return False
+            result += sector[start:]
+            start = 0
+            index += 1
+        return result[:length]
+
+    def truncate(self, fh: Any, size: int) -> None:
+        if not fh.encode:
+            return super().truncate(fh, size)
+        index, tail = divmod(size, self.SECTOR_SIZE)
+        if tail:
+            self._write_sector(fh, index, self._read_sector(fh, index)[:tail])
+            index += 1
+        os.ftruncate(fh.fd, index * self.SLOT_SIZE)
+
+    def file_size(self, fh: Any) -> int:
+        if not fh.encode:
+            return super().file_size(fh)
+        count = os.fstat(fh.fd).st_size // self.SLOT_SIZE
+        if not count:
+            return 0
+        return (count - 1) * self.SECTOR_SIZE + len(self._read_sector(fh, count - 1))
@@ -1,9 +1,12 @@
 # https://www.python.org/dev/peps/pep-0249/
 import datetime
+import os
 import time
 import collections.abc
+import urllib.parse
 
 from _bmnsqlite3 import *
+from _bmnsqlite3 import connect as _connect
 
 # String constant stating the supported DB API level.
 apilevel = "2.0"
@@ -112,3 +115,32 @@ def _register_adapters_and_converters() -> None:
 
 _register_adapters_and_converters()
 del _register_adapters_and_converters
+
+
+# uri is the 7th argument after database
+_URI_ARG_INDEX = 6
+
+
+def connect(database, *args, vfs: str = None, **kwargs):
+    """
+    Same as sqlite3.connect() but *vfs* names the vfs registered by
+    vfs_register(..., name=vfs) to open the database with.
+    """
+    if vfs is None:
+        return _connect(database, *args, **kwargs)
+    uri = kwargs.get("uri", False)
+    if len(args) > _URI_ARG_INDEX:
+        uri = args[_URI_ARG_INDEX]
+    database = os.fspath(database)
+    if isinstance(database, bytes):
+        database = os.fsdecode(database)
+    if uri:
+        database += "&" if "?" in database else "?"
+    else:
+        database = "file:" + urllib.parse.quote(database) + "?"
+    database += "vfs=" + urllib.parse.quote(vfs)
+    if len(args) > _URI_ARG_INDEX:
+        args = args[:_URI_ARG_INDEX] + (True,) + args[_URI_ARG_INDEX + 1:]
+    else:
+        kwargs["uri"] = True
+    return _connect(database, *args, **kwargs)
@@ -1,34 +1,167 @@
 import abc
-from typing import Any, Optional, Callable, Union, Tuple
+from typing import Any, Optional, Callable, Union, Tuple, List
 
 """
 API description:
 
-Module has two methods:
-
-- **vfs_register**(wrapper: object, make_default : Bool = True) - register class instance as a wrapper
-    for some sqlite operations.
+Module has functions to register wrappers, vfs_register and vfs_find, to read their
+counters, vfs_cache_stats, vfs_sync_stats, vfs_memory_stats, vfs_stats and vfs_latency,
+to record I/O events, vfs_trace and vfs_trace_drain with VFS_TRACE_FORMAT and
+VFS_TRACE_OPS constants, and vfs_invalidate. connect(..., vfs=name) chooses a named
+wrapper. null_codec and callback_overhead are described in 'Overhead API' down below,
+wrapper interfaces and ready MemoryVfsWrapper and NullVfsWrapper after them:
+
+- **vfs_register**(wrapper: object, make_default : bool = True, zero_copy_write : Optional[bool] = None,
+    page_cache_size : Optional[int] = None, read_ahead : Optional[int] = None,
+    plain_files : Optional[int] = None, name : Optional[str] = None,
+    memory_store : Optional[bool] = None, durability : Optional[str] = None,
+    sync_interval : Optional[int] = None, side_file : Optional[bool] = None) -
+    register class instance as a wrapper for some sqlite operations.
     Description of the wrapper class is down below.
     There are two approaches to implement it.
     Use None as argument to remove (unregister) wrapper.
+    Wrapper methods are looked up once here. Optional methods which are missed or inherited
+    from interfaces down below are never called. So register the wrapper again
+    after replacing its methods: registering the same wrapper looks up its methods and
+    'codec' again, open connections use them at once. Changing 'codec', having 'lock' or not
+    and 'memory_store' need all connections of the name closed first.
     
     Args:
         wrapper (object): Class instance used as a wrapper for FVS operations. Can be inherited from IVfsWrapper for 
         facilitation (look down below). 
-        Use None to unregister current wrapper. make_default means nothing in that case.
-        make_default (bool):  Use wrapper as a default. Setting this to False in current implementation has no sense.
+        Use None to unregister the wrapper of *name*. make_default means nothing in that case.
+        make_default (bool): Use wrapper as a default. Otherwise only connections asking for *name*
+        by connect(..., vfs=name) or 'file:...?vfs=name' URI use it.
+        zero_copy_write (Optional[bool]): Pass read-only memoryview over sqlite buffer to 'write', 'writev' and 'encode'
+        instead of bytes copy. None means value of wrapper's 'zero_copy_write' attribute.
+        page_cache_size (Optional[int]): Size in bytes of decoded pages cache shared by all connections.
+        0 disables it. None means value of wrapper's 'page_cache_size' attribute.
+        read_ahead (Optional[int]): Number of pages fetched by one synchronous 'readv' call when
+        DB is read sequentially, 0..1024. 0 disables it. None means value of wrapper's
+        'read_ahead' attribute.
+        plain_files (Optional[int]): Mask of SQLITE_OPEN_* file types which the wrapper
+        doesn't transform. None means value of wrapper's 'plain_files' attribute.
+        name (Optional[str]): sqlite VFS name, 'bmn_vfs' if None. Up to 16 names with own wrappers,
+        caches and options can be registered at once.
+        memory_store (Optional[bool]): Keep files which the wrapper doesn't handle in native
+        memory store of the process instead of the default VFS. None means value of
+        wrapper's 'memory_store' attribute.
+        durability (Optional[str]): Sync policy: 'normal', 'full', 'group' or 'interval'.
+        None means value of wrapper's 'durability' attribute.
+        sync_interval (Optional[int]): Merge window of 'group' or period of 'interval' in
+        milliseconds, 0..3600000. None means value of wrapper's 'sync_interval' attribute.
+        side_file (Optional[bool]): Keep locks and WAL-index of main DB opened by full wrapper
+        in '<path>-bmn' file, see 'Side files' down below. None means value of wrapper's
+        'side_file' attribute.
 
     Returns:
         None
 
-- **vfs_find**(vfs_name : Optional[str] = None) - retrieve currently used wrapper or
+- **vfs_find**(vfs_name : Optional[str] = None) - retrieve wrapper registered with the name or
     None if no wrapper is registered.
 
     Args:
-        vfs_name (Optional[str]): Reserved for future use.
+        vfs_name (Optional[str]): VFS name. None means the default VFS.
+
+    Returns:
+        Find registered wrapper instance or None 
+
+- **vfs_cache_stats**(vfs_name : Optional[str] = None) - counters of decoded pages cache of the named
+    VFS ( the default one if None ).
+
+    Returns:
+        Optional[dict]: 'hits', 'misses', 'evictions', 'waits', 'pages', 'size' and 'max_size'
+        or None if no wrapper is registered. 'waits' counts reads which waited for the same
+        page being read by another connection instead of reading it once more
+
+- **vfs_sync_stats**(vfs_name : Optional[str] = None) - sync policy of the named VFS
+    ( the default one if None ) and its counters.
+
+    Returns:
+        Optional[dict]: 'durability', 'sync_interval', 'requested', 'performed' and 'deferred'
+        or None if no wrapper is registered. 'requested' counts syncs asked by sqlite,
+        'performed' counts syncs passed to the wrapper or the default VFS including
+        deferred ones done later, 'deferred' counts syncs merged into later ones
+
+- **vfs_memory_stats**(vfs_name : Optional[str] = None) - memory use of the memory store of the
+    named VFS ( the default one if None ).
+
+    Returns:
+        Optional[dict]: 'files', 'size' and 'allocated' ( bytes ) or None if the VFS isn't
+        registered with memory_store
+
+- **vfs_stats**(vfs_name : Optional[str] = None) - I/O counters of the named VFS
+    ( the default one if None ) since it was registered and of its open files.
+    They're always collected.
+
+    Returns:
+        Optional[dict]: 'calls', 'errors' and 'time' ( seconds ) are dicts by callback name:
+        'open', 'close', 'read', 'write', 'truncate', 'sync', 'file_size', 'lock', 'unlock',
+        'check_reserved_lock', 'file_control', 'sector_size', 'device_characteristics',
+        'delete', 'access' and 'full_pathname', only called ones are there.
+        'bytes_read', 'bytes_written', 'short_reads', 'wrapper_time' and 'root_time' ( seconds )
+        are totals. Time of calls passed to the wrapper, including I/O it does with raw
+        callbacks, is 'wrapper_time', time of calls passed to the default VFS is 'root_time'.
+        'files' is a list of the same dicts for open files with their 'name' and
+        SQLITE_OPEN_* 'flags', file calls only. None if no wrapper is registered.
+        Short reads, busy locks and unknown file controls aren't errors
+
+- **vfs_latency**(vfs_name : Optional[str] = None, reset : bool = False) - latency
+    percentiles of callbacks of the named VFS ( the default one if None ), counted at the
+    same calls as 'vfs_stats'. Latencies are kept in log-linear buckets, so percentiles are
+    within 12.5% of real ones. If reset is True the buckets are emptied after reading.
 
     Returns:
-        Find currently registered wrapper instance or None 
+        Optional[dict]: dicts with 'count', 'p50', 'p90', 'p99' and 'max' ( seconds ) by
+        callback name, only called ones are there. None if no wrapper is registered
+
+- **vfs_trace**(vfs_name : Optional[str] = None, capacity : int = 65536) - starts recording
+    I/O events of the named VFS ( the default one if None ) in a new ring of 'capacity'
+    events, the oldest ones are overwritten when it's full. 0 capacity stops recording.
+    Events are recorded at the same calls as 'vfs_stats'.
+
+    Returns:
+        bool: False if no wrapper is registered
+
+- **vfs_trace_drain**(vfs_name : Optional[str] = None) - events recorded by the named VFS
+    ( the default one if None ) since the previous drain, the ring is empty then.
+
+    Returns:
+        Optional[bytes]: events of 56 bytes each, they're read by
+        struct.iter_unpack(bmnsqlite3.VFS_TRACE_FORMAT, data) as tuples of
+        ( sequence number, start time, duration, file id, offset, length, flags, result code,
+        operation ). Times are nanoseconds of monotonic clock. Gaps of sequence numbers are
+        overwritten events. File id is given at 'open' and is 0 for other VFS calls, flags
+        are SQLITE_OPEN_* flags of the file. Offset is -1 for calls other than 'read',
+        'write' and 'truncate' ( new size ). Length is size of 'read' and 'write', flags of
+        'sync', 'open', 'access' and 'delete' ( syncDir ), level of 'lock' and 'unlock' and
+        op. of 'file_control'. Operation is index of its name in bmnsqlite3.VFS_TRACE_OPS.
+        None if no wrapper is registered
+
+- **vfs_invalidate**(vfs_name : Optional[str] = None) - open files of the named VFS
+    ( the default one if None ) ask 'file_size', 'sector_size' and 'device_characteristics'
+    of the wrapper again. Full wrappers are asked for them once per file, the size is then
+    kept by bmnsqlite3 and asked again only when the change counter in main DB header or
+    WAL checkpoint state in wal-index shows changes by other connections. Call it when
+    storage of the wrapper is changed not through sqlite.
+
+    Returns:
+        bool: False if no wrapper is registered with the name
+
+Side files: main DB opened by a full wrapper with 'side_file' gets empty '<path>-bmn' file
+next to it, opened by the default VFS. Its locks serve the DB, so connections of all
+processes lock each other, and its shared memory '<path>-bmn-shm' makes
+'PRAGMA journal_mode=WAL' work. Without 'side_file' there are no such files: connections
+don't lock each other unless the wrapper has 'lock' method, and WAL is refused unless
+'PRAGMA locking_mode=EXCLUSIVE'. '<path>-bmn-shm' is removed by the last connection
+closing WAL. '<path>-bmn' stays: it must exist while any process uses the DB, remove it
+when the DB is removed. Both are removed when the DB is deleted through the VFS.
+
+Main DB opened natively ( by a partial wrapper, as plain file or in memory store ) can be
+a copy-on-write clone of a read-only base DB: 'file:clone.db?overlay=base.db' URI.
+The clone file keeps only changed pages appended to it and is created empty if missing,
+the base file is never written. Clones don't support WAL mode, full wrappers refuse
+to open them.
 """
 
 """
@@ -49,6 +182,26 @@ https://vstinner.github.io/sys-unraisablehook-python38.html
 Also pay attention that behavior of sys.unraisablehook in python3.7.x differs: just printing to stderr used.
 """
 
+"""
+Overhead API
+
+- **null_codec**() - returns native codec capsule passing data as is, see NullVfsWrapper
+
+- **callback_overhead**(wrapper: Any, method: str = "write", iterations: int = 100000,
+    size: int = 4096) - measures fixed costs of a 'write' callback. Every part of it is
+    repeated 'iterations' times apart from the others: 'gil' ( PyGILState_Ensure/Release
+    without GIL as sqlite calls the VFS ), 'lookup' ( getattr of the method, which the
+    dispatch table of vfs_register saves ), 'arguments' ( bytes of 'size' and offset ),
+    'call' ( the method itself called with None, data and offset ), 'result' ( validation
+    of the result and copy of read data ) and 'total' ( the whole callback ).
+    Pass a method doing nothing to get the floor of one page I/O, the difference with
+    the real method is its own work.
+
+    Returns:
+        dict: seconds per call by part name
+
+"""
+
 """
 Debugging API
 
@@ -58,6 +211,8 @@ ANy of these items can be removed in future
 
 - **connections_count**() - returns opened connection count of currently used VFS. Only BMN VFS supported
 
+- **xor_codec**(key: int) - returns primitive native codec capsule to test 'codec' method
+
 - When exception raised in wrapper's method wrapper attribute by name **exception_location** contains 
     method name where exception raised. This information is neccesary for unit testing.
 
@@ -69,6 +224,81 @@ ANy of these items can be removed in future
 
 class IVfsWrapper(abc.ABC):
 
+    """
+    Set it to True to get read-only memoryview instead of bytes
+    in 'write' and 'writev' ( full wrapper ) or 'encode' ( partial wrapper ) methods.
+    It saves a copy of every written page, but the view is valid only during
+    the call: don't keep any references to it. Use bytes(data) to keep the data.
+    Argument 'zero_copy_write' of vfs_register overrides this value.
+    """
+    zero_copy_write: bool = False
+
+    """
+    Size in bytes of cache for decoded pages of main DB files.
+    Cached pages are read without any wrapper calls, so it helps when 'read'
+    or 'decode' is expensive and connections are short-lived. The cache is
+    shared by all connections of the process and keyed by the full path name
+    ( see 'full_pathname' ), so each page is read once even by concurrent
+    connections. Pages are
+    dropped on writes through this module. The first page is always read
+    to notice changes made outside, but in WAL mode the database must not be
+    written by other processes while cache is on.
+    Argument 'page_cache_size' of vfs_register overrides this value.
+    """
+    page_cache_size: int = 0
+
+    """
+    Mask of file types ( SQLITE_OPEN_MAIN_DB 0x100, SQLITE_OPEN_TEMP_DB 0x200,
+    SQLITE_OPEN_MAIN_JOURNAL 0x800, SQLITE_OPEN_WAL 0x80000 ... ) which the
+    wrapper doesn't transform. The wrapper isn't called for such files:
+    they are opened, read, written, checked and deleted by the default VFS,
+    and 'PRAGMA mmap_size' maps them into memory. Pages of other files are
+    never mapped. It keeps journals and temporary files of big sorts at
+    native speed, e.g. plain_files = 0x80000 | 0x800 | 0x200 | 0x1000 | 0x2000 | 0x400
+    passes all files except main DB.
+    See: https://www.sqlite.org/c3ref/c_open_autoproxy.html
+    Argument 'plain_files' of vfs_register overrides this value.
+    """
+    plain_files: int = 0
+
+    """
+    Set it to True to keep files which the wrapper doesn't handle ( plain files,
+    files of partial wrapper ) in native memory of the process instead of the
+    default VFS. Files are found by full path name, so all connections of the process
+    share them with the usual locking. They stay until deleted or until the wrapper
+    is unregistered. Use MemoryVfsWrapper for databases kept entirely in memory.
+    Argument 'memory_store' of vfs_register overrides this value.
+    """
+    memory_store: bool = False
+
+    """
+    Sync policy of files opened by the wrapper:
+    'normal' - every sync is performed as sqlite asks;
+    'full' - every sync is performed with SQLITE_SYNC_FULL;
+    'group' - commit syncs of WAL file are merged while other connections of the process
+    have the WAL opened: a committing connection releases the WAL write lock and waits
+    up to 'sync_interval' after the first deferred commit, commits of others meanwhile
+    join it, then one sync is performed for all of them. Commits return synced, they
+    only wait longer. Main DB of full wrapper needs 'side_file' for it, otherwise syncs
+    are performed as 'normal';
+    'interval' - commit syncs of WAL file are performed once per 'sync_interval':
+    commits return at once, a native thread syncs the WAL at the end of the interval,
+    so commits of the last 'sync_interval' can be lost on power failure.
+    Deferred syncs are also performed before checkpoint and when WAL is closed, so the DB
+    stays consistent. Only WAL files with PRAGMA synchronous=FULL are affected, other
+    files need every sync. Full wrapper's 'sync' of any handle must make all written
+    data of the file durable then, it can be called from another thread.
+    Argument 'durability' of vfs_register overrides this value.
+    """
+    durability: str = "normal"
+
+    """
+    Merge window of 'group' or period of 'interval' durability in milliseconds.
+    None means 2 for 'group' and 1000 for 'interval'.
+    Argument 'sync_interval' of vfs_register overrides this value.
+    """
+    sync_interval: Optional[int] = None
+
     def full_pathname(self, name: str, out: int) -> Optional[str]:
         """
         Method should return full pathname to file 'name'.
@@ -110,6 +340,20 @@ class IVfsWrapper(abc.ABC):
             Optional[int]: returns, as an integer, the Julian Day Number multiplied by 86400000 (the number of milliseconds in a 24-hour day) or None to choose default behaviour
         """
 
+    def codec(self) -> Optional[Any]:
+        """
+        Optional method called by every vfs_register of the wrapper.
+        It returns PyCapsule named "bmnsqlite3.codec" with pointer to BmnCodec
+        structure (see src/codec.h) or None.
+        Native codec transforms every page in C without GIL in both wrapper types,
+        'encode' and 'decode' methods of partial wrapper are not called at all then.
+        Full wrapper gets already encoded data in 'write'.
+        Transform must keep the size and depend on file offset only.
+
+        Returns:
+            Optional[Any]: Codec capsule or None to choose default behaviour
+        """
+
     def delete(self, path: str, sync_dir: bool) -> None:
         """
         It is optional method, but it is crusial for right functioning.
@@ -124,11 +368,41 @@ class IVfsWrapper(abc.ABC):
 
 class IFullVfsWrapper(IVfsWrapper):
 
+    """
+    Number of pages requested by 'readv' when main DB file is read
+    page by page sequentially ( full table scans ). Following reads of these
+    pages don't call the wrapper. Used only if 'readv' is implemented.
+    'readv' is called synchronously by the reading thread, so it saves calls
+    and GIL round trips, but decoding isn't overlapped with I/O: do it
+    in other threads inside 'readv' if it's needed. Fetched pages are dropped
+    when other connections could change the file: at new transactions, locks
+    of wal-index ( WAL checkpoints ), writes and truncates.
+    Argument 'read_ahead' of vfs_register overrides this value.
+    """
+    read_ahead: int = 16
+
+    """
+    Set it to True to keep locks and WAL-index of main DB in '<path>-bmn' file
+    of the default VFS ( see 'Side files' above ). It's needed by WAL mode and
+    by connections of several processes when 'lock' isn't implemented.
+    Argument 'side_file' of vfs_register overrides this value.
+    """
+    side_file: bool = False
+
     @abc.abstractmethod
     def open(self, path: str, flags: int) -> Union[Any, Tuple[Any, int]]:
         """ The key method in wrapper. The file can be not only DB file.
          There are many file types: main database,
          temporary database, journal and wall files.
+         Types listed in 'plain_files' are opened natively, without the wrapper.
+
+        With 'side_file' locks and WAL-index of main DB are kept in the side file
+        '<path>-bmn' ( and '<path>-bmn-shm' ) opened by the default VFS,
+        so concurrent connections and processes lock each other as usual and
+        'PRAGMA journal_mode=WAL' works. Locks are taken by 'lock' and
+        'unlock' methods instead if they are implemented. The path must be a file system
+        location for that, otherwise DB is opened without locks and WAL
+        isn't available. '<path>-bmn' itself stays empty.
 
         Important remark: if this method not implemented in wrapper,
             then bmnsqlite3 treats this wrapper as partial so it must implement
@@ -186,10 +460,52 @@ class IFullVfsWrapper(IVfsWrapper):
 
         Args:
             fh (Any): Value returned from 'open' method
-            data (bytearray): Data which this method should write
+            data (bytearray): Data which this method should write.
+                It's read-only memoryview if 'zero_copy_write' is set
             offset (int): Offset to place data
         """
 
+    def writev(self, fh: Any, chunks: List[Tuple[int, bytearray]]) -> None:
+        """
+        Optional batched alternative to 'write'.
+        If it is implemented then writes are collected by bmnsqlite3
+        and passed here at once on sync, unlock, close, truncate or read
+        of the collected data, and when they exceed 1 MiB.
+        Adjacent pages are joined into one chunk, so encoding must not
+        depend on boundaries of writes.
+        Chunks don't overlap and must be written in the given order.
+        It's called for all files except WAL.
+
+        Args:
+            fh (Any): Value returned from 'open' method
+            chunks (List[Tuple[int, bytearray]]): (offset, data) pairs.
+                Data are read-only memoryviews if 'zero_copy_write' is set,
+                they're valid only during this call
+        """
+        for offset, data in chunks:
+            self.write(fh, data, offset)
+
+    def commit_atomic(self, fh: Any, chunks: List[Tuple[int, bytearray]]) -> None:
+        """
+        Optional method to commit a whole transaction of main DB at once.
+        If it is implemented then sqlite doesn't write the rollback journal:
+        all pages of the transaction are collected by bmnsqlite3 and
+        passed here in one call instead of 'write' and 'sync'.
+        The wrapper must apply all chunks or none of them and make them
+        durable before returning. Raise an exception if nothing was
+        applied, sqlite commits the same pages with the journal then.
+        Chunks must be applied in the given order.
+        Transactions of WAL mode and ones bigger than 64 MiB are
+        always journaled.
+
+        Args:
+            fh (Any): Value returned from 'open' method
+            chunks (List[Tuple[int, bytearray]]): (offset, data) pairs.
+                Data are read-only memoryviews if 'zero_copy_write' is set,
+                they're valid only during this call
+        """
+        raise NotImplementedError
+
     @abc.abstractmethod
     def read(self, fh: Any, length: int, offset: int) -> Union[bytearray, bool]:
         """
@@ -208,6 +524,45 @@ class IFullVfsWrapper(IVfsWrapper):
                 Any another results are treated as errors
         """
 
+    def readv(self, fh: Any, chunks: List[Tuple[int, int]]) -> List[Union[bytearray, bool]]:
+        """
+        Optional batched alternative to 'read' used for read-ahead.
+        Every chunk is one page, so it's the same as 'read' called
+        for each of them.
+
+        Args:
+            fh (Any): Value returned from 'open' method
+            chunks (List[Tuple[int, int]]): (offset, length) pairs of
+                adjacent pages
+
+        Returns:
+            List[Union[bytearray, bool]]: data of the pages like 'read' returns.
+                The list can be shorter than 'chunks'. Reading stops
+                at the first short result or False
+        """
+        return [self.read(fh, length, offset) for offset, length in chunks]
+
+    def readinto(self, fh: Any, buffer: memoryview, offset: int) -> int:
+        """
+        Optional zero-copy alternative to 'read'.
+        If it is implemented then 'read' isn't called at all.
+        'buffer' is a writable memoryview over the sqlite page buffer, so
+        there's no allocation and no extra copy of the data.
+        The view is valid only during this call. Don't keep any references
+        to it (or to slices of it) after returning.
+
+        Args:
+            fh (Any): Value returned from 'open' method
+            buffer (memoryview): Writable buffer to fill. Its length is
+                the number of bytes requested
+            offset (int): Offset to read from
+
+        Returns:
+            int: Number of bytes written into 'buffer'. Anything less than
+                len(buffer) means short read, the rest is filled with zeros
+        """
+        raise NotImplementedError
+
     @abc.abstractmethod
     def truncate(self, fh: Any, size: int) -> None:
         """
@@ -221,7 +576,10 @@ class IFullVfsWrapper(IVfsWrapper):
     @abc.abstractmethod
     def file_size(self, fh: Any) -> int:
         """
-        Returns file size
+        Returns file size.
+        It's called once per file and after commits or checkpoints of
+        other connections, otherwise the size is kept by bmnsqlite3
+        ( see vfs_invalidate ). WAL size isn't kept.
 
         Args:
             fh (Any): File handle
@@ -273,6 +631,48 @@ class IFullVfsWrapper(IVfsWrapper):
             [type]:
         """
 
+    def lock(self, fh: Any, level: int) -> bool:
+        """
+        Optional method to take database locks instead of the side file
+        ( see 'side_file' ).
+        It's called for main DB files only. Level never decreases here:
+        SQLITE_LOCK_SHARED (1), SQLITE_LOCK_RESERVED (2),
+        SQLITE_LOCK_PENDING (3) or SQLITE_LOCK_EXCLUSIVE (4).
+        See: https://www.sqlite.org/lockingv3.html
+        Exceptions are errors, so the lock must be refused by result.
+
+        Args:
+            fh (Any): Value returned from 'open' method
+            level (int): Lock to take
+
+        Returns:
+            bool: False if the lock is held by others, sqlite retries it
+                with busy handler then
+        """
+
+    def unlock(self, fh: Any, level: int) -> None:
+        """
+        Optional method to release database locks taken by 'lock'.
+        It's called only if 'lock' is implemented.
+
+        Args:
+            fh (Any): Value returned from 'open' method
+            level (int): Lock to keep: SQLITE_LOCK_SHARED (1) or
+                SQLITE_LOCK_NONE (0)
+        """
+
+    def check_reserved_lock(self, fh: Any) -> bool:
+        """
+        Optional method called only if 'lock' is implemented.
+
+        Args:
+            fh (Any): Value returned from 'open' method
+
+        Returns:
+            bool: True if any connection holds RESERVED or higher lock
+                on the file. False when it isn't implemented
+        """
+
     def file_control(self, fh: Any, operation: int, argument: Any) -> bool:
         """
         Optional method to handle some sqlite operations
@@ -308,7 +708,8 @@ class IPartialVfsWrapper(IVfsWrapper):
         Args:
             file_flags (int): Flags of file used here
             callback (Callable[[ bytes, int], int]): Target function
-            data (bytes): Source data
+            data (bytes): Source data. It's read-only memoryview
+                if 'zero_copy_write' is set. 'callback' accepts any bytes-like data
             offset (int): Offset in data
         """
 
@@ -332,3 +733,30 @@ class IPartialVfsWrapper(IVfsWrapper):
         Returns:
             Union[bytes, bool]: Result bytes or False if reading isn't available
         """
+
+
+class MemoryVfsWrapper:
+    """ Wrapper without python callbacks which keeps all files in native memory.
+    Named in-memory databases are shared by connections of the process:
+
+        bmnsqlite3.vfs_register(MemoryVfsWrapper(), name="mem", make_default=False)
+        con = bmnsqlite3.connect("cache.db", vfs="mem")
+    """
+    memory_store = True
+    # all file types
+    plain_files = 0x100 | 0x200 | 0x400 | 0x800 | 0x1000 | 0x2000 | 0x4000 | \
+        0x80000
+
+
+class NullVfsWrapper:
+    """ Wrapper without python callbacks which passes pages as is by native codec.
+    Every call still goes through bmnsqlite3 VFS, so it shows the least cost of
+    any wrapper: compare it with the default VFS and with python wrappers.
+
+        bmnsqlite3.vfs_register(NullVfsWrapper(), name="null", make_default=False)
+        con = bmnsqlite3.connect("test.db", vfs="null")
+    """
+
+    def codec(self) -> Any:
+        from _bmnsqlite3 import null_codec
+        return null_codec()
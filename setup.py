@@ -58,7 +58,8 @@ def create_extension() -> setuptools.Extension:
         ("MODULE_VERSION", quote + PACKAGE_VERSION + quote),
 
         # https://www.sqlite.org/compile.html
-        ("SQLITE_OMIT_LOAD_EXTENSION", "1")
+        ("SQLITE_OMIT_LOAD_EXTENSION", "1"),
+        ("SQLITE_ENABLE_BATCH_ATOMIC_WRITE", "1"),
     ]
 
     undef_macros_list = []
@@ -202,6 +202,243 @@ static int checkFileHandlerObject(PyObject* pHost, PyObject* pObject)
     return 0;
 }
 
+/*
+ dispatch table
+*/
+static const char* const zMethodNames[BMN_METHOD_COUNT] = {
+        "read",
+        "readinto",
+        "write",
+        "truncate",
+        "file_size",
+        "sync",
+        "sector_size",
+        "device_characteristics",
+        "file_control",
+        "encode",
+        "decode",
+        "writev",
+        "readv",
+        "lock",
+        "unlock",
+        "check_reserved_lock",
+        "commit_atomic"};
+
+/*
+ methods sqlite can live without
+ when they're missed or inherited from interfaces in bmnsqlite3.vfs
+ then flag is set at once and python isn't called at all
+*/
+typedef struct OptionalMethod OptionalMethod;
+struct OptionalMethod
+{
+    const char* zName;
+    int iFlag;
+};
+static const OptionalMethod optionalMethods[] = {
+        {"open", BMN_NO_CALLBACK_OPEN},
+        {"access", BMN_NO_CALLBACK_ACCESS},
+        {"delete", BMN_NO_CALLBACK_DELETE},
+        {"random", BMN_NO_CALLBACK_RANDOM},
+        {"full_pathname", BMN_NO_CALLBACK_FULL_PATHNAME},
+        {"readinto", BMN_NO_CALLBACK_READINTO},
+        {"sync", BMN_NO_CALLBACK_SYNC},
+        {"sector_size", BMN_NO_CALLBACK_SECTOR_SIZE},
+        {"device_characteristics", BMN_NO_CALLBACK_DEVICE_CHARACTERISTICS},
+        {"file_control", BMN_NO_CALLBACK_FILE_CONTROL},
+        {"writev", BMN_NO_CALLBACK_WRITEV},
+        {"readv", BMN_NO_CALLBACK_READV},
+        {"lock", BMN_NO_CALLBACK_LOCK},
+        {"unlock", BMN_NO_CALLBACK_UNLOCK},
+        {"check_reserved_lock", BMN_NO_CALLBACK_CHECK_RESERVED_LOCK},
+        {"commit_atomic", BMN_NO_CALLBACK_COMMIT_ATOMIC},
+        {NULL, 0}};
+
+/*
+ 1 if 'zName' of the wrapper is default implementation from interfaces
+ ( IVfsWrapper, IFullVfsWrapper ... ) which does nothing
+*/
+static int isInterfaceMethod(
+        PyObject* pInterfaces,
+        PyObject* pMethod,
+        const char* zName)
+{
+    Py_ssize_t i;
+    PyObject* pFunc;
+    PyTypeObject* pType;
+
+    if(!pInterfaces || !PyMethod_Check(pMethod))
+    {
+        return 0;
+    }
+    for(i = 0; i < PyTuple_GET_SIZE(pInterfaces); ++i)
+    {
+        pType = (PyTypeObject*)PyTuple_GET_ITEM(pInterfaces, i);
+        pFunc = PyDict_GetItemString(pType->tp_dict, zName);
+        if(pFunc && pFunc == PyMethod_GET_FUNCTION(pMethod))
+        {
+            return 1;
+        }
+    }
+    return 0;
+}
+
+/*
+ interface classes from python part of the package
+ returns NULL ( without exception ) if they aren't available
+*/
+static PyObject* getInterfaces()
+{
+    PyObject* pModule;
+    PyObject* pInterfaces;
+    PyObject* pType;
+    int i;
+    static const char* zInterfaces[] = {
+            "IVfsWrapper",
+            "IFullVfsWrapper",
+            "IPartialVfsWrapper"};
+
+    pModule = PyImport_ImportModule(MODULE_NAME ".vfs");
+    if(!pModule)
+    {
+        BMN_VERBOSE("No interfaces module");
+        PyErr_Clear();
+        return NULL;
+    }
+    pInterfaces = PyTuple_New(3);
+    for(i = 0; pInterfaces && i < 3; ++i)
+    {
+        pType = PyObject_GetAttrString(pModule, zInterfaces[i]);
+        if(!pType || !PyType_Check(pType))
+        {
+            Py_XDECREF(pType);
+            Py_CLEAR(pInterfaces);
+            break;
+        }
+        PyTuple_SET_ITEM(pInterfaces, i, pType);
+    }
+    Py_DECREF(pModule);
+    PyErr_Clear();
+    return pInterfaces;
+}
+
+/*
+ returns new reference or NULL if there is no such method
+*/
+static PyObject* lookupMethod(PyObject* pWrapper, const char* zName)
+{
+    PyObject* pMethod;
+
+    pMethod = PyObject_GetAttrString(pWrapper, zName);
+    if(!pMethod)
+    {
+        if(PyErr_ExceptionMatches(PyExc_AttributeError))
+        {
+            PyErr_Clear();
+        }
+        else
+        {
+            saveLocation(pWrapper, zName);
+            PyErr_WriteUnraisable(pWrapper);
+        }
+        return NULL;
+    }
+    if(!PyCallable_Check(pMethod))
+    {
+        Py_DECREF(pMethod);
+        return NULL;
+    }
+    return pMethod;
+}
+
+extern int missingMethods(PyObject* pWrapper)
+{
+    int i;
+    int iFlags;
+    PyObject* pInterfaces;
+    PyObject* pMethod;
+
+    iFlags      = 0;
+    pInterfaces = getInterfaces();
+    for(i = 0; optionalMethods[i].zName; ++i)
+    {
+        pMethod = lookupMethod(pWrapper, optionalMethods[i].zName);
+        if(!pMethod ||
+           isInterfaceMethod(pInterfaces, pMethod, optionalMethods[i].zName))
+        {
+            BMN_VERBOSE("No method '%s'", optionalMethods[i].zName);
+            iFlags |= optionalMethods[i].iFlag;
+        }
+        Py_XDECREF(pMethod);
+    }
+    Py_XDECREF(pInterfaces);
+    return iFlags;
+}
+
+extern void initDispatchTable(BmnvfsInfo* pInfo)
+{
+    int i;
+
+    BMN_ASSERT(pInfo->pWrapper);
+    clearDispatchTable(pInfo);
+    pInfo->iFlags |= missingMethods(pInfo->pWrapper);
+    for(i = 0; i < BMN_METHOD_COUNT; ++i)
+    {
+        pInfo->pMethods[i] = lookupMethod(pInfo->pWrapper, zMethodNames[i]);
+    }
+}
+
+extern void clearDispatchTable(BmnvfsInfo* pInfo)
+{
+    int i;
+
+    for(i = 0; i < BMN_METHOD_COUNT; ++i)
+    {
+        Py_CLEAR(pInfo->pMethods[i]);
+    }
+}
+
+/*
+ calls method from the dispatch table
+ ppArgs[0] is reserved for vectorcall, arguments start from ppArgs[1]
+ raises AttributeError if the method isn't implemented
+ so result can be processed by BMN_CATCH_PY_EXCEPTION as usual
+*/
+static PyObject* callDispatchMethod(
+        BmnvfsInfo* pInfo,
+        int iMethod,
+        PyObject** ppArgs,
+        size_t nArgs)
+{
+    size_t i;
+    PyObject* pMethod;
+    PyObject* pResult;
+
+    pMethod = pInfo->pMethods[iMethod];
+    if(!pMethod)
+    {
+        PyErr_Format(
+                PyExc_AttributeError,
+                "'%s' object has no attribute '%s'",
+                getObjectTypename(pInfo->pWrapper),
+                zMethodNames[iMethod]);
+        return NULL;
+    }
+    for(i = 1; i <= nArgs; ++i)
+    {
+        if(!ppArgs[i])
+        {
+            // argument conversion failed. exception is already set
+            return NULL;
+        }
+    }
+    // vfs_register can replace the table while the method runs
+    Py_INCREF(pMethod);
+    pResult = BMN_VECTORCALL(pMethod, ppArgs + 1, nArgs);
+    Py_DECREF(pMethod);
+    return pResult;
+}
+
 extern int callOpenMethod(
         PyObject* pObject,
         BmnvfsFile* pFile,
@@ -578,122 +815,575 @@ extern int callDeleteMethod(PyObject* pObject, const char* zPath, int syncDir)
     return rc;
 }
 
-int callReadMethod(
-        BmnvfsInfo* vfsInfo,
-        BmnvfsFile* vfsFile,
-        char* buffer,
-        Py_ssize_t amount,
-        sqlite_int64 offset)
+/*
+ memoryview over sqlite buffer is valid only during the call
+ returns 1 and raises BufferError if the wrapper kept any reference to it
+*/
+static int releaseBufferView(
+        PyObject* pObject,
+        PyObject* pView,
+        const char* zMethodName)
 {
+    int iRetained;
+    PyObject* pResult;
+    PyMemoryViewObject* pMemView;
+    _Py_IDENTIFIER(release);
+
+    pMemView  = (PyMemoryViewObject*)pView;
+    iRetained = Py_REFCNT(pView) > 1 || pMemView->exports > 0 ||
+                pMemView->mbuf->exports > 1;
+    if(Py_REFCNT(pView) > 1)
+    {
+        // make the retained view unusable at least
+        pResult = _PyObject_CallMethodId(pView, &PyId_release, NULL);
+        if(pResult)
+        {
+            Py_DECREF(pResult);
+        }
+        else
+        {
+            PyErr_Clear();
+        }
+    }
+    if(iRetained)
+    {
+        saveLocation(pObject, zMethodName);
+        RAISE_ERROR(
+                PyExc_BufferError,
+                pObject,
+                "Method '%s' kept a reference to the sqlite buffer",
+                zMethodName);
+    }
+    return iRetained;
+}
+
+/*
+ zero-copy variant of 'read'
+ wrapper fills memoryview over sqlite buffer and returns number of bytes
+*/
+static int callReadIntoMethod(
+        PyObject* pObject,
+        BmnvfsFile* pFile,
+        char* zBuf,
+        Py_ssize_t iAmt,
+        sqlite_int64 iOfst)
+{
+    BMN_TRACE_MARK;
     int rc;
-    PyGILState_STATE gilState = PyGILState_Ensure();
+    PyObject* pView;
+    PyObject* pResult;
+    PyObject* ppArgs[4];
+    Py_ssize_t iResultLen;
 
-    PyObject* result = PyObject_CallMethod(
-            vfsInfo->pWrapper,
-            "read",
-            "OIL",
-            vfsFile->pFileWrapper,
-            amount,
-            offset);
-    if(result == NULL)
+    rc    = SQLITE_OK;
+    pView = PyMemoryView_FromMemory(zBuf, iAmt, PyBUF_WRITE);
+    if(!pView)
     {
-        rc = BMN_CATCH_PY_EXCEPTION(vfsInfo->pWrapper, "read");
-        PyGILState_Release(gilState);
-        if(rc != BMN_ATTRIBUTE_ERROR)
+        BMN_CATCH_PY_EXCEPTION(pObject, "readinto");
+        return BMN_CB_RESULT_HANDLER_LOGIC_ERROR;
+    }
+    ppArgs[1] = pFile->pFileWrapper;
+    ppArgs[2] = pView;
+    ppArgs[3] = PyLong_FromLongLong(iOfst);
+    pResult = callDispatchMethod(pFile->pInfo, BMN_METHOD_READINTO, ppArgs, 3);
+    Py_XDECREF(ppArgs[3]);
+    if(!pResult)
+    {
+        int ec;
+        ec = BMN_CATCH_PY_EXCEPTION(pObject, "readinto");
+        if(BMN_ATTRIBUTE_ERROR == ec)
         {
-            return BMN_CB_RESULT_HANDLER_LOGIC_ERROR;
+            rc = BMN_CB_RESULT_NO_HANDLER;
+        }
+        else if(ec)
+        {
+            rc = BMN_CB_RESULT_HANDLER_LOGIC_ERROR;
         }
-        return BMN_CB_RESULT_NO_HANDLER;
     }
+    if(releaseBufferView(pObject, pView, "readinto"))
+    {
+        rc = BMN_CB_RESULT_HANDLER_LOGIC_ERROR;
+    }
+    Py_DECREF(pView);
+    if(pResult)
+    {
+        if(SQLITE_OK != rc)
+        {
+            // buffer was kept by wrapper. result doesn't matter
+        }
+        else if(PyLong_Check(pResult) && !PyBool_Check(pResult))
+        {
+            iResultLen = PyLong_AsSsize_t(pResult);
+            if(iResultLen == iAmt)
+            {
+                rc = SQLITE_OK;
+            }
+            else if(iResultLen >= 0 && iResultLen < iAmt)
+            {
+                memset(zBuf + iResultLen, 0, iAmt - iResultLen);
+                rc = SQLITE_IOERR_SHORT_READ;
+            }
+            else
+            {
+                PyErr_Clear();
+                BMN_ERROR("Bad readinto result size:%zd", iResultLen);
+                RAISE_VALUE_ERROR(
+                        pObject,
+                        "readinto",
+                        "Method 'readinto' returned wrong number of bytes");
+                rc = BMN_CB_RESULT_UNEXPECTED_RETURNS;
+            }
+        }
+        else if(Py_None == pResult)
+        {
+            RAISE_NONE_RETURNED(pObject, "readinto");
+            rc = BMN_CB_RESULT_UNEXPECTED_RETURNS;
+        }
+        else
+        {
+            RAISE_WRONG_RETURN_TYPE(pObject, "readinto");
+            rc = BMN_CB_RESULT_UNEXPECTED_RETURNS;
+        }
+        Py_DECREF(pResult);
+        pResult = NULL;
+    }
+    return rc;
+}
 
-    if(result == Py_None)
+extern int callReadMethod(
+        BmnvfsInfo* pInfo,
+        BmnvfsFile* pFile,
+        char* zBuf,
+        Py_ssize_t iAmt,
+        sqlite_int64 iOfst)
+{
+    BMN_TRACE_MARK;
+    int rc;
+    PyGILState_STATE gilstate;
+    PyObject* pObject;
+    PyObject* pResult;
+    PyObject* ppArgs[4];
+    Py_ssize_t iResultLen;
+
+    BMN_ASSERT(pFile->pFileWrapper);
+    pObject  = pInfo->pWrapper;
+    gilstate = PyGILState_Ensure();
+    if(0 == (pInfo->iFlags & BMN_NO_CALLBACK_READINTO))
     {
-        memset(buffer, '\0', amount);
-        rc = SQLITE_IOERR_SHORT_READ;
+        rc = callReadIntoMethod(pObject, pFile, zBuf, iAmt, iOfst);
+        if(BMN_CB_RESULT_NO_HANDLER != rc)
+        {
+            PyGILState_Release(gilstate);
+            return rc;
+        }
+        pInfo->iFlags |= BMN_NO_CALLBACK_READINTO;
     }
-    else if(PyBytes_Check(result))
+
+    rc        = SQLITE_OK;
+    ppArgs[1] = pFile->pFileWrapper;
+    ppArgs[2] = PyLong_FromSsize_t(iAmt);
+    ppArgs[3] = PyLong_FromLongLong(iOfst);
+    pResult   = callDispatchMethod(pInfo, BMN_METHOD_READ, ppArgs, 3);
+    Py_XDECREF(ppArgs[2]);
+    Py_XDECREF(ppArgs[3]);
+    if(pResult)
     {
-        Py_ssize_t resultLength = PyBytes_Size(result);
-        if(resultLength == amount)
+        if(PyBytes_Check(pResult))
         {
-            memcpy(buffer, PyBytes_AsString(result), resultLength);
-            rc = SQLITE_OK;
+            iResultLen = PyBytes_GET_SIZE(pResult);
+            if(iResultLen == iAmt)
+            {
+                memcpy(zBuf, PyBytes_AS_STRING(pResult), iResultLen);
+                rc = SQLITE_OK;
+            }
+            else if(iResultLen < iAmt)
+            {
+                memcpy(zBuf, PyBytes_AS_STRING(pResult), iResultLen);
+                memset(zBuf + iResultLen, 0, iAmt - iResultLen);
+                rc = SQLITE_IOERR_SHORT_READ;
+            }
+            else
+            {
+                BMN_ERROR("Bad read result size:%zd", iResultLen);
+                RAISE_VALUE_ERROR(
+                        pObject,
+                        "read",
+                        "Method 'read' returned wrong number of bytes");
+                rc = BMN_CB_RESULT_UNEXPECTED_RETURNS;
+            }
         }
-        else if(resultLength < amount)
+        else if(PyBool_Check(pResult))
         {
-            memcpy(buffer, PyBytes_AsString(result), resultLength);
-            memset(buffer + resultLength, '\0', amount - resultLength);
+            // there are no enough bytes to read
+            memset(zBuf, 0, iAmt);
             rc = SQLITE_IOERR_SHORT_READ;
         }
+        else if(Py_None == pResult)
+        {
+            RAISE_NONE_RETURNED(pObject, "read");
+            rc = BMN_CB_RESULT_UNEXPECTED_RETURNS;
+        }
         else
         {
-            BMN_ERROR("Bad read result size: %d", resultLength);
-            RAISE_VALUE_ERROR(
-                    vfsInfo->pWrapper,
-                    "read",
-                    "Method 'read' returned wrong number of bytes");
+            RAISE_WRONG_RETURN_TYPE(pObject, "read");
             rc = BMN_CB_RESULT_UNEXPECTED_RETURNS;
         }
+        Py_DECREF(pResult);
+        pResult = NULL;
     }
     else
     {
-        RAISE_WRONG_RETURN_TYPE(vfsInfo->pWrapper, "read")
-        rc = BMN_CB_RESULT_UNEXPECTED_RETURNS;
+        int ec;
+        ec = BMN_CATCH_PY_EXCEPTION(pObject, "read");
+        if(BMN_ATTRIBUTE_ERROR == ec)
+        {
+            rc = BMN_CB_RESULT_NO_HANDLER;
+        }
+        else if(ec)
+        {
+            rc = BMN_CB_RESULT_HANDLER_LOGIC_ERROR;
+        }
     }
+    PyGILState_Release(gilstate);
+    return rc;
+}
+
+/*
+ reads nPages pages of iAmt bytes from iOfst by one call
+ returns number of complete pages placed to zBuf, the rest is past the end
+*/
+extern int callReadvMethod(
+        BmnvfsInfo* pInfo,
+        BmnvfsFile* pFile,
+        char* zBuf,
+        int iAmt,
+        sqlite3_int64 iOfst,
+        int nPages)
+{
+    BMN_TRACE_MARK;
+    int rc;
+    int i;
+    PyGILState_STATE gilstate;
+    PyObject* pObject;
+    PyObject* pList;
+    PyObject* pItem;
+    PyObject* pResult;
+    PyObject* ppArgs[3];
+    Py_ssize_t nItems;
+    Py_ssize_t iResultLen;
 
-    Py_DECREF(result);
-    PyGILState_Release(gilState);
+    BMN_ASSERT(pFile->pFileWrapper);
+    pObject  = pInfo->pWrapper;
+    gilstate = PyGILState_Ensure();
+    pList    = PyList_New(nPages);
+    for(i = 0; pList && i < nPages; ++i)
+    {
+        pItem = Py_BuildValue("(Li)", iOfst + (sqlite3_int64)i * iAmt, iAmt);
+        if(!pItem)
+        {
+            Py_CLEAR(pList);
+            break;
+        }
+        PyList_SET_ITEM(pList, i, pItem);
+    }
+    rc        = 0;
+    ppArgs[1] = pFile->pFileWrapper;
+    ppArgs[2] = pList;
+    pResult   = callDispatchMethod(pInfo, BMN_METHOD_READV, ppArgs, 2);
+    Py_XDECREF(pList);
+    if(pResult)
+    {
+        nItems = 0;
+        if(PyList_Check(pResult) || PyTuple_Check(pResult))
+        {
+            nItems = PySequence_Fast_GET_SIZE(pResult);
+        }
+        if(Py_None == pResult)
+        {
+            RAISE_NONE_RETURNED(pObject, "readv");
+            rc = BMN_CB_RESULT_UNEXPECTED_RETURNS;
+        }
+        else if(!PyList_Check(pResult) && !PyTuple_Check(pResult))
+        {
+            RAISE_WRONG_RETURN_TYPE(pObject, "readv");
+            rc = BMN_CB_RESULT_UNEXPECTED_RETURNS;
+        }
+        else if(nItems > nPages)
+        {
+            RAISE_VALUE_ERROR(
+                    pObject,
+                    "readv",
+                    "Method 'readv' returned wrong number of items");
+            rc = BMN_CB_RESULT_UNEXPECTED_RETURNS;
+        }
+        // short page or False ends the data like in 'read'
+        for(i = 0; 0 <= rc && i < nItems; ++i)
+        {
+            pItem = PySequence_Fast_GET_ITEM(pResult, i);
+            if(PyBool_Check(pItem))
+            {
+                break;
+            }
+            if(!PyBytes_Check(pItem))
+            {
+                RAISE_WRONG_RETURN_TYPE(pObject, "readv");
+                rc = BMN_CB_RESULT_UNEXPECTED_RETURNS;
+                break;
+            }
+            iResultLen = PyBytes_GET_SIZE(pItem);
+            if(iResultLen > iAmt)
+            {
+                BMN_ERROR("Bad readv result size:%zd", iResultLen);
+                RAISE_VALUE_ERROR(
+                        pObject,
+                        "readv",
+                        "Method 'readv' returned wrong number of bytes");
+                rc = BMN_CB_RESULT_UNEXPECTED_RETURNS;
+                break;
+            }
+            if(iResultLen < iAmt)
+            {
+                break;
+            }
+            memcpy(zBuf + (sqlite3_int64)i * iAmt,
+                   PyBytes_AS_STRING(pItem),
+                   iAmt);
+            ++rc;
+        }
+        Py_DECREF(pResult);
+        pResult = NULL;
+    }
+    else
+    {
+        int ec;
+        ec = BMN_CATCH_PY_EXCEPTION(pObject, "readv");
+        if(BMN_ATTRIBUTE_ERROR == ec)
+        {
+            rc = BMN_CB_RESULT_NO_HANDLER;
+        }
+        else
+        {
+            rc = BMN_CB_RESULT_HANDLER_LOGIC_ERROR;
+        }
+    }
+    PyGILState_Release(gilstate);
+    BMN_TRACE_ERROR(rc);
     return rc;
 }
 
-int callWriteMethod(
-        PyObject* object,
-        BmnvfsFile* vfsFile,
-        const char* buffer,
-        Py_ssize_t amount,
-        sqlite_int64 offset)
+extern int callWriteMethod(
+        PyObject* pObject,
+        BmnvfsFile* pFile,
+        const char* zBuf,
+        Py_ssize_t iAmt,
+        sqlite_int64 iOfst)
 {
+    BMN_TRACE_MARK;
     int rc;
-    PyGILState_STATE gilState = PyGILState_Ensure();
+    PyGILState_STATE gilstate;
+    PyObject* pView;
+    PyObject* pResult;
+    PyObject* ppArgs[4];
 
-    PyObject* result = PyObject_CallMethod(
-            object,
-            "write",
-            "Oy#L",
-            vfsFile->pFileWrapper,
-            buffer,
-            amount,
-            offset);
-    if(result)
+    rc       = SQLITE_OK;
+    gilstate = PyGILState_Ensure();
+    pView    = NULL;
+    if(pFile->pInfo->iFlags & BMN_ZERO_COPY_WRITE)
     {
-        Py_DECREF(result);
-        rc = SQLITE_OK;
+        pView = PyMemoryView_FromMemory((char*)zBuf, iAmt, PyBUF_READ);
+        if(!pView)
+        {
+            BMN_CATCH_PY_EXCEPTION(pObject, "write");
+            PyGILState_Release(gilstate);
+            return BMN_CB_RESULT_HANDLER_LOGIC_ERROR;
+        }
+        ppArgs[2] = pView;
+        Py_INCREF(pView);
     }
     else
     {
-        BMN_CATCH_PY_EXCEPTION(object, "write");
-        rc = BMN_CB_RESULT_HANDLER_LOGIC_ERROR;
+        ppArgs[2] = PyBytes_FromStringAndSize(zBuf, iAmt);
+    }
+    ppArgs[1] = pFile->pFileWrapper;
+    ppArgs[3] = PyLong_FromLongLong(iOfst);
+    pResult   = callDispatchMethod(pFile->pInfo, BMN_METHOD_WRITE, ppArgs, 3);
+    Py_XDECREF(ppArgs[2]);
+    Py_XDECREF(ppArgs[3]);
+    if(pResult)
+    {
+        if(Py_None != pResult)
+        {
+            EMIT_RESULT_IGNORED_WARNING("write");
+        }
+        Py_DECREF(pResult);
+        pResult = NULL;
     }
-    PyGILState_Release(gilState);
+    else
+    {
+        int ec;
+        ec = BMN_CATCH_PY_EXCEPTION(pObject, "write");
+        if(BMN_ATTRIBUTE_ERROR == ec)
+        {
+            rc = BMN_CB_RESULT_NO_HANDLER;
+        }
+        else if(ec)
+        {
+            rc = BMN_CB_RESULT_HANDLER_LOGIC_ERROR;
+        }
+    }
+    if(pView)
+    {
+        if(releaseBufferView(pObject, pView, "write"))
+        {
+            rc = BMN_CB_RESULT_HANDLER_LOGIC_ERROR;
+        }
+        Py_DECREF(pView);
+    }
+    PyGILState_Release(gilstate);
+    BMN_TRACE_ERROR(rc);
     return rc;
 }
 
-extern int callDeviceCharacteristicsMethod(PyObject* pObject, BmnvfsFile* pFile)
+/*
+ passes collected writes as list of (offset, data) tuples in one call
+ data are memoryviews over the buffer if 'zero_copy_write' is set
+*/
+static int callChunksMethod(
+        PyObject* pObject,
+        BmnvfsFile* pFile,
+        BmnWriteBuffer* pWrites,
+        int iMethod)
 {
     BMN_TRACE_MARK;
-    BMN_ASSERT(pFile->pFileWrapper);
     int rc;
+    int i;
+    int iRetained;
     PyGILState_STATE gilstate;
+    PyObject* pList;
+    PyObject* pData;
+    PyObject* pItem;
     PyObject* pResult;
-    _Py_IDENTIFIER(device_characteristics);
+    PyObject* ppArgs[3];
+    BmnWriteRun* pRun;
+    const char* zMethod;
 
-    rc       = SQLITE_DEFAULT_DEVICE_CHARACTERISTICS;
+    rc = SQLITE_OK;
+    BMN_ASSERT(pWrites);
+    zMethod  = zMethodNames[iMethod];
     gilstate = PyGILState_Ensure();
-    pResult  = _PyObject_CallMethodId(
+    pList    = PyList_New(pWrites->nRun);
+    for(i = 0; pList && i < pWrites->nRun; ++i)
+    {
+        pRun = &pWrites->aRun[i];
+        if(pFile->pInfo->iFlags & BMN_ZERO_COPY_WRITE)
+        {
+            pData = PyMemoryView_FromMemory(
+                    pWrites->zData + pRun->iPos,
+                    pRun->iAmt,
+                    PyBUF_READ);
+        }
+        else
+        {
+            pData = PyBytes_FromStringAndSize(
+                    pWrites->zData + pRun->iPos,
+                    pRun->iAmt);
+        }
+        pItem = pData ? Py_BuildValue("(LN)", pRun->iOfst, pData) : NULL;
+        if(!pItem)
+        {
+            Py_CLEAR(pList);
+            break;
+        }
+        PyList_SET_ITEM(pList, i, pItem);
+    }
+    ppArgs[1] = pFile->pFileWrapper;
+    ppArgs[2] = pList;
+    pResult   = callDispatchMethod(pFile->pInfo, iMethod, ppArgs, 2);
+    if(pResult)
+    {
+        if(Py_None != pResult)
+        {
+            EMIT_RESULT_IGNORED_WARNING(zMethod);
+        }
+        Py_DECREF(pResult);
+        pResult = NULL;
+    }
+    else
+    {
+        int ec;
+        ec = BMN_CATCH_PY_EXCEPTION(pObject, zMethod);
+        if(BMN_ATTRIBUTE_ERROR == ec)
+        {
+            rc = BMN_CB_RESULT_NO_HANDLER;
+        }
+        else if(ec)
+        {
+            rc = BMN_CB_RESULT_HANDLER_LOGIC_ERROR;
+        }
+    }
+    if(pList && (pFile->pInfo->iFlags & BMN_ZERO_COPY_WRITE))
+    {
+        for(i = 0; i < pWrites->nRun; ++i)
+        {
+            pItem     = PyList_GET_ITEM(pList, i);
+            pData     = PyTuple_GET_ITEM(pItem, 1);
+            // kept list or tuple keeps the view as well
+            iRetained = Py_REFCNT(pList) > 1 || Py_REFCNT(pItem) > 1;
+            if(iRetained)
+            {
+                Py_INCREF(pData);
+            }
+            if(releaseBufferView(pObject, pData, zMethod))
+            {
+                rc = BMN_CB_RESULT_HANDLER_LOGIC_ERROR;
+            }
+            if(iRetained)
+            {
+                Py_DECREF(pData);
+            }
+        }
+    }
+    Py_XDECREF(pList);
+    PyGILState_Release(gilstate);
+    BMN_TRACE_ERROR(rc);
+    return rc;
+}
+
+extern int callWritevMethod(PyObject* pObject, BmnvfsFile* pFile)
+{
+    return callChunksMethod(
             pObject,
-            &PyId_device_characteristics,
-            "O",
-            pFile->pFileWrapper);
+            pFile,
+            pFile->pWrites,
+            BMN_METHOD_WRITEV);
+}
+
+extern int callCommitAtomicMethod(PyObject* pObject, BmnvfsFile* pFile)
+{
+    return callChunksMethod(
+            pObject,
+            pFile,
+            pFile->pBatch,
+            BMN_METHOD_COMMIT_ATOMIC);
+}
+
+extern int callDeviceCharacteristicsMethod(PyObject* pObject, BmnvfsFile* pFile)
+{
+    BMN_TRACE_MARK;
+    BMN_ASSERT(pFile->pFileWrapper);
+    int rc;
+    PyGILState_STATE gilstate;
+    PyObject* pResult;
+    PyObject* ppArgs[2];
+
+    rc        = SQLITE_DEFAULT_DEVICE_CHARACTERISTICS;
+    gilstate  = PyGILState_Ensure();
+    ppArgs[1] = pFile->pFileWrapper;
+    pResult   = callDispatchMethod(
+            pFile->pInfo,
+            BMN_METHOD_DEVICE_CHARACTERISTICS,
+            ppArgs,
+            1);
     if(pResult)
     {
         if(PyLong_Check(pResult))
@@ -745,25 +1435,169 @@ extern int callFileTruncateMethod(
 
     PyGILState_STATE gilstate;
     PyObject* pResult;
+    PyObject* ppArgs[3];
     int rc;
-    _Py_IDENTIFIER(truncate);
 
     gilstate = PyGILState_Ensure();
     rc       = SQLITE_OK;
 #if BMN_DEBUG_FILENAME_CONTROL
     BMN_VERBOSE_IO("truncate %s to %d", pFile->zFName, iSize);
 #endif
-    pResult = _PyObject_CallMethodId(
-            pObject,
-            &PyId_truncate,
-            "O L",
-            pFile->pFileWrapper,
-            iSize);
+    ppArgs[1] = pFile->pFileWrapper;
+    ppArgs[2] = PyLong_FromLongLong(iSize);
+    pResult = callDispatchMethod(pFile->pInfo, BMN_METHOD_TRUNCATE, ppArgs, 2);
+    Py_XDECREF(ppArgs[2]);
+    if(pResult)
+    {
+        if(Py_None != pResult)
+        {
+            EMIT_RESULT_IGNORED_WARNING("truncate");
+        }
+        Py_DECREF(pResult);
+        pResult = NULL;
+    }
+    else
+    {
+        int ec;
+        ec = BMN_CATCH_PY_EXCEPTION(pObject, "truncate");
+        if(BMN_ATTRIBUTE_ERROR == ec)
+        {
+            rc = BMN_CB_RESULT_NO_HANDLER;
+        }
+        else if(ec)
+        {
+            rc = BMN_CB_RESULT_HANDLER_LOGIC_ERROR;
+        }
+    }
+    PyGILState_Release(gilstate);
+    BMN_TRACE_ERROR(rc);
+    return rc;
+}
+
+extern int callFileSizeMethod(
+        PyObject* pObject,
+        BmnvfsFile* pFile,
+        sqlite3_int64* pSize)
+{
+    BMN_TRACE_MARK;
+
+    int rc;
+    PyGILState_STATE gilstate;
+    PyObject* pResult;
+    PyObject* ppArgs[2];
+
+    rc        = SQLITE_OK;
+    gilstate  = PyGILState_Ensure();
+    ppArgs[1] = pFile->pFileWrapper;
+    pResult = callDispatchMethod(pFile->pInfo, BMN_METHOD_FILE_SIZE, ppArgs, 1);
+    if(pResult)
+    {
+        if(PyLong_Check(pResult))
+        {
+            *pSize = PyLong_AsLongLong(pResult);
+            rc     = SQLITE_OK;
+        }
+        else if(Py_None == pResult)
+        {
+            RAISE_NO_MANDATORY_METHOD(pObject, "file_size");
+            rc = BMN_CB_RESULT_NO_HANDLER;
+        }
+        else
+        {
+            RAISE_WRONG_RETURN_TYPE(pObject, "file_size");
+            rc = BMN_CB_RESULT_UNEXPECTED_RETURNS;
+        }
+        Py_DECREF(pResult);
+        pResult = NULL;
+    }
+    else
+    {
+        int ec;
+        ec = BMN_CATCH_PY_EXCEPTION(pObject, "file_size");
+        if(BMN_ATTRIBUTE_ERROR == ec)
+        {
+            rc = BMN_CB_RESULT_NO_HANDLER;
+        }
+        else if(ec)
+        {
+            rc = BMN_CB_RESULT_HANDLER_LOGIC_ERROR;
+        }
+    }
+    PyGILState_Release(gilstate);
+    BMN_VERBOSE_IO("File size %lld", *pSize);
+    BMN_VERBOSE_ERROR(rc);
+    return rc;
+}
+
+extern int callSyncMethod(PyObject* pObject, BmnvfsFile* pFile, int flags)
+{
+    BMN_TRACE_MARK;
+
+    int rc;
+    PyGILState_STATE gilstate;
+    PyObject* pResult;
+    PyObject* ppArgs[3];
+
+    rc = SQLITE_OK;
+    BMN_ASSERT(pFile->pFileWrapper);
+    gilstate  = PyGILState_Ensure();
+    ppArgs[1] = pFile->pFileWrapper;
+    ppArgs[2] = PyLong_FromLong(flags);
+    pResult   = callDispatchMethod(pFile->pInfo, BMN_METHOD_SYNC, ppArgs, 2);
+    Py_XDECREF(ppArgs[2]);
+    if(pResult)
+    {
+        if(Py_None != pResult)
+        {
+            EMIT_RESULT_IGNORED_WARNING("sync");
+        }
+        Py_DECREF(pResult);
+        pResult = NULL;
+        rc      = SQLITE_OK;
+    }
+    else
+    {
+        int ec;
+        ec = BMN_CATCH_PY_EXCEPTION(pObject, "sync");
+        if(BMN_ATTRIBUTE_ERROR == ec)
+        {
+            rc = BMN_CB_RESULT_NO_HANDLER;
+        }
+        else if(ec)
+        {
+            rc = BMN_CB_RESULT_HANDLER_LOGIC_ERROR;
+        }
+    }
+    PyGILState_Release(gilstate);
+    return rc;
+}
+
+extern int callLockMethod(PyObject* pObject, BmnvfsFile* pFile, int iLock)
+{
+    BMN_TRACE_MARK;
+
+    int rc;
+    PyGILState_STATE gilstate;
+    PyObject* pResult;
+    PyObject* ppArgs[3];
+
+    rc = SQLITE_OK;
+    BMN_ASSERT(pFile->pFileWrapper);
+    gilstate  = PyGILState_Ensure();
+    ppArgs[1] = pFile->pFileWrapper;
+    ppArgs[2] = PyLong_FromLong(iLock);
+    pResult   = callDispatchMethod(pFile->pInfo, BMN_METHOD_LOCK, ppArgs, 2);
+    Py_XDECREF(ppArgs[2]);
     if(pResult)
     {
-        if(Py_None != pResult)
+        if(Py_False == pResult)
         {
-            EMIT_RESULT_IGNORED_WARNING("truncate");
+            rc = SQLITE_BUSY;
+        }
+        else if(Py_True != pResult && Py_None != pResult)
+        {
+            RAISE_WRONG_RETURN_TYPE(pObject, "lock");
+            rc = BMN_CB_RESULT_UNEXPECTED_RETURNS;
         }
         Py_DECREF(pResult);
         pResult = NULL;
@@ -771,7 +1605,7 @@ extern int callFileTruncateMethod(
     else
     {
         int ec;
-        ec = BMN_CATCH_PY_EXCEPTION(pObject, "truncate");
+        ec = BMN_CATCH_PY_EXCEPTION(pObject, "lock");
         if(BMN_ATTRIBUTE_ERROR == ec)
         {
             rc = BMN_CB_RESULT_NO_HANDLER;
@@ -786,41 +1620,27 @@ extern int callFileTruncateMethod(
     return rc;
 }
 
-extern int callFileSizeMethod(
-        PyObject* pObject,
-        BmnvfsFile* pFile,
-        sqlite3_int64* pSize)
+extern int callUnlockMethod(PyObject* pObject, BmnvfsFile* pFile, int iLock)
 {
     BMN_TRACE_MARK;
 
     int rc;
     PyGILState_STATE gilstate;
     PyObject* pResult;
-    _Py_IDENTIFIER(file_size);
+    PyObject* ppArgs[3];
 
-    rc       = SQLITE_OK;
-    gilstate = PyGILState_Ensure();
-    pResult  = _PyObject_CallMethodId(
-            pObject,
-            &PyId_file_size,
-            "O",
-            pFile->pFileWrapper);
+    rc = SQLITE_OK;
+    BMN_ASSERT(pFile->pFileWrapper);
+    gilstate  = PyGILState_Ensure();
+    ppArgs[1] = pFile->pFileWrapper;
+    ppArgs[2] = PyLong_FromLong(iLock);
+    pResult   = callDispatchMethod(pFile->pInfo, BMN_METHOD_UNLOCK, ppArgs, 2);
+    Py_XDECREF(ppArgs[2]);
     if(pResult)
     {
-        if(PyLong_Check(pResult))
-        {
-            *pSize = PyLong_AsLongLong(pResult);
-            rc     = SQLITE_OK;
-        }
-        else if(Py_None == pResult)
-        {
-            RAISE_NO_MANDATORY_METHOD(pObject, "file_size");
-            rc = BMN_CB_RESULT_NO_HANDLER;
-        }
-        else
+        if(Py_None != pResult)
         {
-            RAISE_WRONG_RETURN_TYPE(pObject, "file_size");
-            rc = BMN_CB_RESULT_UNEXPECTED_RETURNS;
+            EMIT_RESULT_IGNORED_WARNING("unlock");
         }
         Py_DECREF(pResult);
         pResult = NULL;
@@ -828,7 +1648,7 @@ extern int callFileSizeMethod(
     else
     {
         int ec;
-        ec = BMN_CATCH_PY_EXCEPTION(pObject, "file_size");
+        ec = BMN_CATCH_PY_EXCEPTION(pObject, "unlock");
         if(BMN_ATTRIBUTE_ERROR == ec)
         {
             rc = BMN_CB_RESULT_NO_HANDLER;
@@ -839,43 +1659,49 @@ extern int callFileSizeMethod(
         }
     }
     PyGILState_Release(gilstate);
-    BMN_VERBOSE_IO("File size %lld", *pSize);
-    BMN_VERBOSE_ERROR(rc);
+    BMN_TRACE_ERROR(rc);
     return rc;
 }
 
-extern int callSyncMethod(PyObject* pObject, BmnvfsFile* pFile, int flags)
+extern int callCheckReservedLockMethod(
+        PyObject* pObject,
+        BmnvfsFile* pFile,
+        int* pResOut)
 {
     BMN_TRACE_MARK;
 
     int rc;
     PyGILState_STATE gilstate;
     PyObject* pResult;
-    _Py_IDENTIFIER(sync);
+    PyObject* ppArgs[2];
 
     rc = SQLITE_OK;
     BMN_ASSERT(pFile->pFileWrapper);
-    gilstate = PyGILState_Ensure();
-    pResult  = _PyObject_CallMethodId(
-            pObject,
-            &PyId_sync,
-            "O I",
-            pFile->pFileWrapper,
-            flags);
+    gilstate  = PyGILState_Ensure();
+    ppArgs[1] = pFile->pFileWrapper;
+    pResult   = callDispatchMethod(
+            pFile->pInfo,
+            BMN_METHOD_CHECK_RESERVED_LOCK,
+            ppArgs,
+            1);
     if(pResult)
     {
-        if(Py_None != pResult)
+        if(PyBool_Check(pResult))
         {
-            EMIT_RESULT_IGNORED_WARNING("sync");
+            *pResOut = Py_True == pResult;
+        }
+        else
+        {
+            RAISE_WRONG_RETURN_TYPE(pObject, "check_reserved_lock");
+            rc = BMN_CB_RESULT_UNEXPECTED_RETURNS;
         }
         Py_DECREF(pResult);
         pResult = NULL;
-        rc      = SQLITE_OK;
     }
     else
     {
         int ec;
-        ec = BMN_CATCH_PY_EXCEPTION(pObject, "sync");
+        ec = BMN_CATCH_PY_EXCEPTION(pObject, "check_reserved_lock");
         if(BMN_ATTRIBUTE_ERROR == ec)
         {
             rc = BMN_CB_RESULT_NO_HANDLER;
@@ -886,6 +1712,7 @@ extern int callSyncMethod(PyObject* pObject, BmnvfsFile* pFile, int flags)
         }
     }
     PyGILState_Release(gilstate);
+    BMN_TRACE_ERROR(rc);
     return rc;
 }
 
@@ -896,15 +1723,13 @@ extern int callSectorSizeMethod(PyObject* pObject, BmnvfsFile* pFile)
     int rc;
     PyGILState_STATE gilstate;
     PyObject* pResult;
-    _Py_IDENTIFIER(sector_size);
+    PyObject* ppArgs[2];
 
-    rc       = SQLITE_OK;
-    gilstate = PyGILState_Ensure();
-    pResult  = _PyObject_CallMethodId(
-            pObject,
-            &PyId_sector_size,
-            "O",
-            pFile->pFileWrapper);
+    rc        = SQLITE_OK;
+    gilstate  = PyGILState_Ensure();
+    ppArgs[1] = pFile->pFileWrapper;
+    pResult =
+            callDispatchMethod(pFile->pInfo, BMN_METHOD_SECTOR_SIZE, ppArgs, 1);
     if(pResult)
     {
         if(PyLong_Check(pResult))
@@ -1028,7 +1853,7 @@ extern int callFileControlMethod(
     int rc;
     PyGILState_STATE gilstate;
     PyObject* pResult;
-    _Py_IDENTIFIER(file_control);
+    PyObject* ppArgs[4];
 
     rc = SQLITE_NOTFOUND;
     switch(iOperation)
@@ -1057,14 +1882,17 @@ used by VACUUM operations.
                 *(sqlite3_int64*)pArg);
 
         // rc = BMN_CALLBACK_ERROR;
-        gilstate = PyGILState_Ensure();
-        pResult  = _PyObject_CallMethodId(
-                pObject,
-                &PyId_file_control,
-                "OIL",
-                pFile->pFileWrapper,
-                iOperation,
-                *(sqlite3_int64*)pArg);
+        gilstate  = PyGILState_Ensure();
+        ppArgs[1] = pFile->pFileWrapper;
+        ppArgs[2] = PyLong_FromLong(iOperation);
+        ppArgs[3] = PyLong_FromLongLong(*(sqlite3_int64*)pArg);
+        pResult   = callDispatchMethod(
+                pFile->pInfo,
+                BMN_METHOD_FILE_CONTROL,
+                ppArgs,
+                3);
+        Py_XDECREF(ppArgs[2]);
+        Py_XDECREF(ppArgs[3]);
         if(pResult)
         {
             if(Py_None == pResult)
@@ -1337,8 +2165,80 @@ extern int callGetCurrentTimeInt64(PyObject* pObject, sqlite3_int64* pTime)
  partial methods
 */
 
-// temporary storage
-static BmnvfsFile* pPartialFile = NULL;
+// self of raw callbacks, it is renamed when file is closed
+#define BMN_RAW_FILE_CAPSULE_NAME MODULE_NAME ".file"
+
+static PyObject* rawWriteImpl(PyObject* obj, PyObject* args);
+static PyObject* rawReadImpl(PyObject* obj, PyObject* args);
+
+static PyMethodDef rawWriteDef = {
+        "raw_write",
+        rawWriteImpl,
+        METH_VARARGS,
+        NULL,
+};
+
+static PyMethodDef rawReadDef = {
+        "raw_read",
+        rawReadImpl,
+        METH_VARARGS,
+        NULL,
+};
+
+static BmnvfsFile* getRawFile(PyObject* obj)
+{
+    // wrapper can keep callback and call it after file closing
+    if(!PyCapsule_IsValid(obj, BMN_RAW_FILE_CAPSULE_NAME))
+    {
+        RAISE_ERROR(PyExc_ValueError, NULL, "I/O operation on closed file");
+        return NULL;
+    }
+    return (BmnvfsFile*)PyCapsule_GetPointer(obj, BMN_RAW_FILE_CAPSULE_NAME);
+}
+
+extern int createRawCallbacks(BmnvfsFile* pFile)
+{
+    BMN_TRACE_MARK;
+    PyObject* pSelf;
+    PyGILState_STATE gilstate;
+
+    gilstate         = PyGILState_Ensure();
+    pFile->pRawRead  = NULL;
+    pFile->pRawWrite = NULL;
+    pSelf            = PyCapsule_New(pFile, BMN_RAW_FILE_CAPSULE_NAME, NULL);
+    if(pSelf)
+    {
+        pFile->pRawRead  = PyCFunction_New(&rawReadDef, pSelf);
+        pFile->pRawWrite = PyCFunction_New(&rawWriteDef, pSelf);
+        Py_DECREF(pSelf);
+    }
+    if(!pFile->pRawRead || !pFile->pRawWrite)
+    {
+        PyErr_Clear();
+        Py_CLEAR(pFile->pRawRead);
+        Py_CLEAR(pFile->pRawWrite);
+        PyGILState_Release(gilstate);
+        return SQLITE_NOMEM;
+    }
+    PyGILState_Release(gilstate);
+    return SQLITE_OK;
+}
+
+extern void releaseRawCallbacks(BmnvfsFile* pFile)
+{
+    BMN_TRACE_MARK;
+    PyGILState_STATE gilstate;
+
+    if(!pFile->pRawRead)
+    {
+        return;
+    }
+    gilstate = PyGILState_Ensure();
+    PyCapsule_SetName(PyCFunction_GET_SELF(pFile->pRawRead), NULL);
+    Py_CLEAR(pFile->pRawRead);
+    Py_CLEAR(pFile->pRawWrite);
+    PyGILState_Release(gilstate);
+}
 
 static int prepareBuffer(void** pBuffer, sqlite3_uint64 iSize)
 {
@@ -1358,55 +2258,53 @@ static int prepareBuffer(void** pBuffer, sqlite3_uint64 iSize)
     return SQLITE_OK;
 }
 
-typedef struct MemoryBuffer MemoryBuffer;
-struct MemoryBuffer
-{
-    char* pBuffer;
-    Py_ssize_t nLength;
-};
-
-static int bytesConverter(PyObject* obj, MemoryBuffer* buffer)
-{
-    return PyBytes_AsStringAndSize(obj, &buffer->pBuffer, &buffer->nLength) ? 0
-                                                                            : 1;
-}
-
-// avoid acquiring GIL or something! you're already locked
+// called with GIL, it is released only around root VFS IO
 static PyObject* rawWriteImpl(PyObject* obj, PyObject* args)
 {
     BMN_TRACE_MARK;
 
     sqlite_int64 iOffset;
-    MemoryBuffer buffer;
+    Py_buffer buffer;
+    BmnvfsFile* pFile;
+    PyThreadState* pThreadState;
     int rc;
 
-    if(!PyArg_ParseTuple(args, "O&L", bytesConverter, &buffer, &iOffset))
+    // any bytes-like object, so memoryview from zero-copy 'encode' fits too
+    if(!PyArg_ParseTuple(args, "y*L", &buffer, &iOffset))
     {
         BMN_ERROR("Can't parse arguments");
         return NULL;
     }
+    pFile = getRawFile(obj);
+    if(!pFile)
+    {
+        PyBuffer_Release(&buffer);
+        return NULL;
+    }
 #if BMN_DEBUG_FILENAME_CONTROL
     BMN_VERBOSE_IO(
             "raw write %d by %d to %s",
-            buffer.nLength,
+            buffer.len,
             iOffset,
-            pPartialFile->zFName);
+            pFile->zFName);
 #endif
-    BMN_ASSERT(pPartialFile->pReal);
-    BMN_ASSERT(pPartialFile->pReal->pMethods);
+    BMN_ASSERT(pFile->pReal);
+    BMN_ASSERT(pFile->pReal->pMethods);
     if(iOffset < 0)
     {
+        PyBuffer_Release(&buffer);
         RAISE_VALUE_ERROR(
                 NULL,
                 "encode",
                 "Negative offset passed to 'encode' method");
         return NULL;
     }
-    rc = pPartialFile->pReal->pMethods->xWrite(
-            pPartialFile->pReal,
-            buffer.pBuffer,
-            (int)buffer.nLength,
-            iOffset);
+    // buffer export keeps the data alive and unresizable without GIL
+    pThreadState = PyEval_SaveThread();
+    rc           = pFile->pReal->pMethods
+                           ->xWrite(pFile->pReal, buffer.buf, (int)buffer.len, iOffset);
+    PyEval_RestoreThread(pThreadState);
+    PyBuffer_Release(&buffer);
     if(rc)
     {
         switch(rc)
@@ -1426,11 +2324,13 @@ static PyObject* rawWriteImpl(PyObject* obj, PyObject* args)
     Py_RETURN_NONE;
 }
 
-// avoid acquiring GIL or something! you're already locked
+// called with GIL, it is released only around root VFS IO
 static PyObject* rawReadImpl(PyObject* obj, PyObject* args)
 {
     BMN_TRACE_MARK;
     sqlite_int64 iOffset;
+    BmnvfsFile* pFile;
+    PyThreadState* pThreadState;
     int iAmt;
     int rc;
 
@@ -1455,26 +2355,27 @@ static PyObject* rawReadImpl(PyObject* obj, PyObject* args)
                 "Negative offset passed to 'decode' method");
         return NULL;
     }
-    rc = prepareBuffer(&pPartialFile->pBuffer, iAmt);
+    pFile = getRawFile(obj);
+    if(!pFile)
+    {
+        return NULL;
+    }
+    rc    = prepareBuffer(&pFile->pBuffer, iAmt);
     if(rc)
     {
         BMN_TRACE_ERROR(rc);
         return PyErr_NoMemory();
     }
-    BMN_ASSERT(pPartialFile->pReal);
-    BMN_ASSERT(pPartialFile->pBuffer);
+    BMN_ASSERT(pFile->pReal);
+    BMN_ASSERT(pFile->pBuffer);
 #if BMN_DEBUG_FILENAME_CONTROL
-    BMN_VERBOSE_IO(
-            "raw read %d by %d from %s",
-            iAmt,
-            iOffset,
-            pPartialFile->zFName);
+    BMN_VERBOSE_IO("raw read %d by %d from %s", iAmt, iOffset, pFile->zFName);
 #endif
-    rc = pPartialFile->pReal->pMethods->xRead(
-            pPartialFile->pReal,
-            pPartialFile->pBuffer,
-            iAmt,
-            iOffset);
+    // pBuffer belongs to the file which is used by the calling thread only
+    pThreadState = PyEval_SaveThread();
+    rc           = pFile->pReal->pMethods
+                           ->xRead(pFile->pReal, pFile->pBuffer, iAmt, iOffset);
+    PyEval_RestoreThread(pThreadState);
     if(SQLITE_IOERR_SHORT_READ == rc)
     {
 #if BMN_MARK_SHORT_READ_WITH_BOOL
@@ -1483,7 +2384,7 @@ static PyObject* rawReadImpl(PyObject* obj, PyObject* args)
         Py_RETURN_NONE;
 #endif
     }
-    return PyBytes_FromStringAndSize(pPartialFile->pBuffer, iAmt);
+    return PyBytes_FromStringAndSize(pFile->pBuffer, iAmt);
 }
 
 extern int callEncodeMethod(
@@ -1495,33 +2396,38 @@ extern int callEncodeMethod(
     BMN_TRACE_MARK;
     int rc;
     PyObject* pResult;
-    PyObject* pFunc;
-    PyMethodDef pyMethodDef;
+    PyObject* pView;
+    PyObject* ppArgs[5];
     PyGILState_STATE gilstate;
-    _Py_IDENTIFIER(encode);
 
-    pyMethodDef.ml_name  = "";
-    pyMethodDef.ml_meth  = rawWriteImpl;
-    pyMethodDef.ml_flags = METH_VARARGS;
-    pyMethodDef.ml_doc   = NULL;
-    pPartialFile         = pFile;
-#if BMN_DEBUG_FILENAME_CONTROL
-    BMN_VERBOSE_IO("shared file to write:%s", pFile->zFName);
-#endif
-    rc = SQLITE_OK;
-    ;
+    BMN_ASSERT(pFile->pRawWrite);
+    rc       = SQLITE_OK;
     gilstate = PyGILState_Ensure();
-    pFunc    = PyCFunction_New(&pyMethodDef, NULL);
 
-    pResult = _PyObject_CallMethodId(
-            pFile->pInfo->pWrapper,
-            &PyId_encode,
-            "I O y# L",
-            pFile->iFlags,
-            pFunc,
-            zBuf,
-            iAmt,
-            iOfst);
+    pView = NULL;
+    if(pFile->pInfo->iFlags & BMN_ZERO_COPY_WRITE)
+    {
+        pView = PyMemoryView_FromMemory((char*)zBuf, iAmt, PyBUF_READ);
+        if(!pView)
+        {
+            BMN_CATCH_PY_EXCEPTION(pFile->pInfo->pWrapper, "encode");
+            PyGILState_Release(gilstate);
+            return BMN_CB_RESULT_HANDLER_LOGIC_ERROR;
+        }
+        ppArgs[3] = pView;
+        Py_INCREF(pView);
+    }
+    else
+    {
+        ppArgs[3] = PyBytes_FromStringAndSize(zBuf, iAmt);
+    }
+    ppArgs[1] = PyLong_FromLong(pFile->iFlags);
+    ppArgs[2] = pFile->pRawWrite;
+    ppArgs[4] = PyLong_FromLongLong(iOfst);
+    pResult   = callDispatchMethod(pFile->pInfo, BMN_METHOD_ENCODE, ppArgs, 4);
+    Py_XDECREF(ppArgs[1]);
+    Py_XDECREF(ppArgs[3]);
+    Py_XDECREF(ppArgs[4]);
 
     if(pResult)
     {
@@ -1547,8 +2453,14 @@ extern int callEncodeMethod(
             rc = BMN_CB_RESULT_HANDLER_LOGIC_ERROR;
         }
     }
-    // Py_DECREF(pFunc);
-    Py_CLEAR(pFunc);
+    if(pView)
+    {
+        if(releaseBufferView(pFile->pInfo->pWrapper, pView, "encode"))
+        {
+            rc = BMN_CB_RESULT_HANDLER_LOGIC_ERROR;
+        }
+        Py_DECREF(pView);
+    }
     PyGILState_Release(gilstate);
     return rc;
 }
@@ -1563,31 +2475,21 @@ extern int callDecodeMethod(
     int rc;
     PyGILState_STATE gilstate;
     PyObject* pResult;
-    PyObject* pFunc;
-    _Py_IDENTIFIER(decode);
-    PyMethodDef pyMethodDef;
+    PyObject* ppArgs[5];
     Py_ssize_t iResultLen;
 
-    pyMethodDef.ml_name  = "";
-    pyMethodDef.ml_meth  = rawReadImpl;
-    pyMethodDef.ml_flags = METH_VARARGS;
-    pyMethodDef.ml_doc   = NULL;
-    pPartialFile         = pFile;
-#if BMN_DEBUG_FILENAME_CONTROL
-    BMN_VERBOSE_IO("shared file to read:%s", pFile->zFName);
-#endif
+    BMN_ASSERT(pFile->pRawRead);
     rc       = SQLITE_OK;
     gilstate = PyGILState_Ensure();
-    pFunc    = PyCFunction_New(&pyMethodDef, NULL);
 
-    pResult = _PyObject_CallMethodId(
-            pFile->pInfo->pWrapper,
-            &PyId_decode,
-            "I O I L",
-            pFile->iFlags,
-            pFunc,
-            iAmt,
-            iOfst);
+    ppArgs[1] = PyLong_FromLong(pFile->iFlags);
+    ppArgs[2] = pFile->pRawRead;
+    ppArgs[3] = PyLong_FromSsize_t(iAmt);
+    ppArgs[4] = PyLong_FromLongLong(iOfst);
+    pResult   = callDispatchMethod(pFile->pInfo, BMN_METHOD_DECODE, ppArgs, 4);
+    Py_XDECREF(ppArgs[1]);
+    Py_XDECREF(ppArgs[3]);
+    Py_XDECREF(ppArgs[4]);
 
     if(pResult)
     {
@@ -1656,7 +2558,250 @@ extern int callDecodeMethod(
             rc = BMN_CB_RESULT_HANDLER_LOGIC_ERROR;
         }
     }
-    Py_DECREF(pFunc);
     PyGILState_Release(gilstate);
     return rc;
 }
+
+/*
+ overhead harness
+
+ every stage repeats one part of a 'write' callback ( see callWriteMethod )
+ nIter times, so its fixed costs are measured apart from the work of the
+ wrapper method itself
+*/
+static int setStageTime(
+        PyObject* pResult,
+        const char* zStage,
+        sqlite3_int64 iStart,
+        int nIter)
+{
+    PyObject* pTime;
+    int rc;
+
+    pTime = PyFloat_FromDouble(
+            (double)(bmnStatsClock() - iStart) / 1e9 / (double)nIter);
+    rc = !pTime || PyDict_SetItemString(pResult, zStage, pTime);
+    Py_XDECREF(pTime);
+    return rc;
+}
+
+/*
+ GIL is released as sqlite releases it for I/O
+*/
+static void gilStage(int nIter)
+{
+    int i;
+    PyGILState_STATE gilstate;
+
+    Py_BEGIN_ALLOW_THREADS;
+    for(i = 0; i < nIter; ++i)
+    {
+        gilstate = PyGILState_Ensure();
+        PyGILState_Release(gilstate);
+    }
+    Py_END_ALLOW_THREADS;
+}
+
+static int lookupStage(PyObject* pWrapper, const char* zMethod, int nIter)
+{
+    int i;
+    PyObject* pMethod;
+
+    for(i = 0; i < nIter; ++i)
+    {
+        pMethod = PyObject_GetAttrString(pWrapper, zMethod);
+        if(!pMethod)
+        {
+            return 1;
+        }
+        Py_DECREF(pMethod);
+    }
+    return 0;
+}
+
+static int argumentsStage(const char* zBuf, int iSize, int nIter)
+{
+    int i;
+    PyObject* ppArgs[4];
+
+    ppArgs[1] = Py_None;
+    for(i = 0; i < nIter; ++i)
+    {
+        ppArgs[2] = PyBytes_FromStringAndSize(zBuf, iSize);
+        ppArgs[3] = PyLong_FromLongLong((sqlite3_int64)i * iSize);
+        Py_XDECREF(ppArgs[2]);
+        Py_XDECREF(ppArgs[3]);
+        if(!ppArgs[2] || !ppArgs[3])
+        {
+            return 1;
+        }
+    }
+    return 0;
+}
+
+static int callStage(PyObject* pMethod, PyObject** ppArgs, int nIter)
+{
+    int i;
+    PyObject* pResult;
+
+    for(i = 0; i < nIter; ++i)
+    {
+        pResult = BMN_VECTORCALL(pMethod, ppArgs + 1, 3);
+        if(!pResult)
+        {
+            return 1;
+        }
+        Py_DECREF(pResult);
+    }
+    return 0;
+}
+
+/*
+ result of 'write' is checked and the one of 'read' is copied to sqlite
+*/
+static int resultStage(PyObject* pData, char* zBuf, int iSize, int nIter)
+{
+    int i;
+    int rc;
+    int nBad;
+
+    nBad = 0;
+    for(i = 0; i < nIter; ++i)
+    {
+        nBad += parseResultCode(Py_None, &rc) || SQLITE_OK != rc;
+        if(PyBytes_Check(pData) && PyBytes_GET_SIZE(pData) == iSize)
+        {
+            memcpy(zBuf, PyBytes_AS_STRING(pData), iSize);
+        }
+        else
+        {
+            ++nBad;
+        }
+    }
+    return nBad;
+}
+
+/*
+ the whole callback with a method of the dispatch table
+*/
+static int totalStage(PyObject* pMethod, const char* zBuf, int iSize, int nIter)
+{
+    int i;
+    int rc;
+    int iCode;
+    PyGILState_STATE gilstate;
+    PyObject* pResult;
+    PyObject* ppArgs[4];
+
+    rc = SQLITE_OK;
+    Py_BEGIN_ALLOW_THREADS;
+    for(i = 0; SQLITE_OK == rc && i < nIter; ++i)
+    {
+        gilstate  = PyGILState_Ensure();
+        ppArgs[1] = Py_None;
+        ppArgs[2] = PyBytes_FromStringAndSize(zBuf, iSize);
+        ppArgs[3] = PyLong_FromLongLong((sqlite3_int64)i * iSize);
+        pResult   = NULL;
+        if(ppArgs[2] && ppArgs[3])
+        {
+            pResult = BMN_VECTORCALL(pMethod, ppArgs + 1, 3);
+        }
+        Py_XDECREF(ppArgs[2]);
+        Py_XDECREF(ppArgs[3]);
+        if(!pResult)
+        {
+            // the exception stays in the thread state
+            rc = BMN_CB_RESULT_HANDLER_LOGIC_ERROR;
+        }
+        else if(parseResultCode(pResult, &iCode))
+        {
+            PyErr_SetString(
+                    PyExc_TypeError,
+                    "method must return None or int");
+            rc = iCode;
+        }
+        Py_XDECREF(pResult);
+        PyGILState_Release(gilstate);
+    }
+    Py_END_ALLOW_THREADS;
+    return SQLITE_OK != rc;
+}
+
+extern PyObject* bmnCallbackOverhead(
+        PyObject* pWrapper,
+        const char* zMethod,
+        int nIter,
+        int iSize)
+{
+    PyObject* pMethod;
+    PyObject* pResult;
+    PyObject* ppArgs[4];
+    char* zBuf;
+    sqlite3_int64 iStart;
+    int rc;
+
+    pMethod = PyObject_GetAttrString(pWrapper, zMethod);
+    if(!pMethod)
+    {
+        return NULL;
+    }
+    zBuf      = PyMem_Calloc(iSize ? iSize : 1, 1);
+    ppArgs[1] = Py_None;
+    ppArgs[2] = PyBytes_FromStringAndSize(zBuf, iSize);
+    ppArgs[3] = PyLong_FromLong(0);
+    pResult   = PyDict_New();
+    rc        = !zBuf || !ppArgs[2] || !ppArgs[3] || !pResult;
+    if(zBuf && !rc)
+    {
+        iStart = bmnStatsClock();
+        gilStage(nIter);
+        rc = setStageTime(pResult, "gil", iStart, nIter);
+    }
+    if(!rc)
+    {
+        iStart = bmnStatsClock();
+        rc     = lookupStage(pWrapper, zMethod, nIter) ||
+             setStageTime(pResult, "lookup", iStart, nIter);
+    }
+    if(!rc)
+    {
+        iStart = bmnStatsClock();
+        rc     = argumentsStage(zBuf, iSize, nIter) ||
+             setStageTime(pResult, "arguments", iStart, nIter);
+    }
+    if(!rc)
+    {
+        iStart = bmnStatsClock();
+        rc     = callStage(pMethod, ppArgs, nIter) ||
+             setStageTime(pResult, "call", iStart, nIter);
+    }
+    if(!rc)
+    {
+        iStart = bmnStatsClock();
+        if(resultStage(ppArgs[2], zBuf, iSize, nIter))
+        {
+            PyErr_SetString(PyExc_AssertionError, "unexpected result");
+            rc = 1;
+        }
+        rc = rc || setStageTime(pResult, "result", iStart, nIter);
+    }
+    if(!rc)
+    {
+        iStart = bmnStatsClock();
+        rc     = totalStage(pMethod, zBuf, iSize, nIter) ||
+             setStageTime(pResult, "total", iStart, nIter);
+    }
+    Py_DECREF(pMethod);
+    Py_XDECREF(ppArgs[2]);
+    Py_XDECREF(ppArgs[3]);
+    PyMem_Free(zBuf);
+    if(rc)
+    {
+        Py_CLEAR(pResult);
+        if(!PyErr_Occurred())
+        {
+            PyErr_NoMemory();
+        }
+    }
+    return pResult;
+}
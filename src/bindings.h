@@ -12,6 +12,20 @@
 typedef struct BmnvfsFile BmnvfsFile;
 typedef struct BmnvfsInfo BmnvfsInfo;
 
+/*
+    BMN_NO_CALLBACK_* flags of optional methods which the wrapper
+    misses or inherits from interfaces
+*/
+int missingMethods(PyObject* pWrapper);
+
+/*
+    resolves wrapper methods once per registration
+    missed optional methods are marked with BMN_NO_CALLBACK_* flags
+*/
+void initDispatchTable(BmnvfsInfo* pInfo);
+
+void clearDispatchTable(BmnvfsInfo* pInfo);
+
 /*
     pObject is redundant here when we have pFile pointer
     But let it be for order and possible future changes
@@ -48,6 +62,17 @@ int callReadMethod(
         Py_ssize_t iAmt,
         sqlite_int64 iOfst);
 
+/*
+    returns number of complete pages or negative error code
+*/
+int callReadvMethod(
+        BmnvfsInfo* pInfo,
+        BmnvfsFile* pFile,
+        char* zBuf,
+        int iAmt,
+        sqlite3_int64 iOfst,
+        int nPages);
+
 int callWriteMethod(
         PyObject* pObject,
         BmnvfsFile* pFile,
@@ -55,6 +80,16 @@ int callWriteMethod(
         Py_ssize_t iAmt,
         sqlite_int64 iOfst);
 
+/*
+    flushes pFile->pWrites to 'writev'
+*/
+int callWritevMethod(PyObject* pObject, BmnvfsFile* pFile);
+
+/*
+    passes pFile->pBatch to 'commit_atomic'
+*/
+int callCommitAtomicMethod(PyObject* pObject, BmnvfsFile* pFile);
+
 int callFileSizeMethod(
         PyObject* pObject,
         BmnvfsFile* pFile,
@@ -67,6 +102,18 @@ int callFileTruncateMethod(
 
 int callSyncMethod(PyObject* pObject, BmnvfsFile* pFile, int flags);
 
+/*
+    'lock' returns SQLITE_BUSY when wrapper refused the lock
+*/
+int callLockMethod(PyObject* pObject, BmnvfsFile* pFile, int iLock);
+
+int callUnlockMethod(PyObject* pObject, BmnvfsFile* pFile, int iLock);
+
+int callCheckReservedLockMethod(
+        PyObject* pObject,
+        BmnvfsFile* pFile,
+        int* pResOut);
+
 int callSectorSizeMethod(PyObject* pObject, BmnvfsFile* pFile);
 
 int callRandomnessMethod(PyObject* pObject, int nByte, char* zByte);
@@ -91,6 +138,14 @@ int callGetCurrentTimeInt64(PyObject* pObject, sqlite3_int64* pTime);
  partial methods
 */
 
+/*
+    raw read/write callables passed to 'decode'/'encode'
+    they are bound to the file and live while it is opened
+*/
+int createRawCallbacks(BmnvfsFile* pFile);
+
+void releaseRawCallbacks(BmnvfsFile* pFile);
+
 int callEncodeMethod(
         BmnvfsFile* pFile,
         const char* zBuf,
@@ -103,4 +158,15 @@ int callDecodeMethod(
         Py_ssize_t iAmt,
         sqlite3_int64 iOfst);
 
+/*
+ dict of seconds per call spent in parts of a 'write' callback of
+ pWrapper.zMethod with iSize bytes: "gil", "lookup", "arguments", "call",
+ "result" and the whole callback "total". NULL with python error
+*/
+PyObject* bmnCallbackOverhead(
+        PyObject* pWrapper,
+        const char* zMethod,
+        int nIter,
+        int iSize);
+
 #endif
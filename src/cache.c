@@ -0,0 +1,583 @@
+#include "utils.h"
+
+#include "debug.h"
+
+/*
+ sqlite allocator is used directly: cache works without GIL
+*/
+#define BMN_CACHE_MIN_PAGE 512
+#define BMN_CACHE_MAX_PAGE 65536
+#define BMN_CACHE_MIN_HASH 256
+
+struct BmnCacheFile
+{
+    BmnCacheFile* pNext;
+    int nRef;
+    unsigned int nPage;
+    /*
+     size of cached pages, every page of the file has the same size
+     */
+    int iPageSize;
+    /*
+     changed on every invalidation to reject pages read before it
+     */
+    unsigned int iGeneration;
+    char zName[1];
+};
+
+/*
+ page which is being read by some connection now
+ */
+struct BmnCacheLoad
+{
+    BmnCacheLoad* pNext;
+    BmnCacheFile* pId;
+    sqlite3_int64 iOfst;
+    unsigned long iThread;
+    PyThread_type_lock lock;
+    int nWaiters;
+    int iDone;
+};
+
+struct BmnCacheEntry
+{
+    BmnCacheFile* pId;
+    sqlite3_int64 iOfst;
+    BmnCacheEntry* pHashNext;
+    BmnCacheEntry* pPrev;
+    BmnCacheEntry* pNext;
+    int iAmt;
+    // page data follows
+};
+
+#define ENTRY_DATA(E)   ((char*)&(E)[1])
+#define ENTRY_SIZE(AMT) ((sqlite3_int64)sizeof(BmnCacheEntry) + (AMT))
+
+static int isCacheable(int iAmt, sqlite3_int64 iOfst)
+{
+    return iAmt >= BMN_CACHE_MIN_PAGE && iAmt <= BMN_CACHE_MAX_PAGE &&
+            0 == (iAmt & (iAmt - 1)) && 0 == (iOfst & (iAmt - 1));
+}
+
+static unsigned int hashKey(
+        BmnPageCache* pCache,
+        BmnCacheFile* pId,
+        sqlite3_int64 iOfst)
+{
+    sqlite3_uint64 h;
+    h = (sqlite3_uint64)(uintptr_t)pId ^
+            ((sqlite3_uint64)iOfst * 0x9E3779B97F4A7C15ULL);
+    return (unsigned int)(h ^ (h >> 32)) & (pCache->nHash - 1);
+}
+
+static BmnCacheEntry* findEntry(
+        BmnPageCache* pCache,
+        BmnCacheFile* pId,
+        sqlite3_int64 iOfst)
+{
+    BmnCacheEntry* pEntry;
+    pEntry = pCache->apHash[hashKey(pCache, pId, iOfst)];
+    while(pEntry && (pEntry->pId != pId || pEntry->iOfst != iOfst))
+    {
+        pEntry = pEntry->pHashNext;
+    }
+    return pEntry;
+}
+
+static void unlinkLru(BmnPageCache* pCache, BmnCacheEntry* pEntry)
+{
+    if(pEntry->pPrev)
+    {
+        pEntry->pPrev->pNext = pEntry->pNext;
+    }
+    else
+    {
+        pCache->pFirst = pEntry->pNext;
+    }
+    if(pEntry->pNext)
+    {
+        pEntry->pNext->pPrev = pEntry->pPrev;
+    }
+    else
+    {
+        pCache->pLast = pEntry->pPrev;
+    }
+}
+
+static void pushLru(BmnPageCache* pCache, BmnCacheEntry* pEntry)
+{
+    pEntry->pPrev = NULL;
+    pEntry->pNext = pCache->pFirst;
+    if(pCache->pFirst)
+    {
+        pCache->pFirst->pPrev = pEntry;
+    }
+    else
+    {
+        pCache->pLast = pEntry;
+    }
+    pCache->pFirst = pEntry;
+}
+
+/*
+ unused identity without pages can't be found by anybody
+ */
+static void releaseFile(BmnPageCache* pCache, BmnCacheFile* pId)
+{
+    BmnCacheFile** ppId;
+    if(pId->nRef > 0 || pId->nPage > 0)
+    {
+        return;
+    }
+    for(ppId = &pCache->pFiles; *ppId; ppId = &(*ppId)->pNext)
+    {
+        if(*ppId == pId)
+        {
+            *ppId = pId->pNext;
+            sqlite3_free(pId);
+            return;
+        }
+    }
+}
+
+static void removeEntry(BmnPageCache* pCache, BmnCacheEntry* pEntry)
+{
+    BmnCacheEntry** ppEntry;
+    BmnCacheFile* pId;
+
+    ppEntry = &pCache->apHash[hashKey(pCache, pEntry->pId, pEntry->iOfst)];
+    while(*ppEntry != pEntry)
+    {
+        ppEntry = &(*ppEntry)->pHashNext;
+    }
+    *ppEntry = pEntry->pHashNext;
+    unlinkLru(pCache, pEntry);
+    pCache->iSize -= ENTRY_SIZE(pEntry->iAmt);
+    pCache->nEntry -= 1;
+    pId = pEntry->pId;
+    pId->nPage -= 1;
+    sqlite3_free(pEntry);
+    releaseFile(pCache, pId);
+}
+
+/*
+ pId can be released here
+ */
+static void dropPages(
+        BmnPageCache* pCache,
+        BmnCacheFile* pId,
+        sqlite3_int64 iFrom,
+        sqlite3_int64 iTo)
+{
+    BmnCacheEntry* pEntry;
+    BmnCacheEntry* pNext;
+    for(pEntry = pCache->pFirst; pEntry; pEntry = pNext)
+    {
+        pNext = pEntry->pNext;
+        if((!pId || pEntry->pId == pId) &&
+           pEntry->iOfst + pEntry->iAmt > iFrom &&
+           (iTo < 0 || pEntry->iOfst < iTo))
+        {
+            removeEntry(pCache, pEntry);
+        }
+    }
+}
+
+static void growHash(BmnPageCache* pCache)
+{
+    BmnCacheEntry** apOld;
+    BmnCacheEntry** apNew;
+    BmnCacheEntry* pEntry;
+    BmnCacheEntry* pNext;
+    unsigned int nOld;
+    unsigned int i;
+    unsigned int h;
+
+    apNew = sqlite3_malloc64(sizeof(BmnCacheEntry*) * pCache->nHash * 2);
+    if(!apNew)
+    {
+        // long chains are still correct
+        return;
+    }
+    memset(apNew, 0, sizeof(BmnCacheEntry*) * pCache->nHash * 2);
+    apOld          = pCache->apHash;
+    nOld           = pCache->nHash;
+    pCache->apHash = apNew;
+    pCache->nHash  = nOld * 2;
+    for(i = 0; i < nOld; ++i)
+    {
+        for(pEntry = apOld[i]; pEntry; pEntry = pNext)
+        {
+            pNext             = pEntry->pHashNext;
+            h                 = hashKey(pCache, pEntry->pId, pEntry->iOfst);
+            pEntry->pHashNext = apNew[h];
+            apNew[h]          = pEntry;
+        }
+    }
+    sqlite3_free(apOld);
+}
+
+extern int bmnCacheSetLimit(BmnPageCache* pCache, sqlite3_int64 iMaxSize)
+{
+    int rc;
+    BmnCacheFile* pId;
+    BmnCacheFile* pNext;
+
+    if(!pCache->pMutex)
+    {
+        pCache->pMutex = sqlite3_mutex_alloc(SQLITE_MUTEX_FAST);
+        if(!pCache->pMutex)
+        {
+            return SQLITE_NOMEM;
+        }
+    }
+    rc = SQLITE_OK;
+    sqlite3_mutex_enter(pCache->pMutex);
+    dropPages(pCache, NULL, 0, -1);
+    for(pId = pCache->pFiles; pId; pId = pNext)
+    {
+        pNext = pId->pNext;
+        pId->iGeneration += 1;
+        releaseFile(pCache, pId);
+    }
+    if(iMaxSize > 0 && !pCache->apHash)
+    {
+        pCache->apHash = sqlite3_malloc64(
+                sizeof(BmnCacheEntry*) * BMN_CACHE_MIN_HASH);
+        if(pCache->apHash)
+        {
+            memset(pCache->apHash,
+                   0,
+                   sizeof(BmnCacheEntry*) * BMN_CACHE_MIN_HASH);
+            pCache->nHash = BMN_CACHE_MIN_HASH;
+        }
+        else
+        {
+            rc       = SQLITE_NOMEM;
+            iMaxSize = 0;
+        }
+    }
+    pCache->iMaxSize = iMaxSize > 0 ? iMaxSize : 0;
+    sqlite3_mutex_leave(pCache->pMutex);
+    return rc;
+}
+
+extern BmnCacheFile* bmnCacheOpen(BmnPageCache* pCache, const char* zName)
+{
+    BmnCacheFile* pId;
+    size_t iLen;
+
+    if(!pCache->pMutex || !zName)
+    {
+        return NULL;
+    }
+    sqlite3_mutex_enter(pCache->pMutex);
+    // even disabled cache needs it: cache can be enabled later
+    for(pId = pCache->pFiles; pId; pId = pId->pNext)
+    {
+        if(0 == strcmp(pId->zName, zName))
+        {
+            break;
+        }
+    }
+    if(!pId)
+    {
+        iLen = strlen(zName);
+        pId  = sqlite3_malloc64(sizeof(BmnCacheFile) + iLen);
+        if(pId)
+        {
+            memset(pId, 0, sizeof(BmnCacheFile));
+            memcpy(pId->zName, zName, iLen + 1);
+            pId->pNext     = pCache->pFiles;
+            pCache->pFiles = pId;
+        }
+    }
+    if(pId)
+    {
+        pId->nRef += 1;
+    }
+    sqlite3_mutex_leave(pCache->pMutex);
+    return pId;
+}
+
+extern void bmnCacheClose(BmnPageCache* pCache, BmnCacheFile* pId)
+{
+    if(!pId)
+    {
+        return;
+    }
+    sqlite3_mutex_enter(pCache->pMutex);
+    // pages stay for the next connection
+    pId->nRef -= 1;
+    releaseFile(pCache, pId);
+    sqlite3_mutex_leave(pCache->pMutex);
+}
+
+static BmnCacheLoad* findLoad(
+        BmnPageCache* pCache,
+        BmnCacheFile* pId,
+        sqlite3_int64 iOfst)
+{
+    BmnCacheLoad* pLoad;
+    pLoad = pCache->pLoads;
+    while(pLoad && (pLoad->pId != pId || pLoad->iOfst != iOfst))
+    {
+        pLoad = pLoad->pNext;
+    }
+    return pLoad;
+}
+
+static BmnCacheLoad* startLoad(
+        BmnPageCache* pCache,
+        BmnCacheFile* pId,
+        sqlite3_int64 iOfst)
+{
+    BmnCacheLoad* pLoad;
+    pLoad = sqlite3_malloc64(sizeof(BmnCacheLoad));
+    if(pLoad)
+    {
+        memset(pLoad, 0, sizeof(BmnCacheLoad));
+        pLoad->pId     = pId;
+        pLoad->iOfst   = iOfst;
+        pLoad->iThread = PyThread_get_thread_ident();
+        pLoad->pNext   = pCache->pLoads;
+        pCache->pLoads = pLoad;
+    }
+    return pLoad;
+}
+
+static void freeLoad(BmnCacheLoad* pLoad)
+{
+    if(pLoad->lock)
+    {
+        PyThread_free_lock(pLoad->lock);
+    }
+    sqlite3_free(pLoad);
+}
+
+static void finishLoad(BmnPageCache* pCache, BmnCacheLoad* pLoad)
+{
+    BmnCacheLoad** ppLoad;
+    for(ppLoad = &pCache->pLoads; *ppLoad != pLoad; ppLoad = &(*ppLoad)->pNext)
+    {}
+    *ppLoad      = pLoad->pNext;
+    pLoad->iDone = 1;
+    if(pLoad->lock)
+    {
+        PyThread_release_lock(pLoad->lock);
+    }
+    if(0 == pLoad->nWaiters)
+    {
+        freeLoad(pLoad);
+    }
+}
+
+/*
+ the lock is created locked by the first waiter and released by the loader,
+ then every waiter passes it to the next one
+ returns 0 if it's impossible to wait
+ */
+static int waitLoad(BmnPageCache* pCache, BmnCacheLoad* pLoad)
+{
+    // the loader needs GIL to call the wrapper
+    if(PyGILState_Check())
+    {
+        return 0;
+    }
+    if(!pLoad->lock)
+    {
+        pLoad->lock = PyThread_allocate_lock();
+        if(!pLoad->lock)
+        {
+            return 0;
+        }
+        PyThread_acquire_lock(pLoad->lock, NOWAIT_LOCK);
+    }
+    pLoad->nWaiters += 1;
+    sqlite3_mutex_leave(pCache->pMutex);
+    PyThread_acquire_lock(pLoad->lock, WAIT_LOCK);
+    PyThread_release_lock(pLoad->lock);
+    sqlite3_mutex_enter(pCache->pMutex);
+    pLoad->nWaiters -= 1;
+    if(pLoad->iDone && 0 == pLoad->nWaiters)
+    {
+        freeLoad(pLoad);
+    }
+    return 1;
+}
+
+extern int bmnCacheRead(
+        BmnPageCache* pCache,
+        BmnCacheFile* pId,
+        void* zBuf,
+        int iAmt,
+        sqlite3_int64 iOfst,
+        BmnCacheTicket* pTicket)
+{
+    BmnCacheEntry* pEntry;
+    BmnCacheLoad* pLoad;
+    int iFound;
+
+    iFound         = 0;
+    pTicket->pLoad = NULL;
+    sqlite3_mutex_enter(pCache->pMutex);
+    for(;;)
+    {
+        pTicket->iGeneration = pId->iGeneration;
+        /*
+         the first page is always read to catch external changes:
+         it holds the file change counter
+         */
+        if(iOfst <= 0 || pCache->iMaxSize <= 0 || !isCacheable(iAmt, iOfst) ||
+           (pId->iPageSize && iAmt != pId->iPageSize))
+        {
+            break;
+        }
+        pEntry = findEntry(pCache, pId, iOfst);
+        if(pEntry)
+        {
+            memcpy(zBuf, ENTRY_DATA(pEntry), iAmt);
+            unlinkLru(pCache, pEntry);
+            pushLru(pCache, pEntry);
+            pCache->iHits += 1;
+            iFound = 1;
+            break;
+        }
+        // another connection is reading this page right now
+        pLoad = findLoad(pCache, pId, iOfst);
+        if(!pLoad)
+        {
+            pTicket->pLoad = startLoad(pCache, pId, iOfst);
+            break;
+        }
+        if(pLoad->iThread == PyThread_get_thread_ident() ||
+           !waitLoad(pCache, pLoad))
+        {
+            break;
+        }
+        pCache->iWaits += 1;
+    }
+    // header and change counter reads aren't counted
+    if(!iFound && pCache->iMaxSize > 0 && isCacheable(iAmt, iOfst))
+    {
+        pCache->iMisses += 1;
+    }
+    sqlite3_mutex_leave(pCache->pMutex);
+    return iFound;
+}
+
+static void insertPage(
+        BmnPageCache* pCache,
+        BmnCacheFile* pId,
+        const void* zBuf,
+        int iAmt,
+        sqlite3_int64 iOfst)
+{
+    BmnCacheEntry* pEntry;
+    unsigned int h;
+
+    if(iAmt != pId->iPageSize)
+    {
+        // new page size after VACUUM
+        dropPages(pCache, pId, 0, -1);
+        pId->iPageSize = iAmt;
+    }
+    pEntry = findEntry(pCache, pId, iOfst);
+    if(pEntry)
+    {
+        if(0 == memcmp(ENTRY_DATA(pEntry), zBuf, iAmt))
+        {
+            unlinkLru(pCache, pEntry);
+            pushLru(pCache, pEntry);
+            return;
+        }
+        // the file was changed outside of this VFS
+        BMN_VERBOSE("drop cached pages of %s", pId->zName);
+        pId->iGeneration += 1;
+        dropPages(pCache, pId, 0, -1);
+    }
+    while(pCache->pLast && pCache->iSize + ENTRY_SIZE(iAmt) > pCache->iMaxSize)
+    {
+        removeEntry(pCache, pCache->pLast);
+        pCache->iEvictions += 1;
+    }
+    pEntry = sqlite3_malloc64(ENTRY_SIZE(iAmt));
+    if(!pEntry)
+    {
+        return;
+    }
+    if(pCache->nEntry >= pCache->nHash)
+    {
+        growHash(pCache);
+    }
+    pEntry->pId   = pId;
+    pEntry->iOfst = iOfst;
+    pEntry->iAmt  = iAmt;
+    memcpy(ENTRY_DATA(pEntry), zBuf, iAmt);
+    h                 = hashKey(pCache, pId, iOfst);
+    pEntry->pHashNext = pCache->apHash[h];
+    pCache->apHash[h] = pEntry;
+    pushLru(pCache, pEntry);
+    pCache->iSize += ENTRY_SIZE(iAmt);
+    pCache->nEntry += 1;
+    pId->nPage += 1;
+}
+
+extern void bmnCacheInsert(
+        BmnPageCache* pCache,
+        BmnCacheFile* pId,
+        const void* zBuf,
+        int iAmt,
+        sqlite3_int64 iOfst,
+        BmnCacheTicket* pTicket)
+{
+    if(!isCacheable(iAmt, iOfst))
+    {
+        return;
+    }
+    sqlite3_mutex_enter(pCache->pMutex);
+    if(zBuf && pTicket->iGeneration == pId->iGeneration &&
+       ENTRY_SIZE(iAmt) <= pCache->iMaxSize)
+    {
+        insertPage(pCache, pId, zBuf, iAmt, iOfst);
+    }
+    if(pTicket->pLoad)
+    {
+        finishLoad(pCache, pTicket->pLoad);
+        pTicket->pLoad = NULL;
+    }
+    sqlite3_mutex_leave(pCache->pMutex);
+}
+
+extern void bmnCacheInvalidate(
+        BmnPageCache* pCache,
+        BmnCacheFile* pId,
+        sqlite3_int64 iOfst,
+        sqlite3_int64 iAmt)
+{
+    BmnCacheEntry* pEntry;
+    sqlite3_int64 iPage;
+
+    sqlite3_mutex_enter(pCache->pMutex);
+    pId->iGeneration += 1;
+    if(pId->nPage > 0)
+    {
+        if(iAmt < 0 || iAmt / pId->iPageSize >= pId->nPage)
+        {
+            dropPages(pCache, pId, iOfst, iAmt < 0 ? -1 : iOfst + iAmt);
+        }
+        else
+        {
+            iPage = iOfst - iOfst % pId->iPageSize;
+            for(; iPage < iOfst + iAmt; iPage += pId->iPageSize)
+            {
+                pEntry = findEntry(pCache, pId, iPage);
+                if(pEntry)
+                {
+                    removeEntry(pCache, pEntry);
+                }
+            }
+        }
+    }
+    sqlite3_mutex_leave(pCache->pMutex);
+}
@@ -0,0 +1,100 @@
+/* cache.h - LRU cache of decoded pages
+ *
+ * Pages are kept decoded ( after 'read'/'decode'/native codec ) so
+ * connections can skip wrapper calls for hot pages. Only page aligned
+ * reads of power of two size are cached.
+ * All functions can be called without GIL, cache has its own mutex.
+ */
+
+#ifndef BMN_CACHE_H
+#define BMN_CACHE_H
+#include "sqlite3.h"
+
+typedef struct BmnPageCache BmnPageCache;
+typedef struct BmnCacheFile BmnCacheFile;
+typedef struct BmnCacheEntry BmnCacheEntry;
+typedef struct BmnCacheLoad BmnCacheLoad;
+typedef struct BmnCacheTicket BmnCacheTicket;
+
+struct BmnPageCache
+{
+    sqlite3_mutex* pMutex;
+    /*
+     size in bytes including entry headers. 0 disables the cache
+     */
+    sqlite3_int64 iMaxSize;
+    sqlite3_int64 iSize;
+    BmnCacheEntry** apHash;
+    unsigned int nHash;
+    unsigned int nEntry;
+    // most recently used first
+    BmnCacheEntry* pFirst;
+    BmnCacheEntry* pLast;
+    BmnCacheFile* pFiles;
+    BmnCacheLoad* pLoads;
+    sqlite3_int64 iHits;
+    sqlite3_int64 iMisses;
+    sqlite3_int64 iEvictions;
+    // reads which waited for the same page read by another connection
+    sqlite3_int64 iWaits;
+};
+
+/*
+ state of the missed read between bmnCacheRead and bmnCacheInsert
+ */
+struct BmnCacheTicket
+{
+    unsigned int iGeneration;
+    BmnCacheLoad* pLoad;
+};
+
+/*
+ returns SQLITE_OK or SQLITE_NOMEM
+ drops all cached pages, counters stay
+ */
+int bmnCacheSetLimit(BmnPageCache* pCache, sqlite3_int64 iMaxSize);
+
+/*
+ identity of the file shared by all connections opened it
+ NULL if cache wasn't configured at all or there's no memory
+ */
+BmnCacheFile* bmnCacheOpen(BmnPageCache* pCache, const char* zName);
+
+void bmnCacheClose(BmnPageCache* pCache, BmnCacheFile* pId);
+
+/*
+ returns 1 and fills zBuf if page is found.
+ If the page is being read by another connection it waits for it,
+ so every page is read once by all connections.
+ otherwise returns 0 and fills pTicket, then bmnCacheInsert must be called
+ */
+int bmnCacheRead(
+        BmnPageCache* pCache,
+        BmnCacheFile* pId,
+        void* zBuf,
+        int iAmt,
+        sqlite3_int64 iOfst,
+        BmnCacheTicket* pTicket);
+
+/*
+ zBuf is NULL if read is failed
+ page isn't inserted if file was changed after bmnCacheRead
+ */
+void bmnCacheInsert(
+        BmnPageCache* pCache,
+        BmnCacheFile* pId,
+        const void* zBuf,
+        int iAmt,
+        sqlite3_int64 iOfst,
+        BmnCacheTicket* pTicket);
+
+/*
+ drops pages overlapping the range. negative iAmt means up to the end
+ */
+void bmnCacheInvalidate(
+        BmnPageCache* pCache,
+        BmnCacheFile* pId,
+        sqlite3_int64 iOfst,
+        sqlite3_int64 iAmt);
+
+#endif
@@ -0,0 +1,46 @@
+/* codec.h - native page transform interface
+ *
+ * Wrapper's 'codec' method returns PyCapsule named BMN_CODEC_CAPSULE_NAME
+ * with pointer to BmnCodec structure. This header has no dependencies
+ * except sqlite3.h so it can be copied to the library implementing codec.
+ */
+
+#ifndef BMN_CODEC_H
+#define BMN_CODEC_H
+#include "sqlite3.h"
+
+#define BMN_CODEC_CAPSULE_NAME "bmnsqlite3.codec"
+#define BMN_CODEC_VERSION      1
+
+typedef struct BmnCodec BmnCodec;
+
+/*
+ Both methods transform iAmt bytes placed at offset iOfst of the file.
+ The transform must keep the size and depend on the offset only, i.e.
+ any part of the data can be decoded separately ( stream/CTR/XTS ciphers ).
+ iFileFlags are sqlite open flags ( SQLITE_OPEN_MAIN_DB ... ).
+ Return SQLITE_OK or any sqlite error code.
+
+ They are called without GIL, possibly from several threads at once.
+ Structure and pCtx must stay valid while capsule is alive.
+*/
+struct BmnCodec
+{
+    int iVersion; /* BMN_CODEC_VERSION */
+    void* pCtx;
+    int (*xEncode)(
+            void* pCtx,
+            int iFileFlags,
+            const void* zIn,
+            void* zOut,
+            int iAmt,
+            sqlite3_int64 iOfst);
+    int (*xDecode)(
+            void* pCtx,
+            int iFileFlags,
+            void* zBuf,
+            int iAmt,
+            sqlite3_int64 iOfst);
+};
+
+#endif
@@ -0,0 +1,545 @@
+#include <string.h>
+
+#include "debug.h"
+#include "utils.h"
+
+// microseconds between checks of a sync performed by another thread
+#define BMN_SYNC_POLL 100
+
+struct BmnSyncFile
+{
+    BmnSyncFile* pNext;
+    int nRef;
+    /*
+     merged flags of deferred syncs, 0 if there are none
+     */
+    int iPending;
+    // milliseconds of the first deferred sync and of the last performed one
+    sqlite3_int64 iFirstDeferred;
+    sqlite3_int64 iLastSync;
+    /*
+     deferred syncs are numbered, iSynced is the last one covered by a
+     performed sync
+     */
+    sqlite3_int64 iTicket;
+    sqlite3_int64 iSynced;
+    // handle which deferred the last sync, the flusher syncs it
+    BmnSyncMethod xSync;
+    void* pArg;
+    // handle which is being synced now without the mutex
+    void* pSyncing;
+    char zName[1];
+};
+
+static const char* azPolicy[] = {"normal", "full", "group", "interval"};
+
+extern int bmnDurabilityPolicy(const char* zName)
+{
+    int i;
+    for(i = 0; i < (int)(sizeof(azPolicy) / sizeof(azPolicy[0])); ++i)
+    {
+        if(0 == strcmp(azPolicy[i], zName))
+        {
+            return i;
+        }
+    }
+    return -1;
+}
+
+extern const char* bmnDurabilityName(int iPolicy)
+{
+    BMN_ASSERT(iPolicy >= 0 && iPolicy <= BMN_DURABILITY_INTERVAL);
+    return azPolicy[iPolicy];
+}
+
+static sqlite3_int64 currentTime(sqlite3_vfs* pClock)
+{
+    sqlite3_int64 iTime;
+    double fTime;
+
+    if(pClock->iVersion >= 2 && pClock->xCurrentTimeInt64)
+    {
+        if(SQLITE_OK == pClock->xCurrentTimeInt64(pClock, &iTime))
+        {
+            return iTime;
+        }
+    }
+    else if(SQLITE_OK == pClock->xCurrentTime(pClock, &fTime))
+    {
+        return (sqlite3_int64)(fTime * 86400000.0);
+    }
+    return 0;
+}
+
+/*
+ the strongest sync type, data only if both are
+ */
+static int mergeFlags(int iFlags, int iOther)
+{
+    int iType;
+    if(!iFlags || !iOther)
+    {
+        return iFlags | iOther;
+    }
+    iType = iFlags & 0x0F;
+    if(iType < (iOther & 0x0F))
+    {
+        iType = iOther & 0x0F;
+    }
+    return iType | (iFlags & iOther & SQLITE_SYNC_DATAONLY);
+}
+
+/*
+ 1 if the sync of the file can wait for the next one.
+ 'group' needs the committing connection to wait for it
+ */
+static int canDefer(
+        BmnDurability* pDurability,
+        BmnSyncFile* pId,
+        sqlite3_int64 iNow,
+        int iWaiter)
+{
+    if(pDurability->iInterval <= 0)
+    {
+        return 0;
+    }
+    if(BMN_DURABILITY_GROUP == pDurability->iPolicy)
+    {
+        if(!iWaiter)
+        {
+            return 0;
+        }
+        if(!pId->iPending)
+        {
+            // nobody else would commit meanwhile
+            return pId->nRef > 1;
+        }
+        return iNow - pId->iFirstDeferred < pDurability->iInterval;
+    }
+    if(BMN_DURABILITY_INTERVAL == pDurability->iPolicy)
+    {
+        return iNow - pId->iLastSync < pDurability->iInterval;
+    }
+    return 0;
+}
+
+/*
+ milliseconds when the deferred sync of the file must be performed
+ */
+static sqlite3_int64 syncDeadline(BmnDurability* pDurability, BmnSyncFile* pId)
+{
+    int iInterval;
+
+    iInterval = pDurability->iInterval > 0 ? pDurability->iInterval : 1;
+    if(BMN_DURABILITY_INTERVAL == pDurability->iPolicy)
+    {
+        return pId->iLastSync + iInterval;
+    }
+    return pId->iFirstDeferred + iInterval;
+}
+
+/*
+ leaves the mutex and GIL for iMicro microseconds
+ */
+static void pauseSync(BmnDurability* pDurability, sqlite3_int64 iMicro)
+{
+    PyThreadState* pState;
+
+    pState = NULL;
+    sqlite3_mutex_leave(pDurability->pMutex);
+    if(PyGILState_Check())
+    {
+        pState = PyEval_SaveThread();
+    }
+    PyThread_acquire_lock_timed(pDurability->pPause, (PY_TIMEOUT_T)iMicro, 0);
+    if(pState)
+    {
+        PyEval_RestoreThread(pState);
+    }
+    sqlite3_mutex_enter(pDurability->pMutex);
+}
+
+/*
+ performs deferred syncs of the file merged with flags by xSync( pArg )
+ after the sync which another thread performs now.
+ The mutex is held, it's left during the sync
+ */
+static int performPending(
+        BmnDurability* pDurability,
+        BmnSyncFile* pId,
+        int flags,
+        BmnSyncMethod xSync,
+        void* pArg)
+{
+    sqlite3_int64 iTicket;
+    int iPending;
+    int rc;
+
+    while(pId->pSyncing)
+    {
+        pauseSync(pDurability, BMN_SYNC_POLL);
+    }
+    iPending = pId->iPending;
+    flags    = mergeFlags(iPending, flags);
+    if(!flags)
+    {
+        return SQLITE_OK;
+    }
+    iTicket       = pId->iTicket;
+    pId->iPending = 0;
+    pId->pSyncing = pArg;
+    pDurability->iPerformed += 1;
+    sqlite3_mutex_leave(pDurability->pMutex);
+    rc = xSync(pArg, flags);
+    sqlite3_mutex_enter(pDurability->pMutex);
+    pId->pSyncing = NULL;
+    if(SQLITE_OK == rc)
+    {
+        pId->iSynced   = iTicket;
+        pId->iLastSync = currentTime(pDurability->pClock);
+    }
+    else if(iPending)
+    {
+        // the next sync or flush tries it again
+        pId->iPending = mergeFlags(pId->iPending, iPending);
+    }
+    BMN_TRACE_ERROR(rc);
+    return rc;
+}
+
+static void wakeFlusher(BmnDurability* pDurability)
+{
+    if(pDurability->iFlusher && pDurability->iSleeping)
+    {
+        pDurability->iSleeping = 0;
+        PyThread_release_lock(pDurability->pWakeup);
+    }
+}
+
+/*
+ performs deferred syncs whose window ended, runs without GIL while
+ there are files. pWakeup is held while it doesn't sleep
+ */
+static void flusherMain(void* pArg)
+{
+    BmnDurability* pDurability;
+    BmnSyncFile* pId;
+    sqlite3_int64 iNow;
+    sqlite3_int64 iDue;
+    sqlite3_int64 iWait;
+    PyLockStatus iWoken;
+
+    pDurability = (BmnDurability*)pArg;
+    sqlite3_mutex_enter(pDurability->pMutex);
+    while(pDurability->pFiles)
+    {
+        iWait = -1;
+        iNow  = currentTime(pDurability->pClock);
+        for(pId = pDurability->pFiles; pId; pId = pId->pNext)
+        {
+            if(!pId->iPending || !pId->pArg)
+            {
+                continue;
+            }
+            iDue = syncDeadline(pDurability, pId);
+            if(iDue <= iNow && !pId->pSyncing)
+            {
+                if(SQLITE_OK != performPending(
+                                        pDurability,
+                                        pId,
+                                        0,
+                                        pId->xSync,
+                                        pId->pArg))
+                {
+                    // tried again after the window
+                    pId->iFirstDeferred = currentTime(pDurability->pClock);
+                    pId->iLastSync      = pId->iFirstDeferred;
+                }
+                // files could be closed without the mutex
+                break;
+            }
+            iDue = iDue > iNow ? iDue - iNow : 1;
+            if(iWait < 0 || iDue < iWait)
+            {
+                iWait = iDue;
+            }
+        }
+        if(pId)
+        {
+            continue;
+        }
+        pDurability->iSleeping = 1;
+        sqlite3_mutex_leave(pDurability->pMutex);
+        iWoken = PyThread_acquire_lock_timed(
+                pDurability->pWakeup,
+                iWait < 0 ? -1 : (PY_TIMEOUT_T)iWait * 1000,
+                0);
+        sqlite3_mutex_enter(pDurability->pMutex);
+        if(PY_LOCK_ACQUIRED != iWoken && !pDurability->iSleeping)
+        {
+            // released after the timeout
+            PyThread_acquire_lock(pDurability->pWakeup, NOWAIT_LOCK);
+        }
+        pDurability->iSleeping = 0;
+    }
+    pDurability->iFlusher = 0;
+    sqlite3_mutex_leave(pDurability->pMutex);
+}
+
+/*
+ returns 0 if the flusher can't be started
+ */
+static int startFlusher(BmnDurability* pDurability)
+{
+    if(pDurability->iFlusher)
+    {
+        wakeFlusher(pDurability);
+        return 1;
+    }
+    if(PYTHREAD_INVALID_THREAD_ID ==
+       PyThread_start_new_thread(flusherMain, pDurability))
+    {
+        return 0;
+    }
+    pDurability->iFlusher = 1;
+    return 1;
+}
+
+/*
+ allocates the lock held by this thread
+ */
+static PyThread_type_lock allocateHeldLock(void)
+{
+    PyThread_type_lock pLock;
+
+    pLock = PyThread_allocate_lock();
+    if(pLock)
+    {
+        PyThread_acquire_lock(pLock, NOWAIT_LOCK);
+    }
+    return pLock;
+}
+
+extern int bmnDurabilitySet(
+        BmnDurability* pDurability,
+        sqlite3_vfs* pClock,
+        int iPolicy,
+        int iInterval)
+{
+    if(!pDurability->pMutex)
+    {
+        pDurability->pMutex = sqlite3_mutex_alloc(SQLITE_MUTEX_FAST);
+        if(!pDurability->pMutex)
+        {
+            return SQLITE_NOMEM;
+        }
+    }
+    if(!pDurability->pWakeup)
+    {
+        pDurability->pWakeup = allocateHeldLock();
+    }
+    if(!pDurability->pPause)
+    {
+        pDurability->pPause = allocateHeldLock();
+    }
+    if(!pDurability->pWakeup || !pDurability->pPause)
+    {
+        return SQLITE_NOMEM;
+    }
+    sqlite3_mutex_enter(pDurability->pMutex);
+    pDurability->pClock    = pClock;
+    pDurability->iPolicy   = iPolicy;
+    pDurability->iInterval = iInterval;
+    // windows of deferred syncs change
+    wakeFlusher(pDurability);
+    sqlite3_mutex_leave(pDurability->pMutex);
+    return SQLITE_OK;
+}
+
+extern BmnSyncFile* bmnDurabilityOpen(
+        BmnDurability* pDurability,
+        const char* zName)
+{
+    BmnSyncFile* pId;
+    size_t iLen;
+
+    if(!BMN_HAS_DEFERRED_SYNC || !pDurability->pMutex || !zName)
+    {
+        return NULL;
+    }
+    sqlite3_mutex_enter(pDurability->pMutex);
+    pId = NULL;
+    if(BMN_DURABILITY_GROUP == pDurability->iPolicy ||
+       BMN_DURABILITY_INTERVAL == pDurability->iPolicy)
+    {
+        for(pId = pDurability->pFiles; pId; pId = pId->pNext)
+        {
+            if(0 == strcmp(pId->zName, zName))
+            {
+                break;
+            }
+        }
+        if(!pId)
+        {
+            iLen = strlen(zName);
+            pId  = sqlite3_malloc64(sizeof(BmnSyncFile) + iLen);
+            if(pId)
+            {
+                memset(pId, 0, sizeof(BmnSyncFile));
+                memcpy(pId->zName, zName, iLen + 1);
+                pId->pNext          = pDurability->pFiles;
+                pDurability->pFiles = pId;
+            }
+        }
+        if(pId)
+        {
+            pId->nRef += 1;
+        }
+    }
+    sqlite3_mutex_leave(pDurability->pMutex);
+    return pId;
+}
+
+extern int bmnDurabilityClose(
+        BmnDurability* pDurability,
+        BmnSyncFile* pId,
+        BmnSyncMethod xSync,
+        void* pArg)
+{
+    BmnSyncFile** ppId;
+    int rc;
+
+    if(!pId)
+    {
+        return SQLITE_OK;
+    }
+    sqlite3_mutex_enter(pDurability->pMutex);
+    rc = performPending(pDurability, pId, 0, xSync, pArg);
+    // nobody syncs by the handle now
+    if(pId->pArg == pArg)
+    {
+        pId->xSync = NULL;
+        pId->pArg  = NULL;
+    }
+    pId->nRef -= 1;
+    if(0 == pId->nRef && !pId->iPending)
+    {
+        for(ppId = &pDurability->pFiles; *ppId != pId; ppId = &(*ppId)->pNext)
+        {}
+        *ppId = pId->pNext;
+        sqlite3_free(pId);
+        // it exits when no files are left
+        wakeFlusher(pDurability);
+    }
+    sqlite3_mutex_leave(pDurability->pMutex);
+    return rc;
+}
+
+extern int bmnDurabilitySync(
+        BmnDurability* pDurability,
+        BmnSyncFile* pId,
+        int flags,
+        BmnSyncMethod xSync,
+        void* pArg,
+        sqlite3_int64* piTicket)
+{
+    sqlite3_int64 iNow;
+    int rc;
+
+    if(piTicket)
+    {
+        *piTicket = 0;
+    }
+    if(!pDurability->pMutex)
+    {
+        return xSync(pArg, flags);
+    }
+    iNow = pId ? currentTime(pDurability->pClock) : 0;
+    sqlite3_mutex_enter(pDurability->pMutex);
+    pDurability->iRequested += 1;
+    if(BMN_DURABILITY_FULL == pDurability->iPolicy)
+    {
+        flags = SQLITE_SYNC_FULL;
+    }
+    if(!pId)
+    {
+        pDurability->iPerformed += 1;
+        sqlite3_mutex_leave(pDurability->pMutex);
+        return xSync(pArg, flags);
+    }
+    if(canDefer(pDurability, pId, iNow, NULL != piTicket) &&
+       startFlusher(pDurability))
+    {
+        if(!pId->iPending)
+        {
+            pId->iFirstDeferred = iNow;
+        }
+        pId->iPending = mergeFlags(pId->iPending, flags);
+        pId->iTicket += 1;
+        pId->xSync = xSync;
+        pId->pArg  = pArg;
+        pDurability->iDeferred += 1;
+        if(BMN_DURABILITY_GROUP == pDurability->iPolicy)
+        {
+            *piTicket = pId->iTicket;
+        }
+        sqlite3_mutex_leave(pDurability->pMutex);
+        return SQLITE_OK;
+    }
+    // one sync covers all deferred ones
+    rc = performPending(pDurability, pId, flags, xSync, pArg);
+    sqlite3_mutex_leave(pDurability->pMutex);
+    return rc;
+}
+
+extern int bmnDurabilityWait(
+        BmnDurability* pDurability,
+        BmnSyncFile* pId,
+        sqlite3_int64 iTicket,
+        BmnSyncMethod xSync,
+        void* pArg)
+{
+    sqlite3_int64 iNow;
+    int rc;
+
+    if(!pId || !iTicket)
+    {
+        return SQLITE_OK;
+    }
+    rc = SQLITE_OK;
+    sqlite3_mutex_enter(pDurability->pMutex);
+    // others commit meanwhile, the first one whose window ends syncs all
+    while(SQLITE_OK == rc && pId->iSynced < iTicket &&
+          (pId->iPending || pId->pSyncing))
+    {
+        iNow = currentTime(pDurability->pClock);
+        if(!pId->pSyncing && iNow >= syncDeadline(pDurability, pId))
+        {
+            rc = performPending(pDurability, pId, 0, xSync, pArg);
+        }
+        else
+        {
+            pauseSync(pDurability, BMN_SYNC_POLL);
+        }
+    }
+    sqlite3_mutex_leave(pDurability->pMutex);
+    return rc;
+}
+
+extern int bmnDurabilityFlush(
+        BmnDurability* pDurability,
+        BmnSyncFile* pId,
+        BmnSyncMethod xSync,
+        void* pArg)
+{
+    int rc;
+
+    if(!pId)
+    {
+        return SQLITE_OK;
+    }
+    sqlite3_mutex_enter(pDurability->pMutex);
+    rc = performPending(pDurability, pId, 0, xSync, pArg);
+    sqlite3_mutex_leave(pDurability->pMutex);
+    return rc;
+}
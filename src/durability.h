@@ -0,0 +1,142 @@
+/* durability.h - sync policy of VFS registration
+ *
+ * Every xSync of the VFS is counted here and performed according to the
+ * policy of the registration:
+ * - normal: as sqlite asks
+ * - full: always with SQLITE_SYNC_FULL
+ * - group: commit syncs of WAL files are merged while other connections
+ *   of the process have the WAL opened. A committing connection waits
+ *   after it releases the WAL write lock, so others can commit meanwhile,
+ *   up to the window for one sync which covers all commits of it. Commits
+ *   return synced.
+ * - interval: commit syncs of WAL files are performed once per interval,
+ *   commits of the interval are synced at its end by a flusher thread, so
+ *   only commits of the last interval can be lost on power failure
+ * Deferred syncs of the WAL are also performed before checkpoint writes
+ * pages to the main DB and when the WAL is closed, the DB stays
+ * consistent. Syncs of other files aren't deferred: rollback journals
+ * need each of them.
+ * All functions can be called without GIL, state has its own mutex.
+ */
+
+#ifndef BMN_DURABILITY_H
+#define BMN_DURABILITY_H
+#include "sqlite3.h"
+
+#define BMN_DURABILITY_NORMAL   0
+#define BMN_DURABILITY_FULL     1
+#define BMN_DURABILITY_GROUP    2
+#define BMN_DURABILITY_INTERVAL 3
+
+/*
+ checkpoint is noticed by SQLITE_FCNTL_CKPT_START and the WAL is found
+ by sqlite3_database_file_object, syncs are never deferred without them
+ */
+#if defined(SQLITE_FCNTL_CKPT_START) && SQLITE_VERSION_NUMBER >= 3032000
+#    define BMN_HAS_DEFERRED_SYNC 1
+#else
+#    define BMN_HAS_DEFERRED_SYNC 0
+#endif
+
+typedef struct BmnDurability BmnDurability;
+typedef struct BmnSyncFile BmnSyncFile;
+
+/*
+ performs sync of the file pArg, returns sqlite result code
+ */
+typedef int (*BmnSyncMethod)(void* pArg, int flags);
+
+struct BmnDurability
+{
+    sqlite3_mutex* pMutex;
+    // time source
+    sqlite3_vfs* pClock;
+    int iPolicy;
+    /*
+     milliseconds: merge window of 'group' or period of 'interval'
+     */
+    int iInterval;
+    BmnSyncFile* pFiles;
+    sqlite3_int64 iRequested;
+    sqlite3_int64 iPerformed;
+    sqlite3_int64 iDeferred;
+    /*
+     flusher thread performs deferred syncs at the end of their window.
+     It sleeps on pWakeup and exits when no files are left
+     */
+    PyThread_type_lock pWakeup;
+    int iFlusher;
+    int iSleeping;
+    // always held, timed acquire of it pauses waiting threads
+    PyThread_type_lock pPause;
+};
+
+/*
+ BMN_DURABILITY_* by name or -1
+ */
+int bmnDurabilityPolicy(const char* zName);
+
+const char* bmnDurabilityName(int iPolicy);
+
+/*
+ returns SQLITE_OK or SQLITE_NOMEM
+ files opened already keep deferring syncs according to the new policy,
+ counters stay
+ */
+int bmnDurabilitySet(
+        BmnDurability* pDurability,
+        sqlite3_vfs* pClock,
+        int iPolicy,
+        int iInterval);
+
+/*
+ identity of the WAL file shared by all connections opened it
+ NULL if the policy doesn't defer syncs or there's no memory
+ */
+BmnSyncFile* bmnDurabilityOpen(BmnDurability* pDurability, const char* zName);
+
+/*
+ pending sync of the file is performed by xSync( pArg ) before it's closed
+ */
+int bmnDurabilityClose(
+        BmnDurability* pDurability,
+        BmnSyncFile* pId,
+        BmnSyncMethod xSync,
+        void* pArg);
+
+/*
+ xSync( pArg, flags ) is called at once or the sync is deferred.
+ pId is NULL for files which syncs are never deferred.
+ 'group' defers the sync only if piTicket isn't NULL: the caller must pass
+ *piTicket to bmnDurabilityWait after the WAL write lock is released.
+ *piTicket is 0 if there's nothing to wait for
+ */
+int bmnDurabilitySync(
+        BmnDurability* pDurability,
+        BmnSyncFile* pId,
+        int flags,
+        BmnSyncMethod xSync,
+        void* pArg,
+        sqlite3_int64* piTicket);
+
+/*
+ waits until the deferred sync of iTicket is performed, performs it by
+ xSync( pArg ) when its window ends
+ */
+int bmnDurabilityWait(
+        BmnDurability* pDurability,
+        BmnSyncFile* pId,
+        sqlite3_int64 iTicket,
+        BmnSyncMethod xSync,
+        void* pArg);
+
+/*
+ performs deferred sync of the file if there is one
+ */
+int bmnDurabilityFlush(
+        BmnDurability* pDurability,
+        BmnSyncFile* pId,
+        BmnSyncMethod xSync,
+        void* pArg);
+
+#endif
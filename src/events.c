@@ -0,0 +1,115 @@
+#include <string.h>
+
+#include "debug.h"
+#include "utils.h"
+
+extern int bmnEventsSet(BmnEvents* pEvents, int nCapacity)
+{
+    BmnEvent* aEvent;
+    BmnEvent* aOld;
+
+    BMN_ASSERT(nCapacity >= 0);
+    if(!pEvents->pMutex)
+    {
+        pEvents->pMutex = sqlite3_mutex_alloc(SQLITE_MUTEX_FAST);
+        if(!pEvents->pMutex)
+        {
+            return SQLITE_NOMEM;
+        }
+    }
+    aEvent = NULL;
+    if(nCapacity)
+    {
+        aEvent = sqlite3_malloc64(sizeof(BmnEvent) * (sqlite3_uint64)nCapacity);
+        if(!aEvent)
+        {
+            return SQLITE_NOMEM;
+        }
+    }
+    sqlite3_mutex_enter(pEvents->pMutex);
+    aOld               = pEvents->aEvent;
+    pEvents->aEvent    = aEvent;
+    pEvents->nCapacity = nCapacity;
+    pEvents->iFirst    = pEvents->iNext;
+    sqlite3_mutex_leave(pEvents->pMutex);
+    sqlite3_free(aOld);
+    return SQLITE_OK;
+}
+
+extern sqlite3_int64 bmnEventsFileId(BmnEvents* pEvents)
+{
+    sqlite3_int64 iId;
+    // files are opened before tracing is turned on, so it's not pMutex
+    sqlite3_mutex* pMutex = sqlite3_mutex_alloc(SQLITE_MUTEX_STATIC_APP2);
+
+    sqlite3_mutex_enter(pMutex);
+    iId = ++pEvents->iLastFile;
+    sqlite3_mutex_leave(pMutex);
+    return iId;
+}
+
+extern void bmnEventsAdd(BmnEvents* pEvents, BmnEvent* pEvent)
+{
+    if(!BMN_EVENTS_ON(pEvents))
+    {
+        return;
+    }
+    sqlite3_mutex_enter(pEvents->pMutex);
+    // it could be turned off meanwhile
+    if(pEvents->nCapacity)
+    {
+        pEvent->iSeq = pEvents->iNext++;
+        pEvents->aEvent[pEvent->iSeq % pEvents->nCapacity] = *pEvent;
+    }
+    sqlite3_mutex_leave(pEvents->pMutex);
+}
+
+extern BmnEvent* bmnEventsDrain(BmnEvents* pEvents, int* pnEvent)
+{
+    BmnEvent* aCopy;
+    sqlite3_int64 iFirst;
+    int nEvent;
+    int iSlot;
+    int nHead;
+
+    *pnEvent = 0;
+    if(!pEvents->pMutex)
+    {
+        return NULL;
+    }
+    aCopy = NULL;
+    sqlite3_mutex_enter(pEvents->pMutex);
+    iFirst = pEvents->iFirst;
+    if(pEvents->iNext - iFirst > pEvents->nCapacity)
+    {
+        // overwritten ones are lost
+        iFirst = pEvents->iNext - pEvents->nCapacity;
+    }
+    nEvent = (int)(pEvents->iNext - iFirst);
+    if(nEvent)
+    {
+        aCopy = sqlite3_malloc64(sizeof(BmnEvent) * (sqlite3_uint64)nEvent);
+    }
+    if(aCopy)
+    {
+        // the ring may wrap around its end
+        iSlot = (int)(iFirst % pEvents->nCapacity);
+        nHead = pEvents->nCapacity - iSlot;
+        if(nHead > nEvent)
+        {
+            nHead = nEvent;
+        }
+        memcpy(aCopy, &pEvents->aEvent[iSlot], sizeof(BmnEvent) * nHead);
+        memcpy(&aCopy[nHead],
+               pEvents->aEvent,
+               sizeof(BmnEvent) * (nEvent - nHead));
+        pEvents->iFirst = pEvents->iNext;
+        *pnEvent        = nEvent;
+    }
+    else if(nEvent)
+    {
+        *pnEvent = -1;
+    }
+    sqlite3_mutex_leave(pEvents->pMutex);
+    return aCopy;
+}
@@ -0,0 +1,94 @@
+/* events.h - I/O event trace of VFS registration
+ *
+ * When tracing is on, every call counted in stats.h is also recorded as
+ * a fixed size event in a ring buffer of the registration. The oldest
+ * events are overwritten when the ring is full, the sequence number of
+ * events shows such gaps. Events are drained as a copy, the ring then
+ * starts empty. When tracing is off a call costs one load of capacity.
+ * All functions can be called without GIL, the ring has its own mutex.
+ */
+
+#ifndef BMN_EVENTS_H
+#define BMN_EVENTS_H
+#include "sqlite3.h"
+
+/*
+ capacity of vfs_trace if it isn't given
+ */
+#ifndef BMN_EVENTS_DEFAULT_CAPACITY
+#    define BMN_EVENTS_DEFAULT_CAPACITY 65536
+#endif
+
+#define BMN_EVENTS_ON(P) (0 != (P)->nCapacity)
+#define BMN_EVENT_FORMAT "=qqqqqiiii"
+
+typedef struct BmnEvent BmnEvent;
+typedef struct BmnEvents BmnEvents;
+
+/*
+ 56 bytes without padding, python reads it as struct BMN_EVENT_FORMAT
+ */
+struct BmnEvent
+{
+    sqlite3_int64 iSeq;
+    /*
+     nanoseconds of monotonic clock when the call started and its duration
+     */
+    sqlite3_int64 iTime;
+    sqlite3_int64 iDuration;
+    // 0 for VFS calls other than open and close
+    sqlite3_int64 iFile;
+    /*
+     read and write offset, truncate size, -1 for others
+     */
+    sqlite3_int64 iOffset;
+    /*
+     read and write size, sync flags, lock level, file control op.,
+     flags of open, access and delete
+     */
+    int iLength;
+    // SQLITE_OPEN_* flags of the file
+    int iFlags;
+    int rc;
+    // BMN_OP_*
+    int iOp;
+};
+
+struct BmnEvents
+{
+    sqlite3_mutex* pMutex;
+    int nCapacity;
+    BmnEvent* aEvent;
+    /*
+     sequence number of the next event and of the oldest one not drained
+     */
+    sqlite3_int64 iNext;
+    sqlite3_int64 iFirst;
+    // the last id given to a file, ids are never reused
+    sqlite3_int64 iLastFile;
+};
+
+/*
+ turns tracing on with new empty ring of nCapacity events or off if
+ nCapacity is 0. Returns sqlite result code
+ */
+int bmnEventsSet(BmnEvents* pEvents, int nCapacity);
+
+/*
+ the unique id of a new file
+ */
+sqlite3_int64 bmnEventsFileId(BmnEvents* pEvents);
+
+/*
+ records copy of the event with the next sequence number if tracing is on
+ */
+void bmnEventsAdd(BmnEvents* pEvents, BmnEvent* pEvent);
+
+/*
+ copy of recorded events from the oldest one, the ring is empty then.
+ *pnEvent is the count of them or -1 if there is no memory for the copy.
+ The copy is freed with sqlite3_free
+ */
+BmnEvent* bmnEventsDrain(BmnEvents* pEvents, int* pnEvent);
+
+#endif
@@ -0,0 +1,586 @@
+#include <string.h>
+
+#include "debug.h"
+#include "utils.h"
+
+/*
+ blocks grow twice until this size, by this size then
+*/
+#define BMN_MEM_GROWTH_LIMIT (16 * 1024 * 1024)
+#define BMN_MEM_MIN_ALLOC    4096
+#define BMN_MEM_SECTOR_SIZE  512
+
+#define MEM_FILE(p)  ((BmnMemFile*)(void*)p)
+#define MEM_STORE(p) ((BmnMemStore*)(void*)p)
+
+typedef struct BmnMemFile BmnMemFile;
+
+struct BmnMemNode
+{
+    BmnMemNode* pNext;
+    char* aData;
+    sqlite3_int64 iSize;
+    sqlite3_int64 nAlloc;
+    // opened handles
+    int nRef;
+    // handles holding SHARED lock at least
+    int nShared;
+    // the strongest lock held by any handle
+    int eLock;
+    int iDeleteOnClose;
+    // 0 if the file is deleted but still opened
+    int iLinked;
+    char zName[1];
+};
+
+struct BmnMemFile
+{
+    sqlite3_file base;
+    BmnMemStore* pStore;
+    BmnMemNode* pNode;
+    int eLock;
+};
+
+static int memClose(sqlite3_file*);
+static int memRead(sqlite3_file*, void*, int iAmt, sqlite3_int64 iOfst);
+static int memWrite(sqlite3_file*, const void*, int iAmt, sqlite3_int64 iOfst);
+static int memTruncate(sqlite3_file*, sqlite3_int64 size);
+static int memSync(sqlite3_file*, int flags);
+static int memFileSize(sqlite3_file*, sqlite3_int64* pSize);
+static int memLock(sqlite3_file*, int);
+static int memUnlock(sqlite3_file*, int);
+static int memCheckReservedLock(sqlite3_file*, int*);
+static int memFileControl(sqlite3_file*, int iOperation, void* pArg);
+static int memSectorSize(sqlite3_file*);
+static int memDeviceCharacteristics(sqlite3_file*);
+
+static const sqlite3_io_methods memIoMethods = {
+        1,
+        memClose,
+        memRead,
+        memWrite,
+        memTruncate,
+        memSync,
+        memFileSize,
+        memLock,
+        memUnlock,
+        memCheckReservedLock,
+        memFileControl,
+        memSectorSize,
+        memDeviceCharacteristics};
+
+static BmnMemNode* findNode(BmnMemStore* pStore, const char* zName)
+{
+    BmnMemNode* pNode;
+    for(pNode = pStore->pNodes; pNode; pNode = pNode->pNext)
+    {
+        if(0 == strcmp(pNode->zName, zName))
+        {
+            return pNode;
+        }
+    }
+    return NULL;
+}
+
+static void unlinkNode(BmnMemStore* pStore, BmnMemNode* pNode)
+{
+    BmnMemNode** ppNode;
+    for(ppNode = &pStore->pNodes; *ppNode; ppNode = &(*ppNode)->pNext)
+    {
+        if(*ppNode == pNode)
+        {
+            *ppNode        = pNode->pNext;
+            pNode->pNext   = NULL;
+            pNode->iLinked = 0;
+            pStore->nFile -= 1;
+            return;
+        }
+    }
+}
+
+static void freeNode(BmnMemStore* pStore, BmnMemNode* pNode)
+{
+    BMN_ASSERT(!pNode->iLinked && 0 == pNode->nRef);
+    pStore->iSize -= pNode->iSize;
+    pStore->iAllocated -= pNode->nAlloc;
+    sqlite3_free(pNode->aData);
+    sqlite3_free(pNode);
+}
+
+/*
+ mutex must be held
+*/
+static int growNode(BmnMemStore* pStore, BmnMemNode* pNode, sqlite3_int64 n)
+{
+    sqlite3_int64 nAlloc;
+    char* aData;
+
+    if(n <= pNode->nAlloc)
+    {
+        return SQLITE_OK;
+    }
+    nAlloc = pNode->nAlloc < BMN_MEM_GROWTH_LIMIT
+            ? pNode->nAlloc * 2
+            : pNode->nAlloc + BMN_MEM_GROWTH_LIMIT;
+    if(nAlloc < n)
+    {
+        nAlloc = n;
+    }
+    if(nAlloc < BMN_MEM_MIN_ALLOC)
+    {
+        nAlloc = BMN_MEM_MIN_ALLOC;
+    }
+    nAlloc = (nAlloc + BMN_MEM_MIN_ALLOC - 1) &
+            ~(sqlite3_int64)(BMN_MEM_MIN_ALLOC - 1);
+    aData = sqlite3_realloc64(pNode->aData, nAlloc);
+    if(!aData)
+    {
+        return SQLITE_IOERR_NOMEM;
+    }
+    pStore->iAllocated += nAlloc - pNode->nAlloc;
+    pNode->aData  = aData;
+    pNode->nAlloc = nAlloc;
+    return SQLITE_OK;
+}
+
+static int memClose(sqlite3_file* pFile)
+{
+    BmnMemFile* pMem;
+    BmnMemStore* pStore;
+    BmnMemNode* pNode;
+
+    pMem   = MEM_FILE(pFile);
+    pStore = pMem->pStore;
+    pNode  = pMem->pNode;
+    memUnlock(pFile, SQLITE_LOCK_NONE);
+    sqlite3_mutex_enter(pStore->pMutex);
+    pNode->nRef -= 1;
+    if(0 == pNode->nRef)
+    {
+        if(pNode->iDeleteOnClose && pNode->iLinked)
+        {
+            unlinkNode(pStore, pNode);
+        }
+        if(!pNode->iLinked)
+        {
+            freeNode(pStore, pNode);
+        }
+    }
+    sqlite3_mutex_leave(pStore->pMutex);
+    pMem->pNode         = NULL;
+    pMem->base.pMethods = NULL;
+    return SQLITE_OK;
+}
+
+static int memRead(
+        sqlite3_file* pFile,
+        void* zBuf,
+        int iAmt,
+        sqlite3_int64 iOfst)
+{
+    BmnMemFile* pMem;
+    BmnMemNode* pNode;
+    sqlite3_int64 nCopy;
+    int rc;
+
+    pMem  = MEM_FILE(pFile);
+    pNode = pMem->pNode;
+    rc    = SQLITE_OK;
+    sqlite3_mutex_enter(pMem->pStore->pMutex);
+    nCopy = pNode->iSize - iOfst;
+    if(nCopy < iAmt)
+    {
+        rc = SQLITE_IOERR_SHORT_READ;
+        if(nCopy < 0)
+        {
+            nCopy = 0;
+        }
+        memset((char*)zBuf + nCopy, 0, iAmt - nCopy);
+    }
+    else
+    {
+        nCopy = iAmt;
+    }
+    if(nCopy > 0)
+    {
+        memcpy(zBuf, pNode->aData + iOfst, nCopy);
+    }
+    sqlite3_mutex_leave(pMem->pStore->pMutex);
+    return rc;
+}
+
+static int memWrite(
+        sqlite3_file* pFile,
+        const void* zBuf,
+        int iAmt,
+        sqlite3_int64 iOfst)
+{
+    BmnMemFile* pMem;
+    BmnMemStore* pStore;
+    BmnMemNode* pNode;
+    int rc;
+
+    pMem   = MEM_FILE(pFile);
+    pStore = pMem->pStore;
+    pNode  = pMem->pNode;
+    sqlite3_mutex_enter(pStore->pMutex);
+    rc = growNode(pStore, pNode, iOfst + iAmt);
+    if(SQLITE_OK == rc)
+    {
+        if(iOfst > pNode->iSize)
+        {
+            memset(pNode->aData + pNode->iSize, 0, iOfst - pNode->iSize);
+        }
+        memcpy(pNode->aData + iOfst, zBuf, iAmt);
+        if(iOfst + iAmt > pNode->iSize)
+        {
+            pStore->iSize += iOfst + iAmt - pNode->iSize;
+            pNode->iSize = iOfst + iAmt;
+        }
+    }
+    sqlite3_mutex_leave(pStore->pMutex);
+    return rc;
+}
+
+static int memTruncate(sqlite3_file* pFile, sqlite3_int64 size)
+{
+    BmnMemFile* pMem;
+    BmnMemStore* pStore;
+    BmnMemNode* pNode;
+    char* aData;
+
+    pMem   = MEM_FILE(pFile);
+    pStore = pMem->pStore;
+    pNode  = pMem->pNode;
+    sqlite3_mutex_enter(pStore->pMutex);
+    if(size < pNode->iSize)
+    {
+        pStore->iSize -= pNode->iSize - size;
+        pNode->iSize = size;
+        // give back memory of files truncated a lot ( journals )
+        if(0 == size)
+        {
+            sqlite3_free(pNode->aData);
+            pNode->aData = NULL;
+            pStore->iAllocated -= pNode->nAlloc;
+            pNode->nAlloc = 0;
+        }
+        else if(size < pNode->nAlloc / 4)
+        {
+            aData = sqlite3_realloc64(pNode->aData, size);
+            if(aData)
+            {
+                pStore->iAllocated -= pNode->nAlloc - size;
+                pNode->aData  = aData;
+                pNode->nAlloc = size;
+            }
+        }
+    }
+    sqlite3_mutex_leave(pStore->pMutex);
+    return SQLITE_OK;
+}
+
+static int memSync(sqlite3_file* pFile, int flags)
+{ return SQLITE_OK; }
+
+static int memFileSize(sqlite3_file* pFile, sqlite3_int64* pSize)
+{
+    BmnMemFile* pMem;
+    pMem = MEM_FILE(pFile);
+    sqlite3_mutex_enter(pMem->pStore->pMutex);
+    *pSize = pMem->pNode->iSize;
+    sqlite3_mutex_leave(pMem->pStore->pMutex);
+    return SQLITE_OK;
+}
+
+/*
+ the same rules as unix VFS has for handles of one inode
+*/
+static int memLock(sqlite3_file* pFile, int eLock)
+{
+    BmnMemFile* pMem;
+    BmnMemNode* pNode;
+    int rc;
+
+    pMem = MEM_FILE(pFile);
+    if(pMem->eLock >= eLock)
+    {
+        return SQLITE_OK;
+    }
+    pNode = pMem->pNode;
+    rc    = SQLITE_OK;
+    sqlite3_mutex_enter(pMem->pStore->pMutex);
+    if(pNode->eLock != pMem->eLock &&
+       (pNode->eLock >= SQLITE_LOCK_PENDING || eLock > SQLITE_LOCK_SHARED))
+    {
+        rc = SQLITE_BUSY;
+    }
+    else if(SQLITE_LOCK_SHARED == eLock)
+    {
+        if(SQLITE_LOCK_NONE == pNode->eLock)
+        {
+            pNode->eLock = SQLITE_LOCK_SHARED;
+        }
+        pNode->nShared += 1;
+        pMem->eLock = SQLITE_LOCK_SHARED;
+    }
+    else if(SQLITE_LOCK_EXCLUSIVE == eLock && pNode->nShared > 1)
+    {
+        // new readers wait then
+        pNode->eLock = SQLITE_LOCK_PENDING;
+        pMem->eLock  = SQLITE_LOCK_PENDING;
+        rc           = SQLITE_BUSY;
+    }
+    else
+    {
+        pNode->eLock = eLock;
+        pMem->eLock  = eLock;
+    }
+    sqlite3_mutex_leave(pMem->pStore->pMutex);
+    return rc;
+}
+
+static int memUnlock(sqlite3_file* pFile, int eLock)
+{
+    BmnMemFile* pMem;
+    BmnMemNode* pNode;
+
+    pMem = MEM_FILE(pFile);
+    if(pMem->eLock <= eLock)
+    {
+        return SQLITE_OK;
+    }
+    pNode = pMem->pNode;
+    sqlite3_mutex_enter(pMem->pStore->pMutex);
+    if(pMem->eLock > SQLITE_LOCK_SHARED)
+    {
+        pNode->eLock = SQLITE_LOCK_SHARED;
+    }
+    if(SQLITE_LOCK_NONE == eLock)
+    {
+        pNode->nShared -= 1;
+        if(0 == pNode->nShared)
+        {
+            pNode->eLock = SQLITE_LOCK_NONE;
+        }
+    }
+    pMem->eLock = eLock;
+    sqlite3_mutex_leave(pMem->pStore->pMutex);
+    return SQLITE_OK;
+}
+
+static int memCheckReservedLock(sqlite3_file* pFile, int* pResOut)
+{
+    BmnMemFile* pMem;
+    pMem = MEM_FILE(pFile);
+    sqlite3_mutex_enter(pMem->pStore->pMutex);
+    *pResOut = pMem->pNode->eLock > SQLITE_LOCK_SHARED;
+    sqlite3_mutex_leave(pMem->pStore->pMutex);
+    return SQLITE_OK;
+}
+
+static int memFileControl(sqlite3_file* pFile, int iOperation, void* pArg)
+{
+    BmnMemFile* pMem;
+    int rc;
+
+    pMem = MEM_FILE(pFile);
+    rc   = SQLITE_NOTFOUND;
+    // growth in one step
+    if(SQLITE_FCNTL_SIZE_HINT == iOperation)
+    {
+        sqlite3_mutex_enter(pMem->pStore->pMutex);
+        rc = growNode(pMem->pStore, pMem->pNode, *(sqlite3_int64*)pArg);
+        sqlite3_mutex_leave(pMem->pStore->pMutex);
+    }
+    return rc;
+}
+
+static int memSectorSize(sqlite3_file* pFile)
+{ return BMN_MEM_SECTOR_SIZE; }
+
+static int memDeviceCharacteristics(sqlite3_file* pFile)
+{
+    return SQLITE_IOCAP_ATOMIC | SQLITE_IOCAP_POWERSAFE_OVERWRITE |
+            SQLITE_IOCAP_SAFE_APPEND | SQLITE_IOCAP_SEQUENTIAL;
+}
+
+static int memOpen(
+        sqlite3_vfs* pVfs,
+        const char* zName,
+        sqlite3_file* pFile,
+        int flags,
+        int* pOutFlags)
+{
+    BmnMemStore* pStore;
+    BmnMemFile* pMem;
+    BmnMemNode* pNode;
+    size_t nName;
+    int rc;
+
+    pStore = MEM_STORE(pVfs);
+    pMem   = MEM_FILE(pFile);
+    memset(pMem, 0, sizeof(*pMem));
+    rc = SQLITE_OK;
+    sqlite3_mutex_enter(pStore->pMutex);
+    pNode = zName ? findNode(pStore, zName) : NULL;
+    if(pNode && (flags & SQLITE_OPEN_EXCLUSIVE))
+    {
+        rc = SQLITE_CANTOPEN;
+    }
+    else if(!pNode && !(flags & SQLITE_OPEN_CREATE))
+    {
+        rc = SQLITE_CANTOPEN;
+    }
+    else if(!pNode)
+    {
+        nName = zName ? strlen(zName) : 0;
+        pNode = sqlite3_malloc64(sizeof(BmnMemNode) + nName);
+        if(pNode)
+        {
+            memset(pNode, 0, sizeof(BmnMemNode));
+            memcpy(pNode->zName, zName ? zName : "", nName + 1);
+            // anonymous files can't be found anyway
+            if(zName)
+            {
+                pNode->pNext   = pStore->pNodes;
+                pNode->iLinked = 1;
+                pStore->pNodes = pNode;
+                pStore->nFile += 1;
+            }
+        }
+        else
+        {
+            rc = SQLITE_NOMEM;
+        }
+    }
+    if(SQLITE_OK == rc)
+    {
+        pNode->nRef += 1;
+        if(flags & SQLITE_OPEN_DELETEONCLOSE)
+        {
+            pNode->iDeleteOnClose = 1;
+        }
+        pMem->pStore        = pStore;
+        pMem->pNode         = pNode;
+        pMem->base.pMethods = &memIoMethods;
+        if(pOutFlags)
+        {
+            *pOutFlags = flags;
+        }
+    }
+    sqlite3_mutex_leave(pStore->pMutex);
+    return rc;
+}
+
+static int memDelete(sqlite3_vfs* pVfs, const char* zName, int syncDir)
+{
+    BmnMemStore* pStore;
+    BmnMemNode* pNode;
+    int rc;
+
+    pStore = MEM_STORE(pVfs);
+    rc     = SQLITE_IOERR_DELETE_NOENT;
+    sqlite3_mutex_enter(pStore->pMutex);
+    pNode = findNode(pStore, zName);
+    if(pNode)
+    {
+        unlinkNode(pStore, pNode);
+        if(0 == pNode->nRef)
+        {
+            freeNode(pStore, pNode);
+        }
+        rc = SQLITE_OK;
+    }
+    sqlite3_mutex_leave(pStore->pMutex);
+    return rc;
+}
+
+static int memAccess(
+        sqlite3_vfs* pVfs,
+        const char* zName,
+        int flags,
+        int* pResOut)
+{
+    BmnMemStore* pStore;
+
+    pStore = MEM_STORE(pVfs);
+    sqlite3_mutex_enter(pStore->pMutex);
+    *pResOut = NULL != findNode(pStore, zName);
+    sqlite3_mutex_leave(pStore->pMutex);
+    return SQLITE_OK;
+}
+
+static int memFullPathname(
+        sqlite3_vfs* pVfs,
+        const char* zName,
+        int nOut,
+        char* zOut)
+{
+    sqlite3_vfs* pRoot;
+    pRoot = MEM_STORE(pVfs)->pRootVfs;
+    return pRoot->xFullPathname(pRoot, zName, nOut, zOut);
+}
+
+extern int bmnMemStoreInit(BmnMemStore* pStore, sqlite3_vfs* pRootVfs)
+{
+    if(!pStore->pMutex)
+    {
+        pStore->pMutex = sqlite3_mutex_alloc(SQLITE_MUTEX_FAST);
+        if(!pStore->pMutex)
+        {
+            return SQLITE_NOMEM;
+        }
+    }
+    pStore->pRootVfs           = pRootVfs;
+    pStore->base.iVersion      = 1;
+    pStore->base.szOsFile      = sizeof(BmnMemFile);
+    pStore->base.mxPathname    = pRootVfs->mxPathname;
+    pStore->base.zName         = "bmn_memory";
+    pStore->base.pAppData      = NULL;
+    pStore->base.xOpen         = memOpen;
+    pStore->base.xDelete       = memDelete;
+    pStore->base.xAccess       = memAccess;
+    pStore->base.xFullPathname = memFullPathname;
+    return SQLITE_OK;
+}
+
+extern void bmnMemStoreClear(BmnMemStore* pStore)
+{
+    BmnMemNode* pNode;
+
+    if(!pStore->pMutex)
+    {
+        return;
+    }
+    sqlite3_mutex_enter(pStore->pMutex);
+    while((pNode = pStore->pNodes))
+    {
+        unlinkNode(pStore, pNode);
+        if(0 == pNode->nRef)
+        {
+            freeNode(pStore, pNode);
+        }
+    }
+    sqlite3_mutex_leave(pStore->pMutex);
+}
+
+extern void bmnMemStoreStats(
+        BmnMemStore* pStore,
+        int* pnFile,
+        sqlite3_int64* piSize,
+        sqlite3_int64* piAllocated)
+{
+    *pnFile      = 0;
+    *piSize      = 0;
+    *piAllocated = 0;
+    if(!pStore->pMutex)
+    {
+        return;
+    }
+    sqlite3_mutex_enter(pStore->pMutex);
+    *pnFile      = pStore->nFile;
+    *piSize      = pStore->iSize;
+    *piAllocated = pStore->iAllocated;
+    sqlite3_mutex_leave(pStore->pMutex);
+}
@@ -0,0 +1,53 @@
+/* memstore.h - native in-memory file store
+ *
+ * Files are kept in growable memory blocks keyed by the full path name,
+ * so every connection of the process opening the same name sees the same
+ * data. Read, write, truncate, size and locks are done in C without GIL.
+ * A file lives until it's deleted or the store is cleared, files opened
+ * with SQLITE_OPEN_DELETEONCLOSE are dropped on the last close.
+ * The store looks like sqlite3_vfs, but only xOpen, xDelete, xAccess and
+ * xFullPathname are implemented: it's never registered in sqlite and
+ * serves bmn VFS as the file VFS instead of the root one.
+ */
+
+#ifndef BMN_MEMSTORE_H
+#define BMN_MEMSTORE_H
+#include "sqlite3.h"
+
+typedef struct BmnMemStore BmnMemStore;
+typedef struct BmnMemNode BmnMemNode;
+
+struct BmnMemStore
+{
+    sqlite3_vfs base;
+    // names are resolved by it
+    sqlite3_vfs* pRootVfs;
+    sqlite3_mutex* pMutex;
+    BmnMemNode* pNodes;
+    int nFile;
+    // bytes of data and bytes allocated for it
+    sqlite3_int64 iSize;
+    sqlite3_int64 iAllocated;
+};
+
+/*
+ returns SQLITE_OK or SQLITE_NOMEM
+ can be called again to change the root VFS, files stay
+ */
+int bmnMemStoreInit(BmnMemStore* pStore, sqlite3_vfs* pRootVfs);
+
+/*
+ drops all files. Opened ones keep the data until they're closed
+ */
+void bmnMemStoreClear(BmnMemStore* pStore);
+
+/*
+ number of files, their size and allocated memory in bytes
+ */
+void bmnMemStoreStats(
+        BmnMemStore* pStore,
+        int* pnFile,
+        sqlite3_int64* piSize,
+        sqlite3_int64* piAllocated);
+
+#endif
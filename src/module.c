@@ -1,4 +1,5 @@
 
+#include "bindings.h"
 #include "debug.h"
 #include "sqlite3.h"
 #include "vfs.h"
@@ -17,25 +18,186 @@ static PyObject* module_vfs_register(
         PyObject* args,
         PyObject* kwargs)
 {
-    static char* kwlist[] = {"wrapper", "make_default", NULL};
+    static char* kwlist[] = {
+            "wrapper",
+            "make_default",
+            "zero_copy_write",
+            "page_cache_size",
+            "read_ahead",
+            "plain_files",
+            "name",
+            "memory_store",
+            "durability",
+            "sync_interval",
+            "side_file",
+            NULL};
     PyObject* wrapper;
+    PyObject* zero_copy_write;
+    PyObject* page_cache_size;
+    PyObject* read_ahead;
+    PyObject* plain_files;
+    PyObject* memory_store;
+    PyObject* sync_interval;
+    PyObject* side_file;
+    char* name;
+    char* durability;
     int make_default;
+    int zero_copy;
+    sqlite3_int64 cache_size;
+    int read_ahead_pages;
+    int plain_types;
+    int in_memory;
+    int side;
+    int policy;
+    int interval;
     int rc;
 
-    make_default = 1;
+    make_default    = 1;
+    zero_copy_write = Py_None;
+    page_cache_size = Py_None;
+    read_ahead      = Py_None;
+    plain_files     = Py_None;
+    name            = NULL;
+    memory_store    = Py_None;
+    durability      = NULL;
+    sync_interval   = Py_None;
+    side_file       = Py_None;
     if(!PyArg_ParseTupleAndKeywords(
                args,
                kwargs,
-               "O|i",
+               "O|iOOOOzOzOO",
                kwlist,
                &wrapper,
-               &make_default))
+               &make_default,
+               &zero_copy_write,
+               &page_cache_size,
+               &read_ahead,
+               &plain_files,
+               &name,
+               &memory_store,
+               &durability,
+               &sync_interval,
+               &side_file))
     {
         return NULL;
     }
     BMN_VERBOSE("VFS default: %d", make_default);
 
-    rc = bmnVfsRegister(wrapper, make_default);
+    zero_copy = -1;
+    if(Py_None != zero_copy_write)
+    {
+        zero_copy = PyObject_IsTrue(zero_copy_write);
+        if(zero_copy < 0)
+        {
+            return NULL;
+        }
+    }
+    cache_size = -1;
+    if(Py_None != page_cache_size)
+    {
+        cache_size = PyLong_AsLongLong(page_cache_size);
+        if(cache_size < 0)
+        {
+            if(!PyErr_Occurred())
+            {
+                PyErr_SetString(
+                        PyExc_ValueError,
+                        "page_cache_size must be non-negative");
+            }
+            return NULL;
+        }
+    }
+    read_ahead_pages = -1;
+    if(Py_None != read_ahead)
+    {
+        read_ahead_pages = _PyLong_AsInt(read_ahead);
+        if(read_ahead_pages < 0 || read_ahead_pages > BMN_MAX_READ_AHEAD_PAGES)
+        {
+            if(!PyErr_Occurred())
+            {
+                PyErr_Format(
+                        PyExc_ValueError,
+                        "read_ahead must be in range 0..%d",
+                        BMN_MAX_READ_AHEAD_PAGES);
+            }
+            return NULL;
+        }
+    }
+    plain_types = -1;
+    if(Py_None != plain_files)
+    {
+        plain_types = _PyLong_AsInt(plain_files);
+        if(plain_types < 0 || (plain_types & ~BMN_FILE_TYPES))
+        {
+            if(!PyErr_Occurred())
+            {
+                PyErr_SetString(
+                        PyExc_ValueError,
+                        "plain_files must be a mask of SQLITE_OPEN_* file "
+                        "types");
+            }
+            return NULL;
+        }
+    }
+    in_memory = -1;
+    if(Py_None != memory_store)
+    {
+        in_memory = PyObject_IsTrue(memory_store);
+        if(in_memory < 0)
+        {
+            return NULL;
+        }
+    }
+    side = -1;
+    if(Py_None != side_file)
+    {
+        side = PyObject_IsTrue(side_file);
+        if(side < 0)
+        {
+            return NULL;
+        }
+    }
+    policy = -1;
+    if(durability)
+    {
+        policy = bmnDurabilityPolicy(durability);
+        if(policy < 0)
+        {
+            PyErr_SetString(
+                    PyExc_ValueError,
+                    "durability must be 'normal', 'full', 'group' or "
+                    "'interval'");
+            return NULL;
+        }
+    }
+    interval = -1;
+    if(Py_None != sync_interval)
+    {
+        interval = _PyLong_AsInt(sync_interval);
+        if(interval < 0 || interval > BMN_MAX_SYNC_INTERVAL)
+        {
+            if(!PyErr_Occurred())
+            {
+                PyErr_Format(
+                        PyExc_ValueError,
+                        "sync_interval must be in range 0..%d",
+                        BMN_MAX_SYNC_INTERVAL);
+            }
+            return NULL;
+        }
+    }
+    rc = bmnVfsRegister(
+            wrapper,
+            make_default,
+            zero_copy,
+            cache_size,
+            read_ahead_pages,
+            plain_types,
+            in_memory,
+            side,
+            policy,
+            interval,
+            name);
     if(SQLITE_OK != rc)
     {
         return NULL;
@@ -44,11 +206,33 @@ static PyObject* module_vfs_register(
 }
 PyDoc_STRVAR(
         module_vfs_register_doc,
-        "vfs_register(wrapper)\n\
+        "vfs_register(wrapper, make_default=True, zero_copy_write=None, \
+page_cache_size=None, read_ahead=None, plain_files=None, name=None, \
+memory_store=None, durability=None, sync_interval=None, side_file=None)\n\
 \n\
 Registers class instance *wrapper* to handle pysqlite3 vfs operations.\n\
 You should call this method with *None* argument as a wrapper to unregister\n\
 vfs operations handling and get back default vfs behavior.\n\
+*name* is sqlite name of the vfs, None means 'bmn_vfs'. Connections use\n\
+it by connect(..., vfs=name) or '?vfs=name' URI parameter. If\n\
+*make_default* is false the vfs is used by such connections only.\n\
+If *zero_copy_write* is true then 'write' and 'encode' get read-only\n\
+memoryview instead of bytes. None means wrapper's 'zero_copy_write' value.\n\
+*page_cache_size* limits cache of decoded pages in bytes, 0 disables it.\n\
+None means wrapper's 'page_cache_size' value.\n\
+*read_ahead* is number of pages fetched by 'readv' on sequential reads,\n\
+0 disables it. None means wrapper's 'read_ahead' value.\n\
+*plain_files* is mask of SQLITE_OPEN_* file types the wrapper doesn't\n\
+transform. None means wrapper's 'plain_files' value.\n\
+If *memory_store* is true files the wrapper doesn't handle are kept in\n\
+native memory of the process instead of the default vfs.\n\
+None means wrapper's 'memory_store' value.\n\
+*durability* is sync policy: 'normal', 'full', 'group' or 'interval'.\n\
+None means wrapper's 'durability' value.\n\
+*sync_interval* is merge window of 'group' or period of 'interval' in\n\
+milliseconds. None means wrapper's 'sync_interval' value.\n\
+If *side_file* is true main DB of full wrapper gets '<path>-bmn' file for\n\
+locks and WAL shared memory. None means wrapper's 'side_file' value.\n\
 ");
 
 static PyObject* module_vfs_find(
@@ -60,7 +244,7 @@ static PyObject* module_vfs_find(
     char* vfs_name;
 
     vfs_name = NULL;
-    if(!PyArg_ParseTupleAndKeywords(args, kwargs, "|s", kwlist, &vfs_name))
+    if(!PyArg_ParseTupleAndKeywords(args, kwargs, "|z", kwlist, &vfs_name))
     {
         return NULL;
     }
@@ -68,12 +252,395 @@ static PyObject* module_vfs_find(
 }
 PyDoc_STRVAR(
         module_vfs_find_doc,
-        "vfs_find()\n\
+        "vfs_find(vfs_name=None)\n\
+\n\
+Returns wrapper registered with the name or None. None name means the\n\
+default vfs.\n\
+");
+
+static PyObject* module_vfs_cache_stats(
+        PyObject* self,
+        PyObject* args,
+        PyObject* kwargs)
+{
+    static char* kwlist[] = {"vfs_name", NULL};
+    char* vfs_name;
+
+    vfs_name = NULL;
+    if(!PyArg_ParseTupleAndKeywords(args, kwargs, "|z", kwlist, &vfs_name))
+    {
+        return NULL;
+    }
+    return bmnPageCacheStats(vfs_name);
+}
+PyDoc_STRVAR(
+        module_vfs_cache_stats_doc,
+        "vfs_cache_stats(vfs_name=None)\n\
+\n\
+Returns counters of decoded pages cache of the named vfs or None.\n\
+None name means the default vfs.\n\
+");
+
+static PyObject* module_vfs_sync_stats(
+        PyObject* self,
+        PyObject* args,
+        PyObject* kwargs)
+{
+    static char* kwlist[] = {"vfs_name", NULL};
+    char* vfs_name;
+
+    vfs_name = NULL;
+    if(!PyArg_ParseTupleAndKeywords(args, kwargs, "|z", kwlist, &vfs_name))
+    {
+        return NULL;
+    }
+    return bmnSyncStats(vfs_name);
+}
+PyDoc_STRVAR(
+        module_vfs_sync_stats_doc,
+        "vfs_sync_stats(vfs_name=None)\n\
+\n\
+Returns sync policy of the named vfs and counters of syncs requested,\n\
+performed and deferred or None. None name means the default vfs.\n\
+");
+
+static PyObject* module_vfs_stats(
+        PyObject* self,
+        PyObject* args,
+        PyObject* kwargs)
+{
+    static char* kwlist[] = {"vfs_name", NULL};
+    char* vfs_name;
+
+    vfs_name = NULL;
+    if(!PyArg_ParseTupleAndKeywords(args, kwargs, "|z", kwlist, &vfs_name))
+    {
+        return NULL;
+    }
+    return bmnVfsStats(vfs_name);
+}
+PyDoc_STRVAR(
+        module_vfs_stats_doc,
+        "vfs_stats(vfs_name=None)\n\
 \n\
-Returns registered vfs wrapper or None.\n\
+Returns I/O counters of the named vfs and of its open files or None.\n\
+None name means the default vfs.\n\
+");
+
+static PyObject* module_vfs_latency(
+        PyObject* self,
+        PyObject* args,
+        PyObject* kwargs)
+{
+    static char* kwlist[] = {"vfs_name", "reset", NULL};
+    char* vfs_name;
+    int reset;
+
+    vfs_name = NULL;
+    reset    = 0;
+    if(!PyArg_ParseTupleAndKeywords(
+               args,
+               kwargs,
+               "|zp",
+               kwlist,
+               &vfs_name,
+               &reset))
+    {
+        return NULL;
+    }
+    return bmnLatencyStats(vfs_name, reset);
+}
+PyDoc_STRVAR(
+        module_vfs_latency_doc,
+        "vfs_latency(vfs_name=None, reset=False)\n\
+\n\
+Returns latency percentiles of the named vfs callbacks or None.\n\
+If *reset* is true the histograms start again after they're read.\n\
+None name means the default vfs.\n\
+");
+
+static PyObject* module_vfs_invalidate(
+        PyObject* self,
+        PyObject* args,
+        PyObject* kwargs)
+{
+    static char* kwlist[] = {"vfs_name", NULL};
+    char* vfs_name;
+
+    vfs_name = NULL;
+    if(!PyArg_ParseTupleAndKeywords(args, kwargs, "|z", kwlist, &vfs_name))
+    {
+        return NULL;
+    }
+    return PyBool_FromLong(bmnInvalidateFiles(vfs_name));
+}
+PyDoc_STRVAR(
+        module_vfs_invalidate_doc,
+        "vfs_invalidate(vfs_name=None)\n\
+\n\
+Makes open files of the named vfs ask the wrapper for 'file_size',\n\
+'sector_size' and 'device_characteristics' again. Call it if storage\n\
+of the wrapper is changed not through sqlite. Returns False if there's\n\
+no such vfs. None name means the default vfs.\n\
+");
+
+static PyObject* module_vfs_trace(
+        PyObject* self,
+        PyObject* args,
+        PyObject* kwargs)
+{
+    static char* kwlist[] = {"vfs_name", "capacity", NULL};
+    char* vfs_name;
+    int capacity;
+    int rc;
+
+    vfs_name = NULL;
+    capacity = BMN_EVENTS_DEFAULT_CAPACITY;
+    if(!PyArg_ParseTupleAndKeywords(
+               args,
+               kwargs,
+               "|zi",
+               kwlist,
+               &vfs_name,
+               &capacity))
+    {
+        return NULL;
+    }
+    if(capacity < 0)
+    {
+        PyErr_SetString(PyExc_ValueError, "capacity must be non-negative");
+        return NULL;
+    }
+    rc = bmnVfsTrace(vfs_name, capacity);
+    if(rc < 0)
+    {
+        return NULL;
+    }
+    return PyBool_FromLong(rc);
+}
+PyDoc_STRVAR(
+        module_vfs_trace_doc,
+        "vfs_trace(vfs_name=None, capacity=65536)\n\
+\n\
+Starts recording I/O events of the named vfs in a new ring of *capacity*\n\
+events, 0 stops it. Returns False if there's no such vfs.\n\
+None name means the default vfs.\n\
+");
+
+static PyObject* module_vfs_trace_drain(
+        PyObject* self,
+        PyObject* args,
+        PyObject* kwargs)
+{
+    static char* kwlist[] = {"vfs_name", NULL};
+    char* vfs_name;
+
+    vfs_name = NULL;
+    if(!PyArg_ParseTupleAndKeywords(args, kwargs, "|z", kwlist, &vfs_name))
+    {
+        return NULL;
+    }
+    return bmnVfsTraceDrain(vfs_name);
+}
+PyDoc_STRVAR(
+        module_vfs_trace_drain_doc,
+        "vfs_trace_drain(vfs_name=None)\n\
+\n\
+Returns bytes of I/O events of the named vfs recorded since the last call\n\
+or None. Every event is VFS_TRACE_FORMAT struct. None name means the\n\
+default vfs.\n\
+");
+
+static PyObject* module_vfs_memory_stats(
+        PyObject* self,
+        PyObject* args,
+        PyObject* kwargs)
+{
+    static char* kwlist[] = {"vfs_name", NULL};
+    char* vfs_name;
+
+    vfs_name = NULL;
+    if(!PyArg_ParseTupleAndKeywords(args, kwargs, "|z", kwlist, &vfs_name))
+    {
+        return NULL;
+    }
+    return bmnMemoryStoreStats(vfs_name);
+}
+PyDoc_STRVAR(
+        module_vfs_memory_stats_doc,
+        "vfs_memory_stats(vfs_name=None)\n\
+\n\
+Returns memory use of the named vfs memory store or None.\n\
+None name means the default vfs.\n\
+");
+
+/*
+ native codec which keeps data as is, it's the cheapest wrapper possible
+*/
+static int nullCodecEncode(
+        void* pCtx,
+        int iFileFlags,
+        const void* zIn,
+        void* zOut,
+        int iAmt,
+        sqlite3_int64 iOfst)
+{
+    if(zIn != zOut)
+    {
+        memcpy(zOut, zIn, iAmt);
+    }
+    return SQLITE_OK;
+}
+static int nullCodecDecode(
+        void* pCtx,
+        int iFileFlags,
+        void* zBuf,
+        int iAmt,
+        sqlite3_int64 iOfst)
+{
+    return SQLITE_OK;
+}
+static BmnCodec nullCodec = {
+        BMN_CODEC_VERSION,
+        NULL,
+        nullCodecEncode,
+        nullCodecDecode};
+
+static PyObject* module_null_codec(PyObject* self)
+{
+    return PyCapsule_New(&nullCodec, BMN_CODEC_CAPSULE_NAME, NULL);
+}
+PyDoc_STRVAR(
+        module_null_codec_doc,
+        "null_codec()\n\
+\n\
+Returns native codec capsule which passes data as is.\n\
+");
+
+static PyObject* module_callback_overhead(
+        PyObject* self,
+        PyObject* args,
+        PyObject* kwargs)
+{
+    static char* kwlist[] = {"wrapper", "method", "iterations", "size", NULL};
+    PyObject* wrapper;
+    char* method;
+    int iterations;
+    int size;
+
+    method     = "write";
+    iterations = 100000;
+    size       = 4096;
+    if(!PyArg_ParseTupleAndKeywords(
+               args,
+               kwargs,
+               "O|sii",
+               kwlist,
+               &wrapper,
+               &method,
+               &iterations,
+               &size))
+    {
+        return NULL;
+    }
+    if(iterations <= 0 || size < 0)
+    {
+        PyErr_SetString(
+                PyExc_ValueError,
+                "iterations must be positive and size non-negative");
+        return NULL;
+    }
+    return bmnCallbackOverhead(wrapper, method, iterations, size);
+}
+PyDoc_STRVAR(
+        module_callback_overhead_doc,
+        "callback_overhead(wrapper, method='write', iterations=100000, size=4096)\n\
+\n\
+Returns dict of seconds per call spent in parts of a 'write' callback:\n\
+'gil', 'lookup', 'arguments', 'call', 'result' and 'total'. The method\n\
+of *wrapper* is called with None, *size* bytes and offset.\n\
 ");
 
 #if REGISTER_DEBUG_ITEMS
+/*
+ primitive native codec for tests
+ xor with key mixed with file offset
+*/
+static void xorCodecApply(
+        const unsigned char* zIn,
+        unsigned char* zOut,
+        unsigned char iKey,
+        int iAmt,
+        sqlite3_int64 iOfst)
+{
+    int i;
+    for(i = 0; i < iAmt; ++i)
+    {
+        zOut[i] = zIn[i] ^ (unsigned char)(iKey + iOfst + i);
+    }
+}
+static int xorCodecEncode(
+        void* pCtx,
+        int iFileFlags,
+        const void* zIn,
+        void* zOut,
+        int iAmt,
+        sqlite3_int64 iOfst)
+{
+    xorCodecApply(zIn, zOut, *(unsigned char*)pCtx, iAmt, iOfst);
+    return SQLITE_OK;
+}
+static int xorCodecDecode(
+        void* pCtx,
+        int iFileFlags,
+        void* zBuf,
+        int iAmt,
+        sqlite3_int64 iOfst)
+{
+    xorCodecApply(zBuf, zBuf, *(unsigned char*)pCtx, iAmt, iOfst);
+    return SQLITE_OK;
+}
+static void xorCodecDestructor(PyObject* pCapsule)
+{
+    BmnCodec* pCodec;
+    pCodec = PyCapsule_GetPointer(pCapsule, BMN_CODEC_CAPSULE_NAME);
+    PyMem_Free(pCodec);
+}
+static PyObject* module_xor_codec(PyObject* self, PyObject* args)
+{
+    unsigned char key;
+    BmnCodec* pCodec;
+    PyObject* pCapsule;
+
+    if(!PyArg_ParseTuple(args, "b", &key))
+    {
+        return NULL;
+    }
+    // key is stored right after the structure
+    pCodec = PyMem_Malloc(sizeof(BmnCodec) + 1);
+    if(!pCodec)
+    {
+        return PyErr_NoMemory();
+    }
+    pCodec->iVersion              = BMN_CODEC_VERSION;
+    pCodec->pCtx                  = &pCodec[1];
+    pCodec->xEncode               = xorCodecEncode;
+    pCodec->xDecode               = xorCodecDecode;
+    *(unsigned char*)pCodec->pCtx = key;
+    pCapsule =
+            PyCapsule_New(pCodec, BMN_CODEC_CAPSULE_NAME, xorCodecDestructor);
+    if(!pCapsule)
+    {
+        PyMem_Free(pCodec);
+    }
+    return pCapsule;
+}
+PyDoc_STRVAR(
+        module_xor_codec_doc,
+        "xor_codec(key)\n\
+\n\
+Returns native codec capsule for testing purposes.\n\
+");
 static PyObject* module_get_connections_count(PyObject* self)
 {
     return bmnConnectionCount();
@@ -105,6 +672,46 @@ static PyMethodDef module_methods[] = {
          (PyCFunction)module_vfs_find,
          METH_VARARGS | METH_KEYWORDS,
          module_vfs_find_doc},
+        {"vfs_cache_stats",
+         (PyCFunction)module_vfs_cache_stats,
+         METH_VARARGS | METH_KEYWORDS,
+         module_vfs_cache_stats_doc},
+        {"vfs_sync_stats",
+         (PyCFunction)module_vfs_sync_stats,
+         METH_VARARGS | METH_KEYWORDS,
+         module_vfs_sync_stats_doc},
+        {"vfs_memory_stats",
+         (PyCFunction)module_vfs_memory_stats,
+         METH_VARARGS | METH_KEYWORDS,
+         module_vfs_memory_stats_doc},
+        {"vfs_stats",
+         (PyCFunction)module_vfs_stats,
+         METH_VARARGS | METH_KEYWORDS,
+         module_vfs_stats_doc},
+        {"vfs_latency",
+         (PyCFunction)module_vfs_latency,
+         METH_VARARGS | METH_KEYWORDS,
+         module_vfs_latency_doc},
+        {"vfs_trace",
+         (PyCFunction)module_vfs_trace,
+         METH_VARARGS | METH_KEYWORDS,
+         module_vfs_trace_doc},
+        {"vfs_trace_drain",
+         (PyCFunction)module_vfs_trace_drain,
+         METH_VARARGS | METH_KEYWORDS,
+         module_vfs_trace_drain_doc},
+        {"vfs_invalidate",
+         (PyCFunction)module_vfs_invalidate,
+         METH_VARARGS | METH_KEYWORDS,
+         module_vfs_invalidate_doc},
+        {"null_codec",
+         (PyCFunction)module_null_codec,
+         METH_NOARGS,
+         module_null_codec_doc},
+        {"callback_overhead",
+         (PyCFunction)module_callback_overhead,
+         METH_VARARGS | METH_KEYWORDS,
+         module_callback_overhead_doc},
 
 #if REGISTER_DEBUG_ITEMS
         {"connection_count",
@@ -115,9 +722,36 @@ static PyMethodDef module_methods[] = {
          (PyCFunction)module_get_flags,
          METH_NOARGS,
          module_get_flags_doc},
+        {"xor_codec",
+         (PyCFunction)module_xor_codec,
+         METH_VARARGS,
+         module_xor_codec_doc},
 #endif
         {NULL, NULL}};
 
+/*
+ names of BMN_OP_* by their value
+*/
+static PyObject* traceOps(void)
+{
+    PyObject* pOps;
+    PyObject* pName;
+    int iOp;
+
+    pOps = PyTuple_New(BMN_OP_COUNT);
+    for(iOp = 0; pOps && iOp < BMN_OP_COUNT; ++iOp)
+    {
+        pName = PyUnicode_FromString(bmnStatsOpName(iOp));
+        if(!pName)
+        {
+            Py_CLEAR(pOps);
+            break;
+        }
+        PyTuple_SET_ITEM(pOps, iOp, pName);
+    }
+    return pOps;
+}
+
 PyMODINIT_FUNC PyInit__bmnsqlite3(void)
 {
     PyObject *module, *dict;
@@ -134,6 +768,15 @@ PyMODINIT_FUNC PyInit__bmnsqlite3(void)
             Py_DECREF(module);
             return NULL;
         }
+        if(PyModule_AddStringConstant(
+                   module,
+                   "VFS_TRACE_FORMAT",
+                   BMN_EVENT_FORMAT) < 0 ||
+           PyModule_AddObject(module, "VFS_TRACE_OPS", traceOps()) < 0)
+        {
+            Py_DECREF(module);
+            return NULL;
+        }
         if(!(dict = PyModule_GetDict(module)))
         {
             Py_DECREF(module);
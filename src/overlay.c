@@ -0,0 +1,976 @@
+#include <string.h>
+
+#include "debug.h"
+#include "utils.h"
+
+#define BMN_OVERLAY_HEADER   24
+#define BMN_OVERLAY_MIN_HASH 256
+// zero header isn't a valid record
+#define BMN_OVERLAY_SALT     0x626d6e31
+#define BMN_OVERLAY_NO_LIMIT ((sqlite3_int64)(((sqlite3_uint64)1 << 63) - 1))
+
+#define OVERLAY_FILE(p) ((BmnOverlayFile*)(void*)p)
+
+typedef struct BmnOverlayFile BmnOverlayFile;
+typedef struct BmnOverlaySlot BmnOverlaySlot;
+
+/*
+ position of chunk data in the clone file. iChunk < 0 if slot is free
+*/
+struct BmnOverlaySlot
+{
+    sqlite3_int64 iChunk;
+    sqlite3_int64 iPos;
+};
+
+/*
+ state of the clone shared by all its connections
+*/
+struct BmnOverlay
+{
+    BmnOverlay* pNext;
+    sqlite3_mutex* pMutex;
+    int nRef;
+    BmnOverlaySlot* aSlot;
+    unsigned int nSlot;
+    unsigned int nUsed;
+    sqlite3_int64 iSize;
+    // base data is visible below it, truncation hides the rest
+    sqlite3_int64 iBaseSize;
+    // end of the last valid record
+    sqlite3_int64 iLogSize;
+    /*
+     base path placed like sqlite does: four zeros before it and empty
+     parameters list after it, root VFS keeps pointer to it
+    */
+    char* zBasePath;
+    char* zBase;
+    char zName[1];
+};
+
+struct BmnOverlayFile
+{
+    sqlite3_file base;
+    BmnOverlayStore* pStore;
+    BmnOverlay* pOverlay;
+    sqlite3_file* pBase;
+    sqlite3_file* pClone;
+    int eLock;
+};
+
+static int overlayClose(sqlite3_file*);
+static int overlayRead(sqlite3_file*, void*, int iAmt, sqlite3_int64 iOfst);
+static int overlayWrite(
+        sqlite3_file*,
+        const void*,
+        int iAmt,
+        sqlite3_int64 iOfst);
+static int overlayTruncate(sqlite3_file*, sqlite3_int64 size);
+static int overlaySync(sqlite3_file*, int flags);
+static int overlayFileSize(sqlite3_file*, sqlite3_int64* pSize);
+static int overlayLock(sqlite3_file*, int);
+static int overlayUnlock(sqlite3_file*, int);
+static int overlayCheckReservedLock(sqlite3_file*, int*);
+static int overlayFileControl(sqlite3_file*, int iOperation, void* pArg);
+static int overlaySectorSize(sqlite3_file*);
+static int overlayDeviceCharacteristics(sqlite3_file*);
+
+static const sqlite3_io_methods overlayIoMethods = {
+        1,
+        overlayClose,
+        overlayRead,
+        overlayWrite,
+        overlayTruncate,
+        overlaySync,
+        overlayFileSize,
+        overlayLock,
+        overlayUnlock,
+        overlayCheckReservedLock,
+        overlayFileControl,
+        overlaySectorSize,
+        overlayDeviceCharacteristics};
+
+static void putInt64(unsigned char* p, sqlite3_int64 v)
+{
+    int i;
+    for(i = 7; i >= 0; --i)
+    {
+        p[i] = (unsigned char)(v & 0xff);
+        v >>= 8;
+    }
+}
+
+static sqlite3_int64 getInt64(const unsigned char* p)
+{
+    sqlite3_uint64 v;
+    int i;
+    v = 0;
+    for(i = 0; i < 8; ++i)
+    {
+        v = (v << 8) | p[i];
+    }
+    return (sqlite3_int64)v;
+}
+
+static unsigned int recordCheck(
+        sqlite3_int64 iChunk,
+        sqlite3_int64 iSize,
+        unsigned int nChunk)
+{
+    return BMN_OVERLAY_SALT ^ (unsigned int)iChunk ^
+            (unsigned int)(iChunk >> 32) ^ (unsigned int)iSize ^
+            (unsigned int)(iSize >> 32) ^ nChunk;
+}
+
+static void putRecord(
+        unsigned char* p,
+        sqlite3_int64 iChunk,
+        sqlite3_int64 iSize,
+        unsigned int nChunk)
+{
+    putInt64(p, iChunk);
+    putInt64(p + 8, iSize);
+    putInt64(
+            p + 16,
+            ((sqlite3_int64)nChunk << 32) | recordCheck(iChunk, iSize, nChunk));
+}
+
+static unsigned int hashChunk(BmnOverlay* pOverlay, sqlite3_int64 iChunk)
+{
+    sqlite3_uint64 h;
+    h = (sqlite3_uint64)iChunk * 0x9E3779B97F4A7C15ULL;
+    return (unsigned int)(h ^ (h >> 32)) & (pOverlay->nSlot - 1);
+}
+
+/*
+ position of the chunk in the clone file or -1
+*/
+static sqlite3_int64 lookupChunk(BmnOverlay* pOverlay, sqlite3_int64 iChunk)
+{
+    unsigned int i;
+    if(0 == pOverlay->nUsed)
+    {
+        return -1;
+    }
+    i = hashChunk(pOverlay, iChunk);
+    while(pOverlay->aSlot[i].iChunk >= 0)
+    {
+        if(pOverlay->aSlot[i].iChunk == iChunk)
+        {
+            return pOverlay->aSlot[i].iPos;
+        }
+        i = (i + 1) & (pOverlay->nSlot - 1);
+    }
+    return -1;
+}
+
+static void putSlot(
+        BmnOverlay* pOverlay,
+        sqlite3_int64 iChunk,
+        sqlite3_int64 iPos)
+{
+    unsigned int i;
+    i = hashChunk(pOverlay, iChunk);
+    while(pOverlay->aSlot[i].iChunk >= 0 && pOverlay->aSlot[i].iChunk != iChunk)
+    {
+        i = (i + 1) & (pOverlay->nSlot - 1);
+    }
+    if(pOverlay->aSlot[i].iChunk < 0)
+    {
+        pOverlay->nUsed += 1;
+    }
+    pOverlay->aSlot[i].iChunk = iChunk;
+    pOverlay->aSlot[i].iPos   = iPos;
+}
+
+/*
+ rebuilds the hash keeping chunks below iLimit
+*/
+static int rehash(
+        BmnOverlay* pOverlay,
+        unsigned int nSlot,
+        sqlite3_int64 iLimit)
+{
+    BmnOverlaySlot* aOld;
+    unsigned int nOld;
+    unsigned int i;
+
+    aOld            = pOverlay->aSlot;
+    nOld            = pOverlay->nSlot;
+    pOverlay->aSlot = sqlite3_malloc64(sizeof(BmnOverlaySlot) * nSlot);
+    if(!pOverlay->aSlot)
+    {
+        pOverlay->aSlot = aOld;
+        return SQLITE_NOMEM;
+    }
+    memset(pOverlay->aSlot, 0xff, sizeof(BmnOverlaySlot) * nSlot);
+    pOverlay->nSlot = nSlot;
+    pOverlay->nUsed = 0;
+    for(i = 0; i < nOld; ++i)
+    {
+        if(aOld[i].iChunk >= 0 && aOld[i].iChunk < iLimit)
+        {
+            putSlot(pOverlay, aOld[i].iChunk, aOld[i].iPos);
+        }
+    }
+    sqlite3_free(aOld);
+    return SQLITE_OK;
+}
+
+static int insertChunk(
+        BmnOverlay* pOverlay,
+        sqlite3_int64 iChunk,
+        sqlite3_int64 iPos)
+{
+    int rc;
+    if((pOverlay->nUsed + 1) * 2 > pOverlay->nSlot)
+    {
+        rc = rehash(
+                pOverlay,
+                pOverlay->nSlot ? pOverlay->nSlot * 2 : BMN_OVERLAY_MIN_HASH,
+                BMN_OVERLAY_NO_LIMIT);
+        if(rc)
+        {
+            return rc;
+        }
+    }
+    putSlot(pOverlay, iChunk, iPos);
+    return SQLITE_OK;
+}
+
+/*
+ applies size record. mutex must be held
+*/
+static int applySize(BmnOverlay* pOverlay, sqlite3_int64 iSize)
+{
+    int rc;
+    rc = SQLITE_OK;
+    if(iSize < pOverlay->iSize && pOverlay->nUsed)
+    {
+        rc = rehash(
+                pOverlay,
+                pOverlay->nSlot,
+                (iSize + BMN_OVERLAY_CHUNK - 1) / BMN_OVERLAY_CHUNK);
+    }
+    if(iSize < pOverlay->iBaseSize)
+    {
+        pOverlay->iBaseSize = iSize;
+    }
+    pOverlay->iSize = iSize;
+    return rc;
+}
+
+/*
+ reads records from iLogSize up to the end of the clone file
+ a broken record ends the log, it's overwritten by the next one
+*/
+static int replayRecords(BmnOverlay* pOverlay, sqlite3_file* pClone)
+{
+    unsigned char aHeader[BMN_OVERLAY_HEADER];
+    sqlite3_int64 iEnd;
+    sqlite3_int64 iPos;
+    sqlite3_int64 iChunk;
+    sqlite3_int64 iSize;
+    sqlite3_int64 i;
+    unsigned int nChunk;
+    int rc;
+
+    rc   = pClone->pMethods->xFileSize(pClone, &iEnd);
+    iPos = pOverlay->iLogSize;
+    while(SQLITE_OK == rc && iPos + BMN_OVERLAY_HEADER <= iEnd)
+    {
+        rc = pClone->pMethods->xRead(pClone, aHeader, BMN_OVERLAY_HEADER, iPos);
+        if(rc)
+        {
+            break;
+        }
+        iChunk = getInt64(aHeader);
+        iSize  = getInt64(aHeader + 8);
+        nChunk = (unsigned int)(getInt64(aHeader + 16) >> 32);
+        if((unsigned int)getInt64(aHeader + 16) !=
+                   recordCheck(iChunk, iSize, nChunk) ||
+           iChunk < 0 || iSize < 0 ||
+           iPos + BMN_OVERLAY_HEADER +
+                           (sqlite3_int64)nChunk * BMN_OVERLAY_CHUNK >
+                   iEnd)
+        {
+            BMN_VERBOSE("overlay log ends at %lld", iPos);
+            break;
+        }
+        for(i = 0; i < nChunk && SQLITE_OK == rc; ++i)
+        {
+            rc = insertChunk(
+                    pOverlay,
+                    iChunk + i,
+                    iPos + BMN_OVERLAY_HEADER + i * BMN_OVERLAY_CHUNK);
+        }
+        if(SQLITE_OK == rc)
+        {
+            rc = applySize(pOverlay, iSize);
+        }
+        iPos += BMN_OVERLAY_HEADER + (sqlite3_int64)nChunk * BMN_OVERLAY_CHUNK;
+    }
+    if(SQLITE_OK == rc)
+    {
+        pOverlay->iLogSize = iPos;
+    }
+    return rc;
+}
+
+/*
+ appends record with nChunk chunks already written after its place
+*/
+static int appendRecord(
+        BmnOverlayFile* pFile,
+        sqlite3_int64 iChunk,
+        unsigned int nChunk,
+        sqlite3_int64 iSize)
+{
+    BmnOverlay* pOverlay;
+    unsigned char aHeader[BMN_OVERLAY_HEADER];
+    sqlite3_int64 iPos;
+    unsigned int i;
+    int rc;
+
+    pOverlay = pFile->pOverlay;
+    iPos     = pOverlay->iLogSize;
+    putRecord(aHeader, iChunk, iSize, nChunk);
+    rc = pFile->pClone->pMethods
+                 ->xWrite(pFile->pClone, aHeader, BMN_OVERLAY_HEADER, iPos);
+    for(i = 0; i < nChunk && SQLITE_OK == rc; ++i)
+    {
+        rc = insertChunk(
+                pOverlay,
+                iChunk + i,
+                iPos + BMN_OVERLAY_HEADER + i * BMN_OVERLAY_CHUNK);
+    }
+    if(SQLITE_OK == rc)
+    {
+        pOverlay->iLogSize = iPos + BMN_OVERLAY_HEADER +
+                (sqlite3_int64)nChunk * BMN_OVERLAY_CHUNK;
+        rc = applySize(pOverlay, iSize);
+    }
+    return SQLITE_NOMEM == rc ? SQLITE_IOERR_NOMEM : rc;
+}
+
+/*
+ reads what the clone has at the range, mutex must be held
+ pieces of one source following each other are read at once
+*/
+static int readRange(
+        BmnOverlayFile* pFile,
+        char* zBuf,
+        int iAmt,
+        sqlite3_int64 iOfst)
+{
+    BmnOverlay* pOverlay;
+    sqlite3_file* pRun;
+    sqlite3_file* pSrc;
+    sqlite3_int64 iRunPos;
+    sqlite3_int64 iSrcPos;
+    sqlite3_int64 iChunkPos;
+    int nRun;
+    int iDone;
+    int n;
+    int rc;
+
+    pOverlay = pFile->pOverlay;
+    rc       = SQLITE_OK;
+    pRun     = NULL;
+    iRunPos  = 0;
+    nRun     = 0;
+    for(iDone = 0; iDone <= iAmt && SQLITE_OK == rc; iDone += n)
+    {
+        n       = 0;
+        pSrc    = NULL;
+        // zero after the end
+        iSrcPos = -1;
+        if(iDone < iAmt)
+        {
+            n = BMN_OVERLAY_CHUNK - (int)((iOfst + iDone) % BMN_OVERLAY_CHUNK);
+            if(n > iAmt - iDone)
+            {
+                n = iAmt - iDone;
+            }
+            iChunkPos = lookupChunk(
+                    pOverlay,
+                    (iOfst + iDone) / BMN_OVERLAY_CHUNK);
+            if(iChunkPos >= 0)
+            {
+                pSrc    = pFile->pClone;
+                iSrcPos = iChunkPos + (iOfst + iDone) % BMN_OVERLAY_CHUNK;
+            }
+            else if(iOfst + iDone < pOverlay->iBaseSize)
+            {
+                pSrc    = pFile->pBase;
+                iSrcPos = iOfst + iDone;
+                if(iSrcPos + n > pOverlay->iBaseSize)
+                {
+                    n = (int)(pOverlay->iBaseSize - iSrcPos);
+                }
+            }
+        }
+        if(nRun && pSrc == pRun && iSrcPos == iRunPos + nRun)
+        {
+            nRun += n;
+            continue;
+        }
+        if(nRun)
+        {
+            if(pRun)
+            {
+                rc = pRun->pMethods
+                             ->xRead(pRun, zBuf + iDone - nRun, nRun, iRunPos);
+            }
+            else
+            {
+                memset(zBuf + iDone - nRun, 0, nRun);
+            }
+        }
+        pRun    = pSrc;
+        iRunPos = iSrcPos;
+        nRun    = n;
+        if(iDone == iAmt)
+        {
+            break;
+        }
+    }
+    return rc;
+}
+
+static int overlayRead(
+        sqlite3_file* pFile,
+        void* zBuf,
+        int iAmt,
+        sqlite3_int64 iOfst)
+{
+    BmnOverlayFile* pOverlayFile;
+    BmnOverlay* pOverlay;
+    sqlite3_int64 nAvail;
+    int rc;
+
+    pOverlayFile = OVERLAY_FILE(pFile);
+    pOverlay     = pOverlayFile->pOverlay;
+    sqlite3_mutex_enter(pOverlay->pMutex);
+    nAvail = pOverlay->iSize - iOfst;
+    if(nAvail < iAmt)
+    {
+        if(nAvail < 0)
+        {
+            nAvail = 0;
+        }
+        memset((char*)zBuf + nAvail, 0, iAmt - nAvail);
+        rc = readRange(pOverlayFile, zBuf, (int)nAvail, iOfst);
+        if(SQLITE_OK == rc)
+        {
+            rc = SQLITE_IOERR_SHORT_READ;
+        }
+    }
+    else
+    {
+        rc = readRange(pOverlayFile, zBuf, iAmt, iOfst);
+    }
+    sqlite3_mutex_leave(pOverlay->pMutex);
+    return rc;
+}
+
+/*
+ changed chunks are written in place, new ones are appended
+ with one record for every run of them
+*/
+static int overlayWrite(
+        sqlite3_file* pFile,
+        const void* zBuf,
+        int iAmt,
+        sqlite3_int64 iOfst)
+{
+    BmnOverlayFile* pOverlayFile;
+    BmnOverlay* pOverlay;
+    sqlite3_file* pClone;
+    char aChunk[BMN_OVERLAY_CHUNK];
+    const char* pData;
+    sqlite3_int64 iEnd;
+    sqlite3_int64 iNewSize;
+    sqlite3_int64 iChunk;
+    sqlite3_int64 iChunkOfst;
+    sqlite3_int64 iPos;
+    sqlite3_int64 iRunChunk;
+    unsigned int nRun;
+    int nAppended;
+    int rc;
+
+    pOverlayFile = OVERLAY_FILE(pFile);
+    pOverlay     = pOverlayFile->pOverlay;
+    pClone       = pOverlayFile->pClone;
+    iEnd         = iOfst + iAmt;
+    rc           = SQLITE_OK;
+    iRunChunk    = 0;
+    nRun         = 0;
+    nAppended    = 0;
+    sqlite3_mutex_enter(pOverlay->pMutex);
+    iNewSize = pOverlay->iSize > iEnd ? pOverlay->iSize : iEnd;
+    for(iChunk = iOfst / BMN_OVERLAY_CHUNK;
+        SQLITE_OK == rc && iChunk * BMN_OVERLAY_CHUNK < iEnd;
+        ++iChunk)
+    {
+        iChunkOfst = iChunk * BMN_OVERLAY_CHUNK;
+        if(iOfst <= iChunkOfst && iEnd >= iChunkOfst + BMN_OVERLAY_CHUNK)
+        {
+            pData = (const char*)zBuf + (iChunkOfst - iOfst);
+        }
+        else
+        {
+            // current chunk patched by the part of the data
+            memset(aChunk, 0, BMN_OVERLAY_CHUNK);
+            if(iChunkOfst < pOverlay->iSize)
+            {
+                rc = readRange(
+                        pOverlayFile,
+                        aChunk,
+                        pOverlay->iSize - iChunkOfst < BMN_OVERLAY_CHUNK
+                                ? (int)(pOverlay->iSize - iChunkOfst)
+                                : BMN_OVERLAY_CHUNK,
+                        iChunkOfst);
+            }
+            if(iOfst > iChunkOfst)
+            {
+                memcpy(aChunk + (iOfst - iChunkOfst),
+                       zBuf,
+                       iEnd < iChunkOfst + BMN_OVERLAY_CHUNK
+                               ? iAmt
+                               : (int)(iChunkOfst + BMN_OVERLAY_CHUNK - iOfst));
+            }
+            else
+            {
+                memcpy(aChunk,
+                       (const char*)zBuf + (iChunkOfst - iOfst),
+                       (int)(iEnd - iChunkOfst));
+            }
+            pData = aChunk;
+        }
+        if(rc)
+        {
+            break;
+        }
+        iPos = lookupChunk(pOverlay, iChunk);
+        if(iPos >= 0)
+        {
+            rc = pClone->pMethods
+                         ->xWrite(pClone, pData, BMN_OVERLAY_CHUNK, iPos);
+            continue;
+        }
+        if(nRun && iRunChunk + nRun != iChunk)
+        {
+            rc   = appendRecord(pOverlayFile, iRunChunk, nRun, iNewSize);
+            nRun = 0;
+            nAppended += 1;
+        }
+        if(SQLITE_OK == rc)
+        {
+            if(0 == nRun)
+            {
+                iRunChunk = iChunk;
+            }
+            rc = pClone->pMethods->xWrite(
+                    pClone,
+                    pData,
+                    BMN_OVERLAY_CHUNK,
+                    pOverlay->iLogSize + BMN_OVERLAY_HEADER +
+                            (sqlite3_int64)nRun * BMN_OVERLAY_CHUNK);
+            nRun += 1;
+        }
+    }
+    if(SQLITE_OK == rc && (nRun || (!nAppended && iNewSize != pOverlay->iSize)))
+    {
+        rc = appendRecord(pOverlayFile, iRunChunk, nRun, iNewSize);
+    }
+    sqlite3_mutex_leave(pOverlay->pMutex);
+    return rc;
+}
+
+static int overlayTruncate(sqlite3_file* pFile, sqlite3_int64 size)
+{
+    BmnOverlayFile* pOverlayFile;
+    BmnOverlay* pOverlay;
+    int rc;
+
+    pOverlayFile = OVERLAY_FILE(pFile);
+    pOverlay     = pOverlayFile->pOverlay;
+    rc           = SQLITE_OK;
+    sqlite3_mutex_enter(pOverlay->pMutex);
+    if(size != pOverlay->iSize)
+    {
+        rc = appendRecord(pOverlayFile, 0, 0, size);
+    }
+    sqlite3_mutex_leave(pOverlay->pMutex);
+    return rc;
+}
+
+static int overlaySync(sqlite3_file* pFile, int flags)
+{
+    sqlite3_file* pClone;
+    pClone = OVERLAY_FILE(pFile)->pClone;
+    return pClone->pMethods->xSync(pClone, flags);
+}
+
+static int overlayFileSize(sqlite3_file* pFile, sqlite3_int64* pSize)
+{
+    BmnOverlay* pOverlay;
+    pOverlay = OVERLAY_FILE(pFile)->pOverlay;
+    sqlite3_mutex_enter(pOverlay->pMutex);
+    *pSize = pOverlay->iSize;
+    sqlite3_mutex_leave(pOverlay->pMutex);
+    return SQLITE_OK;
+}
+
+/*
+ locks of the clone file serve the database
+ records of other processes are read once the lock lets them be
+*/
+static int overlayLock(sqlite3_file* pFile, int eLock)
+{
+    BmnOverlayFile* pOverlayFile;
+    BmnOverlay* pOverlay;
+    sqlite3_file* pClone;
+    int rc;
+
+    pOverlayFile = OVERLAY_FILE(pFile);
+    pOverlay     = pOverlayFile->pOverlay;
+    pClone       = pOverlayFile->pClone;
+    rc           = pClone->pMethods->xLock(pClone, eLock);
+    if(SQLITE_OK == rc && SQLITE_LOCK_SHARED == eLock &&
+       SQLITE_LOCK_NONE == pOverlayFile->eLock)
+    {
+        sqlite3_mutex_enter(pOverlay->pMutex);
+        rc = replayRecords(pOverlay, pClone);
+        sqlite3_mutex_leave(pOverlay->pMutex);
+        if(rc)
+        {
+            pClone->pMethods->xUnlock(pClone, SQLITE_LOCK_NONE);
+            return rc;
+        }
+    }
+    if(SQLITE_OK == rc)
+    {
+        pOverlayFile->eLock = eLock;
+    }
+    return rc;
+}
+
+static int overlayUnlock(sqlite3_file* pFile, int eLock)
+{
+    BmnOverlayFile* pOverlayFile;
+    int rc;
+
+    pOverlayFile = OVERLAY_FILE(pFile);
+    rc = pOverlayFile->pClone->pMethods->xUnlock(pOverlayFile->pClone, eLock);
+    if(SQLITE_OK == rc)
+    {
+        pOverlayFile->eLock = eLock;
+    }
+    return rc;
+}
+
+static int overlayCheckReservedLock(sqlite3_file* pFile, int* pResOut)
+{
+    sqlite3_file* pClone;
+    pClone = OVERLAY_FILE(pFile)->pClone;
+    return pClone->pMethods->xCheckReservedLock(pClone, pResOut);
+}
+
+static int overlayFileControl(sqlite3_file* pFile, int iOperation, void* pArg)
+{ return SQLITE_NOTFOUND; }
+
+static int overlaySectorSize(sqlite3_file* pFile)
+{
+    sqlite3_file* pClone;
+    pClone = OVERLAY_FILE(pFile)->pClone;
+    return pClone->pMethods->xSectorSize(pClone);
+}
+
+/*
+ chunks aren't written atomically
+*/
+static int overlayDeviceCharacteristics(sqlite3_file* pFile)
+{
+    sqlite3_file* pClone;
+    pClone = OVERLAY_FILE(pFile)->pClone;
+    return pClone->pMethods->xDeviceCharacteristics(pClone) &
+            SQLITE_IOCAP_POWERSAFE_OVERWRITE;
+}
+
+/*
+ store mutex must be held
+*/
+static void releaseOverlay(BmnOverlayStore* pStore, BmnOverlay* pOverlay)
+{
+    BmnOverlay** ppOverlay;
+
+    pOverlay->nRef -= 1;
+    if(pOverlay->nRef > 0)
+    {
+        return;
+    }
+    for(ppOverlay = &pStore->pList; *ppOverlay;
+        ppOverlay = &(*ppOverlay)->pNext)
+    {
+        if(*ppOverlay == pOverlay)
+        {
+            *ppOverlay = pOverlay->pNext;
+            break;
+        }
+    }
+    sqlite3_mutex_free(pOverlay->pMutex);
+    sqlite3_free(pOverlay->aSlot);
+    sqlite3_free(pOverlay->zBasePath);
+    sqlite3_free(pOverlay);
+}
+
+static void closeFiles(BmnOverlayFile* pOverlayFile)
+{
+    if(pOverlayFile->pBase)
+    {
+        if(pOverlayFile->pBase->pMethods)
+        {
+            pOverlayFile->pBase->pMethods->xClose(pOverlayFile->pBase);
+        }
+        sqlite3_free(pOverlayFile->pBase);
+        pOverlayFile->pBase = NULL;
+    }
+    if(pOverlayFile->pClone)
+    {
+        if(pOverlayFile->pClone->pMethods)
+        {
+            pOverlayFile->pClone->pMethods->xClose(pOverlayFile->pClone);
+        }
+        sqlite3_free(pOverlayFile->pClone);
+        pOverlayFile->pClone = NULL;
+    }
+}
+
+static int overlayClose(sqlite3_file* pFile)
+{
+    BmnOverlayFile* pOverlayFile;
+    BmnOverlayStore* pStore;
+
+    pOverlayFile = OVERLAY_FILE(pFile);
+    pStore       = pOverlayFile->pStore;
+    closeFiles(pOverlayFile);
+    sqlite3_mutex_enter(pStore->pMutex);
+    releaseOverlay(pStore, pOverlayFile->pOverlay);
+    sqlite3_mutex_leave(pStore->pMutex);
+    pOverlayFile->pOverlay      = NULL;
+    pOverlayFile->base.pMethods = NULL;
+    return SQLITE_OK;
+}
+
+/*
+ store mutex must be held
+*/
+static int findOverlay(
+        BmnOverlayStore* pStore,
+        sqlite3_vfs* pBaseVfs,
+        const char* zBase,
+        const char* zName,
+        BmnOverlay** ppOverlay)
+{
+    BmnOverlay* pOverlay;
+    size_t nName;
+    size_t nBase;
+    int rc;
+
+    for(pOverlay = pStore->pList; pOverlay; pOverlay = pOverlay->pNext)
+    {
+        if(0 == strcmp(pOverlay->zName, zName))
+        {
+            // one clone has one base
+            if(strcmp(pOverlay->zBase, zBase))
+            {
+                BMN_ERROR("%s is opened with another base", zName);
+                return SQLITE_CANTOPEN;
+            }
+            pOverlay->nRef += 1;
+            *ppOverlay = pOverlay;
+            return SQLITE_OK;
+        }
+    }
+    nName    = strlen(zName);
+    nBase    = strlen(zBase);
+    pOverlay = sqlite3_malloc64(sizeof(BmnOverlay) + nName + nBase + 1);
+    if(!pOverlay)
+    {
+        return SQLITE_NOMEM;
+    }
+    memset(pOverlay, 0, sizeof(BmnOverlay));
+    memcpy(pOverlay->zName, zName, nName + 1);
+    pOverlay->zBase = pOverlay->zName + nName + 1;
+    memcpy(pOverlay->zBase, zBase, nBase + 1);
+    pOverlay->zBasePath = sqlite3_malloc64(pBaseVfs->mxPathname + 9);
+    pOverlay->pMutex    = sqlite3_mutex_alloc(SQLITE_MUTEX_FAST);
+    rc                  = SQLITE_NOMEM;
+    if(pOverlay->zBasePath && pOverlay->pMutex)
+    {
+        memset(pOverlay->zBasePath, 0, pBaseVfs->mxPathname + 9);
+        rc = pBaseVfs->xFullPathname(
+                pBaseVfs,
+                zBase,
+                pBaseVfs->mxPathname + 1,
+                pOverlay->zBasePath + 4);
+        rc &= 0xff;
+    }
+    if(rc)
+    {
+        sqlite3_mutex_free(pOverlay->pMutex);
+        sqlite3_free(pOverlay->zBasePath);
+        sqlite3_free(pOverlay);
+        return rc;
+    }
+    pOverlay->nRef  = 1;
+    pOverlay->pNext = pStore->pList;
+    pStore->pList   = pOverlay;
+    // nothing is read yet
+    pOverlay->iSize = -1;
+    *ppOverlay      = pOverlay;
+    return SQLITE_OK;
+}
+
+/*
+ the first connection of the clone reads the base size and the records
+*/
+static int loadOverlay(BmnOverlayFile* pOverlayFile, int flags)
+{
+    BmnOverlay* pOverlay;
+    sqlite3_file* pClone;
+    unsigned char aMagic[sizeof(BMN_OVERLAY_MAGIC)];
+    sqlite3_int64 iCloneSize;
+    int rc;
+
+    pOverlay = pOverlayFile->pOverlay;
+    pClone   = pOverlayFile->pClone;
+    if(pOverlay->iSize >= 0)
+    {
+        return SQLITE_OK;
+    }
+    rc = pOverlayFile->pBase->pMethods->xFileSize(
+            pOverlayFile->pBase,
+            &pOverlay->iBaseSize);
+    if(SQLITE_OK == rc)
+    {
+        rc = pClone->pMethods->xFileSize(pClone, &iCloneSize);
+    }
+    if(SQLITE_OK != rc)
+    {
+        return rc;
+    }
+    if(0 == iCloneSize && (flags & SQLITE_OPEN_READWRITE))
+    {
+        rc = pClone->pMethods->xWrite(
+                pClone,
+                BMN_OVERLAY_MAGIC,
+                sizeof(BMN_OVERLAY_MAGIC),
+                0);
+    }
+    else if(iCloneSize > 0)
+    {
+        rc = pClone->pMethods->xRead(pClone, aMagic, sizeof(aMagic), 0);
+        if(SQLITE_OK == rc &&
+           memcmp(aMagic, BMN_OVERLAY_MAGIC, sizeof(BMN_OVERLAY_MAGIC)))
+        {
+            BMN_ERROR("%s isn't overlay clone", pOverlay->zName);
+            rc = SQLITE_CANTOPEN;
+        }
+    }
+    if(SQLITE_OK == rc)
+    {
+        pOverlay->iSize    = pOverlay->iBaseSize;
+        pOverlay->iLogSize = sizeof(BMN_OVERLAY_MAGIC);
+        rc                 = replayRecords(pOverlay, pClone);
+        if(rc)
+        {
+            pOverlay->iSize = -1;
+        }
+    }
+    return rc;
+}
+
+extern int bmnOverlayFileSize(void)
+{ return (int)sizeof(BmnOverlayFile); }
+
+extern int bmnOverlayOpen(
+        BmnOverlayStore* pStore,
+        sqlite3_vfs* pBaseVfs,
+        sqlite3_vfs* pCloneVfs,
+        const char* zBase,
+        const char* zName,
+        sqlite3_file* pFile,
+        int flags,
+        int* pOutFlags)
+{
+    BmnOverlayFile* pOverlayFile;
+    int iBaseFlags;
+    int rc;
+
+    pOverlayFile = OVERLAY_FILE(pFile);
+    memset(pOverlayFile, 0, sizeof(*pOverlayFile));
+    if(!pStore->pMutex)
+    {
+        pStore->pMutex = sqlite3_mutex_alloc(SQLITE_MUTEX_FAST);
+        if(!pStore->pMutex)
+        {
+            return SQLITE_NOMEM;
+        }
+    }
+    pOverlayFile->pBase  = sqlite3_malloc64(pBaseVfs->szOsFile);
+    pOverlayFile->pClone = sqlite3_malloc64(pCloneVfs->szOsFile);
+    if(!pOverlayFile->pBase || !pOverlayFile->pClone)
+    {
+        closeFiles(pOverlayFile);
+        return SQLITE_NOMEM;
+    }
+    memset(pOverlayFile->pBase, 0, pBaseVfs->szOsFile);
+    memset(pOverlayFile->pClone, 0, pCloneVfs->szOsFile);
+    pOverlayFile->pStore = pStore;
+    sqlite3_mutex_enter(pStore->pMutex);
+    rc = findOverlay(pStore, pBaseVfs, zBase, zName, &pOverlayFile->pOverlay);
+    if(SQLITE_OK == rc)
+    {
+        iBaseFlags = SQLITE_OPEN_READONLY | SQLITE_OPEN_MAIN_DB;
+        rc         = pBaseVfs->xOpen(
+                pBaseVfs,
+                pOverlayFile->pOverlay->zBasePath + 4,
+                pOverlayFile->pBase,
+                iBaseFlags,
+                &iBaseFlags);
+    }
+    if(SQLITE_OK == rc)
+    {
+        rc = pCloneVfs->xOpen(
+                pCloneVfs,
+                zName,
+                pOverlayFile->pClone,
+                flags,
+                pOutFlags);
+    }
+    if(SQLITE_OK == rc)
+    {
+        sqlite3_mutex_enter(pOverlayFile->pOverlay->pMutex);
+        rc = loadOverlay(pOverlayFile, flags);
+        sqlite3_mutex_leave(pOverlayFile->pOverlay->pMutex);
+    }
+    if(SQLITE_OK != rc)
+    {
+        BMN_VERBOSE("can't open %s as clone of %s", zName, zBase);
+        closeFiles(pOverlayFile);
+        if(pOverlayFile->pOverlay)
+        {
+            releaseOverlay(pStore, pOverlayFile->pOverlay);
+            pOverlayFile->pOverlay = NULL;
+        }
+    }
+    else
+    {
+        pOverlayFile->base.pMethods = &overlayIoMethods;
+    }
+    sqlite3_mutex_leave(pStore->pMutex);
+    return rc;
+}
@@ -0,0 +1,56 @@
+/* overlay.h - copy-on-write clone of a read-only base database
+ *
+ * The clone file keeps only changed data: records of BMN_OVERLAY_CHUNK
+ * sized chunks appended to it, reads take chunks from the clone first and
+ * from the base file then. Index of the records is built by reading the
+ * clone once and shared by all connections of the process, so creation
+ * of a clone costs nothing and its size depends on changes only.
+ * Records appended by other processes are picked up on SHARED lock.
+ *
+ * Clone file layout: BMN_OVERLAY_MAGIC, then records of
+ * { int64 first chunk, int64 file size, int32 chunks count, int32 check }
+ * followed by chunks. Record without chunks changes size only.
+ */
+
+#ifndef BMN_OVERLAY_H
+#define BMN_OVERLAY_H
+#include "sqlite3.h"
+
+// URI parameter of main DB naming the base DB
+#define BMN_OVERLAY_PARAMETER "overlay"
+#define BMN_OVERLAY_CHUNK     512
+#define BMN_OVERLAY_MAGIC     "bmn overlay 1\0\0"
+
+typedef struct BmnOverlayStore BmnOverlayStore;
+typedef struct BmnOverlay BmnOverlay;
+
+/*
+ clones opened by connections of one VFS
+ */
+struct BmnOverlayStore
+{
+    sqlite3_mutex* pMutex;
+    BmnOverlay* pList;
+};
+
+/*
+ size of sqlite3_file used by bmnOverlayOpen
+ */
+int bmnOverlayFileSize(void);
+
+/*
+ opens main DB zName as clone of zBase. zBase is opened read-only by
+ pBaseVfs, zName is opened by pCloneVfs. zName must be the name sqlite
+ passed to xOpen
+ */
+int bmnOverlayOpen(
+        BmnOverlayStore* pStore,
+        sqlite3_vfs* pBaseVfs,
+        sqlite3_vfs* pCloneVfs,
+        const char* zBase,
+        const char* zName,
+        sqlite3_file* pFile,
+        int flags,
+        int* pOutFlags);
+
+#endif
@@ -0,0 +1,254 @@
+#if defined(_WIN32)
+#    include <Windows.h>
+#else
+#    include <time.h>
+#endif
+
+#include "debug.h"
+#include "utils.h"
+
+#if defined(__GNUC__) || defined(__clang__)
+#    define BMN_ATOMIC_ADD(P, V) __atomic_fetch_add((P), (V), __ATOMIC_RELAXED)
+#    define BMN_ATOMIC_LOAD(P)   __atomic_load_n((P), __ATOMIC_RELAXED)
+#    define BMN_ATOMIC_EXCHANGE(P, V) \
+        __atomic_exchange_n((P), (V), __ATOMIC_RELAXED)
+#    define BMN_ATOMIC_CAS(P, OLD, V) \
+        __atomic_compare_exchange_n( \
+                (P), \
+                &(OLD), \
+                (V), \
+                0, \
+                __ATOMIC_RELAXED, \
+                __ATOMIC_RELAXED)
+#elif defined(_MSC_VER)
+#    define BMN_ATOMIC_ADD(P, V) \
+        _InterlockedExchangeAdd64((volatile __int64*)(P), (V))
+#    define BMN_ATOMIC_LOAD(P) (*(volatile const sqlite3_int64*)(P))
+#    define BMN_ATOMIC_EXCHANGE(P, V) \
+        _InterlockedExchange64((volatile __int64*)(P), (V))
+#    define BMN_ATOMIC_CAS(P, OLD, V) \
+        ((OLD) == _InterlockedCompareExchange64( \
+                          (volatile __int64*)(P), \
+                          (V), \
+                          (OLD)))
+#else
+#    define BMN_ATOMIC_ADD(P, V)      (*(P) += (V))
+#    define BMN_ATOMIC_LOAD(P)        (*(P))
+#    define BMN_ATOMIC_EXCHANGE(P, V) exchange((P), (V))
+#    define BMN_ATOMIC_CAS(P, OLD, V) (*(P) = (V), 1)
+static sqlite3_int64 exchange(sqlite3_int64* pValue, sqlite3_int64 iNew)
+{
+    sqlite3_int64 iOld = *pValue;
+    *pValue            = iNew;
+    return iOld;
+}
+#endif
+
+static const char* azOpName[BMN_OP_COUNT] = {
+        "open",
+        "close",
+        "read",
+        "write",
+        "truncate",
+        "sync",
+        "file_size",
+        "lock",
+        "unlock",
+        "check_reserved_lock",
+        "file_control",
+        "sector_size",
+        "device_characteristics",
+        "delete",
+        "access",
+        "full_pathname"};
+
+extern sqlite3_int64 bmnStatsClock(void)
+{
+#if defined(_WIN32)
+    static LARGE_INTEGER frequency;
+    LARGE_INTEGER counter;
+    if(!frequency.QuadPart)
+    {
+        QueryPerformanceFrequency(&frequency);
+    }
+    QueryPerformanceCounter(&counter);
+    return (sqlite3_int64)((double)counter.QuadPart * 1e9 /
+                           (double)frequency.QuadPart);
+#else
+    struct timespec time;
+    clock_gettime(CLOCK_MONOTONIC, &time);
+    return (sqlite3_int64)time.tv_sec * 1000000000 + time.tv_nsec;
+#endif
+}
+
+extern const char* bmnStatsOpName(int iOp)
+{
+    BMN_ASSERT(iOp >= 0 && iOp < BMN_OP_COUNT);
+    return azOpName[iOp];
+}
+
+static void add(sqlite3_int64* pCounter, int iShared, sqlite3_int64 iValue)
+{
+    if(iShared)
+    {
+        BMN_ATOMIC_ADD(pCounter, iValue);
+    }
+    else
+    {
+        *pCounter += iValue;
+    }
+}
+
+extern void bmnStatsAdd(
+        BmnStats* pStats,
+        int iShared,
+        int iOp,
+        int rc,
+        sqlite3_int64 iTime,
+        int iWrapper,
+        sqlite3_int64 iBytes)
+{
+    add(&pStats->aCalls[iOp], iShared, 1);
+    add(&pStats->aTime[iOp], iShared, iTime);
+    add(iWrapper ? &pStats->iWrapperTime : &pStats->iRootTime, iShared, iTime);
+    switch(rc)
+    {
+        case SQLITE_OK:
+            if(BMN_OP_READ == iOp)
+            {
+                add(&pStats->iBytesRead, iShared, iBytes);
+            }
+            else if(BMN_OP_WRITE == iOp)
+            {
+                add(&pStats->iBytesWritten, iShared, iBytes);
+            }
+            break;
+        case SQLITE_IOERR_SHORT_READ:
+            add(&pStats->iShortReads, iShared, 1);
+            break;
+        case SQLITE_BUSY:
+        case SQLITE_NOTFOUND:
+            break;
+        default:
+            add(&pStats->aErrors[iOp], iShared, 1);
+    }
+}
+
+extern void bmnStatsCopy(BmnStats* pDst, const BmnStats* pSrc)
+{
+    int i;
+
+    for(i = 0; i < BMN_OP_COUNT; ++i)
+    {
+        pDst->aCalls[i]  = BMN_ATOMIC_LOAD(&pSrc->aCalls[i]);
+        pDst->aErrors[i] = BMN_ATOMIC_LOAD(&pSrc->aErrors[i]);
+        pDst->aTime[i]   = BMN_ATOMIC_LOAD(&pSrc->aTime[i]);
+    }
+    pDst->iBytesRead    = BMN_ATOMIC_LOAD(&pSrc->iBytesRead);
+    pDst->iBytesWritten = BMN_ATOMIC_LOAD(&pSrc->iBytesWritten);
+    pDst->iShortReads   = BMN_ATOMIC_LOAD(&pSrc->iShortReads);
+    pDst->iWrapperTime  = BMN_ATOMIC_LOAD(&pSrc->iWrapperTime);
+    pDst->iRootTime     = BMN_ATOMIC_LOAD(&pSrc->iRootTime);
+}
+
+/*
+ values below 8 have own buckets, then every power of two is split
+ into 8 buckets by next 3 bits
+ */
+static int bucketOf(sqlite3_int64 iTime)
+{
+    int iBit;
+
+    if(iTime < 8)
+    {
+        return iTime < 0 ? 0 : (int)iTime;
+    }
+#if defined(__GNUC__) || defined(__clang__)
+    iBit = 63 - __builtin_clzll((unsigned long long)iTime);
+#else
+    for(iBit = 3; (iTime >> (iBit + 1)) != 0; ++iBit)
+    {}
+#endif
+    if(iBit >= 40)
+    {
+        return BMN_LATENCY_BUCKETS - 1;
+    }
+    return (iBit - 2) * 8 + (int)((iTime >> (iBit - 3)) & 7);
+}
+
+/*
+ the least value of the next bucket
+ */
+static sqlite3_int64 bucketEnd(int iBucket)
+{
+    int iBit;
+
+    if(iBucket < 8)
+    {
+        return iBucket + 1;
+    }
+    iBit = iBucket / 8 + 2;
+    return ((sqlite3_int64)(8 + iBucket % 8) + 1) << (iBit - 3);
+}
+
+extern void bmnLatencyAdd(BmnLatency* pLatency, int iOp, sqlite3_int64 iTime)
+{
+    sqlite3_int64 iMax;
+
+    BMN_ATOMIC_ADD(&pLatency->aBucket[iOp][bucketOf(iTime)], 1);
+    iMax = BMN_ATOMIC_LOAD(&pLatency->aMax[iOp]);
+    while(iTime > iMax && !BMN_ATOMIC_CAS(&pLatency->aMax[iOp], iMax, iTime))
+    {}
+}
+
+extern void bmnLatencyCopy(
+        BmnLatency* pLatency,
+        int iOp,
+        int iReset,
+        sqlite3_int64* aBucket,
+        sqlite3_int64* pMax)
+{
+    int i;
+
+    for(i = 0; i < BMN_LATENCY_BUCKETS; ++i)
+    {
+        aBucket[i] = iReset
+                ? BMN_ATOMIC_EXCHANGE(&pLatency->aBucket[iOp][i], 0)
+                : BMN_ATOMIC_LOAD(&pLatency->aBucket[iOp][i]);
+    }
+    *pMax = iReset ? BMN_ATOMIC_EXCHANGE(&pLatency->aMax[iOp], 0)
+                   : BMN_ATOMIC_LOAD(&pLatency->aMax[iOp]);
+}
+
+extern sqlite3_int64 bmnLatencyPercentile(
+        const sqlite3_int64* aBucket,
+        sqlite3_int64 iMax,
+        double fraction)
+{
+    int i;
+    sqlite3_int64 nTotal;
+    sqlite3_int64 nRank;
+    sqlite3_int64 iEnd;
+
+    nTotal = 0;
+    for(i = 0; i < BMN_LATENCY_BUCKETS; ++i)
+    {
+        nTotal += aBucket[i];
+    }
+    if(!nTotal)
+    {
+        return 0;
+    }
+    // the call of the rank is the first one not faster than others
+    nRank = (sqlite3_int64)(fraction * (double)nTotal + 0.5);
+    if(nRank < 1)
+    {
+        nRank = 1;
+    }
+    for(i = 0; i < BMN_LATENCY_BUCKETS - 1 && nRank > aBucket[i]; ++i)
+    {
+        nRank -= aBucket[i];
+    }
+    iEnd = bucketEnd(i) - 1;
+    return iEnd < iMax ? iEnd : iMax;
+}
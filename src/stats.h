@@ -0,0 +1,116 @@
+/* stats.h - I/O counters of VFS registration and its files
+ *
+ * Every call of the VFS and of its files is counted with its result and
+ * time. Time of calls passed to the wrapper ( including root VFS I/O the
+ * wrapper does ) and of calls passed to the root VFS is summed apart.
+ * Counters of the registration are shared by connections and changed by
+ * atomic adds only, counters of a file belong to the connection using it.
+ * Latency of calls of the registration is also kept in log-linear
+ * buckets: 8 per power of two, so percentiles are within 12.5%.
+ * All functions can be called without GIL.
+ */
+
+#ifndef BMN_STATS_H
+#define BMN_STATS_H
+#include "sqlite3.h"
+
+#define BMN_OP_OPEN                   0
+#define BMN_OP_CLOSE                  1
+#define BMN_OP_READ                   2
+#define BMN_OP_WRITE                  3
+#define BMN_OP_TRUNCATE               4
+#define BMN_OP_SYNC                   5
+#define BMN_OP_FILE_SIZE              6
+#define BMN_OP_LOCK                   7
+#define BMN_OP_UNLOCK                 8
+#define BMN_OP_CHECK_RESERVED_LOCK    9
+#define BMN_OP_FILE_CONTROL           10
+#define BMN_OP_SECTOR_SIZE            11
+#define BMN_OP_DEVICE_CHARACTERISTICS 12
+#define BMN_OP_DELETE                 13
+#define BMN_OP_ACCESS                 14
+#define BMN_OP_FULL_PATHNAME          15
+#define BMN_OP_COUNT                  16
+
+/*
+ nanoseconds up to 2^40 ( 18 minutes ), longer calls are in the last one
+ */
+#define BMN_LATENCY_BUCKETS 312
+
+typedef struct BmnStats BmnStats;
+typedef struct BmnLatency BmnLatency;
+
+struct BmnStats
+{
+    sqlite3_int64 aCalls[BMN_OP_COUNT];
+    // results other than SQLITE_OK, short read, busy lock and unknown control
+    sqlite3_int64 aErrors[BMN_OP_COUNT];
+    /*
+     nanoseconds
+     */
+    sqlite3_int64 aTime[BMN_OP_COUNT];
+    sqlite3_int64 iBytesRead;
+    sqlite3_int64 iBytesWritten;
+    sqlite3_int64 iShortReads;
+    sqlite3_int64 iWrapperTime;
+    sqlite3_int64 iRootTime;
+};
+
+struct BmnLatency
+{
+    sqlite3_int64 aBucket[BMN_OP_COUNT][BMN_LATENCY_BUCKETS];
+    sqlite3_int64 aMax[BMN_OP_COUNT];
+};
+
+/*
+ nanoseconds of monotonic clock
+ */
+sqlite3_int64 bmnStatsClock(void);
+
+const char* bmnStatsOpName(int iOp);
+
+/*
+ counts the call which took iTime nanoseconds. iShared is 1 if pStats is
+ shared by threads. iBytes is size of read or written data, they're
+ counted only if the call succeeded
+ */
+void bmnStatsAdd(
+        BmnStats* pStats,
+        int iShared,
+        int iOp,
+        int rc,
+        sqlite3_int64 iTime,
+        int iWrapper,
+        sqlite3_int64 iBytes);
+
+/*
+ consistent enough copy of counters changed by other threads
+ */
+void bmnStatsCopy(BmnStats* pDst, const BmnStats* pSrc);
+
+/*
+ counts the call which took iTime nanoseconds, pLatency is shared
+ */
+void bmnLatencyAdd(BmnLatency* pLatency, int iOp, sqlite3_int64 iTime);
+
+/*
+ copies buckets of the operation, they're zeroed if iReset is set.
+ Calls counted meanwhile are either in the copy or in the next one
+ */
+void bmnLatencyCopy(
+        BmnLatency* pLatency,
+        int iOp,
+        int iReset,
+        sqlite3_int64* aBucket,
+        sqlite3_int64* pMax);
+
+/*
+ nanoseconds, the least of the bucket upper bound and iMax
+ fraction is 0.0..1.0, returns 0 if there are no calls
+ */
+sqlite3_int64 bmnLatencyPercentile(
+        const sqlite3_int64* aBucket,
+        sqlite3_int64 iMax,
+        double fraction);
+
+#endif
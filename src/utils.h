@@ -3,6 +3,14 @@
 #include "Python.h"
 #include "sqlite3.h"
 
+#include "cache.h"
+#include "codec.h"
+#include "durability.h"
+#include "events.h"
+#include "memstore.h"
+#include "overlay.h"
+#include "stats.h"
+
 #define BMN_SQLITE_OFFSET \
     -1000 /* error code offset. it must be negative to distinguish it from \
              real values in some callbacks */
@@ -38,6 +46,14 @@ hahdle short read with Bool or None
 #    define BMN_CLOSE_CONNECTION_ON_REGISTER 1
 #endif
 
+/*
+    distinct names of VFS registered by the process and their max length
+*/
+#ifndef BMN_MAX_VFS_COUNT
+#    define BMN_MAX_VFS_COUNT 16
+#endif
+#define BMN_VFS_NAME_SIZE 64
+
 /*
     Allow to implement xSleep in python code
 
@@ -56,6 +72,57 @@ hahdle short read with Bool or None
 #    define BMN_SAVE_EXCEPTION_LOCATION 1
 #endif
 
+/*
+    Bytes of writes collected for wrapper's 'writev' before they're flushed
+*/
+#ifndef BMN_WRITE_BUFFER_SIZE
+#    define BMN_WRITE_BUFFER_SIZE 1048576
+#endif
+
+/*
+    Bytes of one transaction collected for wrapper's 'commit_atomic',
+    sqlite falls back to the rollback journal for bigger ones
+*/
+#ifndef BMN_ATOMIC_BATCH_SIZE
+#    define BMN_ATOMIC_BATCH_SIZE 67108864
+#endif
+
+/*
+    Default number of pages fetched by one 'readv' call on sequential reads
+    and its upper limit
+*/
+#ifndef BMN_READ_AHEAD_PAGES
+#    define BMN_READ_AHEAD_PAGES 16
+#endif
+#define BMN_MAX_READ_AHEAD_PAGES 1024
+
+/*
+    Default merge window of 'group' durability and period of 'interval'
+    one in milliseconds, and upper limit of both
+*/
+#ifndef BMN_GROUP_SYNC_WINDOW
+#    define BMN_GROUP_SYNC_WINDOW 2
+#endif
+#ifndef BMN_SYNC_INTERVAL
+#    define BMN_SYNC_INTERVAL 1000
+#endif
+#define BMN_MAX_SYNC_INTERVAL 3600000
+
+/*
+    Suffix of root VFS file made next to main DB of full impl. for
+    its locks and WAL shared memory, only if 'side_file' is on
+*/
+#ifndef BMN_SIDE_FILE_SUFFIX
+#    define BMN_SIDE_FILE_SUFFIX "-bmn"
+#endif
+
+/*
+    Bytes of main DB header which sqlite compares to notice changes of
+    other connections: change counter, size, freelist trunk and count
+*/
+#define BMN_FILE_VERS_OFFSET 24
+#define BMN_FILE_VERS_SIZE   16
+
 /*
   It's enough
 */
@@ -157,11 +224,27 @@ hahdle short read with Bool or None
 #    define BMN_NO_CALLBACK_SLEEP 1 << 9
 #endif
 #define BMN_NO_CALLBACK_FULL_PATHNAME 1 << 10
+#define BMN_NO_CALLBACK_READINTO      1 << 11
+#define BMN_ZERO_COPY_WRITE           1 << 12 // memoryview for write/encode
+#define BMN_NO_CALLBACK_WRITEV        1 << 13
+#define BMN_NO_CALLBACK_READV         1 << 14
+#define BMN_NO_CALLBACK_LOCK                1 << 15
+#define BMN_NO_CALLBACK_UNLOCK              1 << 16
+#define BMN_NO_CALLBACK_CHECK_RESERVED_LOCK 1 << 17
+#define BMN_NO_CALLBACK_COMMIT_ATOMIC       1 << 18
 #if 0 == BMN_MARK_SHORT_READ_WITH_BOOL
 #    define BMN_READ_REAL_WORK \
         1 << 10 /* it means read/decode hasn't returned short read error */
 #endif
 
+/*
+  file types of sqlite open flags
+*/
+#define BMN_FILE_TYPES \
+    (SQLITE_OPEN_MAIN_DB | SQLITE_OPEN_TEMP_DB | SQLITE_OPEN_TRANSIENT_DB | \
+     SQLITE_OPEN_MAIN_JOURNAL | SQLITE_OPEN_TEMP_JOURNAL | \
+     SQLITE_OPEN_SUBJOURNAL | SQLITE_OPEN_MASTER_JOURNAL | SQLITE_OPEN_WAL)
+
 /*
   wrappper check result code
 */
@@ -197,10 +280,59 @@ hahdle short read with Bool or None
 #define RAISE_WRAPPER_ERROR(OBJ, ...) \
     RAISE_ERROR(pysqlite_WrapperError, (OBJ), __VA_ARGS__)
 
+/*
+  vectorcall appeared in 3.8 as private API and became public in 3.9
+  args[-1] must be writable, so callers reserve the first slot
+*/
+#if PY_VERSION_HEX >= 0x03090000
+#    define BMN_VECTORCALL(FUNC, ARGS, NARGS) \
+        PyObject_Vectorcall( \
+                (FUNC), \
+                (ARGS), \
+                (NARGS) | PY_VECTORCALL_ARGUMENTS_OFFSET, \
+                NULL)
+#elif PY_VERSION_HEX >= 0x03080000
+#    define BMN_VECTORCALL(FUNC, ARGS, NARGS) \
+        _PyObject_Vectorcall( \
+                (FUNC), \
+                (ARGS), \
+                (NARGS) | PY_VECTORCALL_ARGUMENTS_OFFSET, \
+                NULL)
+#else
+#    define BMN_VECTORCALL(FUNC, ARGS, NARGS) \
+        _PyObject_FastCall((FUNC), (ARGS), (NARGS))
+#endif
+
+/*
+  wrapper methods resolved once by bmnVfsRegister
+  see BmnvfsInfo::pMethods
+*/
+#define BMN_METHOD_READ                   0
+#define BMN_METHOD_READINTO               1
+#define BMN_METHOD_WRITE                  2
+#define BMN_METHOD_TRUNCATE               3
+#define BMN_METHOD_FILE_SIZE              4
+#define BMN_METHOD_SYNC                   5
+#define BMN_METHOD_SECTOR_SIZE            6
+#define BMN_METHOD_DEVICE_CHARACTERISTICS 7
+#define BMN_METHOD_FILE_CONTROL           8
+#define BMN_METHOD_ENCODE                 9
+#define BMN_METHOD_DECODE                 10
+#define BMN_METHOD_WRITEV                 11
+#define BMN_METHOD_READV                  12
+#define BMN_METHOD_LOCK                   13
+#define BMN_METHOD_UNLOCK                 14
+#define BMN_METHOD_CHECK_RESERVED_LOCK    15
+#define BMN_METHOD_COMMIT_ATOMIC          16
+#define BMN_METHOD_COUNT                  17
+
 typedef struct BmnvfsHolder BmnvfsHolder;
 typedef struct BmnvfsFile BmnvfsFile;
 typedef struct BmnvfsInfo BmnvfsInfo;
 typedef struct BmnvfsNode BmnvfsNode;
+typedef struct BmnWriteRun BmnWriteRun;
+typedef struct BmnWriteBuffer BmnWriteBuffer;
+typedef struct BmnReadAhead BmnReadAhead;
 
 struct BmnvfsHolder
 {
@@ -214,10 +346,107 @@ struct BmnvfsNode
     BmnvfsNode* prev;
 };
 
+/*
+ contiguous piece of collected writes, its data is at zData + iPos
+*/
+struct BmnWriteRun
+{
+    sqlite3_int64 iOfst;
+    int iAmt;
+    int iPos;
+};
+
+/*
+ writes waiting for one 'writev' or 'commit_atomic' call
+*/
+struct BmnWriteBuffer
+{
+    char* zData;
+    int nData;
+    int nDataAlloc;
+    BmnWriteRun* aRun;
+    int nRun;
+    int nRunAlloc;
+};
+
+/*
+ pages fetched by 'readv' after sequential reads
+ they're dropped on write and lock changes
+*/
+struct BmnReadAhead
+{
+    char* zData;
+    int nDataAlloc;
+    sqlite3_int64 iOfst;
+    int nData;
+    // detection of sequential reads
+    sqlite3_int64 iNextOfst;
+    int iAmt;
+    int nSequential;
+};
+
 struct BmnvfsInfo
 {
+    /*
+    name of the VFS, empty if the slot is free
+    */
+    char zName[BMN_VFS_NAME_SIZE];
     sqlite3_vfs* pRootVfs;
+    /*
+    opens, deletes and checks files not handled by the wrapper.
+    pRootVfs or memStore
+    */
+    sqlite3_vfs* pFileVfs;
+    /*
+    files of the VFS registered with 'memory_store'
+    */
+    BmnMemStore memStore;
+    /*
+    copy-on-write clones opened by the VFS
+    */
+    BmnOverlayStore overlays;
     PyObject* pWrapper;
+    /*
+    bound methods of pWrapper. NULL if method isn't implemented
+    */
+    PyObject* pMethods[BMN_METHOD_COUNT];
+    /*
+    native page transform from wrapper's 'codec' capsule or NULL
+    */
+    PyObject* pCodecCapsule;
+    const BmnCodec* pCodec;
+    /*
+    decoded pages of main DB files. disabled by default
+    */
+    BmnPageCache cache;
+    /*
+    sync policy and counters
+    */
+    BmnDurability durability;
+    /*
+    calls of the VFS and of all its files, closed ones too
+    */
+    BmnStats stats;
+    BmnLatency latency;
+    // trace of the calls if it's on
+    BmnEvents events;
+    /*
+    pages to read ahead in full impl. with 'readv'. 0 disables it
+    */
+    int iReadAhead;
+    /*
+    incremented by vfs_invalidate, files drop their cached size, sector
+    size and device characteristics when it differs from theirs
+    */
+    int iGeneration;
+    /*
+    file types ( BMN_FILE_TYPES ) the wrapper doesn't transform
+    */
+    int iPlainFiles;
+    /*
+    1 if main DB of full impl. gets BMN_SIDE_FILE_SUFFIX file for locks and WAL
+    */
+    int iSideFile;
     int iFlags;
 
 #if BMN_CLOSE_CONNECTION_ON_REGISTER
@@ -252,6 +481,90 @@ struct BmnvfsFile
  used only in partial impl.
  */
     void* pBuffer;
+    /*
+ callbacks for 'decode' and 'encode' bound to this file
+ used only in partial impl. without native codec
+ */
+    PyObject* pRawRead;
+    PyObject* pRawWrite;
+    /*
+ NULL if pages of this file aren't cached
+ */
+    BmnCacheFile* pCacheFile;
+    /*
+ NULL if writes go to the wrapper at once
+ used only in full impl. with 'writev'
+ */
+    BmnWriteBuffer* pWrites;
+    /*
+ writes of the batch atomic transaction, valid if iBatch is set
+ used only for main DB in full impl. with 'commit_atomic'
+ */
+    BmnWriteBuffer* pBatch;
+    int iBatch;
+    /*
+ NULL if there's no read-ahead
+ used only for main DB in full impl. with 'readv'
+ */
+    BmnReadAhead* pReadAhead;
+    /*
+ root VFS file BMN_SIDE_FILE_SUFFIX locked and mapped instead of main DB
+ used only in full impl. with 'side_file'. NULL if it can't be opened
+ */
+    sqlite3_file* pSide;
+    char* zSideName;
+    /*
+ 1 if partial impl. passes the file to pReal as is, it can be mapped then
+ */
+    int iPlain;
+    /*
+ NULL if syncs of this file are never deferred
+ used only for WAL files
+ */
+    BmnSyncFile* pSyncFile;
+    /*
+ deferred commit sync of the WAL which the connection waits for after
+ the WAL write lock is released, 0 if there is none
+ */
+    sqlite3_int64 iSyncTicket;
+    /*
+ WAL of the same connection and main DB of the WAL, to perform deferred
+ syncs before checkpoint. NULL if not opened
+ */
+    BmnvfsFile* pWal;
+    BmnvfsFile* pMainDb;
+    /*
+ results of wrapper's 'file_size', 'sector_size' and
+ 'device_characteristics', negative if they aren't known yet
+ used only in full impl.
+ */
+    sqlite3_int64 iSize;
+    int iSectorSize;
+    int iDeviceCharacteristics;
+    int iGeneration;
+    /*
+ version of main DB ( BMN_FILE_VERS_SIZE bytes from the change counter )
+ last read or written by this handle, iFileVers is 0 if it isn't known.
+ iCheckSize is set by SHARED lock, the size is asked again if it's
+ needed before the version is read
+ */
+    unsigned char aFileVers[BMN_FILE_VERS_SIZE];
+    int iFileVers;
+    int iCheckSize;
+    /*
+ wal-index header mapped by the side file and WAL salts and backfilled
+ frames seen by this handle. Checkpoints of others change main DB
+ */
+    const volatile unsigned int* aShmHeader;
+    unsigned int aCheckpoint[3];
+    /*
+ name given by sqlite, it's valid until the file is closed. NULL for
+ temporary files
+ */
+    const char* zName;
+    BmnStats stats;
+    // id of the file in events
+    sqlite3_int64 iId;
 };
 
 /*
@@ -16,8 +16,12 @@
 #define BMN_INFO(p) ((BmnvfsInfo*)(void*)p->pAppData)
 #define BMN_VFS(p)  ((BmnvfsInfo*)(void*)p->pAppData)->pRootVfs
 
-static BmnvfsInfo staticInfo;
-static sqlite3_vfs staticVfs;
+/*
+ slots keep their names once registered, so sqlite3_vfs pointers of
+ the name stay valid after unregistering and registering it again
+*/
+static BmnvfsInfo aStaticInfo[BMN_MAX_VFS_COUNT];
+static sqlite3_vfs aStaticVfs[BMN_MAX_VFS_COUNT];
 extern PyObject* pysqlite_WrapperError;
 extern PyObject* pysqlite_OperationalError;
 
@@ -66,6 +70,30 @@ static int bmnvfsCurrentTimeInt64(sqlite3_vfs*, sqlite3_int64*);
 static int bmnvfsSetSystemCall(sqlite3_vfs*, const char*, sqlite3_syscall_ptr);
 static sqlite3_syscall_ptr bmnvfsGetSystemCall(sqlite3_vfs*, const char* z);
 static const char* bmnvfsNextSystemCall(sqlite3_vfs*, const char* zName);
+// writes collected for 'writev'
+static int flushWrites(BmnvfsFile*);
+static int performSync(void*, int flags);
+static void freeWrites(BmnvfsFile*);
+static void freeBatch(BmnvfsFile*);
+static void countVfsCall(
+        BmnvfsInfo*,
+        BmnvfsFile*,
+        int,
+        int,
+        sqlite3_int64,
+        int,
+        int);
+// pages fetched by 'readv'
+static void dropReadAhead(BmnvfsFile*);
+static void freeReadAhead(BmnvfsFile*);
+
+/*
+ guards pInfo->pFiles against vfs_stats reading it
+*/
+static sqlite3_mutex* filesMutex(void)
+{
+    return sqlite3_mutex_alloc(SQLITE_MUTEX_STATIC_APP1);
+}
 
 #ifndef NDEBUG
 static const char* fileName(const char* z)
@@ -81,8 +109,117 @@ static const char* fileName(const char* z)
     return &z[i];
 }
 #endif
+/*
+ full impl. main DB with 'side_file' gets empty root VFS file next to it
+ its locks and shared memory serve the DB, so WAL works
+ and connections of all processes see each other
+*/
+static int openSideFile(
+        BmnvfsInfo* pInfo,
+        BmnvfsFile* pBmnFile,
+        const char* zName)
+{
+    int rc;
+    int nName;
+    int iOutFlags;
+    char* zPath;
+    char* zSide;
+    sqlite3_file* pSide;
+    sqlite3_vfs* pRoot;
+
+    pRoot = pInfo->pRootVfs;
+    nName = (int)strlen(zName);
+    zPath = BMN_MEM_MALLOC(nName + sizeof(BMN_SIDE_FILE_SUFFIX));
+    /*
+     root VFS reads URI parameters of the name, so it's placed like sqlite
+     does: four zeros before the name and empty parameters list after it
+    */
+    zSide = BMN_MEM_MALLOC(pRoot->mxPathname + 9);
+    if(!zPath || !zSide)
+    {
+        BMN_MEM_FREE(zPath);
+        BMN_MEM_FREE(zSide);
+        return SQLITE_NOMEM;
+    }
+    memcpy(zPath, zName, nName);
+    memcpy(zPath + nName, BMN_SIDE_FILE_SUFFIX, sizeof(BMN_SIDE_FILE_SUFFIX));
+    memset(zSide, 0, pRoot->mxPathname + 9);
+    rc = pRoot->xFullPathname(pRoot, zPath, pRoot->mxPathname + 1, zSide + 4);
+    BMN_MEM_FREE(zPath);
+    pSide = (sqlite3_file*)&pBmnFile[1];
+    memset(pSide, 0, pRoot->szOsFile);
+    if(SQLITE_OK == (rc & 0xff))
+    {
+        rc = pRoot->xOpen(
+                pRoot,
+                zSide + 4,
+                pSide,
+                SQLITE_OPEN_READWRITE | SQLITE_OPEN_CREATE |
+                        SQLITE_OPEN_MAIN_DB,
+                &iOutFlags);
+        if(SQLITE_OK == rc &&
+           (pSide->pMethods->iVersion < 2 || !pSide->pMethods->xShmMap))
+        {
+            rc = SQLITE_NOTFOUND;
+        }
+    }
+    if(rc)
+    {
+        BMN_VERBOSE("No side file for %s", zName);
+        if(pSide->pMethods)
+        {
+            pSide->pMethods->xClose(pSide);
+        }
+        BMN_MEM_FREE(zSide);
+        return rc;
+    }
+    pBmnFile->pSide     = pSide;
+    pBmnFile->zSideName = zSide;
+    return SQLITE_OK;
+}
+
+static void closeSideFile(BmnvfsFile* pBmnFile)
+{
+    if(pBmnFile->pSide)
+    {
+        pBmnFile->pSide->pMethods->xClose(pBmnFile->pSide);
+        pBmnFile->pSide = NULL;
+        BMN_MEM_FREE(pBmnFile->zSideName);
+        pBmnFile->zSideName = NULL;
+    }
+}
+/*
+ partial impl. and plain files. Main DB with BMN_OVERLAY_PARAMETER is
+ opened as copy-on-write clone of that read-only base DB
+*/
+static int openRealFile(
+        BmnvfsInfo* pInfo,
+        const char* zName,
+        const char* zBase,
+        sqlite3_file* pReal,
+        int flags,
+        int* pOutFlags)
+{
+    sqlite3_vfs* pVfs;
+
+    pVfs = pInfo->pFileVfs;
+    if(zBase)
+    {
+        return bmnOverlayOpen(
+                &pInfo->overlays,
+                pInfo->pRootVfs,
+                pVfs,
+                zBase,
+                zName,
+                pReal,
+                flags,
+                pOutFlags);
+    }
+    return pVfs->xOpen(pVfs, zName, pReal, flags, pOutFlags);
+}
+
 // Open an bmnvfs file handle.
-static int bmnvfsOpen(
+static int bmnvfsOpenImpl(
         sqlite3_vfs* pVfs,
         const char* zName,
         sqlite3_file* pFile,
@@ -94,12 +231,22 @@ static int bmnvfsOpen(
     BmnvfsFile* pBmnFile = BMN_FILE(pFile);
     BmnvfsInfo* pInfo    = BMN_INFO(pVfs);
     sqlite3_io_methods* pNewSet;
+    const char* zBase;
 
     // TODO: not sure
     if(zName == 0)
     {
         return SQLITE_IOERR;
     }
+    zBase = NULL;
+    if(flags & SQLITE_OPEN_MAIN_DB)
+    {
+        zBase = sqlite3_uri_parameter(zName, BMN_OVERLAY_PARAMETER);
+        if(zBase && !zBase[0])
+        {
+            zBase = NULL;
+        }
+    }
 
     pNewSet = BMN_MEM_MALLOC_SMALL(sizeof(*pNewSet));
     memset(pNewSet, 0, sizeof(*pNewSet));
@@ -122,11 +269,8 @@ static int bmnvfsOpen(
         pNewSet->xShmLock    = bmnvfsShmLock;
         pNewSet->xShmBarrier = bmnvfsShmBarrier;
         pNewSet->xShmUnmap   = bmnvfsShmUnmap;
-    }
-    if(pNewSet->iVersion >= 2)
-    {
-        pNewSet->xFetch   = bmnvfsFetch;
-        pNewSet->xUnfetch = bmnvfsUnfetch;
+        pNewSet->xFetch      = bmnvfsFetch;
+        pNewSet->xUnfetch    = bmnvfsUnfetch;
     }
 
     BMN_VERBOSE_INT(pInfo->iFlags);
@@ -137,8 +281,36 @@ static int bmnvfsOpen(
 #if BMN_DEBUG_FILENAME_CONTROL
     pBmnFile->zFName = zName ? fileName(zName) : "[tmp]";
 #endif
-    rc = BMN_CB_RESULT_NO_HANDLER;
-    if(0 == (pInfo->iFlags & BMN_NO_CALLBACK_OPEN))
+    pBmnFile->pBuffer   = NULL;
+    pBmnFile->pRawRead   = NULL;
+    pBmnFile->pRawWrite  = NULL;
+    pBmnFile->pCacheFile = NULL;
+    pBmnFile->pWrites    = NULL;
+    pBmnFile->pBatch     = NULL;
+    pBmnFile->iBatch     = 0;
+    pBmnFile->pReadAhead = NULL;
+    pBmnFile->pSide      = NULL;
+    pBmnFile->zSideName  = NULL;
+    pBmnFile->iPlain     = 0 != (flags & pInfo->iPlainFiles);
+    pBmnFile->pSyncFile  = NULL;
+    pBmnFile->pWal       = NULL;
+    pBmnFile->pMainDb    = NULL;
+    pBmnFile->iSize      = -1;
+    pBmnFile->iSectorSize            = -1;
+    pBmnFile->iDeviceCharacteristics = -1;
+    pBmnFile->iGeneration            = pInfo->iGeneration;
+    pBmnFile->iFileVers              = 0;
+    pBmnFile->iCheckSize             = 0;
+    pBmnFile->aShmHeader             = NULL;
+    pBmnFile->iSyncTicket            = 0;
+    memset(pBmnFile->aCheckpoint, 0, sizeof(pBmnFile->aCheckpoint));
+    pBmnFile->zName                  = zName;
+    memset(&pBmnFile->stats, 0, sizeof(pBmnFile->stats));
+    pBmnFile->iId = bmnEventsFileId(&pInfo->events);
+    pBmnFile->iFlags     = flags;
+    rc                  = BMN_CB_RESULT_NO_HANDLER;
+    // plain files are opened natively even by full impl.
+    if(!pBmnFile->iPlain && 0 == (pInfo->iFlags & BMN_NO_CALLBACK_OPEN))
     {
         rc = callOpenMethod(pInfo->pWrapper, pBmnFile, zName, flags, pOutFlags);
     }
@@ -148,15 +320,39 @@ static int bmnvfsOpen(
             BMN_CB_RESULT_NO_HANDLER == rc ? "partial" : "full");
     if(BMN_CB_RESULT_NO_HANDLER == rc)
     {
-        pInfo->iFlags |= BMN_NO_CALLBACK_OPEN;
-        sqlite3_vfs* pRoot     = pInfo->pRootVfs;
+        if(!pBmnFile->iPlain)
+        {
+            pInfo->iFlags |= BMN_NO_CALLBACK_OPEN;
+        }
         pBmnFile->pReal        = (sqlite3_file*)&pBmnFile[1];
         // once again  to be clear
         pBmnFile->pFileWrapper = NULL;
         pBmnFile->iFlags       = flags;
-        rc = pRoot->xOpen(pRoot, zName, pBmnFile->pReal, flags, pOutFlags);
+        rc                     = openRealFile(
+                pInfo,
+                zName,
+                zBase,
+                pBmnFile->pReal,
+                flags,
+                pOutFlags);
         BMN_ASSERT(!pBmnFile->pFileWrapper);
         BMN_VERBOSE_HEX(flags);
+        if(SQLITE_OK == rc && !pBmnFile->iPlain)
+        {
+            rc = createRawCallbacks(pBmnFile);
+            if(rc)
+            {
+                pBmnFile->pReal->pMethods->xClose(pBmnFile->pReal);
+                pBmnFile->pReal->pMethods = NULL;
+            }
+        }
+        // shared memory of version 2 and mapping of version 3
+        if(SQLITE_OK == rc)
+        {
+            pNewSet->iVersion = pBmnFile->pReal->pMethods->iVersion < 3
+                    ? pBmnFile->pReal->pMethods->iVersion
+                    : 3;
+        }
     }
     else if(BMN_CB_RESULT_HANDLER_LOGIC_ERROR == rc)
     {
@@ -168,15 +364,66 @@ static int bmnvfsOpen(
         BMN_TRACE_ERROR(rc);
         return SQLITE_CANTOPEN;
     }
+    else if(zBase)
+    {
+        // the wrapper owns the storage, there's nothing to overlay
+        BMN_ERROR("overlay of %s needs natively opened main DB", zName);
+        callCloseMethod(pInfo->pWrapper, pBmnFile);
+        BMN_MEM_FREE_SMALL(pNewSet);
+        return SQLITE_CANTOPEN;
+    }
     else
     {
         pBmnFile->pReal = NULL;
+        // WAL frames must be visible to other connections at once
+        if(0 == (pInfo->iFlags & BMN_NO_CALLBACK_WRITEV) &&
+           0 == (flags & SQLITE_OPEN_WAL))
+        {
+            pBmnFile->pWrites = BMN_MEM_MALLOC(sizeof(BmnWriteBuffer));
+            if(pBmnFile->pWrites)
+            {
+                memset(pBmnFile->pWrites, 0, sizeof(BmnWriteBuffer));
+            }
+        }
+        if(0 == (pInfo->iFlags & BMN_NO_CALLBACK_READV) &&
+           pInfo->iReadAhead > 0 && (flags & SQLITE_OPEN_MAIN_DB))
+        {
+            pBmnFile->pReadAhead = BMN_MEM_MALLOC(sizeof(BmnReadAhead));
+            if(pBmnFile->pReadAhead)
+            {
+                memset(pBmnFile->pReadAhead, 0, sizeof(BmnReadAhead));
+            }
+        }
+        // sqlite uses shared memory only if methods are of version 2
+        if((flags & SQLITE_OPEN_MAIN_DB) && pInfo->iSideFile &&
+           SQLITE_OK == openSideFile(pInfo, pBmnFile, zName))
+        {
+            pNewSet->iVersion = 2;
+        }
     }
     pBmnFile->base.pMethods = pNewSet;
     pBmnFile->pInfo         = pInfo;
+    if(SQLITE_OK == rc && (flags & SQLITE_OPEN_MAIN_DB) && !pBmnFile->iPlain)
+    {
+        pBmnFile->pCacheFile = bmnCacheOpen(&pInfo->cache, zName);
+    }
+#if BMN_HAS_DEFERRED_SYNC
+    if(SQLITE_OK == rc && (flags & SQLITE_OPEN_WAL))
+    {
+        sqlite3_file* pDb;
+        pBmnFile->pSyncFile = bmnDurabilityOpen(&pInfo->durability, zName);
+        pDb                 = sqlite3_database_file_object(zName);
+        if(pDb && pDb->pMethods && bmnvfsClose == pDb->pMethods->xClose)
+        {
+            pBmnFile->pMainDb       = BMN_FILE(pDb);
+            BMN_FILE(pDb)->pWal = pBmnFile;
+        }
+    }
+#endif
 #if BMN_CLOSE_CONNECTION_ON_REGISTER
     BmnvfsNode** temp;
     BmnvfsNode* prev;
+    sqlite3_mutex_enter(filesMutex());
     temp = &pInfo->pFiles;
     prev = NULL;
     while(*temp)
@@ -192,6 +439,7 @@ static int bmnvfsOpen(
     (*temp)->file = pFile;
     (*temp)->next = NULL;
     (*temp)->prev = prev;
+    sqlite3_mutex_leave(filesMutex());
 #else
     pInfo->iOpenedFiles += 1;
 #endif
@@ -206,16 +454,41 @@ static int bmnvfsCloseImpl(sqlite3_file* pFile)
 {
     BMN_TRACE_MARK;
     int rc;
-    rc = SQLITE_OK;
+    int rcFlush;
+    int rcSync;
+    rc      = SQLITE_OK;
+    rcFlush = SQLITE_OK;
     BmnvfsFile* pBmnFile;
     pBmnFile = BMN_FILE(pFile);
     if(pBmnFile->pFileWrapper)
+    {
+        rcFlush = flushWrites(pBmnFile);
+    }
+    // deferred syncs of the WAL are performed before any handle is gone
+    rcSync = bmnDurabilityClose(
+            &pBmnFile->pInfo->durability,
+            pBmnFile->pSyncFile,
+            performSync,
+            pBmnFile);
+    pBmnFile->pSyncFile = NULL;
+    if(pBmnFile->pMainDb)
+    {
+        pBmnFile->pMainDb->pWal = NULL;
+        pBmnFile->pMainDb       = NULL;
+    }
+    if(pBmnFile->pWal)
+    {
+        pBmnFile->pWal->pMainDb = NULL;
+        pBmnFile->pWal          = NULL;
+    }
+    if(pBmnFile->pFileWrapper)
     {
         rc = callCloseMethod(pBmnFile->pInfo->pWrapper, pBmnFile);
         if(rc)
         {
             rc = BMN_CALLBACK_ERROR;
         }
+        closeSideFile(pBmnFile);
     }
     else
     {
@@ -230,6 +503,15 @@ static int bmnvfsCloseImpl(sqlite3_file* pFile)
     {
         BMN_MEM_FREE_SMALL((void*)pBmnFile->base.pMethods);
         pBmnFile->base.pMethods = NULL;
+        BMN_MEM_FREE(pBmnFile->pBuffer);
+        pBmnFile->pBuffer = NULL;
+        releaseRawCallbacks(pBmnFile);
+        bmnCacheClose(&pBmnFile->pInfo->cache, pBmnFile->pCacheFile);
+        pBmnFile->pCacheFile = NULL;
+        freeWrites(pBmnFile);
+        freeBatch(pBmnFile);
+        freeReadAhead(pBmnFile);
+        rc = rcFlush ? rcFlush : rcSync;
     }
     return rc;
 }
@@ -237,11 +519,18 @@ static int bmnvfsClose(sqlite3_file* pFile)
 {
     BMN_TRACE_MARK;
     int rc;
+    int iWrapper;
+    sqlite3_int64 iStart;
     BmnvfsFile* pBmnFile;
     pBmnFile = BMN_FILE(pFile);
+    iWrapper = NULL != pBmnFile->pFileWrapper;
+    iStart   = bmnStatsClock();
     rc       = bmnvfsCloseImpl(pFile);
+    countVfsCall(
+            pBmnFile->pInfo, pBmnFile, BMN_OP_CLOSE, rc, iStart, iWrapper, 0);
 #if BMN_CLOSE_CONNECTION_ON_REGISTER
     BMN_ASSERT(pBmnFile->pInfo);
+    sqlite3_mutex_enter(filesMutex());
     BmnvfsNode** temp = &pBmnFile->pInfo->pFiles;
     BmnvfsNode* prev  = NULL;
 #    if DEBUG_LEAKS_CONTROL
@@ -272,6 +561,7 @@ static int bmnvfsClose(sqlite3_file* pFile)
         prev = *temp;
         temp = &(*temp)->next;
     }
+    sqlite3_mutex_leave(filesMutex());
 #    if DEBUG_LEAKS_CONTROL
     BMN_ASSERT(deleted);
     BMN_ASSERT_EQUAL(openedConnectionsCount(pBmnFile->pInfo), count - 1);
@@ -282,7 +572,64 @@ static int bmnvfsClose(sqlite3_file* pFile)
     return rc;
 }
 
-static int bmnvfsDelete(sqlite3_vfs* pVfs, const char* zName, int syncDir)
+/*
+ type of the file by the name sqlite gives it, xDelete and xAccess don't
+ get open flags. 0 if it isn't known
+*/
+static int fileTypeByName(const char* zName)
+{
+    size_t nName;
+    const char* zBase;
+
+    if(!zName)
+    {
+        return 0;
+    }
+    nName = strlen(zName);
+    if(nName > 8 && 0 == strcmp(zName + nName - 8, "-journal"))
+    {
+        return SQLITE_OPEN_MAIN_JOURNAL;
+    }
+    if(nName > 4 && 0 == strcmp(zName + nName - 4, "-wal"))
+    {
+        return SQLITE_OPEN_WAL;
+    }
+    // "<db>-mj0123AB9CD"
+    zBase = strrchr(zName, '/');
+    if(strstr(zBase ? zBase : zName, "-mj"))
+    {
+        return SQLITE_OPEN_MASTER_JOURNAL;
+    }
+    return 0;
+}
+
+/*
+ side file and its shared memory go with main DB. Missed files are fine
+*/
+static void deleteSideFiles(BmnvfsInfo* pInfo, const char* zName)
+{
+    int nName;
+    char* zSide;
+    sqlite3_vfs* pRoot;
+
+    pRoot = pInfo->pRootVfs;
+    nName = (int)strlen(zName);
+    zSide = BMN_MEM_MALLOC(nName + sizeof(BMN_SIDE_FILE_SUFFIX "-shm"));
+    if(!zSide)
+    {
+        return;
+    }
+    memcpy(zSide, zName, nName);
+    memcpy(zSide + nName,
+           BMN_SIDE_FILE_SUFFIX "-shm",
+           sizeof(BMN_SIDE_FILE_SUFFIX "-shm"));
+    pRoot->xDelete(pRoot, zSide, 0);
+    zSide[nName + sizeof(BMN_SIDE_FILE_SUFFIX) - 1] = 0;
+    pRoot->xDelete(pRoot, zSide, 0);
+    BMN_MEM_FREE(zSide);
+}
+
+static int bmnvfsDeleteImpl(sqlite3_vfs* pVfs, const char* zName, int syncDir)
 {
     /*
         Deletion must be called anyway !!!
@@ -292,25 +639,30 @@ static int bmnvfsDelete(sqlite3_vfs* pVfs, const char* zName, int syncDir)
     int rc;
     BmnvfsInfo* pInfo = BMN_INFO(pVfs);
     rc                = BMN_CB_RESULT_NO_HANDLER;
-    if(0 == (pInfo->iFlags & BMN_NO_CALLBACK_DELETE))
+    if(0 == (pInfo->iFlags & BMN_NO_CALLBACK_DELETE) &&
+       0 == (pInfo->iPlainFiles & fileTypeByName(zName)))
     {
         rc = callDeleteMethod(pInfo->pWrapper, zName, syncDir);
     }
     if(BMN_CB_RESULT_NO_HANDLER == rc)
     {
         pInfo->iFlags |= BMN_NO_CALLBACK_DELETE;
-        rc = pInfo->pRootVfs->xDelete(pInfo->pRootVfs, zName, syncDir);
+        rc = pInfo->pFileVfs->xDelete(pInfo->pFileVfs, zName, syncDir);
     }
     else if(BMN_CB_RESULT_HANDLER_LOGIC_ERROR == rc)
     {
         // pInfo->iCallbackFlags |= BMN_NO_CALLBACK_DELETE;
         rc = BMN_CALLBACK_ERROR;
     }
+    if(SQLITE_OK == rc && pInfo->iSideFile && zName && !fileTypeByName(zName))
+    {
+        deleteSideFiles(pInfo, zName);
+    }
     BMN_TRACE_ERROR(rc);
     return rc;
 }
 
-static int bmnvfsAccess(
+static int bmnvfsAccessImpl(
         sqlite3_vfs* pVfs,
         const char* zName,
         int flags,
@@ -321,13 +673,17 @@ static int bmnvfsAccess(
     BmnvfsInfo* pInfo = BMN_INFO(pVfs);
     rc                = BMN_CB_RESULT_NO_HANDLER;
     // BMN_VERBOSE_INT(pInfo->iCallbackFlags);
-    if(0 == (pInfo->iFlags & BMN_NO_CALLBACK_ACCESS))
+    if(pInfo->iPlainFiles & fileTypeByName(zName))
+    {
+        rc = pInfo->pFileVfs->xAccess(pInfo->pFileVfs, zName, flags, pResOut);
+    }
+    else if(0 == (pInfo->iFlags & BMN_NO_CALLBACK_ACCESS))
     {
         rc = callAccessMethod(pInfo->pWrapper, zName, flags, pResOut);
     }
     if(BMN_CB_RESULT_NO_HANDLER == rc)
     {
-        rc = pInfo->pRootVfs->xAccess(pInfo->pRootVfs, zName, flags, pResOut);
+        rc = pInfo->pFileVfs->xAccess(pInfo->pFileVfs, zName, flags, pResOut);
         pInfo->iFlags |= BMN_NO_CALLBACK_ACCESS;
     }
     else if(rc < 0)
@@ -340,7 +696,7 @@ static int bmnvfsAccess(
     return rc;
 }
 
-static int bmnvfsFullPathname(
+static int bmnvfsFullPathnameImpl(
         sqlite3_vfs* pVfs,
         const char* zName,
         int nOut,
@@ -503,372 +859,2183 @@ static void bmnvfsDlClose(sqlite3_vfs* pVfs, void* pHandle)
     BMN_VFS(pVfs)->xDlClose(BMN_VFS(pVfs), pHandle);
 }
 
-static int bmnvfsRead(
+/*
+ native codec ( see codec.h ) works without GIL
+ encoded data is placed to pBuffer of the file
+*/
+static int codecEncode(
+        BmnvfsFile* pBmnFile,
+        const void* zBuf,
+        int iAmt,
+        sqlite3_int64 iOfst)
+{
+    const BmnCodec* pCodec;
+
+    pCodec = pBmnFile->pInfo->pCodec;
+    if(BMN_MEM_SIZE(pBmnFile->pBuffer) < (sqlite3_uint64)iAmt)
+    {
+        BMN_MEM_FREE(pBmnFile->pBuffer);
+        pBmnFile->pBuffer = BMN_MEM_MALLOC(iAmt);
+        if(!pBmnFile->pBuffer)
+        {
+            return SQLITE_NOMEM;
+        }
+    }
+    return pCodec->xEncode(
+            pCodec->pCtx,
+            pBmnFile->iFlags,
+            zBuf,
+            pBmnFile->pBuffer,
+            iAmt,
+            iOfst);
+}
+
+/*
+ short read means zero tail of unknown length which mustn't be decoded
+ so ask the file size. it happens rarely
+*/
+static int codecDecode(
         sqlite3_file* pFile,
         void* zBuf,
         int iAmt,
-        sqlite_int64 iOfst)
+        sqlite3_int64 iOfst,
+        int rc)
 {
-    BMN_TRACE_MARK;
-    int rc;
+    int rcCodec;
+    sqlite3_int64 iSize;
+    const BmnCodec* pCodec;
     BmnvfsFile* pBmnFile = BMN_FILE(pFile);
-    if(pBmnFile->pFileWrapper)
-    {
-        rc = callReadMethod(pBmnFile->pInfo, pBmnFile, zBuf, iAmt, iOfst);
-    }
-    else
+
+    pCodec = pBmnFile->pInfo->pCodec;
+    if(SQLITE_IOERR_SHORT_READ == rc)
     {
-        // BMN_VERBOSE("decode len:%d offset:%d", iAmt, iOfst);
-        BMN_ASSERT(pBmnFile->pReal);
-        rc = callDecodeMethod(pBmnFile, zBuf, iAmt, iOfst);
-#if BMN_DEBUG_FILENAME_CONTROL
-        if(rc && SQLITE_IOERR_SHORT_READ != rc)
+        if(bmnvfsFileSize(pFile, &iSize) || iSize <= iOfst)
         {
-            BMN_ERROR(
-                    "File: %s , flag: %d",
-                    pBmnFile->zFName,
-                    pBmnFile->iFlags);
+            return rc;
+        }
+        if(iSize - iOfst < iAmt)
+        {
+            iAmt = (int)(iSize - iOfst);
         }
-#endif
     }
-    if(rc < BMN_SQLITE_OFFSET)
+    else if(SQLITE_OK != rc)
     {
-        rc = BMN_CALLBACK_ERROR;
+        return rc;
     }
-    BMN_TRACE_ERROR(rc);
-    return rc;
+    rcCodec =
+            pCodec->xDecode(pCodec->pCtx, pBmnFile->iFlags, zBuf, iAmt, iOfst);
+    return SQLITE_OK == rcCodec ? rc : rcCodec;
 }
 
-static int bmnvfsWrite(
-        sqlite3_file* pFile,
+/*
+ file size, sector size and device characteristics of full impl. are
+ asked from the wrapper once. The size is kept by writes and truncates
+ of this handle. Other connections change main DB by commits, which
+ change its version in the header, and by WAL checkpoints, which change
+ wal-index. The size is asked again only then. WAL is appended by all
+ connections through their own handles, so its size isn't cached
+*/
+static void checkGeneration(BmnvfsFile* pBmnFile)
+{
+    if(pBmnFile->iGeneration != pBmnFile->pInfo->iGeneration)
+    {
+        pBmnFile->iGeneration            = pBmnFile->pInfo->iGeneration;
+        pBmnFile->iSize                  = -1;
+        pBmnFile->iSectorSize            = -1;
+        pBmnFile->iDeviceCharacteristics = -1;
+    }
+}
+
+static void forgetSize(BmnvfsFile* pBmnFile)
+{
+    pBmnFile->iSize = -1;
+}
+
+/*
+ main DB was read at iOfst, the size is dropped if the version differs
+ from the one this handle saw: other connections committed since then
+*/
+static void checkFileVersion(
+        BmnvfsFile* pBmnFile,
         const void* zBuf,
         int iAmt,
         sqlite3_int64 iOfst)
 {
-    BMN_TRACE_MARK;
-    int rc;
-    BmnvfsFile* pBmnFile = BMN_FILE(pFile);
-    if(pBmnFile->pFileWrapper)
-    {
-        rc = callWriteMethod(
-                pBmnFile->pInfo->pWrapper,
-                pBmnFile,
-                zBuf,
-                iAmt,
-                iOfst);
-    }
-    else
+    const unsigned char* zVers;
+
+    if(0 == (pBmnFile->iFlags & SQLITE_OPEN_MAIN_DB) ||
+       iOfst > BMN_FILE_VERS_OFFSET ||
+       iOfst + iAmt < BMN_FILE_VERS_OFFSET + BMN_FILE_VERS_SIZE)
     {
-        BMN_VERBOSE("encode len:%d offset:%d", iAmt, iOfst);
-        BMN_ASSERT(pBmnFile->pReal);
-        rc = callEncodeMethod(pBmnFile, zBuf, iAmt, iOfst);
-        BMN_TRACE_ERROR(rc);
-#if BMN_DEBUG_FILENAME_CONTROL
-        if(rc)
-        {
-            BMN_ERROR(
-                    "File: %s , flag: %d",
-                    pBmnFile->zFName,
-                    pBmnFile->iFlags);
-        }
-#endif
+        return;
     }
-    if(rc < BMN_SQLITE_OFFSET)
+    zVers = (const unsigned char*)zBuf + (BMN_FILE_VERS_OFFSET - iOfst);
+    if(!pBmnFile->iFileVers ||
+       memcmp(pBmnFile->aFileVers, zVers, BMN_FILE_VERS_SIZE))
     {
-        rc = BMN_CALLBACK_ERROR;
+        forgetSize(pBmnFile);
+        memcpy(pBmnFile->aFileVers, zVers, BMN_FILE_VERS_SIZE);
+        pBmnFile->iFileVers = 1;
     }
-    BMN_TRACE_ERROR(rc);
-    return rc;
+    pBmnFile->iCheckSize = 0;
 }
-static int bmnvfsTruncate(sqlite3_file* pFile, sqlite3_int64 size)
+
+/*
+ main DB is written at iOfst by this handle, it knows the new version
+*/
+static void noteFileVersion(
+        BmnvfsFile* pBmnFile,
+        const void* zBuf,
+        int iAmt,
+        sqlite3_int64 iOfst)
 {
-    BMN_TRACE_MARK;
-    int rc;
-    BmnvfsFile* pBmnFile = BMN_FILE(pFile);
-    if(pBmnFile->pFileWrapper)
+    if(0 == (pBmnFile->iFlags & SQLITE_OPEN_MAIN_DB) ||
+       iOfst >= BMN_FILE_VERS_OFFSET + BMN_FILE_VERS_SIZE ||
+       iOfst + iAmt <= BMN_FILE_VERS_OFFSET)
     {
-        rc = callFileTruncateMethod(pBmnFile->pInfo->pWrapper, pBmnFile, size);
-        if(BMN_CB_RESULT_NO_HANDLER == rc)
-        {
-            rc = BMN_CALLBACK_ERROR;
-        }
-        else if(BMN_CB_RESULT_HANDLER_LOGIC_ERROR == rc)
-        {
-            rc = BMN_CALLBACK_ERROR;
-        }
+        return;
     }
-    else
+    pBmnFile->iFileVers = iOfst <= BMN_FILE_VERS_OFFSET &&
+            iOfst + iAmt >= BMN_FILE_VERS_OFFSET + BMN_FILE_VERS_SIZE;
+    if(pBmnFile->iFileVers)
     {
-        BMN_ASSERT(pBmnFile->pReal);
-        rc = pBmnFile->pReal->pMethods->xTruncate(pBmnFile->pReal, size);
+        memcpy(pBmnFile->aFileVers,
+               (const char*)zBuf + (BMN_FILE_VERS_OFFSET - iOfst),
+               BMN_FILE_VERS_SIZE);
     }
-    BMN_TRACE_ERROR(rc);
-    return rc;
 }
+
 /*
-    can be missed
+ WAL salts and backfilled frames of wal-index change when a checkpoint
+ writes main DB or WAL restarts. Without mapped wal-index the size is
+ dropped at every wal-index lock
 */
-static int bmnvfsSync(sqlite3_file* pFile, int flags)
+static void checkCheckpoint(BmnvfsFile* pBmnFile)
 {
-    BMN_TRACE_MARK;
-    int rc;
-    BmnvfsFile* pBmnFile = BMN_FILE(pFile);
-    rc                   = BMN_CB_RESULT_NO_HANDLER;
-    if(pBmnFile->pFileWrapper)
+    unsigned int aCheckpoint[3];
+    const volatile unsigned int* aHeader;
+
+    aHeader = pBmnFile->aShmHeader;
+    if(!aHeader)
     {
-        if(0 == (pBmnFile->pInfo->iFlags & BMN_NO_CALLBACK_SYNC))
-        {
-            rc = callSyncMethod(pBmnFile->pInfo->pWrapper, pBmnFile, flags);
-        }
-        if(BMN_CB_RESULT_NO_HANDLER == rc)
-        {
-            pBmnFile->pInfo->iFlags |= BMN_NO_CALLBACK_SYNC;
-            rc = SQLITE_OK;
-        }
-        else if(BMN_CB_RESULT_HANDLER_LOGIC_ERROR == rc)
-        {
-            pBmnFile->pInfo->iFlags |= BMN_NO_CALLBACK_SYNC;
-            rc = BMN_CALLBACK_ERROR;
-        }
+        forgetSize(pBmnFile);
+        return;
     }
-    else
+    // WalIndexHdr.aSalt at 40 and WalCkptInfo.nBackfill at 96
+    aCheckpoint[0] = aHeader[10];
+    aCheckpoint[1] = aHeader[11];
+    aCheckpoint[2] = aHeader[24];
+    if(memcmp(pBmnFile->aCheckpoint, aCheckpoint, sizeof(aCheckpoint)))
     {
-        BMN_ASSERT(pBmnFile->pReal);
-        rc = pBmnFile->pReal->pMethods->xSync(pBmnFile->pReal, flags);
-        BMN_TRACE_ERROR(rc);
+        forgetSize(pBmnFile);
+        memcpy(pBmnFile->aCheckpoint, aCheckpoint, sizeof(aCheckpoint));
     }
-    BMN_TRACE_ERROR(rc);
-    return rc;
 }
+
 /*
-    must have method
+ rc of the write to the wrapper which ends at iEnd
 */
-static int bmnvfsFileSize(sqlite3_file* pFile, sqlite3_int64* pSize)
+static void extendSize(BmnvfsFile* pBmnFile, int rc, sqlite3_int64 iEnd)
 {
-    BMN_TRACE_MARK;
-    int rc;
-    BmnvfsFile* pBmnFile = BMN_FILE(pFile);
-    if(pBmnFile->pFileWrapper)
+    if(SQLITE_OK != rc)
     {
-        rc = callFileSizeMethod(pBmnFile->pInfo->pWrapper, pBmnFile, pSize);
-        if(rc < 0)
-        {
-            rc     = BMN_CALLBACK_ERROR;
-            *pSize = 0;
-        }
+        pBmnFile->iSize = -1;
     }
-    else
+    else if(pBmnFile->iSize >= 0 && iEnd > pBmnFile->iSize)
     {
-        BMN_ASSERT(pBmnFile->pReal);
-        rc = pBmnFile->pReal->pMethods->xFileSize(pBmnFile->pReal, pSize);
+        pBmnFile->iSize = iEnd;
     }
-    BMN_TRACE_ERROR(rc);
-    return rc;
 }
-static int bmnvfsLock(sqlite3_file* pFile, int flags)
+
+/*
+ writes of full impl. are collected for wrapper's 'writev' and flushed
+ by sync, unlock, close, truncate, overlapping read or full buffer
+ failed writes are dropped, sqlite gets the error and rolls back
+*/
+static int flushWrites(BmnvfsFile* pBmnFile)
 {
-    BMN_TRACE_MARK;
     int rc;
-    BmnvfsFile* pBmnFile = BMN_FILE(pFile);
-    if(pBmnFile->pFileWrapper)
+    int i;
+    BmnWriteBuffer* pWrites;
+
+    pWrites = pBmnFile->pWrites;
+    if(!pWrites || 0 == pWrites->nRun)
     {
-        rc = SQLITE_OK;
+        return SQLITE_OK;
     }
-    else
+    rc = callWritevMethod(pBmnFile->pInfo->pWrapper, pBmnFile);
+    if(rc < BMN_SQLITE_OFFSET)
     {
-        BMN_ASSERT(pBmnFile->pReal);
-        rc = pBmnFile->pReal->pMethods->xLock(pBmnFile->pReal, flags);
+        rc = BMN_CALLBACK_ERROR;
+    }
+    for(i = 0; i < pWrites->nRun; ++i)
+    {
+        extendSize(
+                pBmnFile,
+                rc,
+                pWrites->aRun[i].iOfst + pWrites->aRun[i].iAmt);
+    }
+    // pages could be read from the wrapper after write was collected
+    for(i = 0; pBmnFile->pCacheFile && i < pWrites->nRun; ++i)
+    {
+        bmnCacheInvalidate(
+                &pBmnFile->pInfo->cache,
+                pBmnFile->pCacheFile,
+                pWrites->aRun[i].iOfst,
+                pWrites->aRun[i].iAmt);
     }
+    pWrites->nRun  = 0;
+    pWrites->nData = 0;
     BMN_TRACE_ERROR(rc);
     return rc;
 }
-static int bmnvfsUnlock(sqlite3_file* pFile, int flags)
+
+/*
+ 1 if any run of the buffer overlaps the range
+*/
+static int hasRuns(
+        BmnWriteBuffer* pWrites,
+        sqlite3_int64 iOfst,
+        sqlite3_int64 iAmt)
 {
-    BMN_TRACE_MARK;
-    int rc;
-    BmnvfsFile* pBmnFile = BMN_FILE(pFile);
-    if(pBmnFile->pFileWrapper)
+    int i;
+    BmnWriteRun* pRun;
+
+    for(i = 0; pWrites && i < pWrites->nRun; ++i)
     {
-        rc = SQLITE_OK;
+        pRun = &pWrites->aRun[i];
+        if(iOfst < pRun->iOfst + pRun->iAmt && pRun->iOfst < iOfst + iAmt)
+        {
+            return 1;
+        }
     }
-    else
+    return 0;
+}
+
+/*
+ 1 if any collected write overlaps the range
+*/
+static int hasWrites(
+        BmnvfsFile* pBmnFile,
+        sqlite3_int64 iOfst,
+        sqlite3_int64 iAmt)
+{
+    return hasRuns(pBmnFile->pWrites, iOfst, iAmt);
+}
+
+/*
+ 1 if a run of the buffer contains the range, it's overwritten then
+*/
+static int overwriteRun(
+        BmnWriteBuffer* pWrites,
+        const void* zBuf,
+        int iAmt,
+        sqlite3_int64 iOfst)
+{
+    int i;
+    BmnWriteRun* pRun;
+
+    for(i = 0; i < pWrites->nRun; ++i)
     {
-        BMN_ASSERT(pBmnFile->pReal);
-        rc = pBmnFile->pReal->pMethods->xUnlock(pBmnFile->pReal, flags);
+        pRun = &pWrites->aRun[i];
+        if(iOfst >= pRun->iOfst && iOfst + iAmt <= pRun->iOfst + pRun->iAmt)
+        {
+            memcpy(pWrites->zData + pRun->iPos + (iOfst - pRun->iOfst),
+                   zBuf,
+                   iAmt);
+            return 1;
+        }
     }
-    BMN_TRACE_ERROR(rc);
-    return rc;
+    return 0;
 }
-static int bmnvfsCheckReservedLock(sqlite3_file* pFile, int* pResOut)
+
+/*
+ appends the write to the buffer of at most nLimit bytes
+ adjacent writes are joined to the last run
+*/
+static int appendRun(
+        BmnWriteBuffer* pWrites,
+        const void* zBuf,
+        int iAmt,
+        sqlite3_int64 iOfst,
+        int nLimit)
 {
-    BMN_TRACE_MARK;
-    int rc;
-    BmnvfsFile* pBmnFile = BMN_FILE(pFile);
-    if(pBmnFile->pFileWrapper)
+    int nAlloc;
+    void* pNew;
+    BmnWriteRun* pRun;
+
+    BMN_ASSERT(pWrites->nData + iAmt <= nLimit);
+    if(pWrites->nData + iAmt > pWrites->nDataAlloc)
     {
-        // rc = SQLITE_LOCKED;
-        rc = SQLITE_OK;
+        nAlloc = pWrites->nDataAlloc ? pWrites->nDataAlloc * 2 : 65536;
+        while(nAlloc < pWrites->nData + iAmt)
+        {
+            nAlloc *= 2;
+        }
+        if(nAlloc > nLimit)
+        {
+            nAlloc = nLimit;
+        }
+        pNew = BMN_MEM_REALLOC(pWrites->zData, nAlloc);
+        if(!pNew)
+        {
+            return SQLITE_IOERR_NOMEM;
+        }
+        pWrites->zData      = pNew;
+        pWrites->nDataAlloc = nAlloc;
     }
-    else
+    pRun = pWrites->nRun ? &pWrites->aRun[pWrites->nRun - 1] : NULL;
+    if(pRun && pRun->iOfst + pRun->iAmt == iOfst)
     {
-        BMN_ASSERT(pBmnFile->pReal);
-        rc = pBmnFile->pReal->pMethods->xCheckReservedLock(
-                pBmnFile->pReal,
-                pResOut);
+        pRun->iAmt += iAmt;
     }
-    BMN_TRACE_ERROR(rc);
-    return rc;
+    else
+    {
+        if(pWrites->nRun == pWrites->nRunAlloc)
+        {
+            nAlloc = pWrites->nRunAlloc ? pWrites->nRunAlloc * 2 : 16;
+            pNew   = BMN_MEM_REALLOC(pWrites->aRun, nAlloc * sizeof(*pRun));
+            if(!pNew)
+            {
+                return SQLITE_IOERR_NOMEM;
+            }
+            pWrites->aRun      = pNew;
+            pWrites->nRunAlloc = nAlloc;
+        }
+        pRun        = &pWrites->aRun[pWrites->nRun++];
+        pRun->iOfst = iOfst;
+        pRun->iAmt  = iAmt;
+        pRun->iPos  = pWrites->nData;
+    }
+    memcpy(pWrites->zData + pWrites->nData, zBuf, iAmt);
+    pWrites->nData += iAmt;
+    return SQLITE_OK;
 }
-static int bmnvfsFileControl(sqlite3_file* pFile, int iOperation, void* pArg)
+
+/*
+ adjacent writes are joined so 'writev' gets few large pieces
+*/
+static int bufferWrite(
+        BmnvfsFile* pBmnFile,
+        const void* zBuf,
+        int iAmt,
+        sqlite3_int64 iOfst)
 {
-    BMN_TRACE_MARK;
     int rc;
-    BmnvfsFile* pBmnFile = BMN_FILE(pFile);
-    if(pBmnFile->pFileWrapper)
+    BmnWriteBuffer* pWrites;
+
+    pWrites = pBmnFile->pWrites;
+    if(overwriteRun(pWrites, zBuf, iAmt, iOfst))
     {
-        rc = SQLITE_NOTFOUND;
-        BMN_VERBOSE_INT(iOperation);
-        if(0 == (pBmnFile->pInfo->iFlags & BMN_NO_CALLBACK_FILE_CONTROL))
+        return SQLITE_OK;
+    }
+    // partial overlap would change the order of writes
+    if(pWrites->nData + iAmt > BMN_WRITE_BUFFER_SIZE ||
+       hasWrites(pBmnFile, iOfst, iAmt))
+    {
+        rc = flushWrites(pBmnFile);
+        if(rc)
         {
-            rc = callFileControlMethod(
-                    pBmnFile->pInfo->pWrapper,
-                    pBmnFile,
-                    iOperation,
-                    pArg);
+            return rc;
         }
-        // be carefull
-        if(BMN_CB_RESULT_NO_HANDLER == rc)
+    }
+    if(iAmt > BMN_WRITE_BUFFER_SIZE)
+    {
+        rc = callWriteMethod(
+                pBmnFile->pInfo->pWrapper,
+                pBmnFile,
+                zBuf,
+                iAmt,
+                iOfst);
+        extendSize(pBmnFile, rc, iOfst + iAmt);
+        return rc;
+    }
+    return appendRun(pWrites, zBuf, iAmt, iOfst, BMN_WRITE_BUFFER_SIZE);
+}
+
+static void freeWrites(BmnvfsFile* pBmnFile)
+{
+    if(pBmnFile->pWrites)
+    {
+        BMN_MEM_FREE(pBmnFile->pWrites->zData);
+        BMN_MEM_FREE(pBmnFile->pWrites->aRun);
+        BMN_MEM_FREE(pBmnFile->pWrites);
+        pBmnFile->pWrites = NULL;
+    }
+}
+
+/*
+ batch atomic write: sqlite sends SQLITE_FCNTL_BEGIN_ATOMIC_WRITE, writes
+ all pages of the transaction and sends SQLITE_FCNTL_COMMIT_ATOMIC_WRITE
+ instead of journaling them. Pages are collected and passed to wrapper's
+ 'commit_atomic' at once. Any error but NOMEM makes sqlite rollback the
+ batch and commit the same pages again with the rollback journal
+*/
+static int beginBatch(BmnvfsFile* pBmnFile)
+{
+    int rc;
+
+    dropReadAhead(pBmnFile);
+    rc = flushWrites(pBmnFile);
+    if(rc)
+    {
+        return rc;
+    }
+    if(!pBmnFile->pBatch)
+    {
+        pBmnFile->pBatch = BMN_MEM_MALLOC(sizeof(BmnWriteBuffer));
+        if(!pBmnFile->pBatch)
         {
-            pBmnFile->pInfo->iFlags |= BMN_NO_CALLBACK_FILE_CONTROL;
-            rc = SQLITE_NOTFOUND;
+            return SQLITE_IOERR_NOMEM;
         }
-        else if(rc < 0)
+        memset(pBmnFile->pBatch, 0, sizeof(BmnWriteBuffer));
+    }
+    pBmnFile->pBatch->nRun  = 0;
+    pBmnFile->pBatch->nData = 0;
+    pBmnFile->iBatch        = 1;
+    return SQLITE_OK;
+}
+
+/*
+ too big transaction is an I/O error, so it's journaled
+*/
+static int batchWrite(
+        BmnvfsFile* pBmnFile,
+        const void* zBuf,
+        int iAmt,
+        sqlite3_int64 iOfst)
+{
+    BmnWriteBuffer* pBatch;
+
+    pBatch = pBmnFile->pBatch;
+    if(overwriteRun(pBatch, zBuf, iAmt, iOfst))
+    {
+        return SQLITE_OK;
+    }
+    if((sqlite3_int64)pBatch->nData + iAmt > BMN_ATOMIC_BATCH_SIZE)
+    {
+        BMN_ERROR("batch atomic write exceeds %d bytes", BMN_ATOMIC_BATCH_SIZE);
+        return SQLITE_IOERR_WRITE;
+    }
+    return appendRun(pBatch, zBuf, iAmt, iOfst, BMN_ATOMIC_BATCH_SIZE);
+}
+
+static int commitBatch(BmnvfsFile* pBmnFile)
+{
+    int rc;
+    int i;
+    BmnWriteBuffer* pBatch;
+
+    pBatch = pBmnFile->pBatch;
+    rc     = SQLITE_OK;
+    if(pBatch->nRun)
+    {
+        rc = callCommitAtomicMethod(pBmnFile->pInfo->pWrapper, pBmnFile);
+        if(rc)
         {
-            rc = BMN_CALLBACK_ERROR;
+            rc = SQLITE_IOERR_COMMIT_ATOMIC;
         }
     }
-    else
+    for(i = 0; SQLITE_OK == rc && i < pBatch->nRun; ++i)
     {
-        BMN_ASSERT(pBmnFile->pReal);
-        rc = pBmnFile->pReal->pMethods->xFileControl(
-                pBmnFile->pReal,
-                iOperation,
-                pArg);
+        extendSize(
+                pBmnFile,
+                rc,
+                pBatch->aRun[i].iOfst + pBatch->aRun[i].iAmt);
     }
+    for(i = 0; SQLITE_OK == rc && pBmnFile->pCacheFile && i < pBatch->nRun;
+        ++i)
+    {
+        bmnCacheInvalidate(
+                &pBmnFile->pInfo->cache,
+                pBmnFile->pCacheFile,
+                pBatch->aRun[i].iOfst,
+                pBatch->aRun[i].iAmt);
+    }
+    pBatch->nRun     = 0;
+    pBatch->nData    = 0;
+    pBmnFile->iBatch = 0;
     BMN_TRACE_ERROR(rc);
     return rc;
 }
-static int bmnvfsSectorSize(sqlite3_file* pFile)
+
+static void rollbackBatch(BmnvfsFile* pBmnFile)
+{
+    if(pBmnFile->pBatch)
+    {
+        pBmnFile->pBatch->nRun  = 0;
+        pBmnFile->pBatch->nData = 0;
+    }
+    pBmnFile->iBatch = 0;
+}
+
+static void freeBatch(BmnvfsFile* pBmnFile)
+{
+    if(pBmnFile->pBatch)
+    {
+        BMN_MEM_FREE(pBmnFile->pBatch->zData);
+        BMN_MEM_FREE(pBmnFile->pBatch->aRun);
+        BMN_MEM_FREE(pBmnFile->pBatch);
+        pBmnFile->pBatch = NULL;
+    }
+    pBmnFile->iBatch = 0;
+}
+
+/*
+ page of the batch is read from the wrapper and overwritten by the batch
+ the page cache has only committed pages, so it's bypassed
+*/
+static int batchRead(
+        sqlite3_file* pFile,
+        void* zBuf,
+        int iAmt,
+        sqlite3_int64 iOfst)
 {
-    BMN_TRACE_MARK;
     int rc;
+    int i;
+    sqlite3_int64 iSize;
+    sqlite3_int64 iStart;
+    sqlite3_int64 iEnd;
+    BmnWriteRun* pRun;
     BmnvfsFile* pBmnFile = BMN_FILE(pFile);
-    if(pBmnFile->pFileWrapper)
+
+    rc = callReadMethod(pBmnFile->pInfo, pBmnFile, zBuf, iAmt, iOfst);
+    if(rc < BMN_SQLITE_OFFSET)
     {
-        rc = BMN_CB_RESULT_NO_HANDLER;
-        if(0 == (pBmnFile->pInfo->iFlags & BMN_NO_CALLBACK_SECTOR_SIZE))
-        {
-            rc = callSectorSizeMethod(pBmnFile->pInfo->pWrapper, pBmnFile);
-        }
-        if(rc < 0)
+        return BMN_CALLBACK_ERROR;
+    }
+    if(SQLITE_OK != rc && SQLITE_IOERR_SHORT_READ != rc)
+    {
+        return rc;
+    }
+    for(i = 0; i < pBmnFile->pBatch->nRun; ++i)
+    {
+        pRun   = &pBmnFile->pBatch->aRun[i];
+        iStart = pRun->iOfst > iOfst ? pRun->iOfst : iOfst;
+        iEnd   = pRun->iOfst + pRun->iAmt < iOfst + iAmt
+                  ? pRun->iOfst + pRun->iAmt
+                  : iOfst + iAmt;
+        if(iStart < iEnd)
         {
-            pBmnFile->pInfo->iFlags |= BMN_NO_CALLBACK_SECTOR_SIZE;
-            rc = SQLITE_DEFAULT_SECTOR_SIZE;
+            memcpy((char*)zBuf + (iStart - iOfst),
+                   pBmnFile->pBatch->zData + pRun->iPos +
+                           (iStart - pRun->iOfst),
+                   (size_t)(iEnd - iStart));
         }
     }
-    else
+    // the batch could extend the file
+    if(SQLITE_IOERR_SHORT_READ == rc &&
+       SQLITE_OK == bmnvfsFileSize(pFile, &iSize) && iSize >= iOfst + iAmt)
     {
-        BMN_ASSERT(pBmnFile->pReal);
-        rc = pBmnFile->pReal->pMethods->xSectorSize(pBmnFile->pReal);
+        rc = SQLITE_OK;
     }
-    BMN_VERBOSE_INT(rc);
+    if(pBmnFile->pInfo->pCodec)
+    {
+        rc = codecDecode(pFile, zBuf, iAmt, iOfst, rc);
+    }
+    BMN_TRACE_ERROR(rc);
     return rc;
 }
 
-static int bmnvfsDeviceCharacteristics(sqlite3_file* pFile)
+/*
+ sequential page reads of the main DB are followed by one 'readv'
+ for the next pages, so a scan makes few wrapper calls. 'readv' is called
+ by the reading thread, there is no background prefetch
+ returns BMN_CB_RESULT_NO_HANDLER if the page must be read as usual
+*/
+static int readAhead(
+        BmnvfsFile* pBmnFile,
+        void* zBuf,
+        int iAmt,
+        sqlite3_int64 iOfst)
 {
-    BMN_TRACE_MARK;
     int rc;
-    BmnvfsFile* pBmnFile = BMN_FILE(pFile);
-    if(pBmnFile->pFileWrapper)
+    int nPages;
+    void* pNew;
+    BmnReadAhead* pAhead;
+
+    pAhead = pBmnFile->pReadAhead;
+    if(iAmt == pAhead->iAmt && iOfst == pAhead->iNextOfst)
+    {
+        ++pAhead->nSequential;
+    }
+    else
+    {
+        pAhead->nSequential = 0;
+    }
+    pAhead->iAmt      = iAmt;
+    pAhead->iNextOfst = iOfst + iAmt;
+    if(iOfst >= pAhead->iOfst && iOfst + iAmt <= pAhead->iOfst + pAhead->nData)
+    {
+        memcpy(zBuf, pAhead->zData + (iOfst - pAhead->iOfst), iAmt);
+        return SQLITE_OK;
+    }
+    // small reads are headers and journal records, not pages
+    if(pAhead->nSequential < 2 || iAmt < 512)
+    {
+        return BMN_CB_RESULT_NO_HANDLER;
+    }
+    nPages = pBmnFile->pInfo->iReadAhead;
+    if(pAhead->nDataAlloc < nPages * iAmt)
     {
-        rc = SQLITE_DEFAULT_DEVICE_CHARACTERISTICS;
-        if(0 ==
-           (pBmnFile->pInfo->iFlags & BMN_NO_CALLBACK_DEVICE_CHARACTERISTICS))
+        pNew = BMN_MEM_REALLOC(pAhead->zData, nPages * iAmt);
+        if(!pNew)
         {
-            rc = callDeviceCharacteristicsMethod(
-                    pBmnFile->pInfo->pWrapper,
-                    pBmnFile);
+            return BMN_CB_RESULT_NO_HANDLER;
         }
-        if(rc < 0)
+        pAhead->zData      = pNew;
+        pAhead->nDataAlloc = nPages * iAmt;
+    }
+    if(hasWrites(pBmnFile, iOfst, (sqlite3_int64)nPages * iAmt))
+    {
+        rc = flushWrites(pBmnFile);
+        if(rc)
+        {
+            return rc;
+        }
+    }
+    pAhead->nData = 0;
+    rc            = callReadvMethod(
+            pBmnFile->pInfo,
+            pBmnFile,
+            pAhead->zData,
+            iAmt,
+            iOfst,
+            nPages);
+    if(rc <= 0)
+    {
+        return rc ? rc : BMN_CB_RESULT_NO_HANDLER;
+    }
+    pAhead->iOfst = iOfst;
+    pAhead->nData = rc * iAmt;
+    memcpy(zBuf, pAhead->zData, iAmt);
+    return SQLITE_OK;
+}
+
+static void dropReadAhead(BmnvfsFile* pBmnFile)
+{
+    if(pBmnFile->pReadAhead)
+    {
+        pBmnFile->pReadAhead->nData       = 0;
+        pBmnFile->pReadAhead->nSequential = 0;
+    }
+}
+
+static void freeReadAhead(BmnvfsFile* pBmnFile)
+{
+    if(pBmnFile->pReadAhead)
+    {
+        BMN_MEM_FREE(pBmnFile->pReadAhead->zData);
+        BMN_MEM_FREE(pBmnFile->pReadAhead);
+        pBmnFile->pReadAhead = NULL;
+    }
+}
+
+static int bmnvfsReadImpl(
+        sqlite3_file* pFile,
+        void* zBuf,
+        int iAmt,
+        sqlite_int64 iOfst)
+{
+    BMN_TRACE_MARK;
+    int rc;
+    BmnCacheTicket ticket;
+    BmnvfsFile* pBmnFile = BMN_FILE(pFile);
+    if(pBmnFile->iPlain)
+    {
+        rc = pBmnFile->pReal->pMethods
+                     ->xRead(pBmnFile->pReal, zBuf, iAmt, iOfst);
+        BMN_TRACE_ERROR(rc);
+        return rc;
+    }
+    if(pBmnFile->iBatch && hasRuns(pBmnFile->pBatch, iOfst, iAmt))
+    {
+        rc = batchRead(pFile, zBuf, iAmt, iOfst);
+        BMN_TRACE_ERROR(rc);
+        return rc;
+    }
+    if(hasWrites(pBmnFile, iOfst, iAmt))
+    {
+        rc = flushWrites(pBmnFile);
+        if(rc)
+        {
+            return rc;
+        }
+    }
+    if(pBmnFile->pCacheFile &&
+       bmnCacheRead(
+               &pBmnFile->pInfo->cache,
+               pBmnFile->pCacheFile,
+               zBuf,
+               iAmt,
+               iOfst,
+               &ticket))
+    {
+        if(pBmnFile->pFileWrapper)
+        {
+            checkFileVersion(pBmnFile, zBuf, iAmt, iOfst);
+        }
+        return SQLITE_OK;
+    }
+    if(pBmnFile->pFileWrapper)
+    {
+        rc = BMN_CB_RESULT_NO_HANDLER;
+        if(pBmnFile->pReadAhead)
+        {
+            rc = readAhead(pBmnFile, zBuf, iAmt, iOfst);
+        }
+        if(BMN_CB_RESULT_NO_HANDLER == rc)
+        {
+            rc = callReadMethod(pBmnFile->pInfo, pBmnFile, zBuf, iAmt, iOfst);
+        }
+    }
+    else if(pBmnFile->pInfo->pCodec)
+    {
+        rc = pBmnFile->pReal->pMethods
+                     ->xRead(pBmnFile->pReal, zBuf, iAmt, iOfst);
+    }
+    else
+    {
+        // BMN_VERBOSE("decode len:%d offset:%d", iAmt, iOfst);
+        BMN_ASSERT(pBmnFile->pReal);
+        rc = callDecodeMethod(pBmnFile, zBuf, iAmt, iOfst);
+#if BMN_DEBUG_FILENAME_CONTROL
+        if(rc && SQLITE_IOERR_SHORT_READ != rc)
+        {
+            BMN_ERROR(
+                    "File: %s , flag: %d",
+                    pBmnFile->zFName,
+                    pBmnFile->iFlags);
+        }
+#endif
+    }
+    if(rc < BMN_SQLITE_OFFSET)
+    {
+        rc = BMN_CALLBACK_ERROR;
+    }
+    else if(pBmnFile->pInfo->pCodec)
+    {
+        rc = codecDecode(pFile, zBuf, iAmt, iOfst, rc);
+    }
+    if(SQLITE_OK == rc && pBmnFile->pFileWrapper)
+    {
+        checkFileVersion(pBmnFile, zBuf, iAmt, iOfst);
+    }
+    if(pBmnFile->pCacheFile)
+    {
+        bmnCacheInsert(
+                &pBmnFile->pInfo->cache,
+                pBmnFile->pCacheFile,
+                SQLITE_OK == rc ? zBuf : NULL,
+                iAmt,
+                iOfst,
+                &ticket);
+    }
+    BMN_TRACE_ERROR(rc);
+    return rc;
+}
+
+static int bmnvfsWriteImpl(
+        sqlite3_file* pFile,
+        const void* zBuf,
+        int iAmt,
+        sqlite3_int64 iOfst)
+{
+    BMN_TRACE_MARK;
+    int rc;
+    BmnvfsFile* pBmnFile = BMN_FILE(pFile);
+    if(pBmnFile->iPlain)
+    {
+        rc = pBmnFile->pReal->pMethods
+                     ->xWrite(pBmnFile->pReal, zBuf, iAmt, iOfst);
+        BMN_TRACE_ERROR(rc);
+        return rc;
+    }
+    if(pBmnFile->pFileWrapper)
+    {
+        noteFileVersion(pBmnFile, zBuf, iAmt, iOfst);
+    }
+    if(pBmnFile->pInfo->pCodec)
+    {
+        rc = codecEncode(pBmnFile, zBuf, iAmt, iOfst);
+        if(rc)
+        {
+            BMN_TRACE_ERROR(rc);
+            return rc;
+        }
+        zBuf = pBmnFile->pBuffer;
+    }
+    dropReadAhead(pBmnFile);
+    if(pBmnFile->iBatch)
+    {
+        // the cache keeps committed pages until the batch is committed
+        rc = batchWrite(pBmnFile, zBuf, iAmt, iOfst);
+        BMN_TRACE_ERROR(rc);
+        return rc;
+    }
+    if(pBmnFile->pWrites)
+    {
+        rc = bufferWrite(pBmnFile, zBuf, iAmt, iOfst);
+    }
+    else if(pBmnFile->pFileWrapper)
+    {
+        rc = callWriteMethod(
+                pBmnFile->pInfo->pWrapper,
+                pBmnFile,
+                zBuf,
+                iAmt,
+                iOfst);
+        extendSize(pBmnFile, rc, iOfst + iAmt);
+    }
+    else if(pBmnFile->pInfo->pCodec)
+    {
+        rc = pBmnFile->pReal->pMethods
+                     ->xWrite(pBmnFile->pReal, zBuf, iAmt, iOfst);
+    }
+    else
+    {
+        BMN_VERBOSE("encode len:%d offset:%d", iAmt, iOfst);
+        BMN_ASSERT(pBmnFile->pReal);
+        rc = callEncodeMethod(pBmnFile, zBuf, iAmt, iOfst);
+        BMN_TRACE_ERROR(rc);
+#if BMN_DEBUG_FILENAME_CONTROL
+        if(rc)
+        {
+            BMN_ERROR(
+                    "File: %s , flag: %d",
+                    pBmnFile->zFName,
+                    pBmnFile->iFlags);
+        }
+#endif
+    }
+    if(rc < BMN_SQLITE_OFFSET)
+    {
+        rc = BMN_CALLBACK_ERROR;
+    }
+    // even failed write can change the data
+    if(pBmnFile->pCacheFile)
+    {
+        bmnCacheInvalidate(
+                &pBmnFile->pInfo->cache,
+                pBmnFile->pCacheFile,
+                iOfst,
+                iAmt);
+    }
+    BMN_TRACE_ERROR(rc);
+    return rc;
+}
+static int bmnvfsTruncateImpl(sqlite3_file* pFile, sqlite3_int64 size)
+{
+    BMN_TRACE_MARK;
+    int rc;
+    BmnvfsFile* pBmnFile = BMN_FILE(pFile);
+    if(pBmnFile->pFileWrapper)
+    {
+        dropReadAhead(pBmnFile);
+        rc = flushWrites(pBmnFile);
+        if(rc)
+        {
+            BMN_TRACE_ERROR(rc);
+            return rc;
+        }
+        rc = callFileTruncateMethod(pBmnFile->pInfo->pWrapper, pBmnFile, size);
+        if(BMN_CB_RESULT_NO_HANDLER == rc)
+        {
+            rc = BMN_CALLBACK_ERROR;
+        }
+        else if(BMN_CB_RESULT_HANDLER_LOGIC_ERROR == rc)
+        {
+            rc = BMN_CALLBACK_ERROR;
+        }
+        // sqlite extends files by writes, truncate only shrinks them
+        if(SQLITE_OK == rc && pBmnFile->iSize > size)
+        {
+            pBmnFile->iSize = size;
+        }
+        else if(SQLITE_OK != rc)
+        {
+            forgetSize(pBmnFile);
+        }
+    }
+    else
+    {
+        BMN_ASSERT(pBmnFile->pReal);
+        rc = pBmnFile->pReal->pMethods->xTruncate(pBmnFile->pReal, size);
+    }
+    if(pBmnFile->pCacheFile)
+    {
+        bmnCacheInvalidate(
+                &pBmnFile->pInfo->cache,
+                pBmnFile->pCacheFile,
+                size,
+                -1);
+    }
+    BMN_TRACE_ERROR(rc);
+    return rc;
+}
+/*
+    performs sync of BmnvfsFile, called by durability policy
+*/
+static int performSync(void* pArg, int flags)
+{
+    BMN_TRACE_MARK;
+    int rc;
+    BmnvfsFile* pBmnFile = BMN_FILE(pArg);
+    rc                   = BMN_CB_RESULT_NO_HANDLER;
+    if(pBmnFile->pFileWrapper)
+    {
+        if(0 == (pBmnFile->pInfo->iFlags & BMN_NO_CALLBACK_SYNC))
+        {
+            rc = callSyncMethod(pBmnFile->pInfo->pWrapper, pBmnFile, flags);
+        }
+        if(BMN_CB_RESULT_NO_HANDLER == rc)
+        {
+            pBmnFile->pInfo->iFlags |= BMN_NO_CALLBACK_SYNC;
+            rc = SQLITE_OK;
+        }
+        else if(BMN_CB_RESULT_HANDLER_LOGIC_ERROR == rc)
+        {
+            pBmnFile->pInfo->iFlags |= BMN_NO_CALLBACK_SYNC;
+            rc = BMN_CALLBACK_ERROR;
+        }
+    }
+    else
+    {
+        BMN_ASSERT(pBmnFile->pReal);
+        rc = pBmnFile->pReal->pMethods->xSync(pBmnFile->pReal, flags);
+    }
+    BMN_TRACE_ERROR(rc);
+    return rc;
+}
+/*
+    can be missed
+*/
+static int bmnvfsSyncImpl(sqlite3_file* pFile, int flags)
+{
+    BMN_TRACE_MARK;
+    int rc;
+    BmnvfsFile* pBmnFile = BMN_FILE(pFile);
+    if(pBmnFile->pFileWrapper)
+    {
+        // collected writes must be synced even if the sync is deferred
+        rc = flushWrites(pBmnFile);
+        if(rc)
+        {
+            BMN_TRACE_ERROR(rc);
+            return rc;
+        }
+    }
+    // the connection waits for 'group' sync at wal-index unlock
+    rc = bmnDurabilitySync(
+            &pBmnFile->pInfo->durability,
+            pBmnFile->pSyncFile,
+            flags,
+            performSync,
+            pBmnFile,
+            pBmnFile->pMainDb && pBmnFile->pMainDb->base.pMethods->iVersion >= 2
+                    ? &pBmnFile->iSyncTicket
+                    : NULL);
+    BMN_TRACE_ERROR(rc);
+    return rc;
+}
+/*
+    must have method
+*/
+static int bmnvfsFileSizeImpl(sqlite3_file* pFile, sqlite3_int64* pSize)
+{
+    BMN_TRACE_MARK;
+    int rc;
+    int i;
+    BmnWriteRun* pRun;
+    BmnvfsFile* pBmnFile = BMN_FILE(pFile);
+    if(pBmnFile->pFileWrapper)
+    {
+        checkGeneration(pBmnFile);
+        // the version isn't read yet in this transaction
+        if(pBmnFile->iCheckSize)
+        {
+            forgetSize(pBmnFile);
+            pBmnFile->iCheckSize = 0;
+        }
+        rc = SQLITE_OK;
+        if(pBmnFile->iSize >= 0)
+        {
+            *pSize = pBmnFile->iSize;
+        }
+        else
+        {
+            rc = callFileSizeMethod(pBmnFile->pInfo->pWrapper, pBmnFile, pSize);
+            if(rc < 0)
+            {
+                rc     = BMN_CALLBACK_ERROR;
+                *pSize = 0;
+            }
+            else if(SQLITE_OK == rc && 0 == (pBmnFile->iFlags & SQLITE_OPEN_WAL))
+            {
+                pBmnFile->iSize = *pSize;
+            }
+        }
+        // collected writes only extend the file
+        for(i = 0;
+            SQLITE_OK == rc && pBmnFile->pWrites && i < pBmnFile->pWrites->nRun;
+            ++i)
+        {
+            pRun = &pBmnFile->pWrites->aRun[i];
+            if(pRun->iOfst + pRun->iAmt > *pSize)
+            {
+                *pSize = pRun->iOfst + pRun->iAmt;
+            }
+        }
+        for(i = 0; SQLITE_OK == rc && pBmnFile->iBatch &&
+            i < pBmnFile->pBatch->nRun;
+            ++i)
+        {
+            pRun = &pBmnFile->pBatch->aRun[i];
+            if(pRun->iOfst + pRun->iAmt > *pSize)
+            {
+                *pSize = pRun->iOfst + pRun->iAmt;
+            }
+        }
+    }
+    else
+    {
+        BMN_ASSERT(pBmnFile->pReal);
+        rc = pBmnFile->pReal->pMethods->xFileSize(pBmnFile->pReal, pSize);
+    }
+    BMN_TRACE_ERROR(rc);
+    return rc;
+}
+/*
+ locks of full impl. are taken by wrapper's 'lock'/'unlock' if it has them,
+ otherwise by the side file. Missed method is an error here: dropping
+ locks silently could corrupt the database
+*/
+static int bmnvfsLockImpl(sqlite3_file* pFile, int flags)
+{
+    BMN_TRACE_MARK;
+    int rc;
+    BmnvfsFile* pBmnFile = BMN_FILE(pFile);
+    if(pBmnFile->pFileWrapper)
+    {
+        // the file could be changed by others before this transaction
+        if(SQLITE_LOCK_SHARED == flags)
+        {
+            dropReadAhead(pBmnFile);
+            pBmnFile->iCheckSize = 1;
+        }
+        rc = SQLITE_OK;
+        if(0 == (pBmnFile->pInfo->iFlags & BMN_NO_CALLBACK_LOCK))
+        {
+            rc = callLockMethod(pBmnFile->pInfo->pWrapper, pBmnFile, flags);
+            if(rc < BMN_SQLITE_OFFSET)
+            {
+                rc = BMN_CALLBACK_ERROR;
+            }
+        }
+        else if(pBmnFile->pSide)
+        {
+            rc = pBmnFile->pSide->pMethods->xLock(pBmnFile->pSide, flags);
+        }
+    }
+    else
+    {
+        BMN_ASSERT(pBmnFile->pReal);
+        rc = pBmnFile->pReal->pMethods->xLock(pBmnFile->pReal, flags);
+    }
+    BMN_TRACE_ERROR(rc);
+    return rc;
+}
+static int bmnvfsUnlockImpl(sqlite3_file* pFile, int flags)
+{
+    BMN_TRACE_MARK;
+    int rc;
+    int rcUnlock;
+    BmnvfsFile* pBmnFile = BMN_FILE(pFile);
+    if(pBmnFile->pFileWrapper)
+    {
+        // other connections may read the file after it
+        dropReadAhead(pBmnFile);
+        rc       = flushWrites(pBmnFile);
+        rcUnlock = SQLITE_OK;
+        if(0 == (pBmnFile->pInfo->iFlags & BMN_NO_CALLBACK_LOCK))
+        {
+            if(0 == (pBmnFile->pInfo->iFlags & BMN_NO_CALLBACK_UNLOCK))
+            {
+                rcUnlock = callUnlockMethod(
+                        pBmnFile->pInfo->pWrapper,
+                        pBmnFile,
+                        flags);
+                if(rcUnlock < BMN_SQLITE_OFFSET)
+                {
+                    rcUnlock = BMN_CALLBACK_ERROR;
+                }
+            }
+        }
+        else if(pBmnFile->pSide)
+        {
+            rcUnlock = pBmnFile->pSide->pMethods->xUnlock(
+                    pBmnFile->pSide,
+                    flags);
+        }
+        rc = rc ? rc : rcUnlock;
+    }
+    else
+    {
+        BMN_ASSERT(pBmnFile->pReal);
+        rc = pBmnFile->pReal->pMethods->xUnlock(pBmnFile->pReal, flags);
+    }
+    BMN_TRACE_ERROR(rc);
+    return rc;
+}
+static int bmnvfsCheckReservedLockImpl(sqlite3_file* pFile, int* pResOut)
+{
+    BMN_TRACE_MARK;
+    int rc;
+    BmnvfsFile* pBmnFile = BMN_FILE(pFile);
+    if(pBmnFile->pFileWrapper)
+    {
+        rc       = SQLITE_OK;
+        *pResOut = 0;
+        if(0 == (pBmnFile->pInfo->iFlags & BMN_NO_CALLBACK_LOCK))
+        {
+            if(0 ==
+               (pBmnFile->pInfo->iFlags & BMN_NO_CALLBACK_CHECK_RESERVED_LOCK))
+            {
+                rc = callCheckReservedLockMethod(
+                        pBmnFile->pInfo->pWrapper,
+                        pBmnFile,
+                        pResOut);
+                if(rc < BMN_SQLITE_OFFSET)
+                {
+                    rc = BMN_CALLBACK_ERROR;
+                }
+            }
+        }
+        else if(pBmnFile->pSide)
+        {
+            rc = pBmnFile->pSide->pMethods->xCheckReservedLock(
+                    pBmnFile->pSide,
+                    pResOut);
+        }
+    }
+    else
+    {
+        BMN_ASSERT(pBmnFile->pReal);
+        rc = pBmnFile->pReal->pMethods->xCheckReservedLock(
+                pBmnFile->pReal,
+                pResOut);
+    }
+    BMN_TRACE_ERROR(rc);
+    return rc;
+}
+static int bmnvfsFileControlImpl(
+        sqlite3_file* pFile,
+        int iOperation,
+        void* pArg)
+{
+    BMN_TRACE_MARK;
+    int rc;
+    BmnvfsFile* pBmnFile = BMN_FILE(pFile);
+#if BMN_HAS_DEFERRED_SYNC
+    // pages are copied from the WAL to main DB next, WAL must be synced
+    if(SQLITE_FCNTL_CKPT_START == iOperation && pBmnFile->pWal)
+    {
+        bmnDurabilityFlush(
+                &pBmnFile->pInfo->durability,
+                pBmnFile->pWal->pSyncFile,
+                performSync,
+                pBmnFile->pWal);
+    }
+#endif
+    if(pBmnFile->pFileWrapper)
+    {
+        rc = SQLITE_NOTFOUND;
+        BMN_VERBOSE_INT(iOperation);
+        if(0 == (pBmnFile->pInfo->iFlags & BMN_NO_CALLBACK_COMMIT_ATOMIC) &&
+           (pBmnFile->iFlags & SQLITE_OPEN_MAIN_DB))
+        {
+            switch(iOperation)
+            {
+                case SQLITE_FCNTL_BEGIN_ATOMIC_WRITE:
+                    rc = beginBatch(pBmnFile);
+                    BMN_TRACE_ERROR(rc);
+                    return rc;
+                case SQLITE_FCNTL_COMMIT_ATOMIC_WRITE:
+                    rc = commitBatch(pBmnFile);
+                    BMN_TRACE_ERROR(rc);
+                    return rc;
+                case SQLITE_FCNTL_ROLLBACK_ATOMIC_WRITE:
+                    rollbackBatch(pBmnFile);
+                    return SQLITE_OK;
+            }
+        }
+        // it's sent instead of xSync when synchronous=OFF
+        if(SQLITE_FCNTL_SYNC == iOperation)
+        {
+            rc = flushWrites(pBmnFile);
+            if(rc)
+            {
+                BMN_TRACE_ERROR(rc);
+                return rc;
+            }
+            rc = SQLITE_NOTFOUND;
+        }
+        if(0 == (pBmnFile->pInfo->iFlags & BMN_NO_CALLBACK_FILE_CONTROL))
+        {
+            rc = callFileControlMethod(
+                    pBmnFile->pInfo->pWrapper,
+                    pBmnFile,
+                    iOperation,
+                    pArg);
+        }
+        // be carefull
+        if(BMN_CB_RESULT_NO_HANDLER == rc)
+        {
+            pBmnFile->pInfo->iFlags |= BMN_NO_CALLBACK_FILE_CONTROL;
+            rc = SQLITE_NOTFOUND;
+        }
+        else if(rc < 0)
+        {
+            rc = BMN_CALLBACK_ERROR;
+        }
+    }
+    else
+    {
+        BMN_ASSERT(pBmnFile->pReal);
+        rc = pBmnFile->pReal->pMethods->xFileControl(
+                pBmnFile->pReal,
+                iOperation,
+                pArg);
+    }
+    BMN_TRACE_ERROR(rc);
+    return rc;
+}
+static int bmnvfsSectorSizeImpl(sqlite3_file* pFile)
+{
+    BMN_TRACE_MARK;
+    int rc;
+    BmnvfsFile* pBmnFile = BMN_FILE(pFile);
+    if(pBmnFile->pFileWrapper)
+    {
+        checkGeneration(pBmnFile);
+        if(pBmnFile->iSectorSize >= 0)
+        {
+            return pBmnFile->iSectorSize;
+        }
+        rc = BMN_CB_RESULT_NO_HANDLER;
+        if(0 == (pBmnFile->pInfo->iFlags & BMN_NO_CALLBACK_SECTOR_SIZE))
+        {
+            rc = callSectorSizeMethod(pBmnFile->pInfo->pWrapper, pBmnFile);
+        }
+        if(rc < 0)
+        {
+            pBmnFile->pInfo->iFlags |= BMN_NO_CALLBACK_SECTOR_SIZE;
+            rc = SQLITE_DEFAULT_SECTOR_SIZE;
+        }
+        pBmnFile->iSectorSize = rc;
+    }
+    else
+    {
+        BMN_ASSERT(pBmnFile->pReal);
+        rc = pBmnFile->pReal->pMethods->xSectorSize(pBmnFile->pReal);
+    }
+    BMN_VERBOSE_INT(rc);
+    return rc;
+}
+
+static int bmnvfsDeviceCharacteristicsImpl(sqlite3_file* pFile)
+{
+    BMN_TRACE_MARK;
+    int rc;
+    BmnvfsFile* pBmnFile = BMN_FILE(pFile);
+    if(pBmnFile->pFileWrapper)
+    {
+        checkGeneration(pBmnFile);
+        rc = pBmnFile->iDeviceCharacteristics;
+        if(rc < 0 &&
+           0 ==
+                   (pBmnFile->pInfo->iFlags &
+                    BMN_NO_CALLBACK_DEVICE_CHARACTERISTICS))
+        {
+            rc = callDeviceCharacteristicsMethod(
+                    pBmnFile->pInfo->pWrapper,
+                    pBmnFile);
+        }
+        if(rc < 0)
+        {
+            // we can't return error so handle in the same way everything
+            pBmnFile->pInfo->iFlags |= BMN_NO_CALLBACK_DEVICE_CHARACTERISTICS;
+            rc = SQLITE_DEFAULT_DEVICE_CHARACTERISTICS;
+        }
+        pBmnFile->iDeviceCharacteristics = rc;
+        // transactions of main DB are committed by 'commit_atomic'
+        if(0 == (pBmnFile->pInfo->iFlags & BMN_NO_CALLBACK_COMMIT_ATOMIC) &&
+           (pBmnFile->iFlags & SQLITE_OPEN_MAIN_DB))
+        {
+            rc |= SQLITE_IOCAP_BATCH_ATOMIC;
+        }
+    }
+    else
+    {
+        BMN_ASSERT(pBmnFile->pReal);
+        rc = pBmnFile->pReal->pMethods->xDeviceCharacteristics(pBmnFile->pReal);
+    }
+    BMN_VERBOSE_INT(rc);
+    return rc;
+}
+
+/*
+ entry points count calls in stats of the file and of the VFS and record
+ them in its trace
+*/
+static int isWrapperCall(BmnvfsFile* pBmnFile, int iOp)
+{
+    if(pBmnFile->pFileWrapper)
+    {
+        return 1;
+    }
+    if(pBmnFile->iPlain || pBmnFile->pInfo->pCodec)
+    {
+        return 0;
+    }
+    // partial impl. passes pages to 'encode'/'decode' only
+    return BMN_OP_READ == iOp || BMN_OP_WRITE == iOp;
+}
+
+static void traceCall(
+        BmnvfsInfo* pInfo,
+        BmnvfsFile* pBmnFile,
+        int iOp,
+        int rc,
+        sqlite3_int64 iStart,
+        sqlite3_int64 iTime,
+        sqlite3_int64 iOfst,
+        int iAmt)
+{
+    BmnEvent event;
+
+    event.iTime     = iStart;
+    event.iDuration = iTime;
+    event.iFile     = pBmnFile ? pBmnFile->iId : 0;
+    event.iOffset   = iOfst;
+    event.iLength   = iAmt;
+    event.iFlags    = pBmnFile ? pBmnFile->iFlags : 0;
+    event.rc        = rc;
+    event.iOp       = iOp;
+    bmnEventsAdd(&pInfo->events, &event);
+}
+
+/*
+ iOfst and iAmt are the offset and the size of read and write, other
+ calls pass their argument as iOfst or iAmt to the trace
+*/
+static void countFileCall(
+        sqlite3_file* pFile,
+        int iOp,
+        int rc,
+        sqlite3_int64 iStart,
+        sqlite3_int64 iOfst,
+        int iAmt)
+{
+    int iWrapper;
+    sqlite3_int64 iTime;
+    BmnvfsFile* pBmnFile = BMN_FILE(pFile);
+    BmnvfsInfo* pInfo    = pBmnFile->pInfo;
+
+    iTime    = bmnStatsClock() - iStart;
+    iWrapper = isWrapperCall(pBmnFile, iOp);
+    bmnStatsAdd(&pBmnFile->stats, 0, iOp, rc, iTime, iWrapper, iAmt);
+    bmnStatsAdd(&pInfo->stats, 1, iOp, rc, iTime, iWrapper, iAmt);
+    bmnLatencyAdd(&pInfo->latency, iOp, iTime);
+    if(BMN_EVENTS_ON(&pInfo->events))
+    {
+        traceCall(pInfo, pBmnFile, iOp, rc, iStart, iTime, iOfst, iAmt);
+    }
+}
+
+/*
+ pBmnFile is the opened or closed file, NULL for other calls
+*/
+static void countVfsCall(
+        BmnvfsInfo* pInfo,
+        BmnvfsFile* pBmnFile,
+        int iOp,
+        int rc,
+        sqlite3_int64 iStart,
+        int iWrapper,
+        int iAmt)
+{
+    sqlite3_int64 iTime;
+
+    iTime = bmnStatsClock() - iStart;
+    bmnStatsAdd(&pInfo->stats, 1, iOp, rc, iTime, iWrapper, 0);
+    bmnLatencyAdd(&pInfo->latency, iOp, iTime);
+    if(BMN_EVENTS_ON(&pInfo->events))
+    {
+        traceCall(pInfo, pBmnFile, iOp, rc, iStart, iTime, -1, iAmt);
+    }
+}
+
+static int bmnvfsRead(
+        sqlite3_file* pFile,
+        void* zBuf,
+        int iAmt,
+        sqlite3_int64 iOfst)
+{
+    int rc;
+    sqlite3_int64 iStart;
+    iStart = bmnStatsClock();
+    rc     = bmnvfsReadImpl(pFile, zBuf, iAmt, iOfst);
+    countFileCall(pFile, BMN_OP_READ, rc, iStart, iOfst, iAmt);
+    return rc;
+}
+
+static int bmnvfsWrite(
+        sqlite3_file* pFile,
+        const void* zBuf,
+        int iAmt,
+        sqlite3_int64 iOfst)
+{
+    int rc;
+    sqlite3_int64 iStart;
+    iStart = bmnStatsClock();
+    rc     = bmnvfsWriteImpl(pFile, zBuf, iAmt, iOfst);
+    countFileCall(pFile, BMN_OP_WRITE, rc, iStart, iOfst, iAmt);
+    return rc;
+}
+
+static int bmnvfsTruncate(sqlite3_file* pFile, sqlite3_int64 size)
+{
+    int rc;
+    sqlite3_int64 iStart;
+    iStart = bmnStatsClock();
+    rc     = bmnvfsTruncateImpl(pFile, size);
+    countFileCall(pFile, BMN_OP_TRUNCATE, rc, iStart, size, 0);
+    return rc;
+}
+
+static int bmnvfsSync(sqlite3_file* pFile, int flags)
+{
+    int rc;
+    sqlite3_int64 iStart;
+    iStart = bmnStatsClock();
+    rc     = bmnvfsSyncImpl(pFile, flags);
+    countFileCall(pFile, BMN_OP_SYNC, rc, iStart, -1, flags);
+    return rc;
+}
+
+static int bmnvfsFileSize(sqlite3_file* pFile, sqlite3_int64* pSize)
+{
+    int rc;
+    sqlite3_int64 iStart;
+    iStart = bmnStatsClock();
+    rc     = bmnvfsFileSizeImpl(pFile, pSize);
+    countFileCall(pFile, BMN_OP_FILE_SIZE, rc, iStart, -1, 0);
+    return rc;
+}
+
+static int bmnvfsLock(sqlite3_file* pFile, int flags)
+{
+    int rc;
+    sqlite3_int64 iStart;
+    iStart = bmnStatsClock();
+    rc     = bmnvfsLockImpl(pFile, flags);
+    countFileCall(pFile, BMN_OP_LOCK, rc, iStart, -1, flags);
+    return rc;
+}
+
+static int bmnvfsUnlock(sqlite3_file* pFile, int flags)
+{
+    int rc;
+    sqlite3_int64 iStart;
+    iStart = bmnStatsClock();
+    rc     = bmnvfsUnlockImpl(pFile, flags);
+    countFileCall(pFile, BMN_OP_UNLOCK, rc, iStart, -1, flags);
+    return rc;
+}
+
+static int bmnvfsCheckReservedLock(sqlite3_file* pFile, int* pResOut)
+{
+    int rc;
+    sqlite3_int64 iStart;
+    iStart = bmnStatsClock();
+    rc     = bmnvfsCheckReservedLockImpl(pFile, pResOut);
+    countFileCall(pFile, BMN_OP_CHECK_RESERVED_LOCK, rc, iStart, -1, 0);
+    return rc;
+}
+
+static int bmnvfsFileControl(sqlite3_file* pFile, int iOperation, void* pArg)
+{
+    int rc;
+    sqlite3_int64 iStart;
+    iStart = bmnStatsClock();
+    rc     = bmnvfsFileControlImpl(pFile, iOperation, pArg);
+    countFileCall(pFile, BMN_OP_FILE_CONTROL, rc, iStart, -1, iOperation);
+    return rc;
+}
+
+static int bmnvfsSectorSize(sqlite3_file* pFile)
+{
+    int iSize;
+    sqlite3_int64 iStart;
+    iStart = bmnStatsClock();
+    iSize  = bmnvfsSectorSizeImpl(pFile);
+    countFileCall(pFile, BMN_OP_SECTOR_SIZE, SQLITE_OK, iStart, -1, 0);
+    return iSize;
+}
+
+static int bmnvfsDeviceCharacteristics(sqlite3_file* pFile)
+{
+    int iFlags;
+    sqlite3_int64 iStart;
+    iStart = bmnStatsClock();
+    iFlags = bmnvfsDeviceCharacteristicsImpl(pFile);
+    countFileCall(
+            pFile, BMN_OP_DEVICE_CHARACTERISTICS, SQLITE_OK, iStart, -1, 0);
+    return iFlags;
+}
+
+static int bmnvfsOpen(
+        sqlite3_vfs* pVfs,
+        const char* zName,
+        sqlite3_file* pFile,
+        int flags,
+        int* pOutFlags)
+{
+    int rc;
+    int iWrapper;
+    sqlite3_int64 iStart;
+    iStart   = bmnStatsClock();
+    iWrapper = 0 == (BMN_INFO(pVfs)->iFlags & BMN_NO_CALLBACK_OPEN);
+    rc       = bmnvfsOpenImpl(pVfs, zName, pFile, flags, pOutFlags);
+    countVfsCall(
+            BMN_INFO(pVfs),
+            SQLITE_OK == rc ? BMN_FILE(pFile) : NULL,
+            BMN_OP_OPEN,
+            rc,
+            iStart,
+            iWrapper,
+            flags);
+    return rc;
+}
+
+static int bmnvfsDelete(sqlite3_vfs* pVfs, const char* zName, int syncDir)
+{
+    int rc;
+    int iWrapper;
+    sqlite3_int64 iStart;
+    iStart   = bmnStatsClock();
+    iWrapper = 0 == (BMN_INFO(pVfs)->iFlags & BMN_NO_CALLBACK_DELETE);
+    rc       = bmnvfsDeleteImpl(pVfs, zName, syncDir);
+    countVfsCall(
+            BMN_INFO(pVfs), NULL, BMN_OP_DELETE, rc, iStart, iWrapper, syncDir);
+    return rc;
+}
+
+static int bmnvfsAccess(
+        sqlite3_vfs* pVfs,
+        const char* zName,
+        int flags,
+        int* pResOut)
+{
+    int rc;
+    int iWrapper;
+    sqlite3_int64 iStart;
+    iStart   = bmnStatsClock();
+    iWrapper = 0 == (BMN_INFO(pVfs)->iFlags & BMN_NO_CALLBACK_ACCESS);
+    rc       = bmnvfsAccessImpl(pVfs, zName, flags, pResOut);
+    countVfsCall(
+            BMN_INFO(pVfs), NULL, BMN_OP_ACCESS, rc, iStart, iWrapper, flags);
+    return rc;
+}
+
+static int bmnvfsFullPathname(
+        sqlite3_vfs* pVfs,
+        const char* zName,
+        int nOut,
+        char* zOut)
+{
+    int rc;
+    int iWrapper;
+    sqlite3_int64 iStart;
+    iStart   = bmnStatsClock();
+    iWrapper = 0 == (BMN_INFO(pVfs)->iFlags & BMN_NO_CALLBACK_FULL_PATHNAME);
+    rc       = bmnvfsFullPathnameImpl(pVfs, zName, nOut, zOut);
+    countVfsCall(
+            BMN_INFO(pVfs),
+            NULL,
+            BMN_OP_FULL_PATHNAME,
+            rc,
+            iStart,
+            iWrapper,
+            0);
+    return rc;
+}
+
+/*
+ only plain files are mapped. sqlite reads the page with xRead
+ when the pointer is NULL, so transformed pages are decoded as usual
+*/
+static int bmnvfsFetch(
+        sqlite3_file* pFile,
+        sqlite3_int64 iOfst,
+        int iAmt,
+        void** pp)
+{
+    BMN_TRACE_MARK;
+    BmnvfsFile* pBmnFile = BMN_FILE(pFile);
+    if(!pBmnFile->iPlain)
+    {
+        *pp = NULL;
+        return SQLITE_OK;
+    }
+    BMN_ASSERT(pBmnFile->pReal->pMethods->iVersion >= 3);
+    return pBmnFile->pReal->pMethods->xFetch(pBmnFile->pReal, iOfst, iAmt, pp);
+}
+
+static int bmnvfsUnfetch(sqlite3_file* pFile, sqlite3_int64 iOfst, void* p)
+{
+    BMN_TRACE_MARK;
+    BmnvfsFile* pBmnFile = BMN_FILE(pFile);
+    if(!pBmnFile->iPlain)
+    {
+        return SQLITE_OK;
+    }
+    return pBmnFile->pReal->pMethods->xUnfetch(pBmnFile->pReal, iOfst, p);
+}
+/*
+ full impl. maps wal-index of the side file
+*/
+#define BMN_SHM_FILE(p) \
+    (BMN_FILE(p)->pFileWrapper ? BMN_FILE(p)->pSide : BMN_FILE(p)->pReal)
+
+static int bmnvfsShmLock(sqlite3_file* pFile, int nOffset, int n, int flags)
+{
+    BMN_TRACE_MARK;
+    int rc;
+    sqlite3_int64 iTicket;
+    BmnvfsFile* pWal;
+    sqlite3_file* pShm = BMN_SHM_FILE(pFile);
+    // WAL connections keep SHARED lock, checkpoints of others are
+    // noticed by locks of wal-index
+    if(BMN_FILE(pFile)->pFileWrapper && (flags & SQLITE_SHM_LOCK))
+    {
+        dropReadAhead(BMN_FILE(pFile));
+        checkCheckpoint(BMN_FILE(pFile));
+    }
+    rc   = pShm->pMethods->xShmLock(pShm, nOffset, n, flags);
+    pWal = BMN_FILE(pFile)->pWal;
+    /*
+     the commit ends by release of the WAL write lock, others can commit
+     while it waits for the sync of 'group'. The failed sync is tried
+     again by the next sync, checkpoint or close
+     */
+    if(0 == nOffset && (flags & SQLITE_SHM_UNLOCK) && pWal &&
+       pWal->iSyncTicket)
+    {
+        iTicket           = pWal->iSyncTicket;
+        pWal->iSyncTicket = 0;
+        bmnDurabilityWait(
+                &pWal->pInfo->durability,
+                pWal->pSyncFile,
+                iTicket,
+                performSync,
+                pWal);
+    }
+    return rc;
+}
+
+static int bmnvfsShmMap(
+        sqlite3_file* pFile,
+        int iRegion,
+        int szRegion,
+        int isWrite,
+        void volatile** pp)
+{
+    BMN_TRACE_MARK;
+    int rc;
+    sqlite3_file* pShm = BMN_SHM_FILE(pFile);
+    rc = pShm->pMethods->xShmMap(pShm, iRegion, szRegion, isWrite, pp);
+    if(SQLITE_OK == rc && 0 == iRegion && BMN_FILE(pFile)->pFileWrapper)
+    {
+        BMN_FILE(pFile)->aShmHeader = (const volatile unsigned int*)*pp;
+    }
+    return rc;
+}
+
+static void bmnvfsShmBarrier(sqlite3_file* pFile)
+{
+    BMN_TRACE_MARK;
+    sqlite3_file* pShm = BMN_SHM_FILE(pFile);
+    pShm->pMethods->xShmBarrier(pShm);
+}
+static int bmnvfsShmUnmap(sqlite3_file* pFile, int delFlag)
+{
+    BMN_TRACE_MARK;
+    sqlite3_file* pShm = BMN_SHM_FILE(pFile);
+    BMN_FILE(pFile)->aShmHeader = NULL;
+    return pShm->pMethods->xShmUnmap(pShm, delFlag);
+}
+
+/*
+ -1 means 'ask the wrapper' ( its 'zero_copy_write' attribute )
+*/
+static int resolveZeroCopyWrite(PyObject* pWrapper, int iZeroCopyWrite)
+{
+    PyObject* pAttr;
+    _Py_IDENTIFIER(zero_copy_write);
+
+    if(iZeroCopyWrite >= 0)
+    {
+        return iZeroCopyWrite;
+    }
+    if(_PyObject_LookupAttrId(pWrapper, &PyId_zero_copy_write, &pAttr) <= 0)
+    {
+        return PyErr_Occurred() ? -1 : 0;
+    }
+    iZeroCopyWrite = PyObject_IsTrue(pAttr);
+    Py_DECREF(pAttr);
+    return iZeroCopyWrite;
+}
+
+/*
+ -1 means 'ask the wrapper' ( its 'page_cache_size' attribute )
+*/
+static sqlite3_int64 resolvePageCacheSize(
+        PyObject* pWrapper,
+        sqlite3_int64 iPageCacheSize)
+{
+    PyObject* pAttr;
+    _Py_IDENTIFIER(page_cache_size);
+
+    if(iPageCacheSize >= 0)
+    {
+        return iPageCacheSize;
+    }
+    if(_PyObject_LookupAttrId(pWrapper, &PyId_page_cache_size, &pAttr) <= 0)
+    {
+        return PyErr_Occurred() ? -1 : 0;
+    }
+    if(Py_None == pAttr)
+    {
+        iPageCacheSize = 0;
+    }
+    else
+    {
+        iPageCacheSize = PyLong_AsLongLong(pAttr);
+        if(iPageCacheSize < 0 && !PyErr_Occurred())
+        {
+            PyErr_SetString(
+                    PyExc_ValueError,
+                    "Attribute 'page_cache_size' must be non-negative");
+        }
+    }
+    Py_DECREF(pAttr);
+    return iPageCacheSize;
+}
+
+/*
+ -1 means 'ask the wrapper' ( its 'read_ahead' attribute )
+*/
+static int resolveReadAhead(PyObject* pWrapper, int iReadAhead)
+{
+    PyObject* pAttr;
+    _Py_IDENTIFIER(read_ahead);
+
+    if(iReadAhead >= 0)
+    {
+        return iReadAhead;
+    }
+    if(_PyObject_LookupAttrId(pWrapper, &PyId_read_ahead, &pAttr) <= 0)
+    {
+        return PyErr_Occurred() ? -1 : BMN_READ_AHEAD_PAGES;
+    }
+    if(Py_None == pAttr)
+    {
+        iReadAhead = 0;
+    }
+    else
+    {
+        iReadAhead = _PyLong_AsInt(pAttr);
+        if((iReadAhead < 0 || iReadAhead > BMN_MAX_READ_AHEAD_PAGES) &&
+           !PyErr_Occurred())
+        {
+            PyErr_Format(
+                    PyExc_ValueError,
+                    "Attribute 'read_ahead' must be in range 0..%d",
+                    BMN_MAX_READ_AHEAD_PAGES);
+            iReadAhead = -1;
+        }
+    }
+    Py_DECREF(pAttr);
+    return iReadAhead;
+}
+
+/*
+ -1 means 'ask the wrapper' ( its 'plain_files' attribute )
+*/
+static int resolvePlainFiles(PyObject* pWrapper, int iPlainFiles)
+{
+    PyObject* pAttr;
+    _Py_IDENTIFIER(plain_files);
+
+    if(iPlainFiles >= 0)
+    {
+        return iPlainFiles;
+    }
+    if(_PyObject_LookupAttrId(pWrapper, &PyId_plain_files, &pAttr) <= 0)
+    {
+        return PyErr_Occurred() ? -1 : 0;
+    }
+    if(Py_None == pAttr)
+    {
+        iPlainFiles = 0;
+    }
+    else
+    {
+        iPlainFiles = _PyLong_AsInt(pAttr);
+        if((iPlainFiles < 0 || (iPlainFiles & ~BMN_FILE_TYPES)) &&
+           !PyErr_Occurred())
+        {
+            PyErr_SetString(
+                    PyExc_ValueError,
+                    "Attribute 'plain_files' must be a mask of SQLITE_OPEN_* "
+                    "file types");
+            iPlainFiles = -1;
+        }
+    }
+    Py_DECREF(pAttr);
+    return iPlainFiles;
+}
+
+/*
+ -1 means 'ask the wrapper' ( its 'memory_store' attribute )
+*/
+static int resolveMemoryStore(PyObject* pWrapper, int iMemoryStore)
+{
+    PyObject* pAttr;
+    _Py_IDENTIFIER(memory_store);
+
+    if(iMemoryStore >= 0)
+    {
+        return iMemoryStore;
+    }
+    if(_PyObject_LookupAttrId(pWrapper, &PyId_memory_store, &pAttr) <= 0)
+    {
+        return PyErr_Occurred() ? -1 : 0;
+    }
+    iMemoryStore = PyObject_IsTrue(pAttr);
+    Py_DECREF(pAttr);
+    return iMemoryStore;
+}
+
+/*
+ -1 means 'ask the wrapper' ( its 'side_file' attribute )
+*/
+static int resolveSideFile(PyObject* pWrapper, int iSideFile)
+{
+    PyObject* pAttr;
+    _Py_IDENTIFIER(side_file);
+
+    if(iSideFile >= 0)
+    {
+        return iSideFile;
+    }
+    if(_PyObject_LookupAttrId(pWrapper, &PyId_side_file, &pAttr) <= 0)
+    {
+        return PyErr_Occurred() ? -1 : 0;
+    }
+    iSideFile = PyObject_IsTrue(pAttr);
+    Py_DECREF(pAttr);
+    return iSideFile;
+}
+
+/*
+ -1 means 'ask the wrapper' ( its 'durability' attribute )
+*/
+static int resolveDurability(PyObject* pWrapper, int iDurability)
+{
+    PyObject* pAttr;
+    const char* zPolicy;
+    _Py_IDENTIFIER(durability);
+
+    if(iDurability >= 0)
+    {
+        return iDurability;
+    }
+    if(_PyObject_LookupAttrId(pWrapper, &PyId_durability, &pAttr) <= 0)
+    {
+        return PyErr_Occurred() ? -1 : BMN_DURABILITY_NORMAL;
+    }
+    if(Py_None == pAttr)
+    {
+        iDurability = BMN_DURABILITY_NORMAL;
+    }
+    else
+    {
+        zPolicy = PyUnicode_Check(pAttr) ? PyUnicode_AsUTF8(pAttr) : NULL;
+        iDurability = zPolicy ? bmnDurabilityPolicy(zPolicy) : -1;
+        if(iDurability < 0 && !PyErr_Occurred())
+        {
+            PyErr_SetString(
+                    PyExc_ValueError,
+                    "Attribute 'durability' must be 'normal', 'full', "
+                    "'group' or 'interval'");
+        }
+    }
+    Py_DECREF(pAttr);
+    return iDurability;
+}
+
+/*
+ -1 means 'ask the wrapper' ( its 'sync_interval' attribute ),
+ None there means the default of the policy
+*/
+static int resolveSyncInterval(
+        PyObject* pWrapper,
+        int iSyncInterval,
+        int iDurability)
+{
+    PyObject* pAttr;
+    _Py_IDENTIFIER(sync_interval);
+
+    if(iSyncInterval >= 0)
+    {
+        return iSyncInterval;
+    }
+    if(_PyObject_LookupAttrId(pWrapper, &PyId_sync_interval, &pAttr) < 0)
+    {
+        return -1;
+    }
+    if(!pAttr || Py_None == pAttr)
+    {
+        Py_XDECREF(pAttr);
+        return BMN_DURABILITY_INTERVAL == iDurability ? BMN_SYNC_INTERVAL
+                                                       : BMN_GROUP_SYNC_WINDOW;
+    }
+    iSyncInterval = _PyLong_AsInt(pAttr);
+    if((iSyncInterval < 0 || iSyncInterval > BMN_MAX_SYNC_INTERVAL) &&
+       !PyErr_Occurred())
+    {
+        PyErr_Format(
+                PyExc_ValueError,
+                "Attribute 'sync_interval' must be in range 0..%d",
+                BMN_MAX_SYNC_INTERVAL);
+        iSyncInterval = -1;
+    }
+    Py_DECREF(pAttr);
+    return iSyncInterval;
+}
+
+/*
+ files of the memory store are dropped when it's turned off
+*/
+static void setMemoryStore(BmnvfsInfo* pInfo, int iMemoryStore)
+{
+    if(iMemoryStore)
+    {
+        pInfo->pFileVfs = &pInfo->memStore.base;
+    }
+    else
+    {
+        bmnMemStoreClear(&pInfo->memStore);
+        pInfo->pFileVfs = pInfo->pRootVfs;
+    }
+}
+
+/*
+ returns new reference to codec capsule or None
+ NULL if wrapper returned something wrong
+*/
+static PyObject* resolveCodec(PyObject* pWrapper)
+{
+    PyObject* pCapsule;
+    const BmnCodec* pCodec;
+    _Py_IDENTIFIER(codec);
+
+    pCapsule = _PyObject_CallMethodId(pWrapper, &PyId_codec, NULL);
+    if(!pCapsule)
+    {
+        if(!PyErr_ExceptionMatches(PyExc_AttributeError) &&
+           !PyErr_ExceptionMatches(PyExc_NotImplementedError))
         {
-            // we can't return error so handle in the same way everything
-            pBmnFile->pInfo->iFlags |= BMN_NO_CALLBACK_DEVICE_CHARACTERISTICS;
-            rc = SQLITE_DEFAULT_DEVICE_CHARACTERISTICS;
+            return NULL;
         }
+        PyErr_Clear();
+        Py_RETURN_NONE;
     }
-    else
+    if(Py_None == pCapsule)
     {
-        BMN_ASSERT(pBmnFile->pReal);
-        rc = pBmnFile->pReal->pMethods->xDeviceCharacteristics(pBmnFile->pReal);
+        return pCapsule;
     }
-    BMN_VERBOSE_INT(rc);
-    return rc;
+    if(!PyCapsule_IsValid(pCapsule, BMN_CODEC_CAPSULE_NAME))
+    {
+        PyErr_Format(
+                PyExc_TypeError,
+                "Method 'codec' must return '%s' capsule or None",
+                BMN_CODEC_CAPSULE_NAME);
+        Py_DECREF(pCapsule);
+        return NULL;
+    }
+    pCodec = PyCapsule_GetPointer(pCapsule, BMN_CODEC_CAPSULE_NAME);
+    if(pCodec->iVersion < BMN_CODEC_VERSION || !pCodec->xEncode ||
+       !pCodec->xDecode)
+    {
+        PyErr_Format(
+                PyExc_ValueError,
+                "Invalid codec version %d or methods",
+                pCodec->iVersion);
+        Py_DECREF(pCapsule);
+        return NULL;
+    }
+    return pCapsule;
 }
 
-static int bmnvfsFetch(
-        sqlite3_file* pFile,
-        sqlite3_int64 nSize,
-        int nArg,
-        void** zBuf)
+/*
+ steals reference to pCapsule
+*/
+static void setCodec(BmnvfsInfo* pInfo, PyObject* pCapsule)
 {
-    BMN_TRACE_MARK;
-    return BMN_FILE(pFile)->pReal->pMethods->xFetch(pFile, nSize, nArg, zBuf);
+    Py_CLEAR(pInfo->pCodecCapsule);
+    pInfo->pCodec = NULL;
+    if(pCapsule && Py_None != pCapsule)
+    {
+        pInfo->pCodecCapsule = pCapsule;
+        pInfo->pCodec = PyCapsule_GetPointer(pCapsule, BMN_CODEC_CAPSULE_NAME);
+    }
+    else
+    {
+        Py_XDECREF(pCapsule);
+    }
 }
 
-static int bmnvfsUnfetch(sqlite3_file* pFile, sqlite3_int64 nSize, void* zBuf)
-{
-    BMN_TRACE_MARK;
-    return BMN_FILE(pFile)->pReal->pMethods->xUnfetch(pFile, nSize, zBuf);
-}
-static int bmnvfsShmLock(sqlite3_file* pFile, int nOffset, int n, int flags)
+/*
+ registered VFS of this module by name, NULL name means the default VFS
+*/
+static sqlite3_vfs* findBmnVfs(const char* zName)
 {
-    BMN_TRACE_MARK;
-    return BMN_FILE(pFile)->pReal->pMethods->xShmLock(pFile, nOffset, n, flags);
-}
+    sqlite3_vfs* pVfs;
 
-static int bmnvfsShmMap(
-        sqlite3_file* pFile,
-        int iRegion,
-        int szRegion,
-        int isWrite,
-        void volatile** pp)
-{
-    BMN_TRACE_MARK;
-    return BMN_FILE(pFile)
-            ->pReal->pMethods->xShmMap(pFile, iRegion, szRegion, isWrite, pp);
+    pVfs = sqlite3_vfs_find(zName);
+    if(pVfs && bmnvfsOpen == pVfs->xOpen)
+    {
+        return pVfs;
+    }
+    return NULL;
 }
 
-static void bmnvfsShmBarrier(sqlite3_file* pFile)
-{
-    BMN_TRACE_MARK;
-    BMN_FILE(pFile)->pReal->pMethods->xShmBarrier(pFile);
-}
-static int bmnvfsShmUnmap(sqlite3_file* pFile, int delFlag)
+/*
+ slot which had the name before or a free one. NULL if all are taken.
+ Unregistering frees the slot
+*/
+static sqlite3_vfs* findVfsSlot(const char* zName)
 {
-    BMN_TRACE_MARK;
-    return BMN_FILE(pFile)->pReal->pMethods->xShmUnmap(pFile, delFlag);
+    int i;
+    sqlite3_vfs* pFree;
+
+    pFree = NULL;
+    for(i = 0; i < BMN_MAX_VFS_COUNT; ++i)
+    {
+        // pAppData tells which slot is it
+        aStaticVfs[i].pAppData = &aStaticInfo[i];
+        if(0 == strcmp(aStaticInfo[i].zName, zName))
+        {
+            return &aStaticVfs[i];
+        }
+        if(!pFree && !aStaticInfo[i].zName[0])
+        {
+            pFree = &aStaticVfs[i];
+        }
+    }
+    return pFree;
 }
 
-extern int bmnVfsRegister(PyObject* pWrapper, int iMakeDefault)
+extern int bmnVfsRegister(
+        PyObject* pWrapper,
+        int iMakeDefault,
+        int iZeroCopyWrite,
+        sqlite3_int64 iPageCacheSize,
+        int iReadAhead,
+        int iPlainFiles,
+        int iMemoryStore,
+        int iSideFile,
+        int iDurability,
+        int iSyncInterval,
+        const char* zName)
 {
     sqlite3_vfs* pOld;
     sqlite3_vfs* pRoot;
     sqlite3_vfs* pNew;
     BmnvfsInfo* pInfo;
+    PyObject* pCapsule;
+    const BmnCodec* pCodec;
     int rc;
 
-    pOld = sqlite3_vfs_find(BMNVFS_NAME);
+    if(!zName)
+    {
+        zName = BMNVFS_NAME;
+    }
+    if(!zName[0] || strlen(zName) >= BMN_VFS_NAME_SIZE)
+    {
+        PyErr_Format(
+                PyExc_ValueError,
+                "VFS name must have 1..%d characters",
+                BMN_VFS_NAME_SIZE - 1);
+        return -1;
+    }
+    pOld = findBmnVfs(zName);
+    if(!pOld && sqlite3_vfs_find(zName))
+    {
+        PyErr_Format(
+                PyExc_ValueError,
+                "VFS '%s' is registered by someone else",
+                zName);
+        return -1;
+    }
+    if(Py_None != pWrapper)
+    {
+        iZeroCopyWrite = resolveZeroCopyWrite(pWrapper, iZeroCopyWrite);
+        if(iZeroCopyWrite < 0)
+        {
+            return -1;
+        }
+        iPageCacheSize = resolvePageCacheSize(pWrapper, iPageCacheSize);
+        if(iPageCacheSize < 0)
+        {
+            return -1;
+        }
+        iReadAhead = resolveReadAhead(pWrapper, iReadAhead);
+        if(iReadAhead < 0)
+        {
+            return -1;
+        }
+        iPlainFiles = resolvePlainFiles(pWrapper, iPlainFiles);
+        if(iPlainFiles < 0)
+        {
+            return -1;
+        }
+        iMemoryStore = resolveMemoryStore(pWrapper, iMemoryStore);
+        if(iMemoryStore < 0)
+        {
+            return -1;
+        }
+        iSideFile = resolveSideFile(pWrapper, iSideFile);
+        if(iSideFile < 0)
+        {
+            return -1;
+        }
+        iDurability = resolveDurability(pWrapper, iDurability);
+        if(iDurability < 0)
+        {
+            return -1;
+        }
+        iSyncInterval =
+                resolveSyncInterval(pWrapper, iSyncInterval, iDurability);
+        if(iSyncInterval < 0)
+        {
+            return -1;
+        }
+    }
 
     if(pOld)
     {
@@ -876,9 +3043,69 @@ extern int bmnVfsRegister(PyObject* pWrapper, int iMakeDefault)
         if(pInfo->pWrapper == pWrapper)
         {
             BMN_VERBOSE(
-                    "The same wrapper. Skip vfs register for %s",
+                    "The same wrapper. Refresh vfs register for %s",
                     getObjectTypename(pWrapper));
-            return 0;
+            pCapsule = resolveCodec(pWrapper);
+            if(!pCapsule)
+            {
+                BMN_ERROR("bad codec");
+                return -1;
+            }
+            pCodec = Py_None == pCapsule
+                    ? NULL
+                    : PyCapsule_GetPointer(pCapsule, BMN_CODEC_CAPSULE_NAME);
+            /*
+             open files keep their pages encoded by the codec and their
+             locks taken by 'lock' or by the side file
+            */
+            if(openedConnectionsCount(pInfo) > 0 &&
+               (iMemoryStore != (pInfo->pFileVfs != pInfo->pRootVfs) ||
+                iSideFile != pInfo->iSideFile || pCodec != pInfo->pCodec ||
+                ((missingMethods(pWrapper) ^ pInfo->iFlags) &
+                 BMN_NO_CALLBACK_LOCK)))
+            {
+                Py_DECREF(pCapsule);
+                PyErr_SetString(
+                        pysqlite_OperationalError,
+                        "Close all connections before switching "
+                        "'memory_store', 'side_file', 'codec' or 'lock'");
+                return -1;
+            }
+            if(iMemoryStore != (pInfo->pFileVfs != pInfo->pRootVfs))
+            {
+                setMemoryStore(pInfo, iMemoryStore);
+            }
+            if(pCodec && pCodec == pInfo->pCodec)
+            {
+                // the old capsule owns the context codec calls may use now
+                Py_DECREF(pCapsule);
+            }
+            else
+            {
+                setCodec(pInfo, pCapsule);
+            }
+            // methods replaced since the last registration are called now
+            pInfo->iFlags = iZeroCopyWrite ? BMN_ZERO_COPY_WRITE : 0;
+            initDispatchTable(pInfo);
+            pInfo->iGeneration += 1;
+            // files opened already keep their read-ahead and transform
+            pInfo->iReadAhead  = iReadAhead;
+            pInfo->iPlainFiles = iPlainFiles;
+            pInfo->iSideFile   = iSideFile;
+            if(bmnCacheSetLimit(&pInfo->cache, iPageCacheSize))
+            {
+                BMN_ERROR("page cache isn't available");
+            }
+            if(bmnDurabilitySet(
+                       &pInfo->durability,
+                       pInfo->pRootVfs,
+                       iDurability,
+                       iSyncInterval))
+            {
+                PyErr_NoMemory();
+                return -1;
+            }
+            return iMakeDefault ? sqlite3_vfs_register(pOld, 1) : 0;
         }
 #if BMN_CLOSE_CONNECTION_ON_REGISTER
         /*
@@ -931,7 +3158,12 @@ unwind this stack from the top
     }
     else
     {
+        // the default can be one of ours
         pRoot = sqlite3_vfs_find(NULL);
+        if(pRoot && bmnvfsOpen == pRoot->xOpen)
+        {
+            pRoot = BMN_INFO(pRoot)->pRootVfs;
+        }
     }
     if(!pRoot)
     {
@@ -946,13 +3178,26 @@ unwind this stack from the top
         {
             pInfo = BMN_INFO(pOld);
             BMN_ASSERT(pInfo);
+            clearDispatchTable(pInfo);
+            setCodec(pInfo, NULL);
+            bmnCacheSetLimit(&pInfo->cache, 0);
+            setMemoryStore(pInfo, 0);
             Py_XDECREF(pInfo->pWrapper);
+            pInfo->pWrapper = NULL;
+            iMakeDefault    = pOld == sqlite3_vfs_find(NULL);
             if(sqlite3_vfs_unregister(pOld))
             {
                 BMN_ERROR("unregistering error");
                 return -1;
             }
-            rc = sqlite3_vfs_register(pInfo->pRootVfs, 1);
+            // no files are opened, the slot is free for any name now
+            bmnEventsSet(&pInfo->events, 0);
+            pInfo->durability.iRequested = 0;
+            pInfo->durability.iPerformed = 0;
+            pInfo->durability.iDeferred  = 0;
+            pInfo->zName[0]              = 0;
+            // sqlite would take the next one as default
+            rc = iMakeDefault ? sqlite3_vfs_register(pInfo->pRootVfs, 1) : 0;
             BMN_TRACE_ERROR(rc);
             return rc;
         }
@@ -965,12 +3210,35 @@ unwind this stack from the top
         PyErr_SetString(pysqlite_OperationalError, "Invalid VFS wrapper");
         return -1;
     }
+    pCapsule = resolveCodec(pWrapper);
+    if(!pCapsule)
+    {
+        BMN_ERROR("bad codec");
+        return -1;
+    }
 
     /**
      * flex code approach
      **/
-    pNew  = &staticVfs;
-    pInfo = &staticInfo;
+    pNew = pOld ? pOld : findVfsSlot(zName);
+    if(!pNew)
+    {
+        Py_DECREF(pCapsule);
+        PyErr_Format(
+                pysqlite_OperationalError,
+                "Too many VFS names, only %d can be registered",
+                BMN_MAX_VFS_COUNT);
+        return -1;
+    }
+    pInfo = BMN_INFO(pNew);
+    if(bmnMemStoreInit(&pInfo->memStore, pRoot) ||
+       bmnDurabilitySet(&pInfo->durability, pRoot, iDurability, iSyncInterval))
+    {
+        Py_DECREF(pCapsule);
+        PyErr_NoMemory();
+        return -1;
+    }
+    strcpy(pInfo->zName, zName);
 
     /*
     use this case for current_time test coverage
@@ -982,7 +3250,16 @@ unwind this stack from the top
 #else
     pNew->iVersion      = 1;
 #endif
-    pNew->szOsFile = pRoot->szOsFile + sizeof(BmnvfsFile);
+    pNew->szOsFile = pRoot->szOsFile;
+    if(pNew->szOsFile < pInfo->memStore.base.szOsFile)
+    {
+        pNew->szOsFile = pInfo->memStore.base.szOsFile;
+    }
+    if(pNew->szOsFile < bmnOverlayFileSize())
+    {
+        pNew->szOsFile = bmnOverlayFileSize();
+    }
+    pNew->szOsFile += sizeof(BmnvfsFile);
 #ifndef BMN_DEF_MAXPATHNAME
     pNew->mxPathname = pRoot->mxPathname;
 #else
@@ -990,7 +3267,7 @@ unwind this stack from the top
 #endif
     pNew->pAppData      = pInfo;
     pNew->xOpen         = bmnvfsOpen;
-    pNew->zName         = BMNVFS_NAME;
+    pNew->zName         = pInfo->zName;
     pNew->xDelete       = bmnvfsDelete;
     pNew->xAccess       = bmnvfsAccess;
     pNew->xFullPathname = bmnvfsFullPathname;
@@ -1014,16 +3291,30 @@ unwind this stack from the top
     pNew->xGetSystemCall    = bmnvfsGetSystemCall;
     pNew->xNextSystemCall   = bmnvfsNextSystemCall;
     pInfo->pWrapper         = pWrapper;
-    pInfo->iFlags           = 0;
+    pInfo->iFlags           = iZeroCopyWrite ? BMN_ZERO_COPY_WRITE : 0;
+    pInfo->iReadAhead       = iReadAhead;
+    pInfo->iPlainFiles      = iPlainFiles;
+    pInfo->iSideFile        = iSideFile;
     pInfo->pRootVfs         = pRoot;
+    setMemoryStore(pInfo, iMemoryStore);
     if(initPyModule())
     {
         BMN_ERROR("Can't init BMN module");
         BMN_MEM_FREE(pNew);
         return -1;
     }
-    // TODO: use iMakeDefault
-    rc = sqlite3_vfs_register(pNew, 1);
+    initDispatchTable(pInfo);
+    setCodec(pInfo, pCapsule);
+    // files of the previous wrapper must ask the new one
+    pInfo->iGeneration += 1;
+    memset(&pInfo->stats, 0, sizeof(pInfo->stats));
+    memset(&pInfo->latency, 0, sizeof(pInfo->latency));
+    // pages decoded by previous wrapper must be dropped anyway
+    if(bmnCacheSetLimit(&pInfo->cache, iPageCacheSize))
+    {
+        BMN_ERROR("page cache isn't available");
+    }
+    rc = sqlite3_vfs_register(pNew, iMakeDefault);
 #if BMN_CLOSE_CONNECTION_ON_REGISTER
     pInfo->pFiles = NULL;
 #    if DEBUG_LEAKS_CONTROL
@@ -1040,7 +3331,7 @@ PyObject* bmnFindVfs(const char* zVfsName)
 {
     sqlite3_vfs* pVfs;
 
-    pVfs = sqlite3_vfs_find(BMNVFS_NAME);
+    pVfs = findBmnVfs(zVfsName);
     if(pVfs)
     {
         BmnvfsInfo* pInfo;
@@ -1054,6 +3345,390 @@ PyObject* bmnFindVfs(const char* zVfsName)
     Py_RETURN_NONE;
 }
 
+extern PyObject* bmnPageCacheStats(const char* zVfsName)
+{
+    sqlite3_vfs* pVfs;
+    BmnPageCache* pCache;
+    PyObject* pStats;
+
+    pVfs = findBmnVfs(zVfsName);
+    if(!pVfs)
+    {
+        Py_RETURN_NONE;
+    }
+    pCache = &BMN_INFO(pVfs)->cache;
+    sqlite3_mutex_enter(pCache->pMutex);
+    pStats = Py_BuildValue(
+            "{sLsLsLsLsIsLsL}",
+            "hits",
+            pCache->iHits,
+            "misses",
+            pCache->iMisses,
+            "evictions",
+            pCache->iEvictions,
+            "waits",
+            pCache->iWaits,
+            "pages",
+            pCache->nEntry,
+            "size",
+            pCache->iSize,
+            "max_size",
+            pCache->iMaxSize);
+    sqlite3_mutex_leave(pCache->pMutex);
+    return pStats;
+}
+
+extern PyObject* bmnSyncStats(const char* zVfsName)
+{
+    sqlite3_vfs* pVfs;
+    BmnDurability* pDurability;
+    PyObject* pStats;
+
+    pVfs = findBmnVfs(zVfsName);
+    if(!pVfs)
+    {
+        Py_RETURN_NONE;
+    }
+    pDurability = &BMN_INFO(pVfs)->durability;
+    sqlite3_mutex_enter(pDurability->pMutex);
+    pStats = Py_BuildValue(
+            "{sssisLsLsL}",
+            "durability",
+            bmnDurabilityName(pDurability->iPolicy),
+            "sync_interval",
+            pDurability->iInterval,
+            "requested",
+            pDurability->iRequested,
+            "performed",
+            pDurability->iPerformed,
+            "deferred",
+            pDurability->iDeferred);
+    sqlite3_mutex_leave(pDurability->pMutex);
+    return pStats;
+}
+
+static PyObject* statsDict(const BmnStats* pStats)
+{
+    int i;
+    PyObject* pDict;
+    PyObject* pCalls;
+    PyObject* pErrors;
+    PyObject* pTime;
+    PyObject* pValue;
+
+    pCalls  = PyDict_New();
+    pErrors = PyDict_New();
+    pTime   = PyDict_New();
+    for(i = 0; pCalls && pErrors && pTime && i < BMN_OP_COUNT; ++i)
+    {
+        if(!pStats->aCalls[i])
+        {
+            continue;
+        }
+        pValue = PyLong_FromLongLong(pStats->aCalls[i]);
+        if(!pValue || PyDict_SetItemString(pCalls, bmnStatsOpName(i), pValue))
+        {
+            Py_XDECREF(pValue);
+            break;
+        }
+        Py_DECREF(pValue);
+        pValue = PyLong_FromLongLong(pStats->aErrors[i]);
+        if(!pValue || PyDict_SetItemString(pErrors, bmnStatsOpName(i), pValue))
+        {
+            Py_XDECREF(pValue);
+            break;
+        }
+        Py_DECREF(pValue);
+        pValue = PyFloat_FromDouble((double)pStats->aTime[i] / 1e9);
+        if(!pValue || PyDict_SetItemString(pTime, bmnStatsOpName(i), pValue))
+        {
+            Py_XDECREF(pValue);
+            break;
+        }
+        Py_DECREF(pValue);
+    }
+    pDict = NULL;
+    if(!PyErr_Occurred() && pCalls && pErrors && pTime)
+    {
+        pDict = Py_BuildValue(
+                "{sOsOsOsLsLsLsdsd}",
+                "calls",
+                pCalls,
+                "errors",
+                pErrors,
+                "time",
+                pTime,
+                "bytes_read",
+                pStats->iBytesRead,
+                "bytes_written",
+                pStats->iBytesWritten,
+                "short_reads",
+                pStats->iShortReads,
+                "wrapper_time",
+                (double)pStats->iWrapperTime / 1e9,
+                "root_time",
+                (double)pStats->iRootTime / 1e9);
+    }
+    Py_XDECREF(pCalls);
+    Py_XDECREF(pErrors);
+    Py_XDECREF(pTime);
+    return pDict;
+}
+
+/*
+ counters of an open file copied while the file list is locked
+*/
+typedef struct BmnFileStats BmnFileStats;
+struct BmnFileStats
+{
+    char* zName;
+    int iFlags;
+    BmnStats stats;
+};
+
+/*
+ number of open files of the VFS and up to nMax copies of their stats
+ python objects are built after the list is unlocked: garbage collector
+ can close connections meanwhile
+*/
+static int copyFileStats(BmnvfsInfo* pInfo, BmnFileStats* aStats, int nMax)
+{
+    int n;
+    n = 0;
+#if BMN_CLOSE_CONNECTION_ON_REGISTER
+    BmnvfsNode* pNode;
+    BmnvfsFile* pBmnFile;
+    sqlite3_mutex_enter(filesMutex());
+    for(pNode = pInfo->pFiles; pNode; pNode = pNode->next, ++n)
+    {
+        if(n < nMax)
+        {
+            pBmnFile         = BMN_FILE(pNode->file);
+            aStats[n].zName  = pBmnFile->zName
+                     ? sqlite3_mprintf("%s", pBmnFile->zName)
+                     : NULL;
+            aStats[n].iFlags = pBmnFile->iFlags;
+            bmnStatsCopy(&aStats[n].stats, &pBmnFile->stats);
+        }
+    }
+    sqlite3_mutex_leave(filesMutex());
+#endif
+    return n;
+}
+
+static int setFileItems(PyObject* pDict, const BmnFileStats* pStats)
+{
+    int rc;
+    PyObject* pItems;
+
+    pItems = Py_BuildValue(
+            "{szsi}",
+            "name",
+            pStats->zName,
+            "flags",
+            pStats->iFlags);
+    rc = pItems ? PyDict_Update(pDict, pItems) : -1;
+    Py_XDECREF(pItems);
+    return rc;
+}
+
+extern PyObject* bmnVfsStats(const char* zVfsName)
+{
+    sqlite3_vfs* pVfs;
+    BmnvfsInfo* pInfo;
+    BmnStats stats;
+    BmnFileStats* aStats;
+    PyObject* pResult;
+    PyObject* pFiles;
+    PyObject* pFile;
+    int nFile;
+    int nAlloc;
+    int i;
+
+    pVfs = findBmnVfs(zVfsName);
+    if(!pVfs)
+    {
+        Py_RETURN_NONE;
+    }
+    pInfo  = BMN_INFO(pVfs);
+    aStats = NULL;
+    nAlloc = 0;
+    // files can be opened between the calls
+    while((nFile = copyFileStats(pInfo, aStats, nAlloc)) > nAlloc)
+    {
+        for(i = 0; i < nAlloc; ++i)
+        {
+            sqlite3_free(aStats[i].zName);
+        }
+        sqlite3_free(aStats);
+        nAlloc = nFile + 4;
+        aStats = sqlite3_malloc64(nAlloc * sizeof(BmnFileStats));
+        if(!aStats)
+        {
+            return PyErr_NoMemory();
+        }
+    }
+    bmnStatsCopy(&stats, &pInfo->stats);
+    pResult = statsDict(&stats);
+    pFiles  = PyList_New(0);
+    for(i = 0; pResult && pFiles && i < nFile; ++i)
+    {
+        pFile = statsDict(&aStats[i].stats);
+        if(!pFile || setFileItems(pFile, &aStats[i]) ||
+           PyList_Append(pFiles, pFile))
+        {
+            Py_CLEAR(pResult);
+        }
+        Py_XDECREF(pFile);
+    }
+    for(i = 0; i < nFile; ++i)
+    {
+        sqlite3_free(aStats[i].zName);
+    }
+    sqlite3_free(aStats);
+    if(pResult && (!pFiles || PyDict_SetItemString(pResult, "files", pFiles)))
+    {
+        Py_CLEAR(pResult);
+    }
+    Py_XDECREF(pFiles);
+    return pResult;
+}
+
+extern PyObject* bmnLatencyStats(const char* zVfsName, int iReset)
+{
+    sqlite3_vfs* pVfs;
+    BmnvfsInfo* pInfo;
+    sqlite3_int64 aBucket[BMN_LATENCY_BUCKETS];
+    sqlite3_int64 iMax;
+    sqlite3_int64 nCall;
+    PyObject* pResult;
+    PyObject* pOp;
+    int iOp;
+    int i;
+
+    pVfs = findBmnVfs(zVfsName);
+    if(!pVfs)
+    {
+        Py_RETURN_NONE;
+    }
+    pInfo   = BMN_INFO(pVfs);
+    pResult = PyDict_New();
+    for(iOp = 0; pResult && iOp < BMN_OP_COUNT; ++iOp)
+    {
+        bmnLatencyCopy(&pInfo->latency, iOp, iReset, aBucket, &iMax);
+        nCall = 0;
+        for(i = 0; i < BMN_LATENCY_BUCKETS; ++i)
+        {
+            nCall += aBucket[i];
+        }
+        if(!nCall)
+        {
+            continue;
+        }
+        pOp = Py_BuildValue(
+                "{sLsdsdsdsd}",
+                "count",
+                nCall,
+                "p50",
+                (double)bmnLatencyPercentile(aBucket, iMax, 0.5) / 1e9,
+                "p90",
+                (double)bmnLatencyPercentile(aBucket, iMax, 0.9) / 1e9,
+                "p99",
+                (double)bmnLatencyPercentile(aBucket, iMax, 0.99) / 1e9,
+                "max",
+                (double)iMax / 1e9);
+        if(!pOp || PyDict_SetItemString(pResult, bmnStatsOpName(iOp), pOp))
+        {
+            Py_CLEAR(pResult);
+        }
+        Py_XDECREF(pOp);
+    }
+    return pResult;
+}
+
+extern int bmnVfsTrace(const char* zVfsName, int nCapacity)
+{
+    sqlite3_vfs* pVfs;
+
+    pVfs = findBmnVfs(zVfsName);
+    if(!pVfs)
+    {
+        return 0;
+    }
+    if(SQLITE_OK != bmnEventsSet(&BMN_INFO(pVfs)->events, nCapacity))
+    {
+        PyErr_NoMemory();
+        return -1;
+    }
+    return 1;
+}
+
+extern PyObject* bmnVfsTraceDrain(const char* zVfsName)
+{
+    sqlite3_vfs* pVfs;
+    BmnEvent* aEvent;
+    PyObject* pResult;
+    int nEvent;
+
+    pVfs = findBmnVfs(zVfsName);
+    if(!pVfs)
+    {
+        Py_RETURN_NONE;
+    }
+    aEvent = bmnEventsDrain(&BMN_INFO(pVfs)->events, &nEvent);
+    if(nEvent < 0)
+    {
+        return PyErr_NoMemory();
+    }
+    pResult = PyBytes_FromStringAndSize(
+            (const char*)aEvent,
+            (Py_ssize_t)sizeof(BmnEvent) * nEvent);
+    sqlite3_free(aEvent);
+    return pResult;
+}
+
+extern int bmnInvalidateFiles(const char* zVfsName)
+{
+    sqlite3_vfs* pVfs;
+
+    pVfs = findBmnVfs(zVfsName);
+    if(!pVfs)
+    {
+        return 0;
+    }
+    BMN_INFO(pVfs)->iGeneration += 1;
+    return 1;
+}
+
+extern PyObject* bmnMemoryStoreStats(const char* zVfsName)
+{
+    sqlite3_vfs* pVfs;
+    BmnvfsInfo* pInfo;
+    int nFile;
+    sqlite3_int64 iSize;
+    sqlite3_int64 iAllocated;
+
+    pVfs = findBmnVfs(zVfsName);
+    if(!pVfs)
+    {
+        Py_RETURN_NONE;
+    }
+    pInfo = BMN_INFO(pVfs);
+    if(pInfo->pFileVfs == pInfo->pRootVfs)
+    {
+        Py_RETURN_NONE;
+    }
+    bmnMemStoreStats(&pInfo->memStore, &nFile, &iSize, &iAllocated);
+    return Py_BuildValue(
+            "{sisLsL}",
+            "files",
+            nFile,
+            "size",
+            iSize,
+            "allocated",
+            iAllocated);
+}
+
 #if REGISTER_DEBUG_ITEMS
 extern PyObject* bmnConnectionCount()
 {
@@ -12,11 +12,77 @@
 
 /*
 returns 0 un success and other value on errors
+iZeroCopyWrite: 1/0 or -1 to take it from wrapper
+iPageCacheSize: bytes or -1 to take it from wrapper
+iReadAhead: pages or -1 to take it from wrapper
+iPlainFiles: BMN_FILE_TYPES mask or -1 to take it from wrapper
+iMemoryStore: 1/0 or -1 to take it from wrapper
+iSideFile: 1/0 or -1 to take it from wrapper
+iDurability: BMN_DURABILITY_* or -1 to take it from wrapper
+iSyncInterval: milliseconds or -1 to take it from wrapper
+zName: vfs name or NULL for the default one
 */
-int bmnVfsRegister(PyObject* pWrapper, int iMakeDefault);
+int bmnVfsRegister(
+        PyObject* pWrapper,
+        int iMakeDefault,
+        int iZeroCopyWrite,
+        sqlite3_int64 iPageCacheSize,
+        int iReadAhead,
+        int iPlainFiles,
+        int iMemoryStore,
+        int iSideFile,
+        int iDurability,
+        int iSyncInterval,
+        const char* zName);
 
+/*
+ wrapper of the vfs, NULL zVfsName means the default one
+*/
 PyObject* bmnFindVfs(const char* zVfsName);
 
+/*
+ dict with counters of decoded pages cache or None
+*/
+PyObject* bmnPageCacheStats(const char* zVfsName);
+
+/*
+ dict with sync policy and its counters or None
+*/
+PyObject* bmnSyncStats(const char* zVfsName);
+
+/*
+ dict with I/O counters of the VFS and of its open files or None
+*/
+PyObject* bmnVfsStats(const char* zVfsName);
+
+/*
+ dict of latency percentiles by callback or None
+ the histograms are zeroed after they're read if iReset is set
+*/
+PyObject* bmnLatencyStats(const char* zVfsName, int iReset);
+
+/*
+ turns the trace of the VFS on with ring of nCapacity events or off if
+ it's 0. 0 if there's no such VFS, -1 with python error
+*/
+int bmnVfsTrace(const char* zVfsName, int nCapacity);
+
+/*
+ bytes of events recorded since the last drain or None
+*/
+PyObject* bmnVfsTraceDrain(const char* zVfsName);
+
+/*
+ open files of the VFS ask the wrapper for their size, sector size and
+ device characteristics again. 0 if there's no such VFS
+*/
+int bmnInvalidateFiles(const char* zVfsName);
+
+/*
+ dict with memory use of the memory store or None
+*/
+PyObject* bmnMemoryStoreStats(const char* zVfsName);
+
 #if REGISTER_DEBUG_ITEMS
 PyObject* bmnConnectionCount();
 PyObject* bmnFlags();
@@ -25,10 +25,22 @@ class FlagsTestCase(SqlCheckTestCase):
     BMN_NO_CALLBACK_SECTOR_SIZE = 1 << 6
     BMN_NO_CALLBACK_SYNC = 1 << 7
     BMN_NO_CALLBACK_FILE_CONTROL = 1 << 8
+    BMN_NO_CALLBACK_FULL_PATHNAME = 1 << 10
+    BMN_NO_CALLBACK_READINTO = 1 << 11
 
     def test_flags_api(self) -> None:
         bmnsqlite3.vfs_register(full.UselessWrapper())
-        self.assertEqual(bmnsqlite3.flags(), 0)
+        # methods inherited from interfaces are known at registration
+        inherited = self.BMN_NO_CALLBACK_SECTOR_SIZE | self.BMN_NO_CALLBACK_SYNC | \
+            self.BMN_NO_CALLBACK_FILE_CONTROL | self.BMN_NO_CALLBACK_READINTO
+        self.assertEqual(bmnsqlite3.flags() & inherited, inherited)
+        self.assertFalse(bmnsqlite3.flags() & self.BMN_NO_CALLBACK_OPEN)
+
+        bmnsqlite3.vfs_register(full.ReadIntoWrapper())
+        self.assertFalse(bmnsqlite3.flags() & self.BMN_NO_CALLBACK_READINTO)
+
+        bmnsqlite3.vfs_register(partial.UselessPartialIoWrapper())
+        self.assertTrue(bmnsqlite3.flags() & self.BMN_NO_CALLBACK_OPEN)
 
     def test_open(self) -> None:
         self.check_connect_silent(partial.UselessPartialIoWrapper())
@@ -77,11 +89,11 @@ class FlagsTestCase(SqlCheckTestCase):
         self.assertTrue(bmnsqlite3.flags() & self.BMN_NO_CALLBACK_SECTOR_SIZE)
 
     def test_sync(self) -> None:
-        # sync returns nothing so BMN has no chance to know wether method implemented or not
-        # class NoneSync(minimal.MinimalFullWrapper):
-        #     pass
-        # self.check_write_silent(NoneSync())
-        # self.assertTrue(bmnsqlite3.flags() & self.BMN_NO_CALLBACK_SYNC)
+        # sync returns nothing, but inherited one is detected at registration
+        class NoneSync(minimal.MinimalFullWrapper):
+            pass
+        self.check_write_silent(NoneSync())
+        self.assertTrue(bmnsqlite3.flags() & self.BMN_NO_CALLBACK_SYNC)
 
         class NoSync(minimal.MinimalFullWrapper):
             def sync(self, fh: Any, flags: int) -> None:
@@ -13,12 +13,34 @@ class FullTestCase(unittest.TestCase):
     def test_useless(self):
         full.UselessWrapper().test_base(self)
 
+    def test_readinto(self):
+        full.ReadIntoWrapper().test_all(self)
+
+    def test_zero_copy_write(self):
+        full.ZeroCopyWriteWrapper().test_all(self)
+
+    @unittest.skipUnless(hasattr(bmnsqlite3, "xor_codec"), "debug build only")
+    def test_native_codec(self):
+        full.NativeCodecWrapper(bmnsqlite3.xor_codec(0x33)).test_all(self)
+
     def test_base64(self):
         full.Base64Wrapper().test_base(self)
 
     def test_xor(self):
         full.XorWrapper().test_all(self)
 
+    def test_page_cache(self):
+        full.PageCacheWrapper().test_all(self)
+
+    def test_writev(self):
+        full.WritevWrapper().test_all(self)
+
+    def test_readv(self):
+        full.ReadvWrapper().test_all(self)
+
+    def test_native_files(self):
+        full.NativeFilesWrapper().test_all(self)
+
     def test_xor_mix(self):
         full.XorMixWrapper().test_all(self)
 
@@ -2,6 +2,8 @@
 from io import SEEK_SET
 import logging
 import os
+import threading
+import time
 from tests import wrappers
 from tests.wrappers.testcases import get_db_path
 import unittest
@@ -9,7 +11,7 @@ from typing import Any, Type, Union, Optional, List
 from bmnsqlite3 import vfs
 import bmnsqlite3
 from tests import DbPathMixin
-from tests.wrappers import full, crypto, abstract
+from tests.wrappers import full, crypto, abstract, partial
 import tests.wrappers.testdata as td
 
 log = logging.getLogger(__name__)
@@ -130,3 +132,65 @@ class VacuumTestCase(unittest.TestCase, DbPathMixin):
                 return 0x10 + 0x400
 
         CW().test_vacuum(self_)
+
+
+@unittest.skip("For development only")
+class ConcurrentReadTestCase(unittest.TestCase, DbPathMixin):
+    """
+    Partial wrapper releases GIL around root VFS IO, so readers
+    on separate connections overlap their IO with each other
+    and with pure python threads
+    """
+    scope = "concurrent"
+    THREADS = 4
+    ROWS = 20000
+    SCANS = 5
+
+    def setUp(self) -> None:
+        super().setUp()
+        bmnsqlite3.vfs_register(partial.UselessPartialIoWrapper())
+        with bmnsqlite3.connect(self.db_path()) as con:
+            con.execute("CREATE TABLE IF NOT EXISTS sample(i INTEGER, s TEXT);")
+            con.executemany("INSERT INTO sample values(?, ?);",
+                            ((i, os.urandom(64).hex()) for i in range(self.ROWS)))
+
+    def tearDown(self) -> None:
+        super().tearDown()
+        bmnsqlite3.vfs_register(None)
+        self.erase_db()
+
+    def scan(self) -> None:
+        with bmnsqlite3.connect(self.db_path(), check_same_thread=False) as con:
+            # every page goes through the wrapper
+            con.execute("PRAGMA cache_size=1;")
+            for _ in range(self.SCANS):
+                self.assertEqual(self.ROWS, len(con.execute("SELECT * FROM sample;").fetchall()))
+
+    def run_threads(self, count: int) -> float:
+        threads = [threading.Thread(target=self.scan) for _ in range(count)]
+        start = time.perf_counter()
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        return time.perf_counter() - start
+
+    def test_overlap(self):
+        serial = self.run_threads(1) * self.THREADS
+        concurrent = self.run_threads(self.THREADS)
+        log.warning("%d readers: serial %.3fs, concurrent %.3fs, ratio %.2f",
+                    self.THREADS, serial, concurrent, serial / concurrent)
+
+        stop = threading.Event()
+        counter = [0]
+
+        def spin() -> None:
+            while not stop.is_set():
+                counter[0] += 1
+
+        spinner = threading.Thread(target=spin)
+        spinner.start()
+        elapsed = self.run_threads(self.THREADS)
+        stop.set()
+        spinner.join()
+        log.warning("python thread progress while reading: %.0f iterations/s", counter[0] / elapsed)
@@ -1,5 +1,6 @@
 import unittest
 
+import bmnsqlite3
 from tests.wrappers import partial
 
 
@@ -10,9 +11,19 @@ class PartialBindingTestCase(unittest.TestCase):
         how to implement partial binding"""
         partial.UselessPartialIoWrapper().test_all(self)
 
+    def test_zero_copy_write(self):
+        partial.ZeroCopyPartialIoWrapper().test_all(self)
+
+    @unittest.skipUnless(hasattr(bmnsqlite3, "xor_codec"), "debug build only")
+    def test_native_codec(self):
+        partial.NativeCodecPartialWrapper(bmnsqlite3.xor_codec(0x33)).test_all(self)
+
     def test_xor(self):
         partial.XorPartialIoWrapper().test_all(self)
 
+    def test_page_cache(self):
+        partial.PageCachePartialWrapper().test_all(self)
+
     def test_zip(self):
         partial.ZipPartialWrapper().test_all(self)
 
@@ -71,6 +71,24 @@ class ReturnPolicyTestCase(SqlCheckTestCase):
 
         self.check_write_warns(ReturnAny(), regex="ignored")
 
+    def test_zero_copy_write(self):
+        class KeepBuffer(full.ZeroCopyWriteWrapper):
+            """
+            data belongs to sqlite. holding it after return is an error
+            """
+
+            def write(self, fh: Any, data: memoryview, offset: int) -> None:
+                self.kept = data
+                super().write(fh, data, offset)
+
+        def error_hook(args: UNRAISABLE_ARGS_TYPE):
+            self.assertIs(args.object, w)
+            self.assertEqual(args.exc_type, BufferError)
+            self.assertIn("write", str(args.exc_value))
+
+        w = KeepBuffer()
+        self.check_write(w, error_hook)
+
     def test_read(self):
         class ReturnNotBytes(full.UselessWrapper):
 
@@ -131,6 +149,51 @@ class ReturnPolicyTestCase(SqlCheckTestCase):
         w = ReturnWrongSize()
         self.check_connect(w, error_hook__)
 
+    def test_readinto(self):
+        class ReturnNone(full.ReadIntoWrapper):
+
+            def readinto(self, fh: Any, buffer: memoryview, offset: int) -> int:
+                super().readinto(fh, buffer, offset)
+
+        def error_hook(args: UNRAISABLE_ARGS_TYPE):
+            self.assertIs(args.object, w)
+            self.assertEqual(args.exc_type, TypeError)
+            self.assertIn("readinto", str(args.exc_value))
+            self.assertIn("None", str(args.exc_value))
+
+        w = ReturnNone()
+        self.check_connect(w, error_hook)
+
+        class ReturnWrongSize(full.ReadIntoWrapper):
+
+            def readinto(self, fh: Any, buffer: memoryview, offset: int) -> int:
+                return len(buffer) + 1
+
+        def error_hook_(args: UNRAISABLE_ARGS_TYPE):
+            self.assertIs(args.object, w)
+            self.assertEqual(args.exc_type, ValueError)
+            self.assertIn("readinto", str(args.exc_value))
+            self.assertIn("wrong number of bytes", str(args.exc_value))
+
+        w = ReturnWrongSize()
+        self.check_connect(w, error_hook_)
+
+        class KeepBuffer(full.ReadIntoWrapper):
+            """
+            buffer belongs to sqlite. holding it after return is an error
+            """
+
+            def readinto(self, fh: Any, buffer: memoryview, offset: int) -> int:
+                self.kept = memoryview(buffer)
+                return super().readinto(fh, buffer, offset)
+
+        def error_hook__(args: UNRAISABLE_ARGS_TYPE):
+            self.assertIs(args.object, w)
+            self.assertEqual(args.exc_type, BufferError)
+
+        w = KeepBuffer()
+        self.check_connect(w, error_hook__)
+
     def test_access(self):
         class ReturnNone(full.UselessWrapper):
             """
@@ -1,5 +1,11 @@
 import logging
+import os
 import random
+import struct
+import subprocess
+import sys
+import threading
+import time
 import unittest
 from typing import Any, Tuple, Union, Optional
 
@@ -9,7 +15,25 @@ from tests.wrappers import full, minimal, partial, crypto, abstract
 
 log = logging.getLogger(__name__)
 
+# holds write transaction in another process until it's asked to commit
+# SharedWrapper has 'side_file', so locks of processes see each other
+LOCKING_CHILD = """
+import sys
+import bmnsqlite3
+from tests.wrappers import full
+bmnsqlite3.vfs_register(full.SharedWrapper())
+con = bmnsqlite3.connect(sys.argv[1], isolation_level=None)
+con.execute("BEGIN IMMEDIATE")
+con.execute("INSERT INTO t VALUES (2)")
+print("reserved", flush=True)
+sys.stdin.readline()
+con.execute("COMMIT")
+con.close()
+print("done", flush=True)
+"""
+
 HAS_CONNECTION_COUNT = hasattr(bmnsqlite3, "connection_count")
+HAS_XOR_CODEC = hasattr(bmnsqlite3, "xor_codec")
 
 WRAPPERS_TO_TEST = [
     full.UselessWrapper(),
@@ -92,10 +116,1134 @@ class GetVFSTestCase(unittest.TestCase, DbPathMixin):
 
         w1 = Wrapper()
         bmnsqlite3.vfs_register(wrapper=w1, make_default=0)
-        # there is no support 'make_default = 0' yet
+        self.assertIsNone(bmnsqlite3.vfs_find())
+        self.assertIs(w1, bmnsqlite3.vfs_find("bmn_vfs"))
+        bmnsqlite3.connect(self.db_path()).close()
+        with self.assertRaises(bmnsqlite3.ProgrammingError):
+            bmnsqlite3.connect(self.db_path(), vfs="bmn_vfs")
+        bmnsqlite3.vfs_register(wrapper=w1, make_default=1)
+        self.assertIs(w1, bmnsqlite3.vfs_find())
         with self.assertRaises(bmnsqlite3.ProgrammingError):
             bmnsqlite3.connect(self.db_path())
 
+    def test_named(self):
+        class Wrapper(full.UselessWrapper):
+            def open(self, path: str, flags: int) -> Any:
+                self.opened.append(path)
+                return super().open(path, flags)
+
+        w1, w2 = Wrapper(), Wrapper()
+        w1.opened, w2.opened = [], []
+        bmnsqlite3.vfs_register(w1, make_default=False, name="bmn_one")
+        bmnsqlite3.vfs_register(w2, make_default=False, name="bmn_two")
+        try:
+            self.assertIsNone(bmnsqlite3.vfs_find())
+            self.assertIs(w1, bmnsqlite3.vfs_find("bmn_one"))
+            self.assertIs(w2, bmnsqlite3.vfs_find("bmn_two"))
+            with bmnsqlite3.connect(self.db_path(), vfs="bmn_one") as con:
+                con.execute("CREATE TABLE IF NOT EXISTS t (x)")
+            with bmnsqlite3.connect(f"file:{self.db_path()}?vfs=bmn_two", uri=True) as con:
+                con.execute("CREATE TABLE IF NOT EXISTS t (x)")
+            with bmnsqlite3.connect(self.db_path()) as con:
+                con.execute("CREATE TABLE IF NOT EXISTS t (x)")
+            self.assertEqual(1, len(w1.opened))
+            self.assertEqual(1, len(w2.opened))
+            self.assertIsNotNone(bmnsqlite3.vfs_cache_stats("bmn_one"))
+            self.assertIsNone(bmnsqlite3.vfs_cache_stats())
+
+            bmnsqlite3.vfs_register(None, name="bmn_one")
+            self.assertIsNone(bmnsqlite3.vfs_find("bmn_one"))
+            self.assertIs(w2, bmnsqlite3.vfs_find("bmn_two"))
+            with self.assertRaises(bmnsqlite3.OperationalError):
+                bmnsqlite3.connect(self.db_path(), vfs="bmn_one")
+        finally:
+            bmnsqlite3.vfs_register(None, name="bmn_one")
+            bmnsqlite3.vfs_register(None, name="bmn_two")
+
+        with self.assertRaises(ValueError):
+            bmnsqlite3.vfs_register(w1, name="")
+        with self.assertRaises(ValueError):
+            bmnsqlite3.vfs_register(w1, name="x" * 64)
+        with self.assertRaises(ValueError):
+            bmnsqlite3.vfs_register(w1, name="unix")
+
+    def test_named_reuse(self):
+        # unregistered names free their slots, 16 can be registered at once
+        w = partial.XorPartialIoWrapper()
+        for i in range(40):
+            name = f"bmn_n{i}"
+            bmnsqlite3.vfs_register(w, make_default=False, name=name)
+            self.assertIs(w, bmnsqlite3.vfs_find(name))
+            with bmnsqlite3.connect(self.db_path(), vfs=name) as con:
+                con.execute("CREATE TABLE IF NOT EXISTS t (x)")
+            con.close()
+            self.assertEqual(0, bmnsqlite3.vfs_sync_stats(name)["deferred"])
+            bmnsqlite3.vfs_register(None, name=name)
+            self.assertIsNone(bmnsqlite3.vfs_find(name))
+            self.assertIsNone(bmnsqlite3.vfs_stats(name))
+
+    def test_zero_copy_write(self):
+        class Wrapper(full.UselessWrapper):
+
+            def write(self, fh: Any, data: bytes, offset: int) -> None:
+                self.data_type = type(data)
+                super().write(fh, data, offset)
+
+        w = Wrapper()
+        for zero_copy_write, data_type in ((True, memoryview), (False, bytes)):
+            bmnsqlite3.vfs_register(w, zero_copy_write=zero_copy_write)
+            w.data_type = None
+            with bmnsqlite3.connect(self.db_path()) as con:
+                con.execute("CREATE TABLE IF NOT EXISTS t (x)")
+                con.execute("INSERT INTO t VALUES (1)")
+            self.assertIs(data_type, w.data_type)
+
+    def test_register_again(self):
+        w = full.UselessWrapper()
+        bmnsqlite3.vfs_register(w)
+        con = bmnsqlite3.connect(self.db_path())
+        con.execute("PRAGMA synchronous = FULL")
+        synced = []
+
+        def sync(fh: Any, flags: int) -> None:
+            synced.append(flags)
+
+        w.sync = sync
+        with con:
+            con.execute("DROP TABLE IF EXISTS t")
+            con.execute("CREATE TABLE t (x)")
+        self.assertEqual([], synced)
+        bmnsqlite3.vfs_register(w)
+        with con:
+            con.execute("INSERT INTO t VALUES (1)")
+        self.assertNotEqual([], synced)
+
+        w.codec = bmnsqlite3.null_codec
+        with self.assertRaises(bmnsqlite3.OperationalError):
+            bmnsqlite3.vfs_register(w)
+        self.assertEqual(1, con.execute("SELECT count(*) FROM t").fetchone()[0])
+        con.close()
+        bmnsqlite3.vfs_register(w)
+        with bmnsqlite3.connect(self.db_path()) as con:
+            self.assertEqual(1, con.execute("SELECT count(*) FROM t").fetchone()[0])
+
+    def test_page_cache(self):
+        class Wrapper(full.UselessWrapper):
+            reads = 0
+
+            def read(self, fh: Any, length: int, offset: int) -> Union[bytes, bool]:
+                self.reads += 1
+                return super().read(fh, length, offset)
+
+        def select() -> list:
+            con = bmnsqlite3.connect(path)
+            rows = con.execute("SELECT x FROM t").fetchall()
+            con.close()
+            return rows
+
+        path = self.db_path()
+        if os.path.exists(path):
+            os.unlink(path)
+        w = Wrapper()
+        bmnsqlite3.vfs_register(w, page_cache_size=1 << 20)
+        self.assertEqual(1 << 20, bmnsqlite3.vfs_cache_stats()["max_size"])
+        with bmnsqlite3.connect(path) as con:
+            con.execute("CREATE TABLE t (x)")
+            con.executemany("INSERT INTO t VALUES (?)", ((str(i) * 100,) for i in range(1000)))
+        con.close()
+        rows = select()
+        w.reads = 0
+        self.assertEqual(rows, select())
+        # only header and the first page are read again
+        self.assertLess(w.reads, 5)
+        stats = bmnsqlite3.vfs_cache_stats()
+        self.assertGreater(stats["hits"], 0)
+        self.assertGreater(stats["pages"], 0)
+        self.assertLessEqual(stats["size"], stats["max_size"])
+
+        # another connection changes the pages
+        with bmnsqlite3.connect(path) as con:
+            con.execute("UPDATE t SET x = 'updated'")
+        con.close()
+        self.assertEqual([("updated",)] * len(rows), select())
+
+        # too small cache evicts pages
+        bmnsqlite3.vfs_register(w, page_cache_size=1 << 14)
+        evictions = bmnsqlite3.vfs_cache_stats()["evictions"]
+        select()
+        stats = bmnsqlite3.vfs_cache_stats()
+        self.assertGreater(stats["evictions"], evictions)
+        self.assertLessEqual(stats["size"], 1 << 14)
+
+        bmnsqlite3.vfs_register(w, page_cache_size=0)
+        self.assertEqual(0, bmnsqlite3.vfs_cache_stats()["pages"])
+        with self.assertRaises(ValueError):
+            bmnsqlite3.vfs_register(w, page_cache_size=-1)
+
+    def test_page_cache_threads(self):
+        import collections
+        import threading
+        import time
+
+        class Wrapper(full.UselessWrapper):
+            def __init__(self) -> None:
+                super().__init__()
+                self.reads = collections.Counter()
+
+            def read(self, fh: Any, length: int, offset: int) -> Union[bytes, bool]:
+                self.reads[(length, offset)] += 1
+                # let other threads meet the same page
+                time.sleep(0.001)
+                return super().read(fh, length, offset)
+
+        path = self.db_path()
+        if os.path.exists(path):
+            os.unlink(path)
+        w = Wrapper()
+        bmnsqlite3.vfs_register(w, page_cache_size=1 << 22)
+        with bmnsqlite3.connect(path) as con:
+            con.execute("CREATE TABLE t (x)")
+            con.executemany("INSERT INTO t VALUES (?)", ((str(i) * 100,) for i in range(1000)))
+        con.close()
+        # pages written by that connection aren't cached
+        bmnsqlite3.vfs_register(w, page_cache_size=1 << 22)
+        w.reads.clear()
+        errors = []
+
+        def run() -> None:
+            try:
+                con = bmnsqlite3.connect(path, check_same_thread=False)
+                if 1000 != len(con.execute("SELECT x FROM t").fetchall()):
+                    raise RuntimeError("DB fetch failure")
+                con.close()
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual([], errors)
+        # the first page and the header are read by every connection
+        pages = {k: v for k, v in w.reads.items() if k[0] >= 512 and k[1] > 0}
+        self.assertTrue(pages)
+        self.assertEqual({1}, set(pages.values()))
+
+    def test_writev(self):
+        class Wrapper(full.UselessWrapper):
+            zero_copy_write = True
+
+            def __init__(self) -> None:
+                super().__init__()
+                self.writes = 0
+                self.chunks = []
+
+            def write(self, fh: Any, data: bytes, offset: int) -> None:
+                self.writes += 1
+                super().write(fh, data, offset)
+
+            def writev(self, fh: Any, chunks: list) -> None:
+                self.chunks.append(len(chunks))
+                for offset, data in chunks:
+                    assert isinstance(data, memoryview) and data.readonly
+                    super().write(fh, data, offset)
+
+        path = self.db_path()
+        if os.path.exists(path):
+            os.unlink(path)
+        w = Wrapper()
+        bmnsqlite3.vfs_register(w)
+        con = bmnsqlite3.connect(path)
+        con.execute("CREATE TABLE t (x)")
+        with con:
+            con.executemany("INSERT INTO t VALUES (?)", ((str(i) * 10,) for i in range(10000)))
+        self.assertEqual(0, w.writes)
+        # journal and DB pages are joined into few chunks
+        self.assertLess(len(w.chunks), 20)
+        self.assertLess(sum(w.chunks), 20)
+
+        # collected writes are visible without sync
+        con.execute("PRAGMA synchronous=OFF")
+        with con:
+            con.execute("UPDATE t SET x = 'updated' WHERE rowid <= 5000")
+        con2 = bmnsqlite3.connect(path)
+        self.assertEqual(5000, con2.execute("SELECT count(*) FROM t WHERE x = 'updated'").fetchone()[0])
+        con2.close()
+        con.close()
+        self.assertEqual(0, w.writes)
+
+    def test_commit_atomic(self):
+        class Wrapper(full.UselessWrapper):
+            def __init__(self) -> None:
+                super().__init__()
+                self.commits = []
+                self.journals = 0
+                self.fail = False
+
+            def open(self, path: str, flags: int) -> Any:
+                if path.endswith("-journal"):
+                    self.journals += 1
+                return super().open(path, flags)
+
+            def commit_atomic(self, fh: Any, chunks: list) -> None:
+                if self.fail:
+                    raise IOError("nothing is written")
+                self.commits.append(len(chunks))
+                for offset, data in chunks:
+                    super().write(fh, data, offset)
+                fh.flush()
+
+        path = self.db_path()
+        if os.path.exists(path):
+            os.unlink(path)
+        w = Wrapper()
+        bmnsqlite3.vfs_register(w)
+        con = bmnsqlite3.connect(path)
+        # the first transaction of empty DB is journaled by sqlite
+        con.execute("CREATE TABLE t (x)")
+        w.journals = 0
+        with con:
+            con.executemany("INSERT INTO t VALUES (?)", ((str(i) * 10,) for i in range(1000)))
+        with con:
+            con.execute("UPDATE t SET x = 'updated' WHERE rowid <= 500")
+        self.assertEqual(0, w.journals)
+        self.assertEqual(2, len(w.commits))
+
+        # failed batch is journaled
+        w.fail = True
+        with con:
+            con.execute("DELETE FROM t WHERE rowid > 500")
+        self.assertEqual(1, w.journals)
+        self.assertEqual(2, len(w.commits))
+        con.close()
+        con = bmnsqlite3.connect(path)
+        self.assertEqual(500, con.execute("SELECT count(*) FROM t WHERE x = 'updated'").fetchone()[0])
+        self.assertEqual(500, con.execute("SELECT count(*) FROM t").fetchone()[0])
+        con.close()
+
+    def test_file_info_cache(self):
+        class Wrapper(full.UselessWrapper):
+            def __init__(self) -> None:
+                super().__init__()
+                self.opens = 0
+                self.sizes = 0
+                self.infos = 0
+
+            def open(self, path: str, flags: int) -> Any:
+                self.opens += 1
+                return super().open(path, flags)
+
+            def file_size(self, fh: Any) -> int:
+                self.sizes += 1
+                return super().file_size(fh)
+
+            def sector_size(self, fh: Any) -> int:
+                self.infos += 1
+                return 4096
+
+            def device_characteristics(self, fh: Any) -> int:
+                self.infos += 1
+                return super().device_characteristics(fh)
+
+        path = self.db_path()
+        if os.path.exists(path):
+            os.unlink(path)
+        w = Wrapper()
+        bmnsqlite3.vfs_register(w)
+        con = bmnsqlite3.connect(path)
+        con.execute("CREATE TABLE t (x)")
+        for i in range(100):
+            with con:
+                con.execute("INSERT INTO t VALUES (?)", (str(i) * 100,))
+        self.assertEqual("ok", con.execute("PRAGMA integrity_check").fetchone()[0])
+        # not asked again by own commits
+        self.assertLess(w.sizes, 5)
+        # asked once per file
+        self.assertLess(w.infos, 10)
+
+        infos = w.infos
+        self.assertTrue(bmnsqlite3.vfs_invalidate())
+        self.assertFalse(bmnsqlite3.vfs_invalidate("no such vfs"))
+        with con:
+            con.execute("INSERT INTO t VALUES (1)")
+        self.assertGreater(w.infos, infos)
+        con.close()
+
+    def test_file_size_autocommit(self):
+        class Wrapper(full.UselessWrapper):
+            def __init__(self) -> None:
+                super().__init__()
+                self.sizes = 0
+                self.paths = {}
+
+            def open(self, path: str, flags: int) -> Any:
+                fh = super().open(path, flags)
+                self.paths[id(fh)] = path
+                return fh
+
+            def write(self, fh: Any, data: bytes, offset: int) -> None:
+                super().write(fh, data, offset)
+                fh.flush()
+
+            def file_size(self, fh: Any) -> int:
+                if not self.paths[id(fh)].endswith(("-journal", "-wal")):
+                    self.sizes += 1
+                return super().file_size(fh)
+
+        for mode in ("delete", "wal"):
+            path = self.db_path()
+            for suffix in ("", "-journal", "-wal", "-shm", "-bmn"):
+                if os.path.exists(path + suffix):
+                    os.unlink(path + suffix)
+            w = Wrapper()
+            bmnsqlite3.vfs_register(w, side_file=True)
+            con = bmnsqlite3.connect(path, isolation_level=None)
+            con.execute(f"PRAGMA journal_mode={mode}")
+            con.execute("CREATE TABLE t (x)")
+            sizes = w.sizes
+            for i in range(50):
+                con.execute("INSERT INTO t VALUES (?)", (str(i) * 100,))
+                con.execute("SELECT count(*) FROM t").fetchone()
+            # autocommit statements of one connection don't ask it again
+            self.assertLess(w.sizes - sizes, 5, mode)
+
+            # commits and checkpoints of others are seen
+            con2 = bmnsqlite3.connect(path, isolation_level=None)
+            con2.execute("INSERT INTO t SELECT x FROM t")
+            con2.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+            self.assertEqual(100, con.execute("SELECT count(*) FROM t").fetchone()[0])
+            con.execute("INSERT INTO t VALUES (1)")
+            self.assertEqual(101, con2.execute("SELECT count(*) FROM t").fetchone()[0])
+            self.assertEqual("ok", con.execute("PRAGMA integrity_check").fetchone()[0])
+            con2.close()
+            con.close()
+
+    def test_vfs_stats(self):
+        class Wrapper(full.UselessWrapper):
+            def __init__(self) -> None:
+                super().__init__()
+                self.fail = False
+
+            def write(self, fh: Any, data: bytes, offset: int) -> None:
+                if self.fail:
+                    raise IOError("disk is full")
+                super().write(fh, data, offset)
+
+        path = self.db_path()
+        if os.path.exists(path):
+            os.unlink(path)
+        w = Wrapper()
+        bmnsqlite3.vfs_register(w)
+        con = bmnsqlite3.connect(path)
+        con.execute("CREATE TABLE t (x)")
+        with con:
+            con.executemany("INSERT INTO t VALUES (?)", ((str(i) * 10,) for i in range(1000)))
+        stats = bmnsqlite3.vfs_stats()
+        self.assertGreater(stats["calls"]["write"], 0)
+        self.assertGreater(stats["calls"]["open"], 0)
+        self.assertGreaterEqual(stats["bytes_written"], 4096)
+        self.assertEqual(0, stats["errors"]["write"])
+        self.assertGreater(stats["wrapper_time"], 0)
+        db, = (f for f in stats["files"] if f["flags"] & abstract.SQLITE_OPEN_MAIN_DB)
+        self.assertTrue(db["name"].endswith(os.path.basename(path)))
+        self.assertGreater(db["calls"]["write"], 0)
+        self.assertNotIn("open", db["calls"])
+
+        w.fail = True
+        with self.assertRaises(bmnsqlite3.DatabaseError):
+            with con:
+                con.execute("INSERT INTO t VALUES (1)")
+        stats = bmnsqlite3.vfs_stats()
+        self.assertGreater(stats["errors"]["write"], 0)
+        con.close()
+        self.assertEqual([], bmnsqlite3.vfs_stats()["files"])
+        self.assertIsNone(bmnsqlite3.vfs_stats("no such vfs"))
+
+    def test_vfs_latency(self):
+        class Wrapper(full.UselessWrapper):
+            def __init__(self) -> None:
+                super().__init__()
+                self.stalls = 1
+
+            def sync(self, fh: Any, flags: int) -> None:
+                # the tail must be seen behind fast syncs
+                if self.stalls:
+                    self.stalls -= 1
+                    time.sleep(0.05)
+
+        path = self.db_path()
+        if os.path.exists(path):
+            os.unlink(path)
+        bmnsqlite3.vfs_register(Wrapper())
+        con = bmnsqlite3.connect(path)
+        con.execute("CREATE TABLE t (x)")
+        for i in range(100):
+            with con:
+                con.execute("INSERT INTO t VALUES (?)", (i,))
+        latency = bmnsqlite3.vfs_latency(reset=True)
+        sync = latency["sync"]
+        self.assertGreater(sync["count"], 100)
+        self.assertGreaterEqual(sync["max"], 0.05)
+        self.assertLess(sync["p50"], 0.05)
+        self.assertLessEqual(sync["p50"], sync["p90"])
+        self.assertLessEqual(sync["p99"], sync["max"])
+        self.assertGreater(latency["write"]["count"], 0)
+
+        con.execute("SELECT * FROM t").fetchall()
+        latency = bmnsqlite3.vfs_latency()
+        self.assertIn("read", latency)
+        self.assertNotIn("sync", latency)
+        self.assertNotIn("write", latency)
+        self.assertIsNone(bmnsqlite3.vfs_latency("no such vfs"))
+        con.close()
+
+    def test_vfs_trace(self):
+        path = self.db_path()
+        if os.path.exists(path):
+            os.unlink(path)
+        bmnsqlite3.vfs_register(full.UselessWrapper())
+        self.assertTrue(bmnsqlite3.vfs_trace())
+        con = bmnsqlite3.connect(path)
+        con.execute("PRAGMA page_size = 4096")
+        con.execute("CREATE TABLE t (x)")
+        with con:
+            con.executemany("INSERT INTO t VALUES (?)", ((i,) for i in range(1000)))
+        events = list(struct.iter_unpack(
+            bmnsqlite3.VFS_TRACE_FORMAT, bmnsqlite3.vfs_trace_drain()))
+        self.assertTrue(events)
+        self.assertEqual(list(range(events[0][0], events[0][0] + len(events))),
+                         [event[0] for event in events])
+        ops = bmnsqlite3.VFS_TRACE_OPS
+        opened = {event[3]: event[6] for event in events if "open" == ops[event[8]]}
+        db = [f for f, flags in opened.items() if flags & abstract.SQLITE_OPEN_MAIN_DB]
+        journal = [f for f, flags in opened.items() if flags & abstract.SQLITE_OPEN_MAIN_JOURNAL]
+        self.assertEqual(1, len(db))
+        self.assertTrue(journal)
+        writes = [event for event in events if "write" == ops[event[8]] and event[3] == db[0]]
+        self.assertTrue(writes)
+        for event in writes:
+            self.assertEqual(4096, event[5])
+            self.assertEqual(0, event[4] % 4096)
+            self.assertTrue(event[6] & abstract.SQLITE_OPEN_MAIN_DB)
+            self.assertEqual(0, event[7])
+            self.assertGreaterEqual(event[2], 0)
+        self.assertEqual(b"", bmnsqlite3.vfs_trace_drain())
+
+        # the ring keeps the last events only
+        self.assertTrue(bmnsqlite3.vfs_trace(capacity=10))
+        con.execute("SELECT * FROM t").fetchall()
+        con.execute("SELECT * FROM t").fetchall()
+        events = list(struct.iter_unpack(
+            bmnsqlite3.VFS_TRACE_FORMAT, bmnsqlite3.vfs_trace_drain()))
+        self.assertEqual(10, len(events))
+        self.assertEqual("unlock", ops[events[-1][8]])
+
+        self.assertTrue(bmnsqlite3.vfs_trace(capacity=0))
+        con.execute("SELECT * FROM t").fetchall()
+        self.assertEqual(b"", bmnsqlite3.vfs_trace_drain())
+        con.close()
+        self.assertFalse(bmnsqlite3.vfs_trace("no such vfs"))
+        self.assertIsNone(bmnsqlite3.vfs_trace_drain("no such vfs"))
+        with self.assertRaises(ValueError):
+            bmnsqlite3.vfs_trace(capacity=-1)
+
+    def test_read_ahead(self):
+        class Wrapper(full.UselessWrapper):
+            def __init__(self) -> None:
+                super().__init__()
+                self.reads = 0
+                self.readvs = 0
+
+            def read(self, fh: Any, length: int, offset: int) -> Union[bytes, bool]:
+                self.reads += 1
+                return super().read(fh, length, offset)
+
+            def readv(self, fh: Any, chunks: list) -> list:
+                self.readvs += 1
+                return [super(Wrapper, self).read(fh, length, offset) for offset, length in chunks]
+
+        def scan() -> int:
+            con = bmnsqlite3.connect(path)
+            res = con.execute("SELECT sum(length(x)) FROM t").fetchone()[0]
+            con.close()
+            return res
+
+        path = self.db_path()
+        if os.path.exists(path):
+            os.unlink(path)
+        w = Wrapper()
+        bmnsqlite3.vfs_register(w, read_ahead=0)
+        with bmnsqlite3.connect(path) as con:
+            con.execute("CREATE TABLE t (x)")
+            con.executemany("INSERT INTO t VALUES (?)", ((str(i) * 100,) for i in range(2000)))
+        con.close()
+        expected = scan()
+        pages = w.reads
+        self.assertEqual(0, w.readvs)
+
+        bmnsqlite3.vfs_register(w, read_ahead=32)
+        w.reads = 0
+        self.assertEqual(expected, scan())
+        self.assertGreater(w.readvs, 0)
+        self.assertLess(w.reads + w.readvs, pages // 4)
+
+        # pages changed by another connection aren't taken from read-ahead
+        con = bmnsqlite3.connect(path)
+        self.assertEqual(expected, con.execute("SELECT sum(length(x)) FROM t").fetchone()[0])
+        with bmnsqlite3.connect(path) as con2:
+            # the same size keeps rows on their pages
+            con2.execute("UPDATE t SET x = replace(x, '1', '0')")
+        con2.close()
+        # the last pages are read at once
+        query = "SELECT count(*) FROM t WHERE rowid > 1900 AND x LIKE '%1%'"
+        self.assertEqual(0, con.execute(query).fetchone()[0])
+        con.close()
+
+        for value in (-1, 2000):
+            with self.assertRaises(ValueError):
+                bmnsqlite3.vfs_register(w, read_ahead=value)
+
+    def test_plain_files(self):
+        class Wrapper(partial.XorPartialIoWrapper):
+            def __init__(self) -> None:
+                super().__init__()
+                self.calls = 0
+
+            def encode(self, file_flags: int, callback: Any, data: bytes, offset: int) -> None:
+                self.calls += 1
+                return super().encode(file_flags, callback, data, offset)
+
+            def decode(self, file_flags: int, callback: Any, length: int, offset: int) -> Union[bytes, bool]:
+                self.calls += 1
+                return super().decode(file_flags, callback, length, offset)
+
+        def fill_and_scan(path: str) -> Optional[bool]:
+            # None if mapping can't be seen here
+            for suffix in ("", "-journal"):
+                if os.path.exists(path + suffix):
+                    os.unlink(path + suffix)
+            with bmnsqlite3.connect(path) as con:
+                con.execute("CREATE TABLE t (x)")
+                con.executemany("INSERT INTO t VALUES (?)", ((str(i) * 100,) for i in range(100)))
+            con.close()
+            con = bmnsqlite3.connect(path)
+            mmap = None
+            size = con.execute("PRAGMA mmap_size=1048576").fetchone()[0]
+            self.assertEqual(100, con.execute("SELECT count(*) FROM t").fetchone()[0])
+            if size > 0 and os.path.exists("/proc/self/maps"):
+                with open("/proc/self/maps") as f:
+                    mmap = os.path.realpath(path) in f.read()
+            con.close()
+            return mmap
+
+        w = Wrapper()
+        bmnsqlite3.vfs_register(w, plain_files=abstract.SQLITE_OPEN_MAIN_DB | 0x800)
+        path = self.db_path()
+        self.assertIn(fill_and_scan(path), (True, None))
+        self.assertEqual(0, w.calls)
+        with open(path, "rb") as f:
+            self.assertEqual(b"SQLite format 3\0", f.read(16))
+
+        # transformed pages are read as usual
+        bmnsqlite3.vfs_register(w, plain_files=0)
+        self.assertIn(fill_and_scan(self.db_path(prefix="xor")), (False, None))
+        self.assertGreater(w.calls, 0)
+
+        for value in (-1, 1):
+            with self.assertRaises(ValueError):
+                bmnsqlite3.vfs_register(w, plain_files=value)
+        w.plain_files = 1 << 30
+        with self.assertRaises(ValueError):
+            bmnsqlite3.vfs_register(w)
+
+    def test_native_files(self):
+        class Wrapper(full.NativeFilesWrapper):
+            def __init__(self) -> None:
+                super().__init__()
+                self.opened = []
+                self.deleted = []
+
+            def open(self, path: str, flags: int) -> Any:
+                self.opened.append(flags)
+                return super().open(path, flags)
+
+            def delete(self, path: str, sync_dir: bool) -> None:
+                self.deleted.append(path)
+                super().delete(path, sync_dir)
+
+        path = self.db_path()
+        for suffix in ("", "-journal"):
+            if os.path.exists(path + suffix):
+                os.unlink(path + suffix)
+        w = Wrapper()
+        bmnsqlite3.vfs_register(w)
+        con = bmnsqlite3.connect(path)
+        # temporary b-trees of DISTINCT are spilled to files
+        con.execute("PRAGMA cache_size=10")
+        con.execute("CREATE TABLE t (x)")
+        con.executemany("INSERT INTO t VALUES (?)", ((str(i) * 100,) for i in range(500)))
+        con.commit()
+        self.assertTrue(os.path.exists(path))
+        self.assertFalse(os.path.exists(path + "-journal"))
+        self.assertEqual(500, con.execute("SELECT count(*) FROM (SELECT DISTINCT x FROM t)").fetchone()[0])
+        self.assertEqual(1, len(w.opened))
+        self.assertEqual([], w.deleted)
+        con.close()
+
+    def test_read_ahead_wal(self):
+        class Wrapper(full.UselessWrapper):
+            def write(self, fh: Any, data: bytes, offset: int) -> None:
+                super().write(fh, data, offset)
+                fh.flush()
+
+            def readv(self, fh: Any, chunks: list) -> list:
+                self.readvs += 1
+                return [self.read(fh, length, offset) for offset, length in chunks]
+
+        path = self.db_path()
+        for suffix in ("", "-wal", "-journal"):
+            if os.path.exists(path + suffix):
+                os.unlink(path + suffix)
+        w = Wrapper()
+        w.readvs = 0
+        bmnsqlite3.vfs_register(w, read_ahead=32, side_file=True)
+        with bmnsqlite3.connect(path) as con:
+            self.assertEqual("wal", con.execute("PRAGMA journal_mode=WAL").fetchone()[0])
+            con.execute("CREATE TABLE t (x)")
+            con.executemany("INSERT INTO t VALUES (?)", ((str(i) * 100,) for i in range(2000)))
+        con.close()
+        con = bmnsqlite3.connect(path, isolation_level=None)
+        expected = con.execute("SELECT sum(length(x)) FROM t").fetchone()[0]
+        self.assertGreater(w.readvs, 0)
+
+        # WAL connections keep SHARED lock, the checkpoint of another one
+        # is noticed by wal-index only
+        con2 = bmnsqlite3.connect(path, isolation_level=None)
+        con2.execute("UPDATE t SET x = replace(x, '1', '0')")
+        con2.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        query = "SELECT count(*) FROM t WHERE rowid > 1900 AND x LIKE '%1%'"
+        self.assertEqual(0, con.execute(query).fetchone()[0])
+        self.assertEqual(expected, con.execute("SELECT sum(length(x)) FROM t").fetchone()[0])
+        self.assertEqual("ok", con.execute("PRAGMA integrity_check").fetchone()[0])
+        con2.close()
+        con.close()
+
+    def test_wal(self):
+        path = self.db_path()
+        for suffix in ("", "-wal", "-journal"):
+            if os.path.exists(path + suffix):
+                os.unlink(path + suffix)
+        bmnsqlite3.vfs_register(full.SharedWrapper())
+        writer = bmnsqlite3.connect(path, isolation_level=None)
+        self.assertEqual("wal", writer.execute("PRAGMA journal_mode=WAL").fetchone()[0])
+        writer.execute("CREATE TABLE t (x)")
+        writer.execute("INSERT INTO t VALUES (1)")
+        self.assertTrue(os.path.exists(path + "-wal"))
+        self.assertTrue(os.path.exists(path + "-bmn-shm"))
+
+        # the writer doesn't block readers
+        reader = bmnsqlite3.connect(path, isolation_level=None)
+        writer.execute("BEGIN IMMEDIATE")
+        writer.execute("INSERT INTO t VALUES (2)")
+        self.assertEqual([(1,)], reader.execute("SELECT x FROM t").fetchall())
+        with self.assertRaises(bmnsqlite3.OperationalError):
+            reader.execute("PRAGMA busy_timeout=0")
+            reader.execute("BEGIN IMMEDIATE")
+        writer.execute("COMMIT")
+        self.assertEqual([(1,), (2,)], reader.execute("SELECT x FROM t").fetchall())
+
+        # WAL is removed by the last connection only
+        writer.close()
+        self.assertTrue(os.path.exists(path + "-wal"))
+        self.assertEqual([(1,), (2,)], reader.execute("SELECT x FROM t").fetchall())
+        reader.close()
+        self.assertFalse(os.path.exists(path + "-wal"))
+        con = bmnsqlite3.connect(path)
+        self.assertEqual("wal", con.execute("PRAGMA journal_mode").fetchone()[0])
+        self.assertEqual(2, con.execute("SELECT count(*) FROM t").fetchone()[0])
+        con.close()
+
+    def test_side_file(self):
+        path = self.db_path()
+        for suffix in ("", "-wal", "-journal", "-bmn"):
+            if os.path.exists(path + suffix):
+                os.unlink(path + suffix)
+        w = full.XorWrapper()
+        bmnsqlite3.vfs_register(w)
+        con = bmnsqlite3.connect(path, isolation_level=None)
+        # sqlite keeps the journal mode without shared memory
+        self.assertNotEqual("wal", con.execute("PRAGMA journal_mode=WAL").fetchone()[0])
+        con.execute("CREATE TABLE t (x)")
+        self.assertFalse(os.path.exists(path + "-bmn"))
+        with self.assertRaises(bmnsqlite3.OperationalError):
+            bmnsqlite3.vfs_register(w, side_file=True)
+        con.close()
+
+        bmnsqlite3.vfs_register(w, side_file=True)
+        con = bmnsqlite3.connect(path, isolation_level=None)
+        self.assertEqual("wal", con.execute("PRAGMA journal_mode=WAL").fetchone()[0])
+        self.assertTrue(os.path.exists(path + "-bmn"))
+        con.close()
+        self.assertFalse(os.path.exists(path + "-bmn-shm"))
+
+    def test_wal_partial(self):
+        path = self.db_path()
+        for suffix in ("", "-wal", "-journal"):
+            if os.path.exists(path + suffix):
+                os.unlink(path + suffix)
+        bmnsqlite3.vfs_register(partial.XorPartialIoWrapper())
+        writer = bmnsqlite3.connect(path, isolation_level=None)
+        self.assertEqual("wal", writer.execute("PRAGMA journal_mode=WAL").fetchone()[0])
+        writer.execute("CREATE TABLE t (x)")
+        writer.execute("INSERT INTO t VALUES (1)")
+        reader = bmnsqlite3.connect(path, isolation_level=None)
+        writer.execute("BEGIN IMMEDIATE")
+        writer.execute("INSERT INTO t VALUES (2)")
+        self.assertEqual([(1,)], reader.execute("SELECT x FROM t").fetchall())
+        writer.execute("COMMIT")
+        self.assertEqual([(1,), (2,)], reader.execute("SELECT x FROM t").fetchall())
+        writer.close()
+        reader.close()
+        self.assertFalse(os.path.exists(path + "-wal"))
+
+    def test_durability(self):
+        path = self.db_path()
+        for suffix in ("", "-wal", "-journal"):
+            if os.path.exists(path + suffix):
+                os.unlink(path + suffix)
+        w = partial.XorPartialIoWrapper()
+        bmnsqlite3.vfs_register(w, durability="group", sync_interval=200)
+        self.assertEqual("group", bmnsqlite3.vfs_sync_stats()["durability"])
+        self.assertEqual(200, bmnsqlite3.vfs_sync_stats()["sync_interval"])
+        connections = [
+            bmnsqlite3.connect(path, isolation_level=None, check_same_thread=False)
+            for _ in range(2)
+        ]
+        connections[0].execute("PRAGMA journal_mode=WAL")
+        connections[0].execute("CREATE TABLE t (x)")
+        for con in connections:
+            con.execute("PRAGMA synchronous=FULL")
+        # the commit returns after its sync, nobody joined it in the window
+        before = bmnsqlite3.vfs_sync_stats()
+        start = time.monotonic()
+        connections[0].execute("INSERT INTO t VALUES (0)")
+        self.assertGreaterEqual(time.monotonic() - start, 0.15)
+        stats = bmnsqlite3.vfs_sync_stats()
+        self.assertEqual(1, stats["deferred"] - before["deferred"])
+        self.assertEqual(1, stats["performed"] - before["performed"])
+
+        # the commit of another connection in the window shares the sync
+        before = bmnsqlite3.vfs_sync_stats()
+        thread = threading.Thread(
+            target=connections[0].execute, args=("INSERT INTO t VALUES (1)",))
+        thread.start()
+        time.sleep(0.05)
+        connections[1].execute("INSERT INTO t VALUES (2)")
+        thread.join()
+        stats = bmnsqlite3.vfs_sync_stats()
+        self.assertEqual(2, stats["deferred"] - before["deferred"])
+        self.assertEqual(1, stats["performed"] - before["performed"])
+        for con in connections:
+            con.close()
+        with bmnsqlite3.connect(path) as con:
+            self.assertEqual(3, con.execute("SELECT count(*) FROM t").fetchone()[0])
+        con.close()
+
+        # a single connection doesn't wait for others in 'group'
+        con = bmnsqlite3.connect(path, isolation_level=None)
+        con.execute("PRAGMA synchronous=FULL")
+        before = bmnsqlite3.vfs_sync_stats()
+        for i in range(5):
+            con.execute("INSERT INTO t VALUES (?)", (i,))
+        self.assertEqual(before["deferred"], bmnsqlite3.vfs_sync_stats()["deferred"])
+        con.close()
+
+        bmnsqlite3.vfs_register(w, durability="interval", sync_interval=60000)
+        con = bmnsqlite3.connect(path, isolation_level=None)
+        con.execute("PRAGMA synchronous=FULL")
+        before = bmnsqlite3.vfs_sync_stats()
+        for i in range(5):
+            con.execute("INSERT INTO t VALUES (?)", (i,))
+        stats = bmnsqlite3.vfs_sync_stats()
+        self.assertEqual("interval", stats["durability"])
+        self.assertGreaterEqual(stats["deferred"] - before["deferred"], 4)
+        # checkpoint and close perform deferred syncs
+        con.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+        self.assertGreater(bmnsqlite3.vfs_sync_stats()["performed"], stats["performed"])
+        con.execute("INSERT INTO t VALUES (5)")
+        stats = bmnsqlite3.vfs_sync_stats()
+        con.close()
+        self.assertGreater(bmnsqlite3.vfs_sync_stats()["performed"], stats["performed"])
+
+        # the flusher performs the deferred sync at the end of the interval
+        bmnsqlite3.vfs_register(w, durability="interval", sync_interval=100)
+        con = bmnsqlite3.connect(path, isolation_level=None)
+        con.execute("PRAGMA synchronous=FULL")
+        con.execute("INSERT INTO t VALUES (1)")
+        before = bmnsqlite3.vfs_sync_stats()
+        con.execute("INSERT INTO t VALUES (2)")
+        stats = bmnsqlite3.vfs_sync_stats()
+        self.assertEqual(1, stats["deferred"] - before["deferred"])
+        self.assertEqual(stats["performed"], before["performed"])
+        time.sleep(0.5)
+        self.assertEqual(stats["performed"] + 1, bmnsqlite3.vfs_sync_stats()["performed"])
+        con.close()
+
+        with self.assertRaises(ValueError):
+            bmnsqlite3.vfs_register(w, durability="never")
+        with self.assertRaises(ValueError):
+            bmnsqlite3.vfs_register(w, sync_interval=-1)
+        bmnsqlite3.vfs_register(w, durability="normal")
+        self.assertEqual("normal", bmnsqlite3.vfs_sync_stats()["durability"])
+
+    def test_multiprocess(self):
+        path = self.db_path()
+        for suffix in ("", "-journal"):
+            if os.path.exists(path + suffix):
+                os.unlink(path + suffix)
+        bmnsqlite3.vfs_register(full.SharedWrapper())
+        con = bmnsqlite3.connect(path, isolation_level=None)
+        con.execute("CREATE TABLE t (x)")
+        con.execute("INSERT INTO t VALUES (1)")
+        child = subprocess.Popen(
+            [sys.executable, "-c", LOCKING_CHILD, path],
+            stdin=subprocess.PIPE, stdout=subprocess.PIPE,
+            env=dict(os.environ, PYTHONPATH=os.pathsep.join(sys.path)),
+            universal_newlines=True, errors="replace")
+
+        def expect(token: str) -> None:
+            # debug builds print OS traces to stdout too
+            for line in child.stdout:
+                if line.strip() == token:
+                    return
+            self.fail(f"no {token!r} from the child")
+
+        try:
+            expect("reserved")
+            self.assertEqual([(1,)], con.execute("SELECT x FROM t").fetchall())
+            con.execute("PRAGMA busy_timeout=0")
+            with self.assertRaises(bmnsqlite3.OperationalError):
+                con.execute("INSERT INTO t VALUES (3)")
+            child.stdin.write("commit\n")
+            child.stdin.flush()
+            expect("done")
+        finally:
+            child.communicate()
+        self.assertEqual(0, child.returncode)
+        self.assertEqual([(1,), (2,)], con.execute("SELECT x FROM t").fetchall())
+        con.close()
+
+    def test_lock_methods(self):
+        class Wrapper(full.XorWrapper):
+            def __init__(self) -> None:
+                super().__init__()
+                self.calls = []
+                self.busy = False
+
+            def lock(self, fh: Any, level: int) -> bool:
+                self.calls.append(("lock", level))
+                return not self.busy or level == 1
+
+            def unlock(self, fh: Any, level: int) -> None:
+                self.calls.append(("unlock", level))
+
+            def check_reserved_lock(self, fh: Any) -> bool:
+                return self.busy
+
+        path = self.db_path()
+        if os.path.exists(path):
+            os.unlink(path)
+        w = Wrapper()
+        bmnsqlite3.vfs_register(w)
+        con = bmnsqlite3.connect(path, isolation_level=None)
+        con.execute("CREATE TABLE t (x)")
+        self.assertIn(("lock", 4), w.calls)
+        self.assertEqual(("unlock", 0), w.calls[-1])
+
+        w.busy = True
+        con.execute("PRAGMA busy_timeout=0")
+        with self.assertRaisesRegex(bmnsqlite3.OperationalError, "locked"):
+            con.execute("INSERT INTO t VALUES (1)")
+        self.assertEqual([], con.execute("SELECT x FROM t").fetchall())
+        w.busy = False
+        con.execute("INSERT INTO t VALUES (1)")
+        self.assertEqual([(1,)], con.execute("SELECT x FROM t").fetchall())
+        con.close()
+
+    def test_raw_callbacks(self):
+        class Wrapper(partial.UselessPartialIoWrapper):
+            def __init__(self) -> None:
+                super().__init__()
+                self.callbacks = set()
+
+            def decode(self, file_flags: int, callback: Any, length: int, offset: int) -> Union[bytes, bool]:
+                self.callbacks.add(callback)
+                return super().decode(file_flags, callback, length, offset)
+
+        w = Wrapper()
+        bmnsqlite3.vfs_register(w)
+        with bmnsqlite3.connect(self.db_path()) as con:
+            con.execute("CREATE TABLE IF NOT EXISTS t (x)")
+            con.execute("INSERT INTO t VALUES (1)")
+        con = bmnsqlite3.connect(self.db_path())
+        con.execute("SELECT * FROM t").fetchall()
+        con.close()
+        # one callback per opened file instead of one per call
+        self.assertTrue(w.callbacks)
+        for callback in w.callbacks:
+            with self.assertRaises(ValueError):
+                callback(1, 0)
+
+    def test_partial_threads(self):
+        import threading
+        # random key of the wrapper can't decode files of previous runs
+        paths = [self.db_path(f"thread_{index}") for index in range(4)]
+        for path in paths:
+            if os.path.exists(path):
+                os.unlink(path)
+        bmnsqlite3.vfs_register(partial.XorPartialIoWrapper())
+        errors = []
+
+        def run(index: int) -> None:
+            try:
+                with bmnsqlite3.connect(paths[index]) as con:
+                    con.execute("CREATE TABLE IF NOT EXISTS t (x)")
+                    for i in range(TEST_COMPLEXITY):
+                        con.execute("INSERT INTO t VALUES (?)", (f"{index}:{i}" * 100,))
+                    con.commit()
+                    rows = con.execute("SELECT x FROM t").fetchall()
+                    if (f"{index}:0" * 100,) not in rows:
+                        raise RuntimeError("DB fetch failure")
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(i,)) for i in range(len(paths))]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual([], errors)
+
+    def test_memory_store(self):
+        from bmnsqlite3.vfs import MemoryVfsWrapper
+
+        path = self.db_path()
+        bmnsqlite3.vfs_register(MemoryVfsWrapper(), make_default=False, name="bmn_memory")
+        try:
+            self.assertIsNone(bmnsqlite3.vfs_memory_stats())
+            con1 = bmnsqlite3.connect(path, vfs="bmn_memory")
+            con2 = bmnsqlite3.connect(path, timeout=0, vfs="bmn_memory")
+            con1.execute("CREATE TABLE t (x)")
+            with con1:
+                con1.executemany("INSERT INTO t VALUES (?)", ((i,) for i in range(1000)))
+            self.assertEqual((1000,), con2.execute("SELECT count(*) FROM t").fetchone())
+            # locks are shared too
+            con1.execute("BEGIN IMMEDIATE")
+            with self.assertRaises(bmnsqlite3.OperationalError):
+                con2.execute("BEGIN IMMEDIATE")
+            con1.rollback()
+            con1.close()
+            con2.close()
+            self.assertFalse(os.path.exists(path))
+            stats = bmnsqlite3.vfs_memory_stats("bmn_memory")
+            # journal is deleted
+            self.assertEqual(1, stats["files"])
+            self.assertGreater(stats["size"], 0)
+            self.assertGreaterEqual(stats["allocated"], stats["size"])
+            with bmnsqlite3.connect(path, vfs="bmn_memory") as con:
+                self.assertEqual((1000,), con.execute("SELECT count(*) FROM t").fetchone())
+            con.close()
+        finally:
+            bmnsqlite3.vfs_register(None, name="bmn_memory")
+        self.assertIsNone(bmnsqlite3.vfs_memory_stats("bmn_memory"))
+
+        # partial wrapper encodes pages kept in memory
+        w = partial.UselessPartialIoWrapper()
+        bmnsqlite3.vfs_register(w, memory_store=True)
+        with bmnsqlite3.connect(path) as con:
+            con.execute("CREATE TABLE t (x)")
+            con.execute("INSERT INTO t VALUES (1)")
+        con.close()
+        self.assertFalse(os.path.exists(path))
+        self.assertEqual(1, bmnsqlite3.vfs_memory_stats()["files"])
+        bmnsqlite3.vfs_register(w, memory_store=False)
+        self.assertIsNone(bmnsqlite3.vfs_memory_stats())
+
+    def test_overlay(self):
+        base = self.db_path("overlay_base")
+        clones = [self.db_path(f"overlay_clone{i}") for i in range(2)]
+        for path in [base] + clones:
+            if os.path.exists(path):
+                os.remove(path)
+        with bmnsqlite3.connect(base) as con:
+            con.execute("CREATE TABLE t (x, y)")
+            con.executemany("INSERT INTO t VALUES (?, ?)",
+                            ((i, "base" * 25) for i in range(2000)))
+        con.close()
+        base_size = os.path.getsize(base)
+
+        bmnsqlite3.vfs_register(partial.UselessPartialIoWrapper())
+        uris = [f"file:{path}?overlay={base}" for path in clones]
+        con1 = bmnsqlite3.connect(uris[0], uri=True)
+        con2 = bmnsqlite3.connect(uris[1], uri=True)
+        with con1:
+            con1.execute("UPDATE t SET y = 'clone' WHERE x < 10")
+        with con2:
+            con2.execute("DELETE FROM t WHERE x >= 100")
+        con2.execute("VACUUM")
+        self.assertEqual((2000, 10), con1.execute(
+            "SELECT count(*), sum(y = 'clone') FROM t").fetchone())
+        self.assertEqual((100,), con2.execute("SELECT count(*) FROM t").fetchone())
+        # another connection shares changes of the clone
+        con3 = bmnsqlite3.connect(uris[0], uri=True)
+        self.assertEqual((10,), con3.execute("SELECT sum(y = 'clone') FROM t").fetchone())
+        for con in (con1, con2, con3):
+            con.close()
+        # only changed pages are stored
+        self.assertLess(os.path.getsize(clones[0]), base_size // 10)
+
+        # changes are read back by the next open
+        with bmnsqlite3.connect(uris[1], uri=True) as con:
+            self.assertEqual((100,), con.execute("SELECT count(*) FROM t").fetchone())
+            con.executemany("INSERT INTO t VALUES (?, ?)", ((i, "new") for i in range(500)))
+            self.assertEqual(("ok",), con.execute("PRAGMA integrity_check").fetchone())
+        con.close()
+        bmnsqlite3.vfs_register(None)
+        with bmnsqlite3.connect(base) as con:
+            self.assertEqual((2000, 0), con.execute(
+                "SELECT count(*), sum(y = 'clone') FROM t").fetchone())
+        con.close()
+        self.assertEqual(base_size, os.path.getsize(base))
+
+        # wrapper owning the storage can't have it
+        bmnsqlite3.vfs_register(full.UselessWrapper())
+        with self.assertRaises(bmnsqlite3.OperationalError):
+            bmnsqlite3.connect(uris[0], uri=True).execute("SELECT * FROM t")
+
+    @unittest.skipUnless(HAS_XOR_CODEC, "debug build only")
+    def test_native_codec(self):
+        for w in (full.NativeCodecWrapper(bmnsqlite3.xor_codec(0x5a)),
+                  partial.NativeCodecPartialWrapper(bmnsqlite3.xor_codec(0x5a))):
+            bmnsqlite3.vfs_register(w)
+            path = self.db_path()
+            with bmnsqlite3.connect(path) as con:
+                con.execute("CREATE TABLE IF NOT EXISTS t (x)")
+                con.execute("INSERT INTO t VALUES (?)", ("native codec",))
+            with bmnsqlite3.connect(path) as con:
+                self.assertIn(("native codec",), con.execute("SELECT x FROM t").fetchall())
+            with open(path, "rb") as f:
+                self.assertNotEqual(b"SQLite format 3", f.read(15))
+
+    def test_codec_type(self):
+        class Wrapper(full.UselessWrapper):
+            def codec(self) -> Any:
+                return b"codec"
+
+        with self.assertRaises(TypeError):
+            bmnsqlite3.vfs_register(Wrapper())
+        self.assertIsNone(bmnsqlite3.vfs_find())
+
     def test_vfs_chain(self):
         """
         TODO: this behavior will be changed n future
@@ -235,6 +1383,52 @@ class WrappersTestCase(unittest.TestCase):
         self.assertTrue(w.validate())
 
 
+class BenchTestCase(unittest.TestCase):
+
+    def test_run(self):
+        from bmnsqlite3 import bench
+        configs = ["sqlite3", "bmnsqlite3", "null", "partial", "full", "xor", "aes", "fernet"]
+        report = bench.run(configs, rows=300, repeat=2)
+        self.assertEqual(configs, list(report["results"]))
+        for name, results in report["results"].items():
+            self.assertEqual(list(bench.WORKLOADS), list(results))
+            for workload, result in results.items():
+                self.assertGreater(result["ops"], 0)
+                self.assertGreater(result["ops_per_sec"], 0)
+                self.assertEqual(name not in ("sqlite3", "bmnsqlite3"), "calls" in result)
+        self.assertGreater(report["results"]["full"]["point_lookups"]["calls"]["read"], 0)
+        self.assertIsNone(bmnsqlite3.vfs_find(bench.VFS_NAME))
+
+        self.assertEqual({"gil", "lookup", "arguments", "call", "result", "total"},
+                         set(report["overhead"]))
+        self.assertGreater(report["results"]["null"]["bulk_insert"]["calls"]["write"], 0)
+
+        report = bench.run(["partial"], ["vacuum"], rows=300)
+        self.assertEqual(["vacuum"], list(report["results"]["partial"]))
+        with self.assertRaises(ValueError):
+            bench.run(["no such config"])
+
+
+    def test_callback_overhead(self):
+        class Wrapper:
+            def __init__(self, result=None):
+                self.result = result
+
+            def write(self, fh, data, offset):
+                return self.result
+
+        overhead = bmnsqlite3.callback_overhead(Wrapper(), iterations=1000, size=512)
+        for part in ("gil", "lookup", "arguments", "call", "result", "total"):
+            self.assertGreater(overhead[part], 0)
+        bmnsqlite3.callback_overhead(Wrapper(0), iterations=10)
+        with self.assertRaises(TypeError):
+            bmnsqlite3.callback_overhead(Wrapper("error"), iterations=10)
+        with self.assertRaises(ValueError):
+            bmnsqlite3.callback_overhead(Wrapper(), iterations=0)
+        with self.assertRaises(AttributeError):
+            bmnsqlite3.callback_overhead(Wrapper(), "no_such_method", iterations=10)
+
+
 class UriTestCase(SqlCheckTestCase):
     scope = "uri"
 
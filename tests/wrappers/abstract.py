@@ -37,6 +37,7 @@ SQLITE_OPEN_MAIN_JOURNAL = 0x00000800
 SQLITE_OPEN_TEMP_JOURNAL = 0x00001000
 SQLITE_OPEN_SUBJOURNAL = 0x00002000
 SQLITE_OPEN_SUPER_JOURNAL = 0x00004000
+SQLITE_OPEN_WAL = 0x00080000
 
 SQLITE_ACCESS_EXISTS = 0
 SQLITE_ACCESS_READWRITE = 1
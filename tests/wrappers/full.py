@@ -196,3 +196,94 @@ class SleepWrapper(XorWrapper):
     def encrypt(self, data: bytes, **kwargs) -> bytes:
         time.sleep(0.01)
         return super().encrypt(data, **kwargs)
+
+
+class ReadIntoWrapper(UselessWrapper):
+    """
+    Zero-copy reading: sqlite page buffer is filled in place
+    """
+
+    def readinto(self, fh: Any, buffer: memoryview, offset: int) -> int:
+        fh.seek(offset, os.SEEK_SET)
+        return fh.readinto(buffer)
+
+    def read(self, fh: Any, length: int, offset: int) -> Union[bytes, bool]:
+        raise AssertionError("'readinto' must be used instead")
+
+
+class ZeroCopyWriteWrapper(XorWrapper):
+    """
+    Data to write comes as read-only memoryview over sqlite buffer
+    """
+    zero_copy_write = True
+
+    def write(self, fh: Any, data: memoryview, offset: int) -> None:
+        assert isinstance(data, memoryview) and data.readonly
+        super().write(fh, data, offset)
+
+
+class NativeCodecWrapper(UselessWrapper):
+    """
+    Native codec encodes pages before 'write' and decodes them after 'read'
+    """
+
+    def __init__(self, capsule: Any) -> None:
+        super().__init__()
+        self._capsule = capsule
+
+    def codec(self) -> Any:
+        return self._capsule
+
+
+class PageCacheWrapper(XorWrapper):
+    """
+    Decoded pages are cached by bmnsqlite3
+    """
+    page_cache_size = 1 << 20
+
+
+class WritevWrapper(UselessWrapper):
+    """
+    Pages are written in batches. Xor wrappers can't be used here:
+    their key depends on boundaries of writes
+    """
+
+    def writev(self, fh: Any, chunks: list) -> None:
+        for offset, data in chunks:
+            self.write(fh, data, offset)
+
+
+class ReadvWrapper(XorWrapper):
+    """
+    Sequential reads are fetched ahead in batches
+    """
+    read_ahead = 4
+
+    def readv(self, fh: Any, chunks: list) -> list:
+        return [self.read(fh, length, offset) for offset, length in chunks]
+
+
+class NativeFilesWrapper(XorWrapper):
+    """
+    Only main DB is opened by the wrapper, journals and temporary files are native
+    """
+    plain_files = (abstract.SQLITE_OPEN_TEMP_DB | abstract.SQLITE_OPEN_TRANSIENT_DB |
+                   abstract.SQLITE_OPEN_MAIN_JOURNAL | abstract.SQLITE_OPEN_TEMP_JOURNAL |
+                   abstract.SQLITE_OPEN_SUBJOURNAL | abstract.SQLITE_OPEN_SUPER_JOURNAL |
+                   abstract.SQLITE_OPEN_WAL)
+
+    def open(self, path: str, flags: int) -> Any:
+        assert flags & abstract.SQLITE_OPEN_MAIN_DB, "file %s must be native" % path
+        return super().open(path, flags)
+
+
+class SharedWrapper(XorWrapper):
+    """
+    Writes are visible to other handles at once.
+    Connections of other processes and WAL readers need it
+    """
+    side_file = True
+
+    def write(self, fh: Any, data: bytes, offset: int) -> None:
+        super().write(fh, data, offset)
+        fh.flush()
@@ -1,7 +1,7 @@
 import abc
 import logging
 import struct
-from typing import Callable, Union
+from typing import Any, Callable, Union
 
 from tests import randbytes
 from tests.wrappers import abstract, minimal
@@ -28,6 +28,37 @@ class UselessPartialIoWrapper(minimal.MinimalPartialWrapper):
     """
 
 
+class ZeroCopyPartialIoWrapper(UselessPartialIoWrapper):
+    """
+    Data to encode comes as read-only memoryview and goes to callback as is
+    """
+    zero_copy_write = True
+
+    def encode(self, file_flags: int, callback: ENCODE_CALLBACK_SIGNATURE, data: memoryview, offset: int) -> None:
+        assert isinstance(data, memoryview) and data.readonly
+        callback(data, offset)
+
+
+class NativeCodecPartialWrapper(UselessPartialIoWrapper):
+    """
+    Pages are encoded by native codec, python isn't called for IO at all
+    """
+
+    def __init__(self, capsule: Any) -> None:
+        super().__init__()
+        self._capsule = capsule
+
+    def codec(self) -> Any:
+        return self._capsule
+
+    def encode(self, file_flags: int, callback: ENCODE_CALLBACK_SIGNATURE, data: bytes, offset: int) -> None:
+        raise AssertionError("native codec must be used instead")
+
+    def decode(self, file_flags: int, callback: DECODE_CALLBACK_SIGNATURE, length: int, offset: int) -> \
+            Union[bytes, bool]:
+        raise AssertionError("native codec must be used instead")
+
+
 class XorPartialIoWrapper(abstract.IPartialTestWrapper, abstract.XorMixin):
     """
     This version does primitive IO encoding via XOR operation with random bytes
@@ -45,6 +76,13 @@ class XorPartialIoWrapper(abstract.IPartialTestWrapper, abstract.XorMixin):
         return data
 
 
+class PageCachePartialWrapper(XorPartialIoWrapper):
+    """
+    Decoded pages are cached by bmnsqlite3
+    """
+    page_cache_size = 1 << 20
+
+
 class ISectorSizePartialWrapper(abstract.IPartialTestWrapper, abstract.EncodeMixin, abc.ABC):
     """Align written data by sectors and alloc more space as we can change written data length"""
     RATIO = 2